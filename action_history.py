@@ -0,0 +1,101 @@
+"""Seeded generator of long, consistent action histories for Experiment 4.
+
+An agent walks between rooms, picking objects up and putting them down on
+furniture. A WorldState tracks where every object is after each action, so
+questions about any history have a known answer however long it gets.
+"""
+
+import random
+from typing import Any, Dict, List
+
+import config
+
+# Furniture names are unique across rooms, so a place alone identifies a location
+ROOMS = {
+    "Kitchen": ["Counter", "Fridge", "Sink"],
+    "Living Room": ["Table", "Sofa", "Shelf"],
+    "Bedroom": ["Dresser", "Wardrobe", "Nightstand"],
+    "Garden": ["Bench", "Shed"],
+    "Office": ["Desk", "Drawer"],
+    "Bathroom": ["Cabinet", "Bathtub"],
+}
+OBJECTS = ["Apple", "Book", "Ball", "Key", "Phone", "Cup", "Hat", "Pen", "Lamp", "Shoe", "Watch", "Bottle"]
+MAX_HELD = 3
+HELD = "held"
+
+
+class WorldState:
+    """Ground-truth tracker: the agent's room, held objects and every object's place."""
+
+    def __init__(self, locations: Dict[str, str], room: str):
+        self.locations = dict(locations)
+        self.room = room
+        self.moves = {obj: 0 for obj in locations}
+
+    def objects_here(self) -> List[str]:
+        return [obj for obj, place in self.locations.items() if place in ROOMS[self.room]]
+
+    def held(self) -> List[str]:
+        return [obj for obj, place in self.locations.items() if place == HELD]
+
+    def move(self, room: str) -> str:
+        self.room = room
+        return f"I move to the {room}."
+
+    def pick_up(self, obj: str) -> str:
+        self.locations[obj] = HELD
+        return f"I pick up the {obj}."
+
+    def put(self, obj: str, place: str) -> str:
+        self.locations[obj] = place
+        self.moves[obj] += 1
+        return f"I put the {obj} on the {place}."
+
+
+def generate_history(length: int, seed: int = config.SEED) -> Dict[str, Any]:
+    """Generate a history of exactly `length` actions and a question about its final state.
+
+    The question asks where the object that was put down most often (and is
+    not being carried at the end) ended up. Answering only needs that
+    object's last put, but it can be anywhere in the history and comes after
+    earlier puts of the same object, so the answer is the latest mention
+    rather than any mention.
+
+    Args:
+        length: Number of actions.
+        seed: Seed for the initial layout and every choice the agent makes.
+
+    Returns:
+        Dictionary with the "actions", the ground-truth "final_state"
+        (object -> place or "held"), the "question" and its "expected_answer".
+
+    Raises:
+        ValueError: If the history is too short for any object to be put down.
+    """
+    rng = random.Random(seed)
+    places = [place for room_places in ROOMS.values() for place in room_places]
+    state = WorldState({obj: rng.choice(places) for obj in OBJECTS}, rng.choice(list(ROOMS)))
+
+    actions: List[str] = []
+    while len(actions) < length:
+        held = state.held()
+        here = state.objects_here()
+        roll = rng.random()
+        if held and roll < 0.4:
+            actions.append(state.put(rng.choice(held), rng.choice(ROOMS[state.room])))
+        elif here and len(held) < MAX_HELD and roll < 0.75:
+            actions.append(state.pick_up(rng.choice(here)))
+        else:
+            actions.append(state.move(rng.choice([r for r in ROOMS if r != state.room])))
+
+    candidates = [obj for obj in OBJECTS if state.moves[obj] > 0 and state.locations[obj] != HELD]
+    if not candidates:
+        raise ValueError(f"A history of {length} actions is too short to ask about a placed object")
+    target = max(candidates, key=lambda obj: (state.moves[obj], -OBJECTS.index(obj)))
+
+    return {
+        "actions": actions,
+        "final_state": state.locations,
+        "question": f"Where is the {target}?",
+        "expected_answer": state.locations[target],
+    }
@@ -15,6 +15,8 @@ import numpy as np
 import seaborn as sns
 
 import config
+from results_store import DETAILED_PREFIX, ResultsStore, is_trial
+from utils import server_metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,19 +26,48 @@ logger = logging.getLogger(__name__)
 sns.set_theme(style="whitegrid", context="paper", font_scale=1.2)
 PALETTE = "viridis"
 
+# Mirrors exp3_rag.TIMING_STAGES without importing the experiment's retrieval stack
+RAG_TIMING_STAGES = ["embed_query", "search", "context_assembly", "load", "prefill", "decode", "other"]
+
 
 def load_results() -> List[Dict[str, Any]]:
-    """Load all experiment results from JSON files.
+    """Load all experiment results.
 
-    Reads both standard and detailed result files from the configured
-    RESULTS_DIR and identifies their type.
+    Results in the results store are loaded as their JSON views (the newest
+    write of each model's experiments and of each detailed mode). Result
+    files in RESULTS_DIR that the store does not cover, e.g. from runs made
+    before it existed, are read as well.
 
     Returns:
         List of result dictionaries with type indicators (standard or detailed_needle).
+        Results from the store have "source": "store".
     """
     results = []
+    store = ResultsStore()
+    covered = set()
+    for model in store.models():
+        data = store.model_results(model)
+        # Models with only detailed Exp 1 results have no summary
+        if len(data) > 1:
+            results.append({"type": "standard", "data": data, "source": "store"})
+            covered.add(f"{model.replace(':', '_')}_results.json")
+    for mode in store.detailed_modes():
+        detailed = store.detailed_results(mode)
+        if detailed is not None:
+            results.append(
+                {
+                    "type": "detailed_needle",
+                    "metadata": detailed["experiment_metadata"],
+                    "results": detailed["results"],
+                    "source": "store",
+                }
+            )
+            covered.add(f"{mode}_results.json")
+
     files = glob.glob(os.path.join(config.RESULTS_DIR, "*_results.json"))
     for f in files:
+        if os.path.basename(f) in covered:
+            continue
         try:
             with open(f, "r") as file:
                 data = json.load(file)
@@ -199,7 +230,8 @@ def plot_exp3_rag(results: List[Dict[str, Any]]):
         if res.get("type") == "standard":
             model = res["data"]["model"]
             rag_data = res["data"].get("exp3_rag", {})
-            if not rag_data:
+            # Sweep results have no full-context arm to compare against
+            if not rag_data or "full_context" not in rag_data:
                 continue
 
             data.append(
@@ -243,6 +275,203 @@ def plot_exp3_rag(results: List[Dict[str, Any]]):
     plt.close()
 
 
+def plot_exp3_rag_stages(results: List[Dict[str, Any]]):
+    """Generate stacked per-stage latency bars for RAG vs Full Context.
+
+    Both arms are split into query embedding, vector search, context assembly,
+    model load, prefill, decode and remaining client overhead, so the plot
+    shows whether retrieval or prefill dominates.
+
+    Args:
+        results: List of experiment results
+
+    Saves:
+        exp3_rag_stages.png to plots directory
+    """
+    rows = []
+    for res in results:
+        if res.get("type") == "standard":
+            model = res["data"]["model"]
+            rag_data = res["data"].get("exp3_rag", {})
+            for method_key, method in [("full_context", "Full Context"), ("rag", "RAG")]:
+                timings = rag_data.get(method_key, {}).get("timings")
+                if timings:
+                    rows.append({"Bar": f"{model}\n{method}", **{s: timings.get(s, 0.0) for s in RAG_TIMING_STAGES}})
+
+    if not rows:
+        return
+
+    df = pd.DataFrame(rows).set_index("Bar")
+
+    fig, ax = plt.subplots(figsize=(max(10, len(df) * 1.2), 7))
+    df.plot(kind="bar", stacked=True, ax=ax, colormap=PALETTE, width=0.8)
+    ax.set_title("Experiment 3: Latency Breakdown by Stage", fontsize=16)
+    ax.set_ylabel("Seconds")
+    ax.set_xlabel("")
+    ax.legend(title="Stage", bbox_to_anchor=(1.02, 1), loc="upper left")
+    plt.xticks(rotation=45, ha="right")
+    plt.tight_layout()
+    plt.savefig(os.path.join(config.PLOTS_DIR, "exp3_rag_stages.png"), dpi=300)
+    plt.close()
+
+
+def plot_exp3_scaling(results: List[Dict[str, Any]]):
+    """Generate RAG vs Full Context crossover curves over corpus size.
+
+    Plots latency and accuracy of both arms against the number of documents
+    for every model run in scaling mode, with the latency crossover marked.
+
+    Args:
+        results: List of experiment results
+
+    Saves:
+        exp3_scaling_crossover.png to plots directory
+    """
+    rows = []
+    crossovers = {}
+    for res in results:
+        if res.get("type") == "standard":
+            model = res["data"]["model"]
+            rag_data = res["data"].get("exp3_rag", {})
+            if rag_data.get("mode") != "scaling":
+                continue
+            crossovers[model] = rag_data.get("crossover", {}).get("latency")
+            for point in rag_data.get("points", []):
+                for method_key, method in [("full_context", "Full Context"), ("rag", "RAG")]:
+                    # An arm whose every request failed or timed out has only an error count
+                    if "latency" not in point[method_key]:
+                        continue
+                    rows.append(
+                        {
+                            "Model": model,
+                            "Method": method,
+                            "Documents": point["num_documents"],
+                            "Latency (s)": point[method_key]["latency"],
+                            "Accuracy": point[method_key]["accuracy"],
+                        }
+                    )
+
+    if not rows:
+        return
+
+    df = pd.DataFrame(rows)
+
+    fig, axes = plt.subplots(1, 2, figsize=(16, 6))
+    for ax, metric in zip(axes, ["Latency (s)", "Accuracy"]):
+        sns.lineplot(data=df, x="Documents", y=metric, hue="Model", style="Method", markers=True, ax=ax)
+        ax.set_xscale("log")
+        ax.set_title(f"{metric.split(' ')[0]} vs Corpus Size")
+    for crossover in set(crossovers.values()) - {None}:
+        axes[0].axvline(crossover, color="gray", linestyle="--", alpha=0.6)
+
+    fig.suptitle("Experiment 3: RAG vs Full Context Crossover", fontsize=16)
+    plt.tight_layout()
+    plt.savefig(os.path.join(config.PLOTS_DIR, "exp3_scaling_crossover.png"), dpi=300)
+    plt.close()
+
+
+def collect_server_metrics(results: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Gather the server_metrics recorded by every experiment, one row per request.
+
+    Standard results are searched at any depth, so every experiment and mode
+    contributes. Only trials (see results_store.is_trial) are counted, so
+    averaged and summed entries do not count their requests twice. Detailed
+    needle results written before server_metrics existed are converted from
+    their ollama_metadata.
+
+    Args:
+        results: List of experiment results
+
+    Returns:
+        DataFrame with model, experiment and the server_metrics fields.
+    """
+    rows: List[Dict[str, Any]] = []
+
+    def walk(node: Any, model: str, experiment: str):
+        if is_trial(node):
+            if isinstance(node.get("server_metrics"), dict):
+                rows.append({"model": model, "experiment": experiment, **node["server_metrics"]})
+        elif isinstance(node, dict):
+            for value in node.values():
+                walk(value, model, experiment)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item, model, experiment)
+
+    for res in results:
+        if res.get("type") == "standard":
+            data = res["data"]
+            for key, value in data.items():
+                if key.startswith("exp"):
+                    walk(value, data.get("model", "unknown"), key)
+        elif res.get("type") == "detailed_needle":
+            for row in res["results"]:
+                metrics = row.get("server_metrics")
+                if metrics is None and isinstance(row.get("ollama_metadata"), dict):
+                    metrics = server_metrics(row["ollama_metadata"], row.get("query_time_seconds", 0.0))
+                if metrics:
+                    experiment = f"exp1_needle ({row.get('mode', 'detailed')})"
+                    rows.append({"model": row.get("model", "unknown"), "experiment": experiment, **metrics})
+
+    return pd.DataFrame(rows)
+
+
+def stored_server_metrics() -> pd.DataFrame:
+    """Read the throughput columns of the trials shown by the results store's views.
+
+    Only the model, experiment and throughput columns are loaded. Detailed
+    needle trials are labelled like collect_server_metrics labels them.
+    """
+    columns = ["model", "experiment", "prompt_tokens", "prefill_tokens_per_second", "decode_tokens_per_second"]
+    df = ResultsStore().read(columns=columns, latest=True)
+    detailed = df["experiment"].str.startswith(DETAILED_PREFIX)
+    df.loc[detailed, "experiment"] = "exp1_needle (" + df.loc[detailed, "experiment"].str[len(DETAILED_PREFIX) :] + ")"
+    return df
+
+
+def plot_throughput_vs_context(results: List[Dict[str, Any]]):
+    """Generate prefill and decode throughput vs context length plots, one per model.
+
+    Throughput is what the server reported (tokens over prefill or decode
+    time), so cached responses keep the speed of the request that produced
+    them. Trials in the results store are read column-wise; results loaded
+    from JSON files are searched with collect_server_metrics.
+
+    Args:
+        results: List of experiment results
+
+    Saves:
+        throughput_{model}.png per model to plots directory
+    """
+    df = pd.concat(
+        [stored_server_metrics(), collect_server_metrics([r for r in results if r.get("source") != "store"])],
+        ignore_index=True,
+    )
+    if df.empty:
+        return
+    df = df[df["prompt_tokens"] > 0]
+
+    for model in df["model"].unique():
+        model_df = df[df["model"] == model]
+        fig, axes = plt.subplots(1, 2, figsize=(16, 6))
+        for ax, column, title in [
+            (axes[0], "prefill_tokens_per_second", "Prefill"),
+            (axes[1], "decode_tokens_per_second", "Decode"),
+        ]:
+            data = model_df.dropna(subset=[column])
+            if not data.empty:
+                sns.scatterplot(data=data, x="prompt_tokens", y=column, hue="experiment", s=80, alpha=0.7, ax=ax)
+            ax.set_title(f"{title} Throughput")
+            ax.set_xlabel("Context Length (prompt tokens)")
+            ax.set_ylabel("Tokens / second")
+            ax.grid(True, linestyle="--", alpha=0.7)
+        fig.suptitle(f"Server Throughput vs Context Length: {model}", fontsize=16)
+        plt.tight_layout()
+        safe_model_name = model.replace(":", "_")
+        plt.savefig(os.path.join(config.PLOTS_DIR, f"throughput_{safe_model_name}.png"), dpi=300)
+        plt.close()
+
+
 def plot_radar_summary(results: List[Dict[str, Any]]):
     """Generate radar chart summarizing overall model capabilities.
 
@@ -459,6 +688,9 @@ def main():
     plot_exp1_needle(results)
     plot_exp2_size(results)
     plot_exp3_rag(results)
+    plot_exp3_rag_stages(results)
+    plot_exp3_scaling(results)
+    plot_throughput_vs_context(results)
     plot_radar_summary(results)
     plot_detailed_needle_experiments(results)
     print(f"Plots saved to {config.PLOTS_DIR}")
@@ -1,4 +1,6 @@
+import asyncio
 from abc import ABC, abstractmethod
+from concurrent.futures import Executor
 from typing import Any, Dict, List, Optional
 
 
@@ -7,6 +9,8 @@ class ExperimentBase(ABC):
 
     ID: int
     NAME: str
+    # Where CPU-bound steps run; None means the event loop's default thread pool
+    cpu_executor: Optional[Executor] = None
 
     def __init__(self, model: str, **kwargs):
         self.model = model
@@ -16,3 +20,42 @@ class ExperimentBase(ABC):
     def run(self) -> Any:
         """Run the experiment and return results."""
         pass
+
+    def trials(self) -> List[Dict[str, Any]]:
+        """Independent units of work the scheduler may interleave with other tasks.
+
+        The default is a single trial covering the whole run. A trial may set
+        "estimated_tokens" (its prompt size) to refine the scheduler's duration
+        estimate.
+        """
+        return [{}]
+
+    def run_trial(self, trial: Dict[str, Any]) -> Any:
+        """Run one of the units returned by trials()."""
+        return self.run()
+
+    async def run_trial_async(self, trial: Dict[str, Any]) -> Any:
+        """Run one trial on the current event loop.
+
+        The default runs the blocking run_trial in a worker thread; experiments
+        that are natively async override this to await their requests directly.
+        """
+        return await asyncio.to_thread(self.run_trial, trial)
+
+    def merge_trials(self, results: List[Any]) -> Any:
+        """Combine run_trial results, in trials() order, into what run() returns."""
+        return results[0]
+
+    def plan_requests(self, trial: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Describe the generate requests a trial would send, without sending any.
+
+        Each request is a dict with "prompt_tokens", "max_tokens" and "cached"
+        (True/False if the exact payload is known, None otherwise). Returning
+        None means the experiment cannot predict its requests, and the planner
+        falls back to a configured whole-run duration.
+        """
+        return None
+
+    def peak_concurrency(self) -> int:
+        """Most generate requests this experiment keeps in flight when run as a whole."""
+        return 1
@@ -0,0 +1,179 @@
+"""Lexical BM25 retrieval with Hebrew-aware tokenization.
+
+A pure-Python inverted index that needs no embedding model, so retrieval
+runs without a model server and without an HTTP round trip per query.
+"""
+
+import heapq
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List
+
+# Bumped whenever tokenize() changes, so persisted indexes are rebuilt
+TOKENIZER_VERSION = 1
+
+# One-letter proclitics: ve-, ha-, be-, ke-, le-, mi-, she-
+HEBREW_PREFIX_LETTERS = "והבכלמש"
+MAX_PREFIX_LENGTH = 3
+MIN_STEM_LENGTH = 3
+
+# Geresh/gershayim and ASCII quotes used inside acronyms such as צה"ל
+_ACRONYM_QUOTES = re.compile(r"(?<=\w)[\"'׳״](?=\w)")
+_TOKEN = re.compile(r"\w+")
+
+
+def strip_niqqud(text: str) -> str:
+    """Remove Hebrew vowel points and cantillation marks (and other combining marks)."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def strip_prefixes(token: str) -> str:
+    """Strip up to MAX_PREFIX_LENGTH leading prefix letters, keeping at least MIN_STEM_LENGTH letters."""
+    stripped = 0
+    while (
+        stripped < MAX_PREFIX_LENGTH
+        and token[stripped : stripped + 1] in HEBREW_PREFIX_LETTERS
+        and len(token) - stripped - 1 >= MIN_STEM_LENGTH
+    ):
+        stripped += 1
+    return token[stripped:]
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into normalized index terms.
+
+    Niqqud and acronym quotes are removed and Latin text is lowercased. A
+    Hebrew token that starts with prefix letters yields both its surface form
+    and its prefix-stripped stem, so "ובבית" matches "בית" without losing
+    exact-form matches when the first letter belongs to the word itself.
+    """
+    text = _ACRONYM_QUOTES.sub("", strip_niqqud(text).lower())
+    terms = []
+    for token in _TOKEN.findall(text):
+        terms.append(token)
+        stem = strip_prefixes(token)
+        if stem != token:
+            terms.append(stem)
+    return terms
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index persisted as one JSON file.
+
+    Postings map each term to {chunk_id: term frequency}. The
+    reset_collection/delete/add_documents methods mirror the LangChain vector
+    store API so RagIndex can manage it like the vector stores.
+    """
+
+    INDEX_FILENAME = "bm25_index.json"
+
+    def __init__(self, directory: str, k1: float = 1.5, b: float = 0.75):
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self.index_path = os.path.join(directory, self.INDEX_FILENAME)
+        self.reload()
+
+    def reload(self):
+        """Read the index from disk, e.g. after another builder wrote it."""
+        self.postings: Dict[str, Dict[str, int]] = {}
+        # chunk_id -> {"text", "source", "length"}
+        self.chunks: Dict[str, Dict[str, Any]] = {}
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("tokenizer_version") == TOKENIZER_VERSION:
+                self.postings, self.chunks = data["postings"], data["chunks"]
+        self._total_length = sum(c["length"] for c in self.chunks.values())
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def _save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"tokenizer_version": TOKENIZER_VERSION, "postings": self.postings, "chunks": self.chunks},
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, self.index_path)
+
+    def reset_collection(self):
+        self.postings, self.chunks = {}, {}
+        self._total_length = 0
+        self._save()
+
+    def delete(self, ids: List[str]):
+        for chunk_id in ids:
+            chunk = self.chunks.pop(chunk_id, None)
+            if chunk is None:
+                continue
+            self._total_length -= chunk["length"]
+            for term in set(tokenize(chunk["text"])):
+                postings = self.postings.get(term, {})
+                postings.pop(chunk_id, None)
+                if not postings:
+                    self.postings.pop(term, None)
+        self._save()
+
+    def add_documents(self, documents: List[Any], ids: List[str]):
+        for doc, chunk_id in zip(documents, ids):
+            terms = tokenize(doc.page_content)
+            for term, tf in Counter(terms).items():
+                self.postings.setdefault(term, {})[chunk_id] = tf
+            self.chunks[chunk_id] = {
+                "text": doc.page_content,
+                "source": doc.metadata.get("source"),
+                "length": len(terms),
+            }
+            self._total_length += len(terms)
+        self._save()
+
+    def idf(self, term: str) -> float:
+        """BM25 inverse document frequency, always positive."""
+        df = len(self.postings.get(term, {}))
+        return math.log(1 + (len(self.chunks) - df + 0.5) / (df + 0.5))
+
+    def search(self, query_terms: List[List[str]], k: int) -> List[List[Dict[str, Any]]]:
+        """Top-k chunks by BM25 score for a batch of tokenized queries.
+
+        Only chunks sharing at least one term with a query are scored, so the
+        cost grows with the postings touched rather than the corpus size.
+        """
+        if not self.chunks:
+            return [[] for _ in query_terms]
+
+        avg_length = self._total_length / len(self.chunks)
+        results = []
+        for terms in query_terms:
+            scores: Dict[str, float] = {}
+            for term in set(terms):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = self.idf(term)
+                for chunk_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.chunks[chunk_id]["length"] / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+            top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            results.append(
+                [
+                    {
+                        "id": chunk_id,
+                        "text": self.chunks[chunk_id]["text"],
+                        "source": self.chunks[chunk_id]["source"],
+                        "score": score,
+                    }
+                    for chunk_id, score in top
+                ]
+            )
+        return results
@@ -32,7 +32,14 @@ METADATA_FILE = os.path.join(DOCUMENTS_DIR, "articles_metadata.json")
 RESULTS_DIR = os.path.join(BASE_DIR, "results")
 PLOTS_DIR = os.path.join(BASE_DIR, "plots")
 CACHE_DIR = os.path.join(RESULTS_DIR, "cache")
+# Per-run JSONL journals of finished trials (see journal.py)
+JOURNAL_DIR = os.path.join(RESULTS_DIR, "runs")
+# Partitioned trial-level results (see results_store.py)
+RESULTS_STORE_DIR = os.path.join(RESULTS_DIR, "store")
 TESTS_DIR = os.path.join(BASE_DIR, "tests")
+# Benchmark baselines tracked in the repo
+BENCHMARKS_DIR = os.path.join(BASE_DIR, "benchmarks")
+LOADTEST_DIR = os.path.join(RESULTS_DIR, "loadtest")
 
 # Create directories if they don't exist
 for d in [RESULTS_DIR, PLOTS_DIR, CACHE_DIR]:
@@ -84,6 +91,133 @@ EXP2_ID_RANGE = (1000, 9999)
 # Experiment 3: RAG
 EXP3_RAG_K = 3
 EXP3_CHUNK_SIZE = 500
+EXP3_CHUNK_OVERLAP = 50
+EXP3_EMBEDDING_MODEL = "nomic-embed-text"
+# The embedding model stays loaded between the batches of one embedding call and is unloaded after the last
+EXP3_EMBEDDING_KEEP_ALIVE = "5m"
+EXP3_INDEX_DIR = os.path.join(BASE_DIR, "chroma_db_shared")
+EXP3_NUMPY_INDEX_DIR = os.path.join(BASE_DIR, "numpy_index_shared")
+EXP3_BM25_INDEX_DIR = os.path.join(BASE_DIR, "bm25_index_shared")
+# Retrieval backend: "chroma" (LangChain + Chroma), "numpy" (in-process exact search) or "bm25" (lexical)
+EXP3_RETRIEVER = "chroma"
+# Query-set mode also reports build time, query latency and recall of these backends for comparison
+EXP3_BASELINE_RETRIEVERS = ["bm25"]
+EXP3_BM25_K1 = 1.5
+EXP3_BM25_B = 0.75
+# Bring a stale shared index up to date automatically; when False a stale index raises instead
+EXP3_INDEX_AUTO_UPDATE = True
+# Query-set mode: number of generated (query, expected document) pairs, or a JSON file of them
+EXP3_QUERY_SET_SIZE = 50
+EXP3_QUERY_SET_FILE = os.environ.get("EXP3_QUERY_SET_FILE")
+EXP3_MAX_CONCURRENCY = 4
+# Sweep mode: index variants (chunk size x overlap) and k values evaluated on the query set
+EXP3_SWEEP_CHUNK_SIZES = [250, 500, 1000]
+EXP3_SWEEP_CHUNK_OVERLAPS = [0, 50, 100]
+EXP3_SWEEP_K = [1, 3, 5, 10]
+EXP3_SWEEP_INDEX_DIR = os.path.join(CACHE_DIR, "rag_sweep")
+EXP3_EMBEDDING_CACHE_DIR = os.path.join(CACHE_DIR, "embeddings")
+# Scaling mode: corpus sizes (real articles plus seeded synthetic variants) for the RAG vs full-context crossover
+EXP3_SCALING_DOC_COUNTS = [20, 200, 2000, 20000]
+EXP3_SCALING_QUERIES = 10
+EXP3_SCALING_RETRIEVER = "numpy"
+EXP3_SCALING_INDEX_DIR = os.path.join(CACHE_DIR, "rag_scaling")
+# The full-context arm is truncated to the model window (the benchmarked models use 100K contexts)
+EXP3_SCALING_CONTEXT_TOKENS = 100_000
+# Scaling requests time out after a base plus their prompt tokens at the slowest prefill rate still
+# counted as an answer (a 100K-token prompt gets ~17 minutes); timed-out requests are errors
+EXP3_SCALING_TIMEOUT_SECONDS = 30
+EXP3_SCALING_MIN_PREFILL_TOKENS_PER_SECOND = 100
+
+# Experiment 4: Context Strategies
+EXP4_COMPRESS_CHUNK_SIZE = 3
+# Map-reduce compress: summaries merged per reduce call, so the reduce tree has depth log_fan_in(chunks)
+EXP4_REDUCE_FAN_IN = 2
+# Upper bound on in-flight generate requests across all strategy chains
+EXP4_MAX_CONCURRENCY = 8
+# Compress benchmark: the base history is repeated this many times (the final state stays the same)
+EXP4_COMPRESS_HISTORY_REPEATS = [1, 4, 16]
+# History sweep: lengths (in actions) of the generated histories every strategy is run on
+EXP4_HISTORY_LENGTHS = [100, 1000, 10000]
+# History-sweep requests time out after a base plus their prompt tokens at the slowest prefill rate
+# still counted as an answer; each point's num_ctx fits its full-history baseline prompt
+EXP4_HISTORY_TIMEOUT_SECONDS = 30
+EXP4_HISTORY_MIN_PREFILL_TOKENS_PER_SECOND = 100
+# Select strategy: history lines most similar to the question, plus always the most recent ones
+# (K stays below the 10-action standard history, so selection drops lines there too)
+EXP4_SELECT_K = 4
+EXP4_SELECT_RECENT = 0
+EXP4_EMBEDDING_CACHE_DIR = os.path.join(CACHE_DIR, "action_embeddings")
+
+# Scheduler: one global queue of (model, experiment, trial) tasks
+# Requests the server serves in parallel (match OLLAMA_NUM_PARALLEL)
+SCHEDULER_HOST_CONCURRENCY = 4
+# Models with work in flight at once (match OLLAMA_MAX_LOADED_MODELS); more loads can evict each other
+SCHEDULER_MAX_RESIDENT_MODELS = 1
+# Task duration estimates used to order the queue: fixed overhead plus prompt tokens at the prefill rate
+SCHEDULER_TASK_OVERHEAD_SECONDS = 2.0
+SCHEDULER_PREFILL_TOKENS_PER_SECOND = 1000
+# Experiments that run as a single trial have no token estimate; rough whole-run durations instead
+SCHEDULER_EXPERIMENT_SECONDS = {1: 30.0, 2: 120.0, 3: 60.0, 4: 300.0}
+SCHEDULER_DEFAULT_TASK_SECONDS = 60.0
+# Host pool: each server's URL, parallel slots and the models it holds (None: every model).
+# OLLAMA_HOSTS="http://gpu1:11434,http://gpu2:11434" replaces the default single host with hosts serving every model
+OLLAMA_HOSTS: list[dict] = [
+    {"url": url if url.startswith("http") else f"http://{url}", "capacity": SCHEDULER_HOST_CONCURRENCY, "models": None}
+    for url in (u.strip() for u in os.environ.get("OLLAMA_HOSTS", OLLAMA_HOST).split(","))
+    if url
+]
+# A host that drops connections is skipped for this long, and its trial retried elsewhere up to this many times
+SCHEDULER_HOST_RETRY_SECONDS = 60.0
+SCHEDULER_MAX_ATTEMPTS = 3
+# How long the server keeps a model loaded after a queue-engine request (Ollama's keep_alive, e.g. "5m"), so
+# resident models stay loaded between tasks; a model the scheduler evicts is unloaded right away. Other engines
+# send 0 and unload the model once it is idle.
+SCHEDULER_KEEP_ALIVE = os.environ.get("BENCHMARK_SCHEDULER_KEEP_ALIVE", "5m")
+
+# Async engine: one event loop drives every model; SCHEDULER_MAX_RESIDENT_MODELS models run at once
+# Trials of one model in flight at once, across all of its experiments
+ASYNC_MODEL_CONCURRENCY = 4
+# Worker processes for CPU-bound steps such as haystack construction (started on first use)
+CPU_POOL_WORKERS = 2
+
+# Planner (--plan): used for models with no past responses to measure throughput from
+PLAN_DEFAULT_DECODE_TOKENS_PER_SECOND = 30
+PLAN_DEFAULT_OUTPUT_TOKENS = 100
+PLAN_DEFAULT_LOAD_SECONDS = 10.0
+
+# Tracing (tracing.py): spans are written to this Chrome trace file when set; off by default
+TRACE_FILE = os.environ.get("BENCHMARK_TRACE_FILE") or None
+
+# Startup benchmark (startup_benchmark.py): each entry point is imported cold this many times
+STARTUP_BENCHMARK_REPEATS = 3
+# Budgets written with --update-baselines are the measurements times this factor, plus the slack
+STARTUP_BUDGET_HEADROOM = 1.5
+STARTUP_BUDGET_SLACK_SECONDS = 0.1
+
+# Micro-benchmarks (micro_benchmark.py): input sizes in characters, and when a case counts as a regression
+MICRO_BENCHMARK_SCALES = [10_000, 100_000, 1_000_000, 10_000_000]
+MICRO_BENCHMARK_REPEATS = 5
+MICRO_BENCHMARK_THRESHOLD = 1.5
+MICRO_BENCHMARK_SLACK_SECONDS = 0.0001
+MICRO_BENCHMARK_SLACK_MB = 0.1
+
+# Live metrics (metrics.py): served on this localhost port and/or snapshotted to this file when set; off by default
+METRICS_PORT = int(os.environ["BENCHMARK_METRICS_PORT"]) if os.environ.get("BENCHMARK_METRICS_PORT") else None
+METRICS_SNAPSHOT_FILE = os.environ.get("BENCHMARK_METRICS_FILE") or None
+METRICS_SNAPSHOT_SECONDS = 15
+# Requests/s is averaged over this window
+METRICS_RATE_WINDOW_SECONDS = 60
+# Upper bounds of the request latency histogram buckets, in seconds
+METRICS_LATENCY_BUCKETS = [0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+
+# Load test (load_test.py): scenario grid, and the stand-in server's simulated model speed
+LOADTEST_CONCURRENCY = [1, 4, 16]
+LOADTEST_PROMPT_CHARS = [1_000, 10_000, 100_000]
+LOADTEST_REQUESTS = 32
+LOADTEST_SERVER_PARALLEL = 4
+LOADTEST_PREFILL_TOKENS_PER_SECOND = 50_000
+LOADTEST_DECODE_TOKENS_PER_SECOND = 1_000
+LOADTEST_OUTPUT_TOKENS = 16
 
 
 # Logging Setup
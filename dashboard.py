@@ -8,78 +8,78 @@ import seaborn as sns
 import streamlit as st
 
 import config
+from results_store import ResultsStore, flatten
 
 st.set_page_config(page_title="Context Benchmark Results", layout="wide")
 
 st.title("Context Horizons: LLM Benchmark Results")
 
 
+# Columns the dashboard reads from the results store
+COLUMNS = ["model", "experiment", "path", "key", "doc_count", "accuracy", "latency"]
+
+
 # Load data
 @st.cache_data
 def load_data():
-    results = []
-    if not os.path.exists(config.RESULTS_DIR):
-        return []
+    """Trials of the newest stored results of each model, plus summary files the store does not cover."""
+    store = ResultsStore()
+    frames = [store.read(columns=COLUMNS, latest=True)]
+    stored = set(store.models())
 
     files = glob.glob(os.path.join(config.RESULTS_DIR, "*_results.json"))
     for f in files:
-        # Skip detailed results for now, focus on summary
-        if (
-            "detailed" in os.path.basename(f)
-            or "needle" in os.path.basename(f)
-            and "results.json" in os.path.basename(f)
-            and "exp" not in os.path.basename(f)
-        ):
-            # detailed files usually named "info_retrieval_results.json" or similar.
-            # Summary files are "{model}_results.json"
-            pass
-
         try:
             with open(f) as file:
                 data = json.load(file)
-                if "model" in data:
-                    results.append(data)
         except Exception:
-            pass
+            continue
+        # Summary files are "{model}_results.json"; detailed files have no "model" key
+        if "model" not in data or data["model"] in stored:
+            continue
+        rows = [
+            dict(row, model=data["model"], experiment=key)
+            for key, value in data.items()
+            if key.startswith("exp")
+            for row in flatten(value)
+            if row["kind"] == "trial"
+        ]
+        frames.append(pd.DataFrame(rows, columns=COLUMNS))
+
+    frames = [frame for frame in frames if not frame.empty]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS)
 
-    return results
+
+def top_level(df, experiment):
+    """Trials stored directly under one of the experiment's keys (Exp 1 positions, Exp 3 arms, Exp 4 strategies)."""
+    rows = df[df["experiment"] == experiment]
+    return rows[rows["path"] == rows["key"].map(lambda key: json.dumps([key]))]
 
 
 data = load_data()
 
-if not data:
+if data.empty:
     st.warning("No results found in results/ directory.")
     st.info("Run 'python main.py' to generate results.")
     st.stop()
 
 # Sidebar
-model_names = sorted(list(set([d["model"] for d in data])))
+model_names = sorted(data["model"].unique())
 selected_models = st.sidebar.multiselect("Select Models", model_names, default=model_names)
 
-filtered_data = [d for d in data if d["model"] in selected_models]
+filtered_data = data[data["model"].isin(selected_models)]
 
-if not filtered_data:
+if filtered_data.empty:
     st.warning("No models selected.")
     st.stop()
 
 # Exp 1
 st.header("Experiment 1: Needle in Haystack (Quick)")
-exp1_data = []
-for d in filtered_data:
-    if "exp1_needle" in d and isinstance(d["exp1_needle"], dict):
-        for pos, metrics in d["exp1_needle"].items():
-            if isinstance(metrics, dict):
-                exp1_data.append(
-                    {
-                        "Model": d["model"],
-                        "Position": pos,
-                        "Accuracy": metrics.get("accuracy", 0),
-                        "Latency": metrics.get("latency", 0),
-                    }
-                )
-
-if exp1_data:
-    df1 = pd.DataFrame(exp1_data)
+exp1_data = top_level(filtered_data, "exp1_needle")
+
+if not exp1_data.empty:
+    df1 = exp1_data.rename(columns={"model": "Model", "key": "Position", "accuracy": "Accuracy", "latency": "Latency"})
+    df1 = df1[["Model", "Position", "Accuracy", "Latency"]].fillna(0)
 
     col1, col2 = st.columns(2)
     with col1:
@@ -102,21 +102,13 @@ if exp1_data:
 
 # Exp 2
 st.header("Experiment 2: Context Size")
-exp2_data = []
-for d in filtered_data:
-    if "exp2_size" in d and isinstance(d["exp2_size"], list):
-        for res in d["exp2_size"]:
-            exp2_data.append(
-                {
-                    "Model": d["model"],
-                    "Doc Count": res.get("doc_count", 0),
-                    "Accuracy": res.get("accuracy", 0),
-                    "Latency": res.get("latency", 0),
-                }
-            )
-
-if exp2_data:
-    df2 = pd.DataFrame(exp2_data)
+exp2_data = filtered_data[filtered_data["experiment"] == "exp2_size"]
+
+if not exp2_data.empty:
+    df2 = exp2_data.rename(
+        columns={"model": "Model", "doc_count": "Doc Count", "accuracy": "Accuracy", "latency": "Latency"}
+    )
+    df2 = df2[["Model", "Doc Count", "Accuracy", "Latency"]].fillna(0)
     st.subheader("Accuracy vs Context Size")
     st.line_chart(df2, x="Doc Count", y="Accuracy", color="Model")
 
@@ -125,38 +117,25 @@ if exp2_data:
 
 # Exp 3
 st.header("Experiment 3: RAG vs Full")
-exp3_data = []
-for d in filtered_data:
-    if "exp3_rag" in d and isinstance(d["exp3_rag"], dict):
-        rag = d["exp3_rag"].get("rag", {})
-        full = d["exp3_rag"].get("full_context", {})
-        exp3_data.append(
-            {
-                "Model": d["model"],
-                "RAG Accuracy": rag.get("accuracy", 0),
-                "Full Accuracy": full.get("accuracy", 0),
-                "RAG Latency": rag.get("latency", 0),
-                "Full Latency": full.get("latency", 0),
-            }
-        )
-
-if exp3_data:
-    df3 = pd.DataFrame(exp3_data)
+exp3_data = top_level(filtered_data, "exp3_rag")
+exp3_data = exp3_data[exp3_data["key"].isin(["rag", "full_context"])]
+
+if not exp3_data.empty:
+    df3 = pd.DataFrame({"Model": sorted(exp3_data["model"].unique())})
+    for column in ["accuracy", "latency"]:
+        for arm, label in [("rag", "RAG"), ("full_context", "Full")]:
+            arm_rows = exp3_data[exp3_data["key"] == arm].set_index("model")
+            df3[f"{label} {column.title()}"] = df3["Model"].map(arm_rows[column]).fillna(0)
     st.dataframe(df3)
 
 # Exp 4
 st.header("Experiment 4: Strategies")
-exp4_data = []
-for d in filtered_data:
-    if "exp4_strategies" in d and isinstance(d["exp4_strategies"], dict):
-        row = {"Model": d["model"]}
-        for strat, res in d["exp4_strategies"].items():
-            if isinstance(res, dict):
-                row[strat] = 1.0 if res.get("correct") else 0.0
-        exp4_data.append(row)
-
-if exp4_data:
-    df4 = pd.DataFrame(exp4_data).set_index("Model")
+exp4_data = top_level(filtered_data, "exp4_strategies")
+
+if not exp4_data.empty:
+    df4 = exp4_data.pivot(index="model", columns="key", values="accuracy").fillna(0)
+    df4.index.name = "Model"
+    df4.columns.name = None
     st.write(df4)
     fig, ax = plt.subplots()
     sns.heatmap(df4, annot=True, cmap="Blues", ax=ax, vmin=0, vmax=1)
@@ -7,18 +7,46 @@ from datetime import datetime
 from typing import Any, Dict, List, Literal, Optional, Union, cast
 
 import config
+import tracing
 from base import ExperimentBase
 from utils import (
     OllamaClient,
+    count_tokens,
     embed_fact,
     generate_filler_text,
     insert_secret_message,
     load_english_articles,
     load_text_from_file,
+    server_metrics,
 )
 
 logger = logging.getLogger(__name__)
 
+DETAILED_PROMPT_TEMPLATE = """Below is a passage of text. Please read it carefully and answer the following question:
+
+{question}
+
+<TEXT>
+{text}
+</TEXT>
+
+Please provide your answer clearly."""
+DETAILED_MAX_TOKENS = 500
+
+
+def build_haystack(source_file: str, prompt_length: int, position: str, secret_message: str) -> Optional[str]:
+    """Load the source text and insert the secret message.
+
+    Module-level so it can run in a worker process.
+
+    Returns:
+        The haystack, or None if the source text could not be loaded.
+    """
+    base_text = load_text_from_file(source_file, prompt_length)
+    if not base_text:
+        return None
+    return insert_secret_message(base_text, position, secret_message)
+
 
 class NeedleExperiment(ExperimentBase):
     ID = 1
@@ -68,7 +96,8 @@ class NeedleExperiment(ExperimentBase):
 
         for position in positions:
             logger.info(f"Testing position: {position}")
-            context = embed_fact(base_context, fact, position)
+            with tracing.span("prompt.build", position=position):
+                context = embed_fact(base_context, fact, position)
 
             start_time = time.time()
             response_data = self.client.generate_with_stats(
@@ -80,13 +109,15 @@ class NeedleExperiment(ExperimentBase):
             prompt_eval_count = response_data.get("prompt_eval_count", 0)
 
             # Evaluation
-            is_correct = expected_answer.lower() in response_text.lower()
+            with tracing.span("score", position=position):
+                is_correct = expected_answer.lower() in response_text.lower()
 
             results[position] = {
                 "accuracy": 1.0 if is_correct else 0.0,
                 "latency": latency,
                 "response": response_text,
                 "prompt_tokens": prompt_eval_count,
+                "server_metrics": server_metrics(response_data, latency),
             }
             logger.info(f"Position {position}: Correct={is_correct}, Latency={latency:.2f}s")
 
@@ -104,27 +135,21 @@ class NeedleExperiment(ExperimentBase):
         """Run a single async trial."""
         logger.info(f"Testing length={prompt_length}, position={position}")
 
-        # Load text (sync I/O is acceptable here as it's fast)
-        base_text = load_text_from_file(source_file, prompt_length)
-
-        if not base_text:
-            logger.warning(f"Could not load text from {source_file}, skipping")
-            return None
-
-        # Insert secret message
-        text_with_secret = insert_secret_message(base_text, position, secret_message)
-        include_secret = position != "control"
+        # Haystack construction is CPU-bound at large prompt lengths, so it runs off the event loop
+        loop = asyncio.get_running_loop()
+        with tracing.span("prompt.build", prompt_length=prompt_length, position=position):
+            text_with_secret = await loop.run_in_executor(
+                self.cpu_executor, build_haystack, source_file, prompt_length, position, secret_message
+            )
 
-        # Create prompt
-        prompt = f"""Below is a passage of text. Please read it carefully and answer the following question:
+            if text_with_secret is None:
+                logger.warning(f"Could not load text from {source_file}, skipping")
+                return None
 
-{question}
-
-<TEXT>
-{text_with_secret}
-</TEXT>
+            # Create prompt
+            prompt = DETAILED_PROMPT_TEMPLATE.format(question=question, text=text_with_secret)
 
-Please provide your answer clearly."""
+        include_secret = position != "control"
 
         # Run query
         experiment_id = f"{self.model}_{prompt_length}_{position}_{int(time.time())}"
@@ -132,14 +157,17 @@ Please provide your answer clearly."""
         start_time = time.time()
         try:
             # Use async generation
-            response_data = await self.client.generate_with_stats_async(prompt=prompt, temperature=0.1, max_tokens=500)
+            response_data = await self.client.generate_with_stats_async(
+                prompt=prompt, temperature=0.1, max_tokens=DETAILED_MAX_TOKENS
+            )
             query_time = time.time() - start_time
 
             response_text = response_data.get("response", "")
             token_count = response_data.get("prompt_eval_count", 0)
 
             # Detection
-            found_secret = expected_answer.upper() in response_text.upper()
+            with tracing.span("score", prompt_length=prompt_length, position=position):
+                found_secret = expected_answer.upper() in response_text.upper()
 
             result = {
                 "experiment_id": experiment_id,
@@ -163,6 +191,7 @@ Please provide your answer clearly."""
                     "prompt_eval_duration": response_data.get("prompt_eval_duration", 0),
                     "total_duration": response_data.get("total_duration", 0),
                 },
+                "server_metrics": server_metrics(response_data, query_time),
             }
 
             logger.info(f"Result: found={found_secret}, tokens={token_count}, time={query_time:.2f}s")
@@ -179,17 +208,13 @@ Please provide your answer clearly."""
         question: str = exp_cfg["question"]
         expected_answer: str = exp_cfg["expected_answer"]
         source_file: str = exp_cfg["source_file"]
-        prompt_lengths: List[int] = exp_cfg["prompt_lengths"]
-        positions: List[str] = exp_cfg["positions"]
 
-        tasks = []
-        for prompt_length in prompt_lengths:
-            for position in positions:
-                tasks.append(
-                    self._run_single_trial(
-                        prompt_length, position, secret_message, question, expected_answer, source_file
-                    )
-                )
+        tasks = [
+            self._run_single_trial(
+                trial["prompt_length"], trial["position"], secret_message, question, expected_answer, source_file
+            )
+            for trial in self.trials()
+        ]
 
         # Gather all results
         results = await asyncio.gather(*tasks)
@@ -202,30 +227,102 @@ Please provide your answer clearly."""
         # Run the async loop
         return asyncio.run(self._run_detailed_async())
 
-    def save_detailed_results(self, results: List[Dict[str, Any]], output_dir: Optional[str] = None):
-        """Save detailed experiment results to JSON."""
-        if output_dir is None:
-            output_dir = config.RESULTS_DIR
+    def trials(self) -> List[Dict[str, Any]]:
+        """One trial per (prompt length, position) in detailed modes; quick mode is a single trial."""
+        if self.mode == "quick":
+            return [{}]
+        exp_cfg = cast(Dict[str, Any], self.exp_config)
+        return [
+            # Prompt lengths are in characters, roughly four per token
+            {"prompt_length": prompt_length, "position": position, "estimated_tokens": prompt_length // 4}
+            for prompt_length in exp_cfg["prompt_lengths"]
+            for position in exp_cfg["positions"]
+        ]
+
+    def run_trial(self, trial: Dict[str, Any]) -> Any:
+        """Run a single (prompt length, position) trial of a detailed mode."""
+        if self.mode == "quick":
+            return self.run_quick()
+        return asyncio.run(self._run_trial_detailed(trial))
 
-        output_file = os.path.join(output_dir, f"{self.mode}_results.json")
+    async def run_trial_async(self, trial: Dict[str, Any]) -> Any:
+        if self.mode == "quick":
+            return await super().run_trial_async(trial)
+        return await self._run_trial_detailed(trial)
 
+    async def _run_trial_detailed(self, trial: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         exp_cfg = cast(Dict[str, Any], self.exp_config)
-        output = {
+        return await self._run_single_trial(
+            trial["prompt_length"],
+            trial["position"],
+            exp_cfg["secret_message"],
+            exp_cfg["question"],
+            exp_cfg["expected_answer"],
+            exp_cfg["source_file"],
+        )
+
+    def plan_requests(self, trial: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        exp_cfg = cast(Dict[str, Any], self.exp_config)
+        if self.mode == "quick":
+            # Filler text is sampled at random, so the payloads (and cache hits) are unknown
+            tokens = int(exp_cfg["context_words"] * 1.3)
+            return [{"prompt_tokens": tokens, "max_tokens": 2048, "cached": None} for _ in exp_cfg["positions"]]
+
+        text = build_haystack(
+            exp_cfg["source_file"], trial["prompt_length"], trial["position"], exp_cfg["secret_message"]
+        )
+        if text is None:
+            return []
+        prompt = DETAILED_PROMPT_TEMPLATE.format(question=exp_cfg["question"], text=text)
+        payload = self.client.generate_payload(prompt, temperature=0.1, max_tokens=DETAILED_MAX_TOKENS)
+        return [
+            {
+                "prompt_tokens": count_tokens(prompt),
+                "max_tokens": DETAILED_MAX_TOKENS,
+                "cached": self.client.is_cached(payload),
+            }
+        ]
+
+    def peak_concurrency(self) -> int:
+        # Detailed modes gather every trial at once
+        return 1 if self.mode == "quick" else len(self.trials())
+
+    def merge_trials(self, results: List[Any]) -> Any:
+        if self.mode == "quick":
+            return results[0]
+        # Failed trials return None
+        return [r for r in results if r is not None]
+
+    def detailed_output(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Detailed results with their experiment metadata, as saved to JSON.
+
+        The results may span several models (e.g. every model in a run journal);
+        the metadata lists each of them.
+        """
+        exp_cfg = cast(Dict[str, Any], self.exp_config)
+        return {
             "experiment_metadata": {
                 "experiment_name": f"needle-in-haystack-{self.mode}",
                 "date_run": datetime.now().isoformat(),
                 "secret_message": exp_cfg["secret_message"],
                 "source_file": exp_cfg.get("source_file", "N/A"),
                 "total_experiments": len(results),
-                "models": [self.model],
+                "models": list(dict.fromkeys(r["model"] for r in results)) or [self.model],
                 "prompt_lengths": exp_cfg["prompt_lengths"],
                 "positions": exp_cfg["positions"],
             },
             "results": results,
         }
 
+    def save_detailed_results(self, results: List[Dict[str, Any]], output_dir: Optional[str] = None):
+        """Save detailed experiment results to JSON."""
+        if output_dir is None:
+            output_dir = config.RESULTS_DIR
+
+        output_file = os.path.join(output_dir, f"{self.mode}_results.json")
+
         with open(output_file, "w") as f:
-            json.dump(output, f, indent=2)
+            json.dump(self.detailed_output(results), f, indent=2)
 
         logger.info(f"Saved {len(results)} results to {output_file}")
 
@@ -2,11 +2,12 @@ import json
 import logging
 import random
 import time
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 import config
+import tracing
 from base import ExperimentBase
-from utils import OllamaClient, count_tokens, load_english_articles
+from utils import OllamaClient, count_tokens, load_english_articles, server_metrics
 
 logger = logging.getLogger(__name__)
 
@@ -54,16 +55,21 @@ class ContextSizeExperiment(ExperimentBase):
             # Let's inject a specific unique ID into one document.
 
             unique_id = f"ID-{random.randint(*config.EXP2_ID_RANGE)}"
-            selected_docs[target_doc_idx] += f"\n\nUnique Reference ID: {unique_id}"
-            context = "\n\n".join(selected_docs)
+            with tracing.span("prompt.build", doc_count=doc_count):
+                selected_docs[target_doc_idx] += f"\n\nUnique Reference ID: {unique_id}"
+                context = "\n\n".join(selected_docs)
 
             query = "What is the Unique Reference ID mentioned in the text? Return only the ID."
 
             start_time = time.time()
-            response = self.client.generate(prompt=f"Context:\n{context}\n\nQuestion: {query}", temperature=0.1)
+            response_data = self.client.generate_with_stats(
+                prompt=f"Context:\n{context}\n\nQuestion: {query}", temperature=0.1
+            )
             latency = time.time() - start_time
+            response = response_data.get("response", "")
 
-            is_correct = unique_id in response
+            with tracing.span("score", doc_count=doc_count):
+                is_correct = unique_id in response
 
             logger.info(f"Docs: {doc_count}, Tokens: {token_count:.0f}, Correct: {is_correct}, Latency: {latency:.2f}s")
 
@@ -74,11 +80,23 @@ class ContextSizeExperiment(ExperimentBase):
                     "latency": latency,
                     "accuracy": 1.0 if is_correct else 0.0,
                     "response": response,
+                    "server_metrics": server_metrics(response_data, latency),
                 }
             )
 
         return results
 
+    def plan_requests(self, trial: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        # Documents are sampled at random, so only their average size is known
+        if not self.articles:
+            return []
+        doc_tokens = sum(count_tokens(a) for a in self.articles) / len(self.articles)
+        return [
+            {"prompt_tokens": int(doc_count * doc_tokens), "max_tokens": 2048, "cached": None}
+            for doc_count in config.EXP2_DOC_COUNTS
+            if doc_count <= len(self.articles)
+        ]
+
 
 if __name__ == "__main__":
     exp = ContextSizeExperiment(config.MODELS[0])
@@ -1,37 +1,246 @@
+import asyncio
 import json
 import logging
 import os
 import random
 import time
-from typing import Any, Dict
-
-# LangChain imports
-from langchain_chroma import Chroma
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Literal, Optional, Tuple
 
 import config
+import tracing
 from base import ExperimentBase
-from utils import OllamaClient, load_hebrew_articles
+from retrievers import CachedEmbeddings, NumpyRetriever, NumpyVectorIndex, create_retriever, default_embeddings
+from utils import (
+    OllamaClient,
+    average_server_metrics,
+    count_tokens,
+    embed_fact,
+    fit_num_ctx,
+    load_english_articles,
+    load_hebrew_documents,
+    prefill_timeout,
+    server_durations,
+    server_metrics,
+)
 
 logger = logging.getLogger(__name__)
 
+# Per-arm latency breakdown, in the order the stages happen
+TIMING_STAGES = ["embed_query", "search", "context_assembly", "load", "prefill", "decode", "other"]
+
+# Since it's Hebrew, we need a Hebrew query: "Does the text mention the following sentence? Answer yes or no."
+QUERY_TEMPLATE = "האם הטקסט מזכיר את המשפט הבא: '{fact}'? השב בכן או לא."
+
+MODES = ["single", "query_set", "sweep", "scaling"]
+
+# Scaling mode: every document carries one unique fact, so answers and retrieval hits can be checked exactly
+SCALING_FACT_TEMPLATE = "The archive code of record {index} is {code}."
+SCALING_QUERY_TEMPLATE = "What is the archive code of record {index}? Return only the code."
+
+
+def build_query_set(documents: Dict[str, str], size: int, seed: int = config.SEED) -> List[Dict[str, str]]:
+    """Generate (query, expected document) pairs from the corpus.
+
+    Documents are visited round-robin so every article is covered, and a
+    random sentence of each one becomes the fact to ask about.
+
+    Args:
+        documents: Mapping of source ID (file name) to document text.
+        size: Number of pairs to generate.
+        seed: Seed for sentence sampling.
+
+    Returns:
+        List of {"query", "source"} dictionaries.
+    """
+    rng = random.Random(seed)
+    sources, articles = list(documents), list(documents.values())
+    sentences = [[s.strip() for s in doc.split(".") if len(s.strip()) >= 20] for doc in articles]
+
+    pairs = []
+    for i in range(size):
+        doc_idx = i % len(articles)
+        fact = rng.choice(sentences[doc_idx]) if sentences[doc_idx] else articles[doc_idx][:100]
+        pairs.append({"query": QUERY_TEMPLATE.format(fact=fact), "source": sources[doc_idx]})
+    return pairs
+
+
+def load_query_set(path: str) -> List[Dict[str, str]]:
+    """Load (query, expected document) pairs from a JSON list of {"query", "source"} objects.
+
+    The source is the file name of the article that answers the query.
+
+    Raises:
+        ValueError: If an entry is missing the query or source.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        pairs: List[Dict[str, str]] = json.load(f)
+    for pair in pairs:
+        if "query" not in pair or "source" not in pair:
+            raise ValueError(f"Query set entries need 'query' and 'source' keys: {pair}")
+    return pairs
+
+
+def summarize_arm(arm_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Average accuracy, latency, prompt tokens and stage timings over the answered queries.
+
+    Failed and timed-out requests are counted as "errors" instead of wrong
+    answers; when no query was answered, only the error count is returned.
+    """
+    answered = [r for r in arm_results if "error" not in r]
+    n = len(answered)
+    errors = len(arm_results) - n
+    if n == 0:
+        return {"errors": errors}
+    return {
+        "accuracy": sum(r["accuracy"] for r in answered) / n,
+        "latency": sum(r["latency"] for r in answered) / n,
+        "prompt_tokens": sum(r["prompt_tokens"] for r in answered) / n,
+        "timings": {stage: sum(r["timings"][stage] for r in answered) / n for stage in TIMING_STAGES},
+        "server_metrics": average_server_metrics([r["server_metrics"] for r in answered if "server_metrics" in r]),
+        "errors": errors,
+    }
+
+
+def scaling_timeout(prompt_tokens: int) -> float:
+    """Request timeout of a scaling prompt (see prefill_timeout)."""
+    return prefill_timeout(
+        prompt_tokens, config.EXP3_SCALING_TIMEOUT_SECONDS, config.EXP3_SCALING_MIN_PREFILL_TOKENS_PER_SECOND
+    )
+
+
+def build_scaling_corpus(
+    base_articles: List[str], size: int, seed: int = config.SEED
+) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """Build a corpus of any size from real articles and seeded synthetic variants.
+
+    Document i is base article i (cycling through the base corpus); past the
+    base corpus it is a variant with the article's sentences in a seeded
+    order. Every document gets one unique fact in its middle. Each document
+    only depends on (seed, i), so smaller corpora are prefixes of larger ones.
+
+    Args:
+        base_articles: Real articles to build from.
+        size: Number of documents.
+        seed: Seed for the variants and facts.
+
+    Returns:
+        Tuple of (document text by source ID, fact code by source ID).
+    """
+    documents = {}
+    codes = {}
+    for i in range(size):
+        rng = random.Random(f"{seed}-{i}")
+        text = base_articles[i % len(base_articles)]
+        if i >= len(base_articles):
+            sentences = [s.strip() for s in text.split(".") if s.strip()]
+            rng.shuffle(sentences)
+            text = ". ".join(sentences) + "."
+        code = str(rng.randint(100000, 999999))
+        documents[f"doc_{i}"] = embed_fact(text, SCALING_FACT_TEMPLATE.format(index=i, code=code), "middle")
+        codes[f"doc_{i}"] = code
+    return documents, codes
+
+
+def full_context_window(documents: Dict[str, str], target: str, max_tokens: int) -> Tuple[str, int]:
+    """Concatenate as many documents as fit in max_tokens, always including the target.
+
+    The target document is placed in the middle of the included documents.
+
+    Returns:
+        Tuple of (context, number of documents included).
+    """
+    budget = max_tokens - count_tokens(documents[target])
+    included = []
+    for source, text in documents.items():
+        if source == target:
+            continue
+        tokens = count_tokens(text)
+        if tokens > budget:
+            break
+        included.append(text)
+        budget -= tokens
+    included.insert(len(included) // 2, documents[target])
+    return "\n\n".join(included), len(included)
+
+
+def find_crossover(points: List[Dict[str, Any]]) -> Dict[str, Optional[int]]:
+    """Smallest corpus sizes at which RAG beats full context on latency and on accuracy (None if never).
+
+    Points where an arm answered no query (every request failed or timed out) are skipped.
+    """
+    answered = [p for p in points if "latency" in p["rag"] and "latency" in p["full_context"]]
+    return {
+        "latency": next(
+            (p["num_documents"] for p in answered if p["rag"]["latency"] < p["full_context"]["latency"]), None
+        ),
+        "accuracy": next(
+            (p["num_documents"] for p in answered if p["rag"]["accuracy"] > p["full_context"]["accuracy"]), None
+        ),
+    }
+
+
+def prepare_shared_indexes(mode: str = "single") -> Dict[str, Dict[str, int]]:
+    """Build or update the shared indexes a run in this mode reads.
+
+    Called once in the parent process before workers fan out, so parallel
+    workers can open the indexes read-only instead of racing to build them.
+
+    Returns:
+        Update counts per retriever backend.
+    """
+    # Sweep and scaling indexes live in their own directories and are built under the build lock
+    documents = load_hebrew_documents()
+    if not documents or mode in ("sweep", "scaling"):
+        return {}
+    names = [config.EXP3_RETRIEVER]
+    if mode == "query_set":
+        names += [n for n in config.EXP3_BASELINE_RETRIEVERS if n not in names]
+
+    stats = {}
+    for name in names:
+        stats[name] = create_retriever(name).build(documents)
+        logger.info(f"Shared {name} index ready: {stats[name]}")
+    return stats
+
 
 class RagExperiment(ExperimentBase):
     ID = 3
     NAME = "RAG vs Full"
 
-    def __init__(self, model: str, **kwargs):
-        super().__init__(model, **kwargs)
+    def __init__(
+        self,
+        model: str,
+        mode: Literal["single", "query_set", "sweep", "scaling"] = "single",
+        read_only_index: bool = False,
+        **kwargs,
+    ):
+        """Initialize RAG experiment.
+
+        Args:
+            model: Model identifier
+            mode: "single" asks one random question; "query_set" evaluates a
+                batch of questions with batched retrieval and concurrent generation;
+                "sweep" runs the query set over chunk size / overlap / k combinations;
+                "scaling" grows a synthetic corpus to find where RAG overtakes full context
+            read_only_index: Open shared indexes prepared by prepare_shared_indexes()
+                without writing to them (used by parallel workers)
+        """
+        super().__init__(model, mode=mode, **kwargs)
+        if mode not in MODES:
+            raise ValueError(f"Invalid mode: {mode}. Must be one of {MODES}")
+        self.mode = mode
+        self.read_only_index = read_only_index
         self.client = OllamaClient(model)
-        self.articles = load_hebrew_articles()
-        # Use a shared directory for all models to avoid re-embedding
-        self.persist_directory = os.path.join(config.BASE_DIR, "chroma_db_shared")
+        # Keyed by file name, the source ID every index and query set uses
+        self.documents = load_hebrew_documents()
+        self.articles = list(self.documents.values())
+        # Use a shared directory for all models to avoid re-embedding (None: the backend's default)
+        self.persist_directory: Optional[str] = None
 
     def cleanup(self):
-        if hasattr(self, "vectorstore"):
-            self.vectorstore = None
+        if hasattr(self, "retriever"):
+            self.retriever = None
         # Do not delete the directory so it can be reused
         # if os.path.exists(self.persist_directory):
         #     shutil.rmtree(self.persist_directory)
@@ -40,40 +249,149 @@ class RagExperiment(ExperimentBase):
     def setup_rag(self):
         # Embed and Store
         # Note: Using nomic-embed-text for embeddings as it's standard with Ollama
-        embeddings = OllamaEmbeddings(model="nomic-embed-text", base_url=config.OLLAMA_HOST)
-
-        # Check if DB exists and reuse it
-        if os.path.exists(self.persist_directory):
-            logger.info(f"Loading existing RAG DB from {self.persist_directory}")
-            self.vectorstore = Chroma(persist_directory=self.persist_directory, embedding_function=embeddings)
-            # Basic check to ensure it's not empty (optional, but good for safety)
-            # If it's empty or broken, we might want to rebuild, but for now assume it's good if it exists.
-            return
-
-        logger.info("Creating new RAG DB...")
-
-        # Create documents
-        docs = [
-            Document(page_content=article, metadata={"source": f"doc_{i}"}) for i, article in enumerate(self.articles)
-        ]
-
-        # Split
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=config.EXP3_CHUNK_SIZE, chunk_overlap=50)
-        splits = text_splitter.split_documents(docs)
-
-        self.vectorstore = Chroma.from_documents(
-            documents=splits,
-            embedding=embeddings,
-            persist_directory=self.persist_directory,
+        self.retriever = create_retriever(config.EXP3_RETRIEVER, persist_directory=self.persist_directory)
+        # The index manifest decides whether the shared store still matches the corpus
+        start_time = time.perf_counter()
+        self._open_index(self.retriever)
+        self.index_build_seconds = time.perf_counter() - start_time
+
+    def _open_index(self, retriever: Any):
+        """Build a shared index, or only verify it when it was prepared by the parent process."""
+        if self.read_only_index:
+            retriever.open_read_only(self.documents)
+        else:
+            retriever.build(self.documents)
+
+    def _arm_result(
+        self,
+        context: str,
+        response_data: Dict[str, Any],
+        latency: float,
+        request_seconds: float,
+        timings: Dict[str, float],
+    ) -> Dict[str, Any]:
+        """Build the result of one arm and complete its per-stage timings.
+
+        Args:
+            latency: End-to-end latency of the arm, retrieval stages included.
+            request_seconds: Client wall-clock time of the generate request alone.
+
+        Returns:
+            The arm result; an empty response_data (the request failed or timed
+            out) adds an "error" entry.
+        """
+        response = response_data.get("response", "")
+
+        # Prefill/decode come from the server; whatever is left is client and network overhead
+        server = server_durations(response_data)
+        timings.update({"load": server["load"], "prefill": server["prefill"], "decode": server["decode"]})
+        timings = {stage: timings.get(stage, 0.0) for stage in TIMING_STAGES if stage != "other"}
+        timings["other"] = max(0.0, latency - sum(timings.values()))
+
+        with tracing.span("score"):
+            accuracy = 1.0 if "כן" in response or "Yes" in response else 0.0
+
+        return {
+            "latency": latency,
+            "response": response,
+            "accuracy": accuracy,
+            "context_chars": len(context),
+            "prompt_tokens": response_data.get("prompt_eval_count", 0),
+            "timings": timings,
+            "server_metrics": server_metrics(response_data, request_seconds),
+            **({} if response_data else {"error": "request failed or timed out"}),
+        }
+
+    def _answer(self, context: str, query: str, start_time: float, timings: Dict[str, float]) -> Dict[str, Any]:
+        """Generate the answer for one arm.
+
+        Args:
+            context: Context passed to the model.
+            query: Question to answer.
+            start_time: perf_counter() value when the arm started.
+            timings: Client-side stage durations measured so far, in seconds.
+
+        Returns:
+            Arm result with end-to-end latency, response, accuracy and timings.
+        """
+        request_start = time.perf_counter()
+        response_data = self.client.generate_with_stats(
+            prompt=f"Context:\n{context}\n\nQuestion: {query}", temperature=0.1
+        )
+        end_time = time.perf_counter()
+        return self._arm_result(context, response_data, end_time - start_time, end_time - request_start, timings)
+
+    async def _answer_async(
+        self,
+        context: str,
+        query: str,
+        timings: Dict[str, float],
+        semaphore: asyncio.Semaphore,
+        **request_options: Any,
+    ) -> Dict[str, Any]:
+        """Async variant of _answer; the arm's latency is its client stages plus its own request.
+
+        request_options (num_ctx, timeout) are passed on to the generate request.
+        """
+        async with semaphore:
+            start_time = time.perf_counter()
+            response_data = await self.client.generate_with_stats_async(
+                prompt=f"Context:\n{context}\n\nQuestion: {query}", temperature=0.1, **request_options
+            )
+            request_seconds = time.perf_counter() - start_time
+        return self._arm_result(
+            context, response_data, request_seconds + sum(timings.values()), request_seconds, timings
         )
-        logger.info(f"RAG Setup complete. Stored {len(splits)} chunks.")
 
     def run(self) -> Dict[str, Any]:
         try:
+            if self.mode == "query_set":
+                return self._run_query_set()
+            if self.mode == "sweep":
+                return self._run_sweep()
+            if self.mode == "scaling":
+                return self._run_scaling()
             return self._run_experiment()
         finally:
             self.cleanup()
 
+    def plan_requests(self, trial: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Requests of every mode; a retrieved context is sized as k chunks of the mode's chunk size."""
+        arm = {"max_tokens": 2048, "cached": None}
+        # Chunk sizes are in characters, roughly four per token
+        rag_tokens = config.EXP3_RAG_K * config.EXP3_CHUNK_SIZE // 4
+
+        if self.mode == "scaling":
+            base_articles = self.articles + load_english_articles()
+            if not base_articles:
+                return []
+            # Documents cycle through the base articles (variants only reorder sentences)
+            doc_tokens = sum(count_tokens(a) for a in base_articles) / len(base_articles)
+            requests = []
+            for size in config.EXP3_SCALING_DOC_COUNTS:
+                full_tokens = min(int(size * doc_tokens), config.EXP3_SCALING_CONTEXT_TOKENS)
+                for _ in range(min(config.EXP3_SCALING_QUERIES, size)):
+                    requests += [dict(arm, prompt_tokens=full_tokens), dict(arm, prompt_tokens=rag_tokens)]
+            return requests
+
+        if not self.articles:
+            return []
+        queries = 1 if self.mode == "single" else len(self._query_pairs())
+        if self.mode == "sweep":
+            return [
+                dict(arm, prompt_tokens=k * size // 4)
+                for size in config.EXP3_SWEEP_CHUNK_SIZES
+                for overlap in config.EXP3_SWEEP_CHUNK_OVERLAPS
+                if overlap < size
+                for k in config.EXP3_SWEEP_K
+                for _ in range(queries)
+            ]
+        full_tokens = count_tokens("\n\n".join(self.articles))
+        return [dict(arm, prompt_tokens=tokens) for _ in range(queries) for tokens in (full_tokens, rag_tokens)]
+
+    def peak_concurrency(self) -> int:
+        return 1 if self.mode == "single" else config.EXP3_MAX_CONCURRENCY
+
     def _run_experiment(self) -> Dict[str, Any]:
         logger.info(f"Starting Experiment 3 (RAG vs Full) for {self.model}")
 
@@ -95,45 +413,493 @@ class RagExperiment(ExperimentBase):
             fact = sentences[len(sentences) // 2].strip()
 
         # Create a query
-        # Since it's Hebrew, we need a Hebrew query.
         # Assuming the model can handle "Summarize this: {fact}" or "Does the text mention {fact}?"
         # Let's use a simple retrieval check.
-        query = f"האם הטקסט מזכיר את המשפט הבא: '{fact}'? השב בכן או לא."
+        query = QUERY_TEMPLATE.format(fact=fact)
 
         results = {}
 
         # 1. Full Context
+        start_time = time.perf_counter()
+        with tracing.span("prompt.build", arm="full_context"):
+            full_context = "\n\n".join(self.articles)
+        timings = {"context_assembly": time.perf_counter() - start_time}
+        results["full_context"] = self._answer(full_context, query, start_time, timings)
+        logger.info(f"Full Context: Latency={results['full_context']['latency']:.2f}s")
+
+        # 2. RAG
+        start_time = time.perf_counter()
+        with tracing.span("retrieval.embed_query"):
+            encoded_query = self.retriever.encode_queries([query])
+        timings = {"embed_query": time.perf_counter() - start_time}
+
+        stage_start = time.perf_counter()
+        with tracing.span("retrieval.search", k=config.EXP3_RAG_K):
+            relevant_chunks = self.retriever.search(encoded_query, config.EXP3_RAG_K)[0]
+        timings["search"] = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        with tracing.span("prompt.build", arm="rag"):
+            rag_context = "\n\n".join([hit["text"] for hit in relevant_chunks])
+        timings["context_assembly"] = time.perf_counter() - stage_start
+
+        results["rag"] = self._answer(rag_context, query, start_time, timings)
+        logger.info(f"RAG: Latency={results['rag']['latency']:.2f}s")
+
+        return results
+
+    def _query_pairs(self) -> List[Dict[str, str]]:
+        """Query set from EXP3_QUERY_SET_FILE, or generated from the corpus.
+
+        Raises:
+            ValueError: If the query set is empty.
+        """
+        if config.EXP3_QUERY_SET_FILE:
+            pairs = load_query_set(config.EXP3_QUERY_SET_FILE)
+        else:
+            pairs = build_query_set(self.documents, config.EXP3_QUERY_SET_SIZE)
+        if not pairs:
+            raise ValueError(
+                f"Query set is empty (EXP3_QUERY_SET_FILE={config.EXP3_QUERY_SET_FILE}, "
+                f"EXP3_QUERY_SET_SIZE={config.EXP3_QUERY_SET_SIZE})"
+            )
+        return pairs
+
+    def _run_query_set(self) -> Dict[str, Any]:
+        """Evaluate many queries with one batched embedding and one vectorized search."""
+        logger.info(f"Starting Experiment 3 (RAG vs Full - Query Set Mode) for {self.model}")
+
+        if not self.articles:
+            logger.error("No Hebrew articles found.")
+            return {}
+
+        self.setup_rag()
+
+        pairs = self._query_pairs()
+        queries = [p["query"] for p in pairs]
+        k = config.EXP3_RAG_K
+
+        stage_start = time.perf_counter()
+        encoded_queries = self.retriever.encode_queries(queries)
+        embed_seconds = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        hits = self.retriever.search(encoded_queries, k)
+        search_seconds = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
         full_context = "\n\n".join(self.articles)
-        start_time = time.time()
-        full_response = self.client.generate(prompt=f"Context:\n{full_context}\n\nQuestion: {query}", temperature=0.1)
-        full_latency = time.time() - start_time
-
-        results["full_context"] = {
-            "latency": full_latency,
-            "response": full_response,
-            "accuracy": 1.0 if "כן" in full_response or "Yes" in full_response else 0.0,
+        full_assembly = time.perf_counter() - stage_start
+
+        rows = asyncio.run(
+            self._answer_query_set(pairs, hits, full_context, full_assembly, embed_seconds, search_seconds)
+        )
+
+        recall = sum(r["retrieval_hit"] for r in rows) / len(rows)
+        rag_summary = summarize_arm([r["rag"] for r in rows])
+        rag_summary["recall_at_k"] = recall
+        full_summary = summarize_arm([r["full_context"] for r in rows])
+
+        errors = f"errors full={full_summary['errors']} rag={rag_summary['errors']}"
+        if "accuracy" not in full_summary or "accuracy" not in rag_summary:
+            logger.warning(f"Query set: an arm answered no query ({errors})")
+        else:
+            logger.info(
+                f"Query set: {len(rows)} queries, recall@{k}={recall:.2f}, "
+                f"accuracy full={full_summary['accuracy']:.2f} rag={rag_summary['accuracy']:.2f}, {errors}"
+            )
+
+        retrievers = {
+            self.retriever.NAME: {
+                "index_build_seconds": self.index_build_seconds,
+                "query_latency": (embed_seconds + search_seconds) / len(pairs),
+                "recall_at_k": recall,
+            }
         }
-        logger.info(f"Full Context: Latency={full_latency:.2f}s")
+        retrievers.update(self._evaluate_baseline_retrievers(pairs, k))
 
-        # 2. RAG
-        start_time = time.time()
-        retriever = self.vectorstore.as_retriever(search_kwargs={"k": config.EXP3_RAG_K})
-        relevant_docs = retriever.invoke(query)
-        rag_context = "\n\n".join([d.page_content for d in relevant_docs])
-
-        rag_response = self.client.generate(prompt=f"Context:\n{rag_context}\n\nQuestion: {query}", temperature=0.1)
-        rag_latency = time.time() - start_time
-
-        results["rag"] = {
-            "latency": rag_latency,
-            "response": rag_response,
-            "accuracy": 1.0 if "כן" in rag_response or "Yes" in rag_response else 0.0,
+        return {
+            "mode": "query_set",
+            "num_queries": len(rows),
+            "k": k,
+            "retrieval": {
+                "recall_at_k": recall,
+                "embed_seconds": embed_seconds,
+                "search_seconds": search_seconds,
+            },
+            "retrievers": retrievers,
+            "full_context": full_summary,
+            "rag": rag_summary,
+            "queries": rows,
         }
-        logger.info(f"RAG: Latency={rag_latency:.2f}s")
 
-        return results
+    def _evaluate_baseline_retrievers(self, pairs: List[Dict[str, str]], k: int) -> Dict[str, Dict[str, float]]:
+        """Measure index build time, per-query latency and recall@k of EXP3_BASELINE_RETRIEVERS.
+
+        Only retrieval is evaluated; the RAG arm keeps using the configured retriever.
+        """
+        queries = [p["query"] for p in pairs]
+        stats = {}
+        for name in config.EXP3_BASELINE_RETRIEVERS:
+            if name == self.retriever.NAME:
+                continue
+            try:
+                start_time = time.perf_counter()
+                retriever = create_retriever(name)
+                self._open_index(retriever)
+                build_seconds = time.perf_counter() - start_time
+
+                start_time = time.perf_counter()
+                hits = retriever.retrieve(queries, k)
+                query_seconds = time.perf_counter() - start_time
+            except Exception as e:
+                logger.error(f"Baseline retriever {name} failed: {e}")
+                continue
+
+            recall = sum(p["source"] in [hit["source"] for hit in h] for p, h in zip(pairs, hits)) / len(pairs)
+            stats[name] = {
+                "index_build_seconds": build_seconds,
+                "query_latency": query_seconds / len(pairs),
+                "recall_at_k": recall,
+            }
+            logger.info(
+                f"Baseline retriever {name}: build={build_seconds:.2f}s, "
+                f"latency={stats[name]['query_latency'] * 1000:.2f}ms/query, recall@{k}={recall:.2f}"
+            )
+        return stats
+
+    async def _answer_query_set(
+        self,
+        pairs: List[Dict[str, str]],
+        hits: List[List[Dict[str, Any]]],
+        full_context: str,
+        full_assembly: float,
+        embed_seconds: float,
+        search_seconds: float,
+    ) -> List[Dict[str, Any]]:
+        """Run both arms for every query concurrently, bounded by EXP3_MAX_CONCURRENCY."""
+        semaphore = asyncio.Semaphore(config.EXP3_MAX_CONCURRENCY)
+        n = len(pairs)
+        tasks = []
+        for pair, query_hits in zip(pairs, hits):
+            stage_start = time.perf_counter()
+            rag_context = "\n\n".join([hit["text"] for hit in query_hits])
+            # Embedding and search ran once for the whole batch, so each query gets its share
+            rag_timings = {
+                "embed_query": embed_seconds / n,
+                "search": search_seconds / n,
+                "context_assembly": time.perf_counter() - stage_start,
+            }
+            tasks.append(
+                self._answer_async(full_context, pair["query"], {"context_assembly": full_assembly}, semaphore)
+            )
+            tasks.append(self._answer_async(rag_context, pair["query"], rag_timings, semaphore))
+
+        answers = await asyncio.gather(*tasks)
+
+        rows = []
+        for i, (pair, query_hits) in enumerate(zip(pairs, hits)):
+            retrieved_sources = [hit["source"] for hit in query_hits]
+            rows.append(
+                {
+                    "query": pair["query"],
+                    "expected_source": pair["source"],
+                    "retrieved_sources": retrieved_sources,
+                    "retrieval_hit": pair["source"] in retrieved_sources,
+                    "full_context": answers[2 * i],
+                    "rag": answers[2 * i + 1],
+                }
+            )
+        return rows
+
+    def _run_sweep(self) -> Dict[str, Any]:
+        """Evaluate every chunk size / overlap / k combination on the query set.
+
+        Index variants use the in-process NumPy backend and share one
+        content-hash embedding cache, so chunk texts common to several variants
+        are embedded once. The variants are then built in parallel and every
+        (variant, k) configuration reuses the same query embeddings.
+        """
+        logger.info(f"Starting Experiment 3 (RAG Sweep Mode) for {self.model}")
+
+        if not self.articles:
+            logger.error("No Hebrew articles found.")
+            return {}
+
+        embeddings = CachedEmbeddings(default_embeddings())
+        retrievers: Dict[Tuple[int, int], NumpyRetriever] = {
+            (size, overlap): NumpyRetriever(
+                os.path.join(config.EXP3_SWEEP_INDEX_DIR, f"cs{size}_ov{overlap}"),
+                embeddings=embeddings,
+                chunk_size=size,
+                chunk_overlap=overlap,
+            )
+            for size in config.EXP3_SWEEP_CHUNK_SIZES
+            for overlap in config.EXP3_SWEEP_CHUNK_OVERLAPS
+            if overlap < size
+        }
+
+        # Embed the union of all variants' new chunks in one pass, before any index is built
+        stage_start = time.perf_counter()
+        new_chunks = [c.page_content for r in retrievers.values() for c in r.rag_index.plan(self.documents)["add"]]
+        embedded = embeddings.warm(new_chunks)
+        embed_seconds = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(retrievers)) as pool:
+            build_stats = dict(zip(retrievers, pool.map(lambda r: r.build(self.documents), retrievers.values())))
+        build_seconds = time.perf_counter() - stage_start
+        logger.info(
+            f"Built {len(retrievers)} index variants in {build_seconds:.2f}s "
+            f"({embedded} chunks embedded, {len(new_chunks) - embedded} from cache)"
+        )
+
+        pairs = self._query_pairs()
+        stage_start = time.perf_counter()
+        encoded_queries = NumpyVectorIndex.normalize(embeddings.embed_queries([p["query"] for p in pairs]))
+        query_embed_seconds = time.perf_counter() - stage_start
+
+        configurations = asyncio.run(
+            self._evaluate_sweep(pairs, encoded_queries, query_embed_seconds, retrievers, build_stats)
+        )
+        for c in configurations:
+            name = f"chunk_size={c['chunk_size']} overlap={c['chunk_overlap']} k={c['k']}"
+            if c["accuracy"] is None:
+                logger.warning(f"{name}: no query answered ({c['errors']} errors)")
+                continue
+            logger.info(
+                f"{name}: recall={c['recall_at_k']:.2f} accuracy={c['accuracy']:.2f} "
+                f"context_tokens={c['context_tokens']:.0f} latency={c['latency']:.2f}s errors={c['errors']}"
+            )
+        answered = [c for c in configurations if c["accuracy"] is not None]
+
+        return {
+            "mode": "sweep",
+            "num_queries": len(pairs),
+            "embedding": {
+                "chunks_needed": len(new_chunks),
+                "chunks_embedded": embedded,
+                "seconds": embed_seconds,
+            },
+            "index_build_seconds": build_seconds,
+            "configurations": configurations,
+            # Most accurate configuration, ties broken by the smallest context
+            "best": max(answered, key=lambda c: (c["accuracy"], -c["context_tokens"]), default=None),
+        }
+
+    async def _evaluate_sweep(
+        self,
+        pairs: List[Dict[str, str]],
+        encoded_queries: Any,
+        query_embed_seconds: float,
+        retrievers: Dict[Tuple[int, int], NumpyRetriever],
+        build_stats: Dict[Tuple[int, int], Dict[str, int]],
+    ) -> List[Dict[str, Any]]:
+        """Generate answers for every (variant, k, query) concurrently and summarize per configuration."""
+        semaphore = asyncio.Semaphore(config.EXP3_MAX_CONCURRENCY)
+        n = len(pairs)
+        max_k = max(config.EXP3_SWEEP_K)
+
+        jobs = []
+        tasks = []
+        for (size, overlap), retriever in retrievers.items():
+            stage_start = time.perf_counter()
+            # Hits are sorted, so the top-k for every smaller k is a prefix of one max-k search
+            hits = retriever.search(encoded_queries, max_k)
+            search_seconds = time.perf_counter() - stage_start
+
+            for k in config.EXP3_SWEEP_K:
+                for pair, query_hits in zip(pairs, hits):
+                    stage_start = time.perf_counter()
+                    context = "\n\n".join([hit["text"] for hit in query_hits[:k]])
+                    timings = {
+                        "embed_query": query_embed_seconds / n,
+                        "search": search_seconds / n,
+                        "context_assembly": time.perf_counter() - stage_start,
+                    }
+                    hit = pair["source"] in [h["source"] for h in query_hits[:k]]
+                    jobs.append(((size, overlap, k), hit))
+                    tasks.append(self._answer_async(context, pair["query"], timings, semaphore))
+
+        answers = await asyncio.gather(*tasks)
+
+        grouped: Dict[Tuple[int, int, int], List[Tuple[bool, Dict[str, Any]]]] = {}
+        for (key, hit), answer in zip(jobs, answers):
+            grouped.setdefault(key, []).append((hit, answer))
+
+        configurations = []
+        for (size, overlap, k), entries in grouped.items():
+            summary = summarize_arm([answer for _, answer in entries])
+            configurations.append(
+                {
+                    "chunk_size": size,
+                    "chunk_overlap": overlap,
+                    "k": k,
+                    "num_chunks": build_stats[(size, overlap)]["total"],
+                    "recall_at_k": sum(hit for hit, _ in entries) / len(entries),
+                    # None when every request of the configuration failed
+                    "accuracy": summary.get("accuracy"),
+                    "context_tokens": summary.get("prompt_tokens"),
+                    "context_chars": sum(a["context_chars"] for _, a in entries) / len(entries),
+                    "latency": summary.get("latency"),
+                    "timings": summary.get("timings"),
+                    "server_metrics": summary.get("server_metrics"),
+                    "errors": summary["errors"],
+                }
+            )
+        return configurations
+
+    def _run_scaling(self) -> Dict[str, Any]:
+        """Compare RAG with full context on corpora from tens to tens of thousands of documents.
+
+        Each corpus size gets its own index (EXP3_SCALING_RETRIEVER) built
+        through a shared embedding cache, so a chunk is embedded once across
+        all sizes. The full-context arm sees as many documents as fit in
+        EXP3_SCALING_CONTEXT_TOKENS, always including the one that answers
+        the query.
+        """
+        logger.info(f"Starting Experiment 3 (RAG Scaling Mode) for {self.model}")
+
+        base_articles = self.articles + load_english_articles()
+        if not base_articles:
+            logger.error("No articles found.")
+            return {}
+
+        embeddings = CachedEmbeddings(default_embeddings())
+        k = config.EXP3_RAG_K
+        points = []
+        for size in sorted(config.EXP3_SCALING_DOC_COUNTS):
+            documents, codes = build_scaling_corpus(base_articles, size)
+            retriever = create_retriever(
+                config.EXP3_SCALING_RETRIEVER,
+                persist_directory=os.path.join(
+                    config.EXP3_SCALING_INDEX_DIR, f"{config.EXP3_SCALING_RETRIEVER}_n{size}"
+                ),
+                embeddings=embeddings,
+            )
+
+            misses_before = embeddings.misses
+            start_time = time.perf_counter()
+            build_stats = retriever.build(documents)
+            build_seconds = time.perf_counter() - start_time
+
+            rng = random.Random(f"{config.SEED}-queries-{size}")
+            targets = rng.sample(range(size), min(config.EXP3_SCALING_QUERIES, size))
+            pairs = [
+                {"query": SCALING_QUERY_TEMPLATE.format(index=i), "source": f"doc_{i}", "code": codes[f"doc_{i}"]}
+                for i in targets
+            ]
+
+            stage_start = time.perf_counter()
+            encoded_queries = retriever.encode_queries([p["query"] for p in pairs])
+            embed_seconds = time.perf_counter() - stage_start
+            stage_start = time.perf_counter()
+            hits = retriever.search(encoded_queries, k)
+            search_seconds = time.perf_counter() - stage_start
+
+            full_results, rag_results, docs_in_context = asyncio.run(
+                self._answer_scaling(pairs, hits, documents, embed_seconds, search_seconds)
+            )
+            recall = sum(p["source"] in [h["source"] for h in query_hits] for p, query_hits in zip(pairs, hits))
+
+            point: Dict[str, Any] = {
+                "num_documents": size,
+                "num_chunks": build_stats["total"],
+                "index_build_seconds": build_seconds,
+                "chunks_embedded": embeddings.misses - misses_before,
+                "retrieval": {
+                    "latency": (embed_seconds + search_seconds) / len(pairs),
+                    "recall_at_k": recall / len(pairs),
+                },
+                "full_context": {
+                    **summarize_arm(full_results),
+                    "documents_in_context": sum(docs_in_context) / len(docs_in_context),
+                    "truncated": min(docs_in_context) < size,
+                },
+                "rag": summarize_arm(rag_results),
+            }
+            points.append(point)
+            full, rag = point["full_context"], point["rag"]
+            errors = f"errors full={full['errors']} rag={rag['errors']}"
+            if "latency" not in full or "latency" not in rag:
+                logger.warning(f"{size} documents: an arm answered no query ({errors})")
+                continue
+            logger.info(
+                f"{size} documents: build={build_seconds:.2f}s, recall@{k}={point['retrieval']['recall_at_k']:.2f}, "
+                f"full latency={full['latency']:.2f}s (prefill {full['timings']['prefill']:.2f}s), "
+                f"rag latency={rag['latency']:.2f}s, accuracy full={full['accuracy']:.2f} rag={rag['accuracy']:.2f}, "
+                f"{errors}"
+            )
+
+        crossover = find_crossover(points)
+        logger.info(f"RAG overtakes full context at: {crossover}")
+        return {
+            "mode": "scaling",
+            "k": k,
+            "retriever": config.EXP3_SCALING_RETRIEVER,
+            "context_tokens_limit": config.EXP3_SCALING_CONTEXT_TOKENS,
+            "points": points,
+            "crossover": crossover,
+        }
+
+    async def _answer_scaling(
+        self,
+        pairs: List[Dict[str, str]],
+        hits: List[List[Dict[str, Any]]],
+        documents: Dict[str, str],
+        embed_seconds: float,
+        search_seconds: float,
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[int]]:
+        """Run both arms for every scaling query concurrently; accuracy is an exact fact-code match.
+
+        Every request of a corpus size runs with one num_ctx, sized to its
+        largest full-context prompt, so the arms share a loaded model instead
+        of reloading it between each other. Each request times out after
+        scaling_timeout() of its own prompt; failed and timed-out answers keep
+        their "error" and are not scored.
+        """
+        semaphore = asyncio.Semaphore(config.EXP3_MAX_CONCURRENCY)
+        n = len(pairs)
+        arms = []
+        docs_in_context = []
+        for pair, query_hits in zip(pairs, hits):
+            stage_start = time.perf_counter()
+            full_context, included = full_context_window(documents, pair["source"], config.EXP3_SCALING_CONTEXT_TOKENS)
+            full_timings = {"context_assembly": time.perf_counter() - stage_start}
+            docs_in_context.append(included)
+
+            stage_start = time.perf_counter()
+            rag_context = "\n\n".join([hit["text"] for hit in query_hits])
+            rag_timings = {
+                "embed_query": embed_seconds / n,
+                "search": search_seconds / n,
+                "context_assembly": time.perf_counter() - stage_start,
+            }
+            arms.append((full_context, pair["query"], full_timings))
+            arms.append((rag_context, pair["query"], rag_timings))
+
+        prompt_tokens = [count_tokens(context) + count_tokens(query) for context, query, _ in arms]
+        num_ctx = fit_num_ctx(max(prompt_tokens))
+        answers = await asyncio.gather(
+            *(
+                self._answer_async(context, query, timings, semaphore, num_ctx=num_ctx, timeout=scaling_timeout(tokens))
+                for (context, query, timings), tokens in zip(arms, prompt_tokens)
+            )
+        )
+        for i, pair in enumerate(pairs):
+            for answer in answers[2 * i : 2 * i + 2]:
+                if "error" not in answer:
+                    answer["accuracy"] = 1.0 if pair["code"] in answer["response"] else 0.0
+        return answers[0::2], answers[1::2], docs_in_context
 
 
 if __name__ == "__main__":
-    exp = RagExperiment(config.MODELS[0])
-    print(json.dumps(exp.run(), indent=2))
+    import sys
+
+    mode_arg = sys.argv[1] if len(sys.argv) > 1 else "single"
+    if mode_arg not in MODES:
+        print(f"Invalid mode: {mode_arg}")
+        sys.exit(1)
+
+    exp = RagExperiment(config.MODELS[0], mode=mode_arg)  # type: ignore[arg-type]
+    print(json.dumps(exp.run(), indent=2, ensure_ascii=False))
@@ -1,20 +1,74 @@
+import asyncio
 import json
 import logging
-from typing import Any, Dict
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Literal, Optional, Tuple
+
+import numpy as np
 
 import config
+import tracing
+from action_history import generate_history
 from base import ExperimentBase
-from utils import OllamaClient
+from retrievers import CachedEmbeddings, NumpyVectorIndex, default_embeddings
+from utils import (
+    OllamaClient,
+    add_server_stats,
+    count_tokens,
+    fit_num_ctx,
+    prefill_timeout,
+    server_durations,
+    server_metrics,
+)
 
 logger = logging.getLogger(__name__)
 
+# Strategy names, in result order; each is an async chain method named _<strategy>
+STRATEGIES = ["baseline", "select", "compress", "write"]
+# Compared by compress_benchmark only, so the standard and history-sweep results keep their strategies
+COMPRESS_STRATEGIES = ["compress", "compress_mapreduce"]
+
+MODES = ["standard", "compress_benchmark", "history_sweep"]
+
+# Prompts of the strategy chains, shared with plan_requests
+ANSWER_PROMPT = "{label}:\n{context}\n\nQuestion: {question}\nAnswer with just the location name."
+COMPRESS_PROMPT = (
+    "Current Summary: {summary}\nNew Actions:\n{chunk}\n\nUpdate the summary of where items are located. Keep it brief."
+)
+MAP_PROMPT = "Actions:\n{chunk}\n\nSummarize where items are located after these actions. Keep it brief."
+REDUCE_PROMPT = (
+    "Summaries of consecutive periods, oldest first:\n\n{parts}\n\n"
+    "Merge them into one brief summary of where items are located now. Later parts override earlier ones."
+)
+WRITE_PROMPT = (
+    "{scratchpad}\nAction: {action}\n\nUpdate the Current State JSON to reflect item locations. Return only JSON."
+)
+INITIAL_SCRATCHPAD = "Current State: {}"
+
+# A strategy chain answers a task ({"actions", "question", "expected_answer"}) and adds its cost to usage
+StrategyChain = Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[str]]
+
 
 class StrategiesExperiment(ExperimentBase):
     ID = 4
     NAME = "Context Strategies"
 
-    def __init__(self, model: str, **kwargs):
-        super().__init__(model, **kwargs)
+    def __init__(
+        self, model: str, mode: Literal["standard", "compress_benchmark", "history_sweep"] = "standard", **kwargs
+    ):
+        """Initialize strategies experiment.
+
+        Args:
+            model: Model identifier
+            mode: "standard" runs the STRATEGIES on the action history;
+                "compress_benchmark" compares the sequential and map-reduce
+                compress strategies as the history grows; "history_sweep" runs
+                the STRATEGIES on generated histories of EXP4_HISTORY_LENGTHS actions
+        """
+        super().__init__(model, mode=mode, **kwargs)
+        if mode not in MODES:
+            raise ValueError(f"Invalid mode: {mode}. Must be one of {MODES}")
+        self.mode = mode
         self.client = OllamaClient(model)
         self.actions = [
             "I enter the Kitchen.",
@@ -30,77 +84,350 @@ class StrategiesExperiment(ExperimentBase):
         ]
         self.final_question = "Where is the Apple?"
         self.expected_answer = "Table"  # Living Room Table
+        # Recreated for every asyncio.run() in _run_strategies
+        self._semaphore = asyncio.Semaphore(config.EXP4_MAX_CONCURRENCY)
+        # History-line embeddings for the select strategy, loaded on first use
+        self._action_embeddings: Optional[CachedEmbeddings] = None
+        # Context window of the history-sweep point being run (None: the server's default)
+        self._num_ctx: Optional[int] = None
+
+    def peak_concurrency(self) -> int:
+        return config.EXP4_MAX_CONCURRENCY
+
+    def plan_requests(self, trial: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Requests of every strategy chain this mode runs.
+
+        A chain's first prompts are exact, so their cache status is known.
+        Prompts that embed earlier responses (summaries, the scratchpad)
+        count PLAN_DEFAULT_OUTPUT_TOKENS per response, and the select
+        strategy's context counts EXP4_SELECT_K + EXP4_SELECT_RECENT average lines.
+        """
+        return [request for names, task in self._workload() for name in names for request in self._plan(name, task)]
+
+    def _workload(self) -> List[Tuple[List[str], Dict[str, Any]]]:
+        """The (strategies, task) pairs run() evaluates in this mode."""
+        if self.mode == "compress_benchmark":
+            return [
+                (COMPRESS_STRATEGIES, self._task(self.actions * repeats))
+                for repeats in config.EXP4_COMPRESS_HISTORY_REPEATS
+            ]
+        if self.mode == "history_sweep":
+            return [
+                (STRATEGIES, generate_history(length, seed=config.SEED))
+                for length in sorted(config.EXP4_HISTORY_LENGTHS)
+            ]
+        return [(STRATEGIES, self._task(self.actions))]
+
+    def _plan(self, name: str, task: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Requests one strategy chain sends for a task, in chain order."""
+
+        num_ctx = self._task_num_ctx(task)
+
+        def exact(prompt: str) -> Dict[str, Any]:
+            payload = self.client.generate_payload(prompt, num_ctx=num_ctx)
+            return {"prompt_tokens": count_tokens(prompt), "max_tokens": 2048, "cached": self.client.is_cached(payload)}
+
+        def estimated(prompt: str, responses: int = 1) -> Dict[str, Any]:
+            tokens = count_tokens(prompt) + responses * config.PLAN_DEFAULT_OUTPUT_TOKENS
+            return {"prompt_tokens": tokens, "max_tokens": 2048, "cached": None}
+
+        actions = task["actions"]
+        chunk_size = config.EXP4_COMPRESS_CHUNK_SIZE
+        chunks = ["\n".join(actions[i : i + chunk_size]) for i in range(0, len(actions), chunk_size)]
+        answer = estimated(self._answer_prompt(task, "Summary of Events", ""))
+
+        if name == "baseline":
+            return [exact(self._answer_prompt(task, "History", "\n".join(actions)))]
+        if name == "select":
+            lines = min(len(actions), config.EXP4_SELECT_K + config.EXP4_SELECT_RECENT)
+            line_tokens = count_tokens("\n".join(actions)) / max(len(actions), 1)
+            request = estimated(self._answer_prompt(task, "Relevant History", ""), responses=0)
+            return [dict(request, prompt_tokens=request["prompt_tokens"] + int(lines * line_tokens))]
+        if name == "compress":
+            folds = [estimated(COMPRESS_PROMPT.format(summary="", chunk=chunk)) for chunk in chunks[1:]]
+            first = [exact(COMPRESS_PROMPT.format(summary="", chunk=chunk)) for chunk in chunks[:1]]
+            return first + folds + [answer]
+        if name == "compress_mapreduce":
+            requests = [exact(MAP_PROMPT.format(chunk=chunk)) for chunk in chunks]
+            fan_in = config.EXP4_REDUCE_FAN_IN
+            summaries = len(chunks)
+            while summaries > 1:
+                # Only groups of more than one summary are merged by a request
+                groups = [min(fan_in, summaries - i) for i in range(0, summaries, fan_in)]
+                requests += [estimated(REDUCE_PROMPT.format(parts=""), responses=size) for size in groups if size > 1]
+                summaries = len(groups)
+            return requests + [answer]
+        if name == "write":
+            steps = [estimated(WRITE_PROMPT.format(scratchpad="", action=action)) for action in actions[1:]]
+            first = [exact(WRITE_PROMPT.format(scratchpad=INITIAL_SCRATCHPAD, action=action)) for action in actions[:1]]
+            return first + steps + [estimated(self._answer_prompt(task, "Final State", ""))]
+        raise ValueError(f"Unknown strategy: {name}")
+
+    def _task_num_ctx(self, task: Dict[str, Any]) -> Optional[int]:
+        """Context window for a task's requests; None keeps the server's default.
+
+        History-sweep histories outgrow the default window, so each point is
+        sized to fit its largest prompt, the full-history baseline.
+        """
+        if self.mode != "history_sweep":
+            return None
+        return fit_num_ctx(count_tokens(self._answer_prompt(task, "History", "\n".join(task["actions"]))))
 
     def run(self) -> Dict[str, Any]:
         logger.info(f"Starting Experiment 4 (Strategies) for {self.model}")
-        results = {}
+        start_time = time.perf_counter()
+        if self.mode == "compress_benchmark":
+            results = asyncio.run(self._run_compress_benchmark())
+        elif self.mode == "history_sweep":
+            results = asyncio.run(self._run_history_sweep())
+        else:
+            results = asyncio.run(self._run_strategies(STRATEGIES, self._task(self.actions)))
+        logger.info(f"Experiment 4 finished in {time.perf_counter() - start_time:.2f}s")
+        return results
 
-        # 1. Baseline (Full History)
-        history = "\n".join(self.actions)
-        prompt = f"History:\n{history}\n\nQuestion: {self.final_question}\n" "Answer with just the location name."
-        resp = self.client.generate(prompt)
-        results["baseline"] = {
-            "response": resp,
-            "correct": self.expected_answer.lower() in resp.lower(),
+    def _task(self, actions: List[str]) -> Dict[str, Any]:
+        """Task over the given actions with the fixed question about the Apple."""
+        return {"actions": actions, "question": self.final_question, "expected_answer": self.expected_answer}
+
+    async def _run_strategies(self, names: List[str], task: Dict[str, Any]) -> Dict[str, Any]:
+        """Run every strategy as its own async chain; they share nothing, so they run concurrently."""
+        self._semaphore = asyncio.Semaphore(config.EXP4_MAX_CONCURRENCY)
+        outcomes = await asyncio.gather(*(self._run_strategy(getattr(self, f"_{name}"), task) for name in names))
+        return dict(zip(names, outcomes))
+
+    async def _run_compress_benchmark(self) -> Dict[str, Any]:
+        """Sequential fold vs map-reduce compression on ever longer histories.
+
+        The base history is repeated, so the expected answer stays the same
+        while the number of actions to compress grows.
+        """
+        points = []
+        for repeats in config.EXP4_COMPRESS_HISTORY_REPEATS:
+            actions = self.actions * repeats
+            outcomes = await self._run_strategies(COMPRESS_STRATEGIES, self._task(actions))
+            points.append({"history_length": len(actions), **outcomes})
+            logger.info(
+                f"History of {len(actions)} actions: "
+                + ", ".join(
+                    f"{name} wall={r['wall_time']:.2f}s tokens={r['prompt_tokens'] + r['eval_tokens']} "
+                    f"correct={r['correct']}"
+                    for name, r in outcomes.items()
+                )
+            )
+        return {"mode": "compress_benchmark", "points": points}
+
+    async def _run_history_sweep(self) -> Dict[str, Any]:
+        """Run every strategy on generated histories of growing length.
+
+        Each point records latency, tokens and correctness per strategy; the
+        break-even lengths are the shortest histories at which a strategy
+        beats the full-history baseline on latency and on accuracy. Points
+        where the strategy or the baseline failed are not compared.
+        """
+        points = []
+        for length in sorted(config.EXP4_HISTORY_LENGTHS):
+            history = generate_history(length, seed=config.SEED)
+            self._num_ctx = self._task_num_ctx(history)
+            try:
+                outcomes = await self._run_strategies(STRATEGIES, history)
+            finally:
+                self._num_ctx = None
+            points.append({"history_length": length, "question": history["question"], **outcomes})
+            logger.info(
+                f"History of {length} actions: "
+                + ", ".join(f"{name} wall={r['wall_time']:.2f}s correct={r['correct']}" for name, r in outcomes.items())
+            )
+
+        def answered(name: str) -> List[Dict[str, Any]]:
+            return [p for p in points if "error" not in p[name] and "error" not in p["baseline"]]
+
+        break_even = {
+            name: {
+                "latency": next(
+                    (p["history_length"] for p in answered(name) if p[name]["wall_time"] < p["baseline"]["wall_time"]),
+                    None,
+                ),
+                "accuracy": next(
+                    (
+                        p["history_length"]
+                        for p in answered(name)
+                        if p[name]["correct"] and not p["baseline"]["correct"]
+                    ),
+                    None,
+                ),
+            }
+            for name in STRATEGIES
+            if name != "baseline"
         }
+        logger.info(f"Break-even history lengths: {break_even}")
+        return {"mode": "history_sweep", "points": points, "break_even": break_even}
 
-        # 2. Select (Simulated RAG - picking relevant lines)
-        # Ideally we use embeddings, but for this simple list, keyword matching is a proxy
-        keywords = ["Apple", "put", "pick"]
-        selected = [a for a in self.actions if any(k in a for k in keywords)]
-        history_select = "\n".join(selected)
-        prompt = (
-            f"Relevant History:\n{history_select}\n\n"
-            f"Question: {self.final_question}\nAnswer with just the location name."
-        )
-        resp = self.client.generate(prompt)
-        results["select"] = {
+    async def _run_strategy(self, chain: StrategyChain, task: Dict[str, Any]) -> Dict[str, Any]:
+        """Run one strategy chain and record its answer and cost."""
+        usage: Dict[str, Any] = {
+            "calls": 0,
+            "embedding_calls": 0,
+            "prompt_tokens": 0,
+            "eval_tokens": 0,
+            "server_seconds": 0.0,
+            # Summed over the chain's requests for server_metrics
+            "server_stats": {},
+            "client_seconds": 0.0,
+        }
+        start_time = time.perf_counter()
+        error = None
+        with tracing.span("strategy", strategy=chain.__name__.lstrip("_")):
+            try:
+                resp = await chain(task, usage)
+            except Exception as e:
+                # One failing chain must not discard the results of the others
+                logger.error(f"Strategy {chain.__name__.lstrip('_')} failed: {e}")
+                resp, error = "", str(e)
+            with tracing.span("score"):
+                correct = task["expected_answer"].lower() in resp.lower()
+
+        server_stats, client_seconds = usage.pop("server_stats"), usage.pop("client_seconds")
+        result = {
             "response": resp,
-            "correct": self.expected_answer.lower() in resp.lower(),
+            "correct": correct,
+            **usage,
+            "wall_time": time.perf_counter() - start_time,
+            "server_metrics": server_metrics(server_stats, client_seconds),
         }
+        if error is not None:
+            result["error"] = error
+        return result
+
+    async def _generate(self, prompt: str, usage: Dict[str, Any]) -> str:
+        """Generate a response and add the call's token counts and server time to usage.
+
+        Raises:
+            RuntimeError: If the request failed or timed out, so the chain
+                records an error instead of scoring an empty answer
+        """
+        options: Dict[str, Any] = {}
+        if self._num_ctx is not None:
+            timeout = prefill_timeout(
+                count_tokens(prompt),
+                config.EXP4_HISTORY_TIMEOUT_SECONDS,
+                config.EXP4_HISTORY_MIN_PREFILL_TOKENS_PER_SECOND,
+            )
+            options = {"num_ctx": self._num_ctx, "timeout": timeout}
+        async with self._semaphore:
+            start_time = time.perf_counter()
+            response_data = await self.client.generate_with_stats_async(prompt, **options)
+            usage["client_seconds"] += time.perf_counter() - start_time
+        if not response_data:
+            raise RuntimeError("generate request failed or timed out")
+        add_server_stats(usage["server_stats"], response_data)
+        usage["calls"] += 1
+        usage["prompt_tokens"] += response_data.get("prompt_eval_count", 0)
+        usage["eval_tokens"] += response_data.get("eval_count", 0)
+        usage["server_seconds"] += server_durations(response_data)["server_total"]
+        response: str = response_data.get("response", "")
+        return response
+
+    @staticmethod
+    def _answer_prompt(task: Dict[str, Any], context_label: str, context: str) -> str:
+        return ANSWER_PROMPT.format(label=context_label, context=context, question=task["question"])
+
+    async def _answer(self, task: Dict[str, Any], context_label: str, context: str, usage: Dict[str, Any]) -> str:
+        """Ask the task's question over the context a strategy produced."""
+        return await self._generate(self._answer_prompt(task, context_label, context), usage)
+
+    async def _baseline(self, task: Dict[str, Any], usage: Dict[str, Any]) -> str:
+        """Full history."""
+        return await self._answer(task, "History", "\n".join(task["actions"]), usage)
+
+    async def _select(self, task: Dict[str, Any], usage: Dict[str, Any]) -> str:
+        """RAG over the history - the lines most similar to the question, in their original order."""
+        # Embedding requests are blocking, so keep them off the event loop the other chains share
+        selected = await asyncio.to_thread(self.select_actions, task["actions"], task["question"], usage)
+        return await self._answer(task, "Relevant History", "\n".join(selected), usage)
+
+    def select_actions(self, actions: List[str], question: str, usage: Dict[str, Any]) -> List[str]:
+        """Pick the EXP4_SELECT_K history lines most similar to the question, plus the last EXP4_SELECT_RECENT.
+
+        Every distinct line is embedded once and cached on disk, so a
+        selection costs one query embedding; when lines repeat, the most
+        recent occurrence wins.
+
+        Returns:
+            Selected lines in history order.
+        """
+        if self._action_embeddings is None:
+            self._action_embeddings = CachedEmbeddings(default_embeddings(), cache_dir=config.EXP4_EMBEDDING_CACHE_DIR)
+        embeddings = self._action_embeddings
+
+        unique_lines = list(dict.fromkeys(actions))
+        if embeddings.warm(unique_lines):
+            usage["embedding_calls"] += 1
+        line_vectors = NumpyVectorIndex.normalize(embeddings.embed_documents(unique_lines))
+        query_vector = NumpyVectorIndex.normalize(embeddings.embed_queries([question]))[0]
+        usage["embedding_calls"] += 1
+
+        row = {line: i for i, line in enumerate(unique_lines)}
+        scores = line_vectors[[row[a] for a in actions]] @ query_vector
 
-        # 3. Compress (Summarize every 3 steps)
+        # Stable sort over the reversed history: among equal scores, later lines come first
+        newest_first = np.argsort(-scores[::-1], kind="stable")[: config.EXP4_SELECT_K]
+        chosen = {len(actions) - 1 - i for i in newest_first.tolist()}
+        chosen.update(range(max(0, len(actions) - config.EXP4_SELECT_RECENT), len(actions)))
+        return [actions[i] for i in sorted(chosen)]
+
+    async def _compress(self, task: Dict[str, Any], usage: Dict[str, Any]) -> str:
+        """Fold the history into a running summary, a few actions at a time."""
+        actions = task["actions"]
         summary = ""
-        chunk_size = 3
-        for i in range(0, len(self.actions), chunk_size):
-            chunk = "\n".join(self.actions[i : i + chunk_size])
+        chunk_size = config.EXP4_COMPRESS_CHUNK_SIZE
+        for i in range(0, len(actions), chunk_size):
+            chunk = "\n".join(actions[i : i + chunk_size])
             # Ask model to update summary
-            prompt = (
-                f"Current Summary: {summary}\nNew Actions:\n{chunk}\n\n"
-                "Update the summary of where items are located. Keep it brief."
-            )
-            summary = self.client.generate(prompt)
+            summary = await self._generate(COMPRESS_PROMPT.format(summary=summary, chunk=chunk), usage)
 
-        prompt = (
-            f"Summary of Events:\n{summary}\n\nQuestion: {self.final_question}\n" "Answer with just the location name."
-        )
-        resp = self.client.generate(prompt)
-        results["compress"] = {
-            "response": resp,
-            "correct": self.expected_answer.lower() in resp.lower(),
-        }
+        return await self._answer(task, "Summary of Events", summary, usage)
 
-        # 4. Write (Scratchpad - update state after each step)
-        scratchpad = "Current State: {}"
-        for action in self.actions:
-            prompt = (
-                f"{scratchpad}\nAction: {action}\n\n"
-                "Update the Current State JSON to reflect item locations. Return only JSON."
-            )
-            scratchpad = self.client.generate(prompt)
+    async def _compress_mapreduce(self, task: Dict[str, Any], usage: Dict[str, Any]) -> str:
+        """Summarize chunks concurrently, then merge neighbouring summaries up a tree.
 
-        prompt = (
-            f"Final State:\n{scratchpad}\n\nQuestion: {self.final_question}\n" "Answer with just the location name."
-        )
-        resp = self.client.generate(prompt)
-        results["write"] = {
-            "response": resp,
-            "correct": self.expected_answer.lower() in resp.lower(),
-        }
+        Latency grows with the tree depth (log of the number of chunks)
+        instead of with the number of chunks.
+        """
+        actions = task["actions"]
+        chunk_size = config.EXP4_COMPRESS_CHUNK_SIZE
+        chunks = ["\n".join(actions[i : i + chunk_size]) for i in range(0, len(actions), chunk_size)]
+        summaries = await asyncio.gather(*(self._generate(MAP_PROMPT.format(chunk=chunk), usage) for chunk in chunks))
 
-        return results
+        fan_in = config.EXP4_REDUCE_FAN_IN
+        while len(summaries) > 1:
+            groups = [summaries[i : i + fan_in] for i in range(0, len(summaries), fan_in)]
+            summaries = await asyncio.gather(*(self._reduce(group, usage) for group in groups))
+
+        return await self._answer(task, "Summary of Events", summaries[0] if summaries else "", usage)
+
+    async def _reduce(self, summaries: List[str], usage: Dict[str, Any]) -> str:
+        """Merge summaries of consecutive periods into one; a single summary passes through."""
+        if len(summaries) == 1:
+            return summaries[0]
+        parts = "\n\n".join(f"Part {i + 1}:\n{summary}" for i, summary in enumerate(summaries))
+        return await self._generate(REDUCE_PROMPT.format(parts=parts), usage)
+
+    async def _write(self, task: Dict[str, Any], usage: Dict[str, Any]) -> str:
+        """Scratchpad - update state after each step."""
+        scratchpad = INITIAL_SCRATCHPAD
+        for action in task["actions"]:
+            scratchpad = await self._generate(WRITE_PROMPT.format(scratchpad=scratchpad, action=action), usage)
+
+        return await self._answer(task, "Final State", scratchpad, usage)
 
 
 if __name__ == "__main__":
-    exp = StrategiesExperiment(config.MODELS[0])
+    import sys
+
+    mode_arg = sys.argv[1] if len(sys.argv) > 1 else "standard"
+    if mode_arg not in MODES:
+        print(f"Invalid mode: {mode_arg}")
+        sys.exit(1)
+
+    exp = StrategiesExperiment(config.MODELS[0], mode=mode_arg)  # type: ignore[arg-type]
     print(json.dumps(exp.run(), indent=2))
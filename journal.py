@@ -0,0 +1,156 @@
+"""Append-only JSONL journal of finished trials, one file per benchmark run.
+
+Every trial is appended as soon as it finishes, so a crashed run loses at
+most the trials that were in flight. Resuming a run skips every trial already
+in its journal, and the summary files are rebuilt from the journal rather
+than from whatever one process held in memory.
+"""
+
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import config
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent appends are not serialized
+    fcntl = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+
+def new_run_id() -> str:
+    return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def latest_run_id(directory: Optional[str] = None) -> Optional[str]:
+    """Return the ID of the most recently modified journal, if any."""
+    directory = directory or config.JOURNAL_DIR
+    if not os.path.isdir(directory):
+        return None
+    journals = [f for f in os.listdir(directory) if f.endswith(".jsonl")]
+    if not journals:
+        return None
+    latest = max(journals, key=lambda f: os.path.getmtime(os.path.join(directory, f)))
+    return latest[: -len(".jsonl")]
+
+
+def trial_key(model: str, exp_id: int, trial: Dict[str, Any]) -> str:
+    """Identify a trial by content, so reordering the trial grid does not break a resume."""
+    return f"{model}/exp{exp_id}/{json.dumps(trial, sort_keys=True)}"
+
+
+class RunJournal:
+    """Journal of one benchmark run, stored as ``{directory}/{run_id}.jsonl``.
+
+    The first line records the run's settings; every later line is one
+    finished trial. Trials already in the file when the journal is opened are
+    available through completed(). The object holds no locks or handles, so
+    it can be passed to worker processes, and each append takes an exclusive
+    file lock.
+    """
+
+    def __init__(self, run_id: str, settings: Dict[str, Any], resume: bool = False, directory: Optional[str] = None):
+        """Open or create a run's journal.
+
+        Args:
+            run_id: Run identifier, also the journal file name.
+            settings: Settings the trials depend on (e.g. experiment modes).
+            resume: Continue an existing journal instead of requiring a new one.
+            directory: Journal directory (default: config.JOURNAL_DIR).
+
+        Raises:
+            ValueError: If the journal exists and resume is False, or if it was
+                recorded with different settings.
+        """
+        self.run_id = run_id
+        self.settings = settings
+        self.path = os.path.join(directory or config.JOURNAL_DIR, f"{run_id}.jsonl")
+        self._completed: Dict[str, Dict[str, Any]] = {}
+
+        entries = self.entries()
+        if not entries:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._append({"type": "run", "run_id": run_id, "started": datetime.now().isoformat(), **settings})
+            return
+
+        if not resume:
+            raise ValueError(f"Run {run_id} already exists; resume it or choose another run ID")
+        header = entries[0]
+        recorded = {key: header.get(key) for key in settings}
+        if recorded != settings:
+            raise ValueError(f"Run {run_id} was recorded with {recorded}, not {settings}; start a new run instead")
+        for entry in entries[1:]:
+            self._completed[trial_key(entry["model"], entry["exp_id"], entry["trial"])] = entry
+        logger.info(f"Resuming run {run_id}: {len(self._completed)} trials already completed")
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Read every entry currently in the journal file."""
+        if not os.path.exists(self.path):
+            return []
+        entries = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A crash mid-append leaves a torn last line; that trial simply reruns
+                    logger.warning(f"Skipping unreadable line {line_number} of {self.path}")
+        return entries
+
+    def _append(self, entry: Dict[str, Any]):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with open(self.path, "a", encoding="utf-8") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def completed(self, model: str, exp_id: int, trial: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return the journal entry of a trial finished before this journal was opened."""
+        return self._completed.get(trial_key(model, exp_id, trial))
+
+    def record(
+        self,
+        model: str,
+        exp_id: int,
+        trial_index: int,
+        trial: Dict[str, Any],
+        result: Any,
+        host: Optional[str] = None,
+    ):
+        """Append a finished trial. Trials without a result are not recorded, so they rerun on resume."""
+        if result is None:
+            return
+        self._append(
+            {
+                "type": "trial",
+                "model": model,
+                "exp_id": exp_id,
+                "trial_index": trial_index,
+                "trial": trial,
+                "host": host,
+                "finished": datetime.now().isoformat(),
+                "result": result,
+            }
+        )
+
+    def trial_results(self, exp_id: int, model: Optional[str] = None) -> List[Any]:
+        """Results of an experiment's recorded trials, in trial order per model."""
+        # A trial recorded twice (e.g. by two runs racing on one ID) counts once
+        trials = {
+            trial_key(e["model"], e["exp_id"], e["trial"]): e
+            for e in self.entries()[1:]
+            if e["exp_id"] == exp_id and (model is None or e["model"] == model)
+        }
+        ordered = sorted(trials.values(), key=lambda e: (e["model"], e["trial_index"]))
+        return [e["result"] for e in ordered]
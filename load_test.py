@@ -0,0 +1,421 @@
+"""Load test of the real OllamaClient against a local stand-in server.
+
+The stand-in answers /api/generate like Ollama: it holds each request for the
+time a model with the configured prefill and decode throughput would take,
+serves LOADTEST_SERVER_PARALLEL requests at once (like OLLAMA_NUM_PARALLEL)
+and reports the matching token counts and durations. It runs in its own
+process, so the client CPU and memory measured here are the client's alone.
+
+Every scenario sends the same number of uncached requests through one of the
+execution models the benchmark uses (sequential, a thread pool, asyncio via
+generate_with_stats_async, or a process pool like the pool engine) at one
+concurrency level and prompt size, and reports throughput, latency
+percentiles and client CPU/RSS. Results are saved as JSON and can be
+compared with an earlier run.
+
+Usage:
+    python load_test.py                                   # the full grid from config
+    python load_test.py --modes threaded asyncio --concurrency 8 32 --prompt-chars 50000
+    python load_test.py --compare results/loadtest/loadtest_20250101_120000.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Pool, get_context
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import config
+
+try:
+    import resource
+except ImportError:  # Windows: CPU time falls back to this process alone, and peak RSS is not measured
+    resource = None  # type: ignore[assignment]
+from utils import OllamaClient, count_tokens
+
+logger = logging.getLogger(__name__)
+
+MODES = ["sequential", "threaded", "asyncio", "process"]
+MODEL = "loadtest-model"
+FILLER_WORDS = ["the", "quick", "brown", "fox", "jumps", "over", "a", "lazy", "dog", "again"]
+
+
+def serve_stand_in(port_queue: Any, settings: Dict[str, Any]):
+    """Run the stand-in Ollama server until the process is terminated; its port is put on port_queue."""
+    slots = threading.Semaphore(settings["parallel"])
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            prompt_tokens = count_tokens(payload.get("prompt", ""))
+            output_tokens = settings["output_tokens"]
+            prefill = prompt_tokens / settings["prefill_tokens_per_second"]
+            decode = output_tokens / settings["decode_tokens_per_second"]
+
+            start = time.perf_counter()
+            with slots:
+                time.sleep(prefill + decode)
+            total = time.perf_counter() - start
+
+            body = json.dumps(
+                {
+                    "model": payload.get("model"),
+                    "response": " ".join(FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(output_tokens)),
+                    "done": True,
+                    "prompt_eval_count": prompt_tokens,
+                    "eval_count": output_tokens,
+                    "load_duration": 0,
+                    "prompt_eval_duration": int(prefill * 1e9),
+                    "eval_duration": int(decode * 1e9),
+                    "total_duration": int(total * 1e9),
+                }
+            ).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        # The default backlog of 5 drops connections under load, and each drop stalls the client for a second
+        request_queue_size = 1024
+
+    server = Server(("127.0.0.1", 0), Handler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+class StandInServer:
+    """Starts serve_stand_in in a separate process; use as a context manager."""
+
+    def __init__(
+        self,
+        parallel: Optional[int] = None,
+        prefill_tokens_per_second: Optional[float] = None,
+        decode_tokens_per_second: Optional[float] = None,
+        output_tokens: Optional[int] = None,
+    ):
+        self.settings = {
+            "parallel": parallel or config.LOADTEST_SERVER_PARALLEL,
+            "prefill_tokens_per_second": prefill_tokens_per_second or config.LOADTEST_PREFILL_TOKENS_PER_SECOND,
+            "decode_tokens_per_second": decode_tokens_per_second or config.LOADTEST_DECODE_TOKENS_PER_SECOND,
+            "output_tokens": output_tokens or config.LOADTEST_OUTPUT_TOKENS,
+        }
+        self.url = ""
+        self._process: Any = None
+
+    def __enter__(self) -> "StandInServer":
+        context = get_context("spawn")
+        port_queue = context.Queue()
+        self._process = context.Process(target=serve_stand_in, args=(port_queue, self.settings), daemon=True)
+        self._process.start()
+        self.url = f"http://127.0.0.1:{port_queue.get(timeout=30)}"
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._process.terminate()
+        self._process.join()
+        return False
+
+
+def make_prompts(count: int, prompt_chars: int) -> List[str]:
+    """Distinct prompts of about prompt_chars characters, so no request is answered from the cache."""
+    filler = " ".join(FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(prompt_chars // 4 + 1))[:prompt_chars]
+    return [f"Request {i}: {filler}" for i in range(count)]
+
+
+def _timed_request(client: OllamaClient, prompt: str) -> Tuple[float, bool]:
+    start = time.perf_counter()
+    ok = bool(client.generate_with_stats(prompt, max_tokens=config.LOADTEST_OUTPUT_TOKENS))
+    return time.perf_counter() - start, ok
+
+
+def _process_request(job: Tuple[str, str, str]) -> Tuple[float, bool]:
+    host, cache_dir, prompt = job
+    client = OllamaClient(MODEL, host=host)
+    client.cache_dir = cache_dir
+    return _timed_request(client, prompt)
+
+
+def run_mode(mode: str, host: str, prompts: List[str], concurrency: int, cache_dir: str) -> List[Tuple[float, bool]]:
+    """Send every prompt through one execution model.
+
+    Returns:
+        (latency in seconds, success) per request.
+    """
+    client = OllamaClient(MODEL, host=host)
+    client.cache_dir = cache_dir
+
+    if mode == "sequential":
+        return [_timed_request(client, prompt) for prompt in prompts]
+
+    if mode == "threaded":
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(lambda prompt: _timed_request(client, prompt), prompts))
+
+    if mode == "asyncio":
+
+        async def run_all() -> List[Tuple[float, bool]]:
+            slots = asyncio.Semaphore(concurrency)
+
+            async def request(prompt: str) -> Tuple[float, bool]:
+                async with slots:
+                    start = time.perf_counter()
+                    response = await client.generate_with_stats_async(prompt, max_tokens=config.LOADTEST_OUTPUT_TOKENS)
+                    return time.perf_counter() - start, bool(response)
+
+            return list(await asyncio.gather(*(request(prompt) for prompt in prompts)))
+
+        return asyncio.run(run_all())
+
+    if mode == "process":
+        # Same process model as the pool engine
+        with Pool(processes=concurrency) as pool:
+            return pool.map(_process_request, [(host, cache_dir, prompt) for prompt in prompts], chunksize=1)
+
+    raise ValueError(f"Unknown mode: {mode}. Must be one of {MODES}")
+
+
+def _cpu_seconds() -> float:
+    """CPU time of this process and its finished worker processes."""
+    if resource is None:
+        return time.process_time()
+    cpu = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        cpu += usage.ru_utime + usage.ru_stime
+    return cpu
+
+
+def _rss_mb() -> Optional[float]:
+    """Current resident set size of this process (Linux only)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def _lifetime_peak_rss_mb(children: bool = False) -> Optional[float]:
+    """Peak RSS since the process started (or of its largest finished worker), not of one scenario."""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss / divisor
+
+
+def run_scenario(mode: str, host: str, concurrency: int, prompt_chars: int, requests: int) -> Dict[str, Any]:
+    """Run one scenario and summarize it.
+
+    Returns:
+        Dictionary with the scenario parameters, wall time, requests/s,
+        latency percentiles, errors, client CPU seconds (worker processes
+        included in process mode), RSS after the scenario and its change
+        over the scenario. The lifetime_peak_rss_mb fields are peaks since
+        the load test started, so they are not comparable across scenarios.
+    """
+    prompts = make_prompts(requests, prompt_chars)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        rss_before = _rss_mb()
+        cpu_before = _cpu_seconds()
+        start = time.perf_counter()
+        outcomes = run_mode(mode, host, prompts, concurrency, cache_dir)
+        wall = time.perf_counter() - start
+        cpu = _cpu_seconds() - cpu_before
+        rss_after = _rss_mb()
+
+    latencies = np.array([latency for latency, ok in outcomes if ok])
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]).tolist() if len(latencies) else (None, None, None)
+    result = {
+        "mode": mode,
+        "concurrency": concurrency,
+        "prompt_chars": prompt_chars,
+        "requests": requests,
+        "errors": sum(not ok for _, ok in outcomes),
+        "wall_seconds": wall,
+        "requests_per_second": requests / wall if wall > 0 else None,
+        "latency_p50": p50,
+        "latency_p95": p95,
+        "latency_p99": p99,
+        "latency_mean": float(latencies.mean()) if len(latencies) else None,
+        "client_cpu_seconds": cpu,
+        "client_cpu_ms_per_request": cpu * 1000 / requests,
+        "rss_mb": rss_after,
+        "rss_change_mb": rss_after - rss_before if rss_after is not None and rss_before is not None else None,
+        "lifetime_peak_rss_mb": _lifetime_peak_rss_mb(),
+    }
+    if mode == "process":
+        result["worker_lifetime_peak_rss_mb"] = _lifetime_peak_rss_mb(children=True)
+    return result
+
+
+def scenarios(modes: List[str], concurrency_levels: List[int], prompt_sizes: List[int]) -> List[Tuple[str, int, int]]:
+    """(mode, concurrency, prompt chars) to run; sequential runs once per prompt size, at concurrency 1."""
+    grid = []
+    for prompt_chars in prompt_sizes:
+        for mode in modes:
+            for concurrency in [1] if mode == "sequential" else concurrency_levels:
+                grid.append((mode, concurrency, prompt_chars))
+    return grid
+
+
+def run_load_test(
+    modes: Optional[List[str]] = None,
+    concurrency_levels: Optional[List[int]] = None,
+    prompt_sizes: Optional[List[int]] = None,
+    requests: Optional[int] = None,
+    server: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Run every scenario against a fresh stand-in server.
+
+    Args:
+        modes: Execution models to compare (default: all of MODES).
+        concurrency_levels: Requests in flight (default: config.LOADTEST_CONCURRENCY).
+        prompt_sizes: Prompt sizes in characters (default: config.LOADTEST_PROMPT_CHARS).
+        requests: Requests per scenario (default: config.LOADTEST_REQUESTS).
+        server: StandInServer keyword arguments.
+
+    Returns:
+        Dictionary with the run's "metadata" (server settings included) and its "scenarios".
+    """
+    modes = modes or MODES
+    concurrency_levels = concurrency_levels or config.LOADTEST_CONCURRENCY
+    prompt_sizes = prompt_sizes or config.LOADTEST_PROMPT_CHARS
+    requests = requests or config.LOADTEST_REQUESTS
+
+    results = []
+    with StandInServer(**(server or {})) as stand_in:
+        # One unrecorded request per mode first, so one-time costs (e.g. importing aiohttp) stay out of the results
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for mode in modes:
+                run_mode(mode, stand_in.url, [f"Warm-up {mode}"], 1, cache_dir)
+
+        for mode, concurrency, prompt_chars in scenarios(modes, concurrency_levels, prompt_sizes):
+            logger.info(f"Running {mode} with concurrency {concurrency}, {prompt_chars} chars per prompt...")
+            results.append(run_scenario(mode, stand_in.url, concurrency, prompt_chars, requests))
+
+    return {
+        "metadata": {
+            "timestamp": datetime.now().isoformat(),
+            "python": sys.version.split()[0],
+            "cpu_count": os.cpu_count(),
+            "requests_per_scenario": requests,
+            "server": stand_in.settings,
+        },
+        "scenarios": results,
+    }
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Match scenarios of two runs and compute the change in throughput and p95 latency."""
+    key_fields = ("mode", "concurrency", "prompt_chars")
+    before = {tuple(s[k] for k in key_fields): s for s in previous.get("scenarios", [])}
+    changes = []
+    for scenario in current["scenarios"]:
+        old = before.get(tuple(scenario[k] for k in key_fields))
+        if old is None:
+            continue
+        change = {k: scenario[k] for k in key_fields}
+        for metric in ("requests_per_second", "latency_p95", "client_cpu_ms_per_request"):
+            if scenario.get(metric) and old.get(metric):
+                change[f"{metric}_change"] = scenario[metric] / old[metric] - 1
+        changes.append(change)
+    return changes
+
+
+def format_report(run: Dict[str, Any]) -> str:
+    lines = [
+        f"{'Mode':<11} {'Conc':>5} {'Prompt':>8} {'Req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} "
+        f"{'CPU/req':>9} {'RSS':>8} {'RSS +/-':>8} {'Errors':>7}"
+    ]
+
+    def seconds(value: Optional[float]) -> str:
+        return f"{value * 1000:.0f}ms" if value is not None else "-"
+
+    for s in run["scenarios"]:
+        rss = f"{s['rss_mb']:.0f}MB" if s["rss_mb"] is not None else "-"
+        rss_change = f"{s['rss_change_mb']:+.1f}MB" if s["rss_change_mb"] is not None else "-"
+        lines.append(
+            f"{s['mode']:<11} {s['concurrency']:>5} {s['prompt_chars']:>8} {s['requests_per_second']:>8.1f} "
+            f"{seconds(s['latency_p50']):>8} {seconds(s['latency_p95']):>8} {seconds(s['latency_p99']):>8} "
+            f"{s['client_cpu_ms_per_request']:>7.1f}ms {rss:>8} {rss_change:>8} {s['errors']:>7}"
+        )
+    return "\n".join(lines)
+
+
+def format_comparison(changes: List[Dict[str, Any]]) -> str:
+    lines = [f"{'Mode':<11} {'Conc':>5} {'Prompt':>8} {'Req/s':>9} {'p95':>9} {'CPU/req':>9}"]
+
+    def percent(change: Dict[str, Any], metric: str) -> str:
+        value = change.get(f"{metric}_change")
+        return f"{value:+.1%}" if value is not None else "-"
+
+    for c in changes:
+        lines.append(
+            f"{c['mode']:<11} {c['concurrency']:>5} {c['prompt_chars']:>8} "
+            f"{percent(c, 'requests_per_second'):>9} {percent(c, 'latency_p95'):>9} "
+            f"{percent(c, 'client_cpu_ms_per_request'):>9}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Ollama client against a local stand-in server")
+    parser.add_argument("--modes", nargs="+", choices=MODES, help="Execution models to compare (default: all)")
+    parser.add_argument("--concurrency", nargs="+", type=int, help="Concurrency levels")
+    parser.add_argument("--prompt-chars", nargs="+", type=int, help="Prompt sizes in characters")
+    parser.add_argument("--requests", type=int, help="Requests per scenario")
+    parser.add_argument("--server-parallel", type=int, help="Requests the stand-in serves at once")
+    parser.add_argument("--prefill-tps", type=float, help="Stand-in prefill tokens per second")
+    parser.add_argument("--decode-tps", type=float, help="Stand-in decode tokens per second")
+    parser.add_argument("--output", help="Results file (default: a timestamped file in results/loadtest)")
+    parser.add_argument("--compare", metavar="PATH", help="Earlier results file to compare with")
+    args = parser.parse_args()
+
+    run = run_load_test(
+        modes=args.modes,
+        concurrency_levels=args.concurrency,
+        prompt_sizes=args.prompt_chars,
+        requests=args.requests,
+        server={
+            "parallel": args.server_parallel,
+            "prefill_tokens_per_second": args.prefill_tps,
+            "decode_tokens_per_second": args.decode_tps,
+        },
+    )
+    print(format_report(run))
+
+    output = args.output or os.path.join(
+        config.LOADTEST_DIR, f"loadtest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+    logger.info(f"Saved results to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        print(f"\nChange since {args.compare}:")
+        print(format_comparison(compare(run, previous)))
+
+
+if __name__ == "__main__":
+    main()
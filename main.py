@@ -1,25 +1,55 @@
 import argparse
+import asyncio
 import json
 import logging
 import os
 import time
+from concurrent.futures import Executor, ProcessPoolExecutor
 from functools import partial
-from multiprocessing import Pool, cpu_count
-from typing import Optional
+from multiprocessing import Pool, cpu_count, get_context
+from typing import Any, Dict, List, Optional, Tuple
 
 import config
+import metrics
+import tracing
+from base import ExperimentBase
+from journal import RunJournal, latest_run_id, new_run_id
+from planner import format_plan, plan_sweep
 from plugins import PluginRegistry
+from results_store import ResultsStore, detailed_experiment
+from scheduler import Scheduler, make_task
 
 logger = logging.getLogger("BenchmarkRunner")
 
-
-def run_single_model(model: str, experiments: Optional[list] = None, exp1_mode: str = "quick"):
+# Compatibility mapping for result keys
+RESULT_KEYS = {
+    1: "exp1_needle",
+    2: "exp2_size",
+    3: "exp3_rag",
+    4: "exp4_strategies",
+}
+
+
+def run_single_model(
+    model: str,
+    experiments: Optional[list] = None,
+    exp1_mode: str = "quick",
+    exp3_mode: str = "single",
+    exp3_read_only_index: bool = False,
+    exp4_mode: str = "standard",
+    journal: Optional[RunJournal] = None,
+):
     """Run all selected experiments for a single model.
 
     Args:
         model: Model identifier.
         experiments: List of experiment IDs to run.
         exp1_mode: Mode for Experiment 1.
+        exp3_mode: Mode for Experiment 3.
+        exp3_read_only_index: Open the shared RAG indexes read-only (already built by the parent).
+        exp4_mode: Mode for Experiment 4.
+        journal: Run journal; trials already in it are skipped and finished ones are appended.
+            Without a journal each experiment runs as a whole.
 
     Returns:
         Dictionary containing results for the model.
@@ -35,18 +65,10 @@ def run_single_model(model: str, experiments: Optional[list] = None, exp1_mode:
     if experiments is None:
         experiments = list(all_experiments.keys())
 
-    model_results = {
+    model_results: Dict[str, Any] = {
         "model": model,
     }
 
-    # Compatibility mapping for result keys
-    key_map = {
-        1: "exp1_needle",
-        2: "exp2_size",
-        3: "exp3_rag",
-        4: "exp4_strategies",
-    }
-
     experiments.sort()
 
     for exp_id in experiments:
@@ -55,60 +77,390 @@ def run_single_model(model: str, experiments: Optional[list] = None, exp1_mode:
             continue
 
         ExpClass = all_experiments[exp_id]
-        key = key_map.get(exp_id, f"exp{exp_id}")
-
         logger.info(f"[{model}] Running Exp {exp_id}: {ExpClass.NAME}...")
 
         try:
-            # Prepare arguments
-            kwargs = {}
-            if exp_id == 1:
-                kwargs["mode"] = exp1_mode
-
             # Initialize and run
+            kwargs = experiment_kwargs(exp_id, exp1_mode, exp3_mode, exp4_mode, exp3_read_only_index)
             experiment = ExpClass(model, **kwargs)
-            results = experiment.run()
-
-            # Handle results
-            if exp_id == 1 and exp1_mode != "quick":
-                # Detailed mode: save separately
-                if hasattr(experiment, "save_detailed_results"):
-                    experiment.save_detailed_results(results)
-                    logger.info(f"[{model}] Detailed results saved separately for {exp1_mode}")
+            with tracing.span("experiment", model=model, exp_id=exp_id):
+                if journal is None:
+                    results = experiment.run()
                 else:
-                    logger.warning(f"[{model}] Detailed results generated but save method missing.")
-            else:
-                # Standard mode: add to model results
-                model_results[key] = results
-
+                    results = run_journaled_trials(experiment, exp_id, journal)
+            store_experiment_results(model_results, experiment, exp_id, results, exp1_mode, journal)
         except Exception as e:
             logger.error(f"Exp {exp_id} failed for {model}: {e}")
 
-    # Save results for this model (if not just running detailed exp1)
+    save_model_results(model_results, experiments, exp1_mode, journal.run_id if journal else None)
+    return model_results
+
+
+def run_journaled_trials(experiment: Any, exp_id: int, journal: RunJournal) -> Any:
+    """Run an experiment trial by trial, reusing trials already in the journal.
+
+    Experiments with a native async trial path run their remaining trials
+    concurrently on one event loop, as their run() does; each trial is
+    journaled as soon as it finishes. Other experiments run them one at a time.
+    """
+    trials = experiment.trials()
+    results: List[Any] = [None] * len(trials)
+    pending = []
+    for index, trial in enumerate(trials):
+        entry = journal.completed(experiment.model, exp_id, trial)
+        if entry is not None:
+            results[index] = entry["result"]
+        else:
+            pending.append(index)
+
+    if len(pending) > 1 and has_async_trials(experiment):
+
+        async def run_trial(index: int):
+            with tracing.span("trial", model=experiment.model, exp_id=exp_id, trial=index):
+                results[index] = await experiment.run_trial_async(trials[index])
+            await asyncio.to_thread(journal.record, experiment.model, exp_id, index, trials[index], results[index])
+
+        async def run_pending():
+            await asyncio.gather(*(run_trial(index) for index in pending))
+
+        asyncio.run(run_pending())
+    else:
+        for index in pending:
+            with tracing.span("trial", model=experiment.model, exp_id=exp_id, trial=index):
+                results[index] = experiment.run_trial(trials[index])
+            journal.record(experiment.model, exp_id, index, trials[index], results[index])
+    return experiment.merge_trials(results)
+
+
+def has_async_trials(experiment: Any) -> bool:
+    """Whether the experiment overrides run_trial_async instead of running run_trial in a thread."""
+    method = getattr(type(experiment), "run_trial_async", None)
+    return method is not None and method is not ExperimentBase.run_trial_async
+
+
+def experiment_kwargs(
+    exp_id: int, exp1_mode: str, exp3_mode: str, exp4_mode: str, exp3_read_only_index: bool = False
+) -> Dict[str, Any]:
+    """Constructor arguments for an experiment given the selected modes."""
+    kwargs: Dict[str, Any] = {}
+    if exp_id == 1:
+        kwargs["mode"] = exp1_mode
+    elif exp_id == 3:
+        kwargs["mode"] = exp3_mode
+        if exp3_read_only_index:
+            kwargs["read_only_index"] = True
+    elif exp_id == 4:
+        kwargs["mode"] = exp4_mode
+    return kwargs
+
+
+def store_experiment_results(
+    model_results: Dict[str, Any],
+    experiment: Any,
+    exp_id: int,
+    results: Any,
+    exp1_mode: str,
+    journal: Optional[RunJournal] = None,
+):
+    """Add one experiment's results to the model summary (detailed Exp 1 results are saved separately)."""
+    model = model_results["model"]
+    if exp_id == 1 and exp1_mode != "quick":
+        # Detailed mode: save separately
+        if journal is not None:
+            # Written once for all models from the journal (see save_detailed_summary)
+            logger.info(f"[{model}] Detailed results recorded in run {journal.run_id}")
+        elif hasattr(experiment, "save_detailed_results"):
+            experiment.save_detailed_results(results)
+            logger.info(f"[{model}] Detailed results saved separately for {exp1_mode}")
+        else:
+            logger.warning(f"[{model}] Detailed results generated but save method missing.")
+    else:
+        # Standard mode: add to model results
+        model_results[RESULT_KEYS.get(exp_id, f"exp{exp_id}")] = results
+
+
+def save_model_results(
+    model_results: Dict[str, Any], experiments: List[int], exp1_mode: str, run_id: Optional[str] = None
+):
+    """Store the model's results and write the summary JSON view, unless only detailed Exp 1 results were produced.
+
+    Args:
+        model_results: Results of the model, keyed by experiment.
+        experiments: Experiment IDs that ran.
+        exp1_mode: Mode of Experiment 1.
+        run_id: Run the results belong to in the results store (default: a new run ID).
+    """
     # Logic: If running quick mode OR any other experiment, save the summary JSON.
     should_save = exp1_mode == "quick" or any(e != 1 for e in experiments)
+    if not should_save:
+        return
+
+    model = model_results["model"]
+    run_id = run_id or new_run_id()
+    safe_model_name = model.replace(":", "_")
+    output_file = os.path.join(config.RESULTS_DIR, f"{safe_model_name}_results.json")
+    try:
+        store = ResultsStore()
+        for key, results in model_results.items():
+            if key != "model":
+                store.write(run_id, model, key, results)
+        with open(output_file, "w") as f:
+            json.dump(store.model_results(model, run_id), f, indent=2)
+        logger.info(f"[{model}] Saved results to {output_file}")
+    except Exception as e:
+        logger.error(f"[{model}] Failed to save results: {e}")
+
+
+def save_detailed_summary(journal: RunJournal, exp1_mode: str):
+    """Store the detailed Exp 1 trials of every model in the run and write their JSON view."""
+    ExpClass = PluginRegistry.get_all_experiments().get(1)
+    results = journal.trial_results(1)
+    if ExpClass is None or not results:
+        return
+    experiment: Any = ExpClass(results[0]["model"], mode=exp1_mode)
+    if not hasattr(experiment, "detailed_output"):
+        experiment.save_detailed_results(results)
+        return
+
+    store = ResultsStore()
+    for model in dict.fromkeys(r["model"] for r in results):
+        model_rows = [r for r in results if r["model"] == model]
+        store.write(journal.run_id, model, detailed_experiment(exp1_mode), experiment.detailed_output(model_rows))
+    output_file = os.path.join(config.RESULTS_DIR, f"{exp1_mode}_results.json")
+    with open(output_file, "w") as f:
+        json.dump(store.detailed_results(exp1_mode, journal.run_id), f, indent=2)
+    logger.info(f"Saved {len(results)} results to {output_file}")
+
+
+def run_scheduled(
+    models: List[str],
+    experiments: List[int],
+    exp1_mode: str = "quick",
+    exp3_mode: str = "single",
+    exp4_mode: str = "standard",
+    exp3_read_only_index: bool = False,
+    journal: Optional[RunJournal] = None,
+) -> List[Dict[str, Any]]:
+    """Run every (model, experiment, trial) from one global work queue.
+
+    Results are merged per experiment and saved per model exactly as
+    run_single_model saves them. Trials already in the journal are not
+    queued, and finished ones are appended to it.
 
-    if should_save:
-        safe_model_name = model.replace(":", "_")
-        output_file = os.path.join(config.RESULTS_DIR, f"{safe_model_name}_results.json")
+    Returns:
+        The results dictionary of each model.
+    """
+    all_experiments = PluginRegistry.get_all_experiments()
+    for exp_id in experiments:
+        if exp_id not in all_experiments:
+            logger.warning(f"Experiment ID {exp_id} not found in registry.")
+    experiments = sorted(e for e in experiments if e in all_experiments)
+
+    instances: Dict[Tuple[str, int], Any] = {}
+    tasks: List[Dict[str, Any]] = []
+    resumed: List[Dict[str, Any]] = []
+    for model in models:
+        for exp_id in experiments:
+            try:
+                kwargs = experiment_kwargs(exp_id, exp1_mode, exp3_mode, exp4_mode, exp3_read_only_index)
+                experiment = all_experiments[exp_id](model, **kwargs)
+                trials = experiment.trials()
+            except Exception as e:
+                logger.error(f"Exp {exp_id} failed for {model}: {e}")
+                continue
+            instances[(model, exp_id)] = experiment
+            for i, trial in enumerate(trials):
+                task = make_task(model, exp_id, i, trial)
+                entry = journal.completed(model, exp_id, trial) if journal is not None else None
+                if entry is not None:
+                    resumed.append(dict(task, result=entry["result"]))
+                else:
+                    tasks.append(task)
+
+    def run_task(task: Dict[str, Any]) -> Any:
+        with tracing.span(
+            "trial", model=task["model"], exp_id=task["exp_id"], trial=task["trial_index"], host=task["host"]
+        ):
+            return instances[(task["model"], task["exp_id"])].run_trial(task["trial"])
+
+    def record(task: Dict[str, Any], result: Any):
+        if journal is not None:
+            journal.record(task["model"], task["exp_id"], task["trial_index"], task["trial"], result, task["host"])
+
+    logger.info(f"Scheduling {len(tasks)} tasks for {len(models)} models ({len(resumed)} already completed)")
+    # Journaled only once the scheduler accepts a result, so a trial answered by a dead host reruns on resume
+    completed = Scheduler(tasks, run_task, on_result=record).run() + resumed
+
+    all_results = []
+    for model in models:
+        model_results: Dict[str, Any] = {"model": model}
+        for exp_id in experiments:
+            if (model, exp_id) not in instances:
+                continue
+            experiment = instances[(model, exp_id)]
+            done = sorted(
+                (t for t in completed if t["model"] == model and t["exp_id"] == exp_id),
+                key=lambda t: t["trial_index"],
+            )
+            errors = [t["error"] for t in done if "error" in t]
+            if errors:
+                logger.error(f"Exp {exp_id} failed for {model}: {errors[0]}")
+                continue
+            try:
+                results = experiment.merge_trials([t["result"] for t in done])
+                store_experiment_results(model_results, experiment, exp_id, results, exp1_mode, journal)
+            except Exception as e:
+                logger.error(f"Exp {exp_id} failed for {model}: {e}")
+        save_model_results(model_results, experiments, exp1_mode, journal.run_id if journal else None)
+        all_results.append(model_results)
+    return all_results
+
+
+async def run_model_async(
+    model: str,
+    experiments: List[int],
+    exp1_mode: str = "quick",
+    exp3_mode: str = "single",
+    exp4_mode: str = "standard",
+    exp3_read_only_index: bool = False,
+    cpu_executor: Optional[Executor] = None,
+    journal: Optional[RunJournal] = None,
+) -> Dict[str, Any]:
+    """Run all selected experiments for one model on the running event loop.
+
+    The trials of every experiment share ASYNC_MODEL_CONCURRENCY slots.
+    Trials already in the journal are skipped, finished ones are appended,
+    and results are saved exactly as run_single_model saves them.
+
+    Returns:
+        Dictionary containing results for the model.
+    """
+    logger.info(f"[{model}] Starting on the event loop")
+    all_experiments = PluginRegistry.get_all_experiments()
+    for exp_id in experiments:
+        if exp_id not in all_experiments:
+            logger.warning(f"Experiment ID {exp_id} not found in registry.")
+    experiments = sorted(e for e in experiments if e in all_experiments)
+    slots = asyncio.Semaphore(config.ASYNC_MODEL_CONCURRENCY)
+
+    async def run_trial(experiment: Any, exp_id: int, index: int, trial: Dict[str, Any]) -> Any:
+        entry = journal.completed(model, exp_id, trial) if journal is not None else None
+        if entry is not None:
+            return entry["result"]
+        metrics.QUEUE_DEPTH.inc()
+        async with slots:
+            metrics.QUEUE_DEPTH.dec()
+            with tracing.span("trial", model=model, exp_id=exp_id, trial=index):
+                result = await experiment.run_trial_async(trial)
+        if journal is not None:
+            await asyncio.to_thread(journal.record, model, exp_id, index, trial, result)
+        return result
+
+    async def run_experiment(exp_id: int) -> Optional[Tuple[Any, Any]]:
+        ExpClass = all_experiments[exp_id]
+        logger.info(f"[{model}] Running Exp {exp_id}: {ExpClass.NAME}...")
         try:
-            with open(output_file, "w") as f:
-                json.dump(model_results, f, indent=2)
-            logger.info(f"[{model}] Saved results to {output_file}")
+            kwargs = experiment_kwargs(exp_id, exp1_mode, exp3_mode, exp4_mode, exp3_read_only_index)
+            # Constructors load corpora from disk, so they run off the event loop
+            experiment = await asyncio.to_thread(ExpClass, model, **kwargs)
+            experiment.cpu_executor = cpu_executor
+            outcomes = await asyncio.gather(
+                *(run_trial(experiment, exp_id, i, trial) for i, trial in enumerate(experiment.trials())),
+                return_exceptions=True,
+            )
+            errors = [o for o in outcomes if isinstance(o, BaseException)]
+            if errors:
+                raise errors[0]
+            return experiment, experiment.merge_trials(list(outcomes))
         except Exception as e:
-            logger.error(f"[{model}] Failed to save results: {e}")
+            logger.error(f"Exp {exp_id} failed for {model}: {e}")
+            return None
+
+    model_results: Dict[str, Any] = {"model": model}
+    outcomes = await asyncio.gather(*(run_experiment(exp_id) for exp_id in experiments))
+    for exp_id, outcome in zip(experiments, outcomes):
+        if outcome is not None:
+            experiment, results = outcome
+            store_experiment_results(model_results, experiment, exp_id, results, exp1_mode, journal)
 
+    save_model_results(model_results, experiments, exp1_mode, journal.run_id if journal else None)
     return model_results
 
 
-def run_benchmark(models=None, experiments=None, exp1_mode="quick", parallel=False):
+async def run_all_async(
+    models: List[str],
+    experiments: List[int],
+    exp1_mode: str = "quick",
+    exp3_mode: str = "single",
+    exp4_mode: str = "standard",
+    exp3_read_only_index: bool = False,
+    journal: Optional[RunJournal] = None,
+) -> List[Dict[str, Any]]:
+    """Drive every model from one event loop, SCHEDULER_MAX_RESIDENT_MODELS models at a time.
+
+    Experiments are created only when their model starts and released when
+    it finishes, so memory is bounded by the models in flight rather than the
+    model count. CPU-bound steps go to a small process pool shared by all
+    models.
+
+    Returns:
+        The results dictionary of each model.
+    """
+    model_slots = asyncio.Semaphore(config.SCHEDULER_MAX_RESIDENT_MODELS)
+
+    with ProcessPoolExecutor(max_workers=config.CPU_POOL_WORKERS, mp_context=get_context("spawn")) as cpu_executor:
+
+        async def run_model(model: str) -> Dict[str, Any]:
+            async with model_slots:
+                return await run_model_async(
+                    model, experiments, exp1_mode, exp3_mode, exp4_mode, exp3_read_only_index, cpu_executor, journal
+                )
+
+        return list(await asyncio.gather(*(run_model(model) for model in models)))
+
+
+def prepare_rag_indexes(exp3_mode: str) -> bool:
+    """Build the shared RAG indexes in this process.
+
+    Returns:
+        True if the indexes are ready for read-only use by workers.
+    """
+    from exp3_rag import prepare_shared_indexes
+
+    try:
+        prepare_shared_indexes(exp3_mode)
+        return True
+    except Exception as e:
+        # Workers fall back to building the indexes themselves, serialized by the build lock
+        logger.error(f"Failed to prepare shared RAG indexes: {e}")
+        return False
+
+
+def run_benchmark(
+    models=None,
+    experiments=None,
+    exp1_mode="quick",
+    parallel=False,
+    exp3_mode="single",
+    exp4_mode="standard",
+    engine=None,
+    run_id=None,
+    resume=False,
+):
     """Run benchmark suite.
 
     Args:
         models: List of models to test (default: all from config)
         experiments: List of experiment numbers to run (default: all)
         exp1_mode: Mode for experiment 1 - "quick", "info_retrieval", or "anomaly_detection"
-        parallel: Whether to run models in parallel processes
+        exp3_mode: Mode for experiment 3 - "single", "query_set", "sweep" or "scaling"
+        exp4_mode: Mode for experiment 4 - "standard", "compress_benchmark" or "history_sweep"
+        parallel: Whether to run models in parallel processes (same as engine="pool")
+        engine: "sequential", "pool" (one process per model), "queue" (global work queue
+            of every model, experiment and trial) or "async" (one event loop for all models);
+            defaults to "pool" if parallel else "sequential"
+        run_id: ID of the run journal (default: a new timestamped ID)
+        resume: Continue the run_id journal (default: the latest run), skipping trials already in it
     """
     logger.info("Starting Full Benchmark Suite")
     start_time = time.time()
@@ -121,7 +473,44 @@ def run_benchmark(models=None, experiments=None, exp1_mode="quick", parallel=Fal
         PluginRegistry.discover_experiments()
         experiments = list(PluginRegistry.get_all_experiments().keys())
 
-    if parallel and len(models) > 1:
+    if engine is None:
+        engine = "pool" if parallel else "sequential"
+
+    if resume and run_id is None:
+        run_id = latest_run_id()
+        if run_id is None:
+            raise ValueError(f"No run to resume in {config.JOURNAL_DIR}")
+    settings = {"exp1_mode": exp1_mode, "exp3_mode": exp3_mode, "exp4_mode": exp4_mode}
+    journal = RunJournal(run_id or new_run_id(), settings, resume=resume)
+    logger.info(f"Recording trials to {journal.path}")
+
+    if engine == "queue":
+        logger.info("Running benchmark from a global work queue")
+        read_only_index = 3 in experiments and prepare_rag_indexes(exp3_mode)
+        run_scheduled(
+            models,
+            experiments,
+            exp1_mode=exp1_mode,
+            exp3_mode=exp3_mode,
+            exp4_mode=exp4_mode,
+            exp3_read_only_index=read_only_index,
+            journal=journal,
+        )
+    elif engine == "async":
+        logger.info("Running benchmark on a single event loop")
+        read_only_index = 3 in experiments and prepare_rag_indexes(exp3_mode)
+        asyncio.run(
+            run_all_async(
+                models,
+                experiments,
+                exp1_mode=exp1_mode,
+                exp3_mode=exp3_mode,
+                exp4_mode=exp4_mode,
+                exp3_read_only_index=read_only_index,
+                journal=journal,
+            )
+        )
+    elif engine == "pool" and len(models) > 1:
         # Limit processes to CPU count or number of models, whichever is smaller
         num_processes = min(cpu_count(), len(models))
         # Cap at 4 to be safe for typical local setups unless explicitly overridden
@@ -129,14 +518,28 @@ def run_benchmark(models=None, experiments=None, exp1_mode="quick", parallel=Fal
 
         logger.info(f"Running benchmark with {num_processes} parallel processes")
 
-        func = partial(run_single_model, experiments=experiments, exp1_mode=exp1_mode)
+        # Build the shared RAG indexes once, before fan-out, so workers only read them
+        read_only_index = 3 in experiments and prepare_rag_indexes(exp3_mode)
+
+        func = partial(
+            run_single_model,
+            experiments=experiments,
+            exp1_mode=exp1_mode,
+            exp3_mode=exp3_mode,
+            exp3_read_only_index=read_only_index,
+            exp4_mode=exp4_mode,
+            journal=journal,
+        )
 
         with Pool(processes=num_processes) as pool:
             pool.map(func, models)
     else:
         logger.info("Running benchmark sequentially")
         for model in models:
-            run_single_model(model, experiments, exp1_mode)
+            run_single_model(model, experiments, exp1_mode, exp3_mode, exp4_mode=exp4_mode, journal=journal)
+
+    if 1 in experiments and exp1_mode != "quick":
+        save_detailed_summary(journal, exp1_mode)
 
     end_time = time.time()
     duration = end_time - start_time
@@ -158,13 +561,95 @@ if __name__ == "__main__":
         default="quick",
         help="Mode for Experiment 1 (default: quick)",
     )
+    parser.add_argument(
+        "--exp3-mode",
+        choices=["single", "query_set", "sweep", "scaling"],
+        default="single",
+        help="Mode for Experiment 3 (default: single)",
+    )
+    parser.add_argument(
+        "--exp4-mode",
+        choices=["standard", "compress_benchmark", "history_sweep"],
+        default="standard",
+        help="Mode for Experiment 4 (default: standard)",
+    )
     parser.add_argument("--parallel", action="store_true", help="Run models in parallel")
+    parser.add_argument(
+        "--engine",
+        choices=["sequential", "pool", "queue", "async"],
+        help="Execution engine: sequential, pool (one process per model, same as --parallel), queue "
+        "(global work queue scheduled by model residency and server slots) or async (one event loop "
+        "with per-model concurrency limits)",
+    )
+
+    parser.add_argument("--run-id", help="ID of the run journal in results/runs (default: a new timestamped ID)")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume the --run-id run (default: the latest run), skipping trials already in its journal",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Write tracing spans (prompt build, cache, HTTP, server phases, scoring) to PATH in Chrome trace "
+        "format; open it in ui.perfetto.dev or chrome://tracing",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        metavar="PORT",
+        help="Serve live metrics (requests in flight, queue depth, tokens/s, cache hit ratio, errors, latency) "
+        "in Prometheus text format on http://127.0.0.1:PORT/metrics",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="PATH",
+        help=f"Rewrite PATH with the live metrics every {config.METRICS_SNAPSHOT_SECONDS}s",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Print the predicted time, token volume, peak concurrency and cache coverage of the run, "
+        "then exit without sending any request",
+    )
 
     args = parser.parse_args()
 
-    run_benchmark(
-        models=args.models,
-        experiments=args.experiments,
-        exp1_mode=args.exp1_mode,
-        parallel=args.parallel,
-    )
+    if args.trace:
+        tracing.enable(args.trace)
+
+    engine = args.engine or ("pool" if args.parallel else "sequential")
+    if args.plan:
+        plan = plan_sweep(
+            models=args.models,
+            experiments=args.experiments,
+            exp1_mode=args.exp1_mode,
+            exp3_mode=args.exp3_mode,
+            exp4_mode=args.exp4_mode,
+            engine=engine,
+        )
+        print(format_plan(plan))
+        raise SystemExit(0)
+
+    exporter = metrics.start_exporter(args.metrics_port, args.metrics_file)
+    if exporter is not None and engine == "pool" and len(args.models or config.MODELS) > 1:
+        # Workers record into their own registries, which the parent's exporter never sees
+        logger.warning(
+            "Metrics are per process: with the pool engine the exporter only shows the parent process, "
+            "whose counters stay at zero. Use --engine queue or --engine async for live metrics."
+        )
+    try:
+        run_benchmark(
+            models=args.models,
+            experiments=args.experiments,
+            exp1_mode=args.exp1_mode,
+            parallel=args.parallel,
+            exp3_mode=args.exp3_mode,
+            exp4_mode=args.exp4_mode,
+            engine=engine,
+            run_id=args.run_id,
+            resume=args.resume,
+        )
+    finally:
+        if exporter is not None:
+            exporter.stop()
@@ -0,0 +1,363 @@
+"""Opt-in live metrics for long benchmark runs, in the Prometheus text format.
+
+The client, the scheduler and the async engine always record into the
+registry below (a lock and a dict update per event, next to requests that take
+seconds); exporting is what is opt-in. With config.METRICS_PORT set (the
+BENCHMARK_METRICS_PORT environment variable or main.py --metrics-port),
+/metrics is served on localhost for Prometheus or curl, and with
+config.METRICS_SNAPSHOT_FILE set (BENCHMARK_METRICS_FILE or --metrics-file)
+the same text is rewritten every METRICS_SNAPSHOT_SECONDS.
+
+Besides the raw counters and histograms, every rendering derives the figures
+worth watching without a Prometheus server: requests/s over the last
+METRICS_RATE_WINDOW_SECONDS, prefill and decode tokens/s per model (tokens
+over server-reported seconds) and the response-cache hit ratio. Metrics are
+per process, so the pool engine's workers are not aggregated (main.py warns
+when exporting with it); the queue and async engines run in one process.
+"""
+
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: List[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    """A named metric holding one value per combination of label values."""
+
+    TYPE = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Optional[List[str]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames or []
+        self._values: Dict[LabelValues, Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return float(self._values.get(self._key(labels), 0.0))
+
+    def values(self) -> Dict[LabelValues, Any]:
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """(name suffix, formatted labels, value) of every sample."""
+        return [("", _format_labels(self.labelnames, key), value) for key, value in sorted(self.values().items())]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Counter):
+    TYPE = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: Any):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    """Cumulative histogram; each label set holds [per-bucket counts, count, sum]."""
+
+    TYPE = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Optional[List[str]] = None,
+        buckets: Optional[List[float]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = sorted(buckets or config.METRICS_LATENCY_BUCKETS)
+
+    def observe(self, value: float, **labels: Any):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.setdefault(key, [[0] * len(self.buckets), 0, 0.0])
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += 1
+            state[2] += value
+
+    def value(self, **labels: Any) -> float:
+        """Number of observations."""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+        return float(state[1]) if state else 0.0
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        samples: List[Tuple[str, str, float]] = []
+        with self._lock:
+            items = sorted((key, (list(counts), count, total)) for key, (counts, count, total) in self._values.items())
+        for key, (counts, count, total) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                samples.append(("_bucket", _format_labels(self.labelnames, key, le), cumulative))
+            samples.append(("_bucket", _format_labels(self.labelnames, key, 'le="+Inf"'), count))
+            samples.append(("_sum", _format_labels(self.labelnames, key), total))
+            samples.append(("_count", _format_labels(self.labelnames, key), count))
+        return samples
+
+
+class Registry:
+    """The metrics of this process, plus the rates derived from them when rendered."""
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        # (monotonic time, total requests) at start and at each rendering, for the requests/s window
+        self._request_history: Deque[Tuple[float, float]] = deque([(time.monotonic(), 0.0)])
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Any:
+        self.metrics.append(metric)
+        return metric
+
+    def reset(self):
+        for metric in self.metrics:
+            metric.reset()
+        with self._lock:
+            self._request_history.clear()
+            self._request_history.append((time.monotonic(), 0.0))
+
+    def requests_per_second(self, now: Optional[float] = None) -> float:
+        """Request rate since the oldest rendering inside the rate window."""
+        now = time.monotonic() if now is None else now
+        total = sum(REQUESTS.values().values())
+        with self._lock:
+            history = self._request_history
+            history.append((now, total))
+            while len(history) > 1 and now - history[1][0] >= config.METRICS_RATE_WINDOW_SECONDS:
+                history.popleft()
+            start, start_total = history[0]
+        return (total - start_total) / (now - start) if now > start else 0.0
+
+    def derived(self) -> List[Metric]:
+        """Gauges computed from the counters at render time."""
+        rate = Gauge("benchmark_requests_per_second", "Ollama requests per second over the recent window")
+        rate.set(self.requests_per_second())
+
+        hits, misses = CACHE_LOOKUPS.value(result="hit"), CACHE_LOOKUPS.value(result="miss")
+        hit_ratio = Gauge("benchmark_cache_hit_ratio", "Fraction of response-cache lookups that hit")
+        if hits + misses:
+            hit_ratio.set(hits / (hits + misses))
+
+        throughput = Gauge(
+            "benchmark_tokens_per_second",
+            "Server throughput per model and phase (tokens over server seconds)",
+            ["model", "phase"],
+        )
+        seconds = SERVER_SECONDS.values()
+        for (model, phase), tokens in TOKENS.values().items():
+            phase_seconds = seconds.get((model, phase), 0.0)
+            if phase_seconds > 0:
+                throughput.set(tokens / phase_seconds, model=model, phase=phase)
+        return [rate, hit_ratio, throughput]
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics + self.derived():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+IN_FLIGHT = REGISTRY.register(Gauge("benchmark_requests_in_flight", "Ollama requests awaiting a response", ["model"]))
+QUEUE_DEPTH = REGISTRY.register(Gauge("benchmark_queue_depth", "Trials waiting for a host or a concurrency slot"))
+REQUESTS = REGISTRY.register(
+    Counter("benchmark_requests_total", "Ollama requests completed or failed", ["model", "endpoint"])
+)
+ERRORS = REGISTRY.register(
+    Counter("benchmark_errors_total", "Failed requests and trials by error type", ["model", "error"])
+)
+RETRIES = REGISTRY.register(Counter("benchmark_retries_total", "Trials requeued after a failure", ["host"]))
+CACHE_LOOKUPS = REGISTRY.register(Counter("benchmark_cache_lookups_total", "Response-cache lookups", ["result"]))
+TOKENS = REGISTRY.register(Counter("benchmark_tokens_total", "Tokens processed by the server", ["model", "phase"]))
+SERVER_SECONDS = REGISTRY.register(
+    Counter("benchmark_server_seconds_total", "Server-reported processing time", ["model", "phase"])
+)
+LATENCY = REGISTRY.register(
+    Histogram("benchmark_request_duration_seconds", "Ollama request latency seen by the client", ["model", "endpoint"])
+)
+
+
+@contextmanager
+def track_request(model: str, endpoint: str) -> Iterator[None]:
+    """Count one Ollama request as in flight while the block runs, then record its latency and outcome."""
+    IN_FLIGHT.inc(model=model)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        ERRORS.inc(model=model, error=type(e).__name__)
+        raise
+    finally:
+        IN_FLIGHT.dec(model=model)
+        REQUESTS.inc(model=model, endpoint=endpoint)
+        LATENCY.observe(time.perf_counter() - start, model=model, endpoint=endpoint)
+
+
+def record_response(model: str, response_data: Dict[str, Any]):
+    """Add the token counts and server timings of a generate response."""
+    for phase, tokens_key, duration_key in (
+        ("prefill", "prompt_eval_count", "prompt_eval_duration"),
+        ("decode", "eval_count", "eval_duration"),
+    ):
+        tokens, nanoseconds = response_data.get(tokens_key), response_data.get(duration_key)
+        if tokens and nanoseconds:
+            TOKENS.inc(tokens, model=model, phase=phase)
+            SERVER_SECONDS.inc(nanoseconds / 1e9, model=model, phase=phase)
+
+
+def record_cache_lookup(hit: bool):
+    CACHE_LOOKUPS.inc(result="hit" if hit else "miss")
+
+
+def _serve(port: int) -> Any:
+    """Start an HTTP server for /metrics on localhost; the caller runs its serve_forever()."""
+    # Imported here: http.server adds tens of milliseconds to the cold start of every entry point
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(f"Metrics scrape: {format % args}")
+
+    return ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+
+
+def write_snapshot(path: str):
+    """Atomically replace the snapshot file with the current metrics."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(REGISTRY.render())
+    os.replace(tmp_path, path)
+
+
+class Exporter:
+    """Serves /metrics and/or rewrites a snapshot file in background daemon threads."""
+
+    def __init__(
+        self, port: Optional[int] = None, snapshot_file: Optional[str] = None, interval: Optional[float] = None
+    ):
+        self.port = port
+        self.snapshot_file = snapshot_file
+        self.interval = interval or config.METRICS_SNAPSHOT_SECONDS
+        self._server: Any = None
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> "Exporter":
+        if self.port is not None:
+            self._server = _serve(self.port)
+            self.port = self._server.server_address[1]
+            self._start_thread(self._server.serve_forever, "metrics-http")
+            logger.info(f"Serving metrics on http://127.0.0.1:{self.port}/metrics")
+        if self.snapshot_file:
+            self._start_thread(self._snapshot_loop, "metrics-snapshot")
+            logger.info(f"Writing metrics to {self.snapshot_file} every {self.interval:g}s")
+        return self
+
+    def _start_thread(self, target, name: str):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _snapshot_loop(self):
+        while not self._stop.wait(self.interval):
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        try:
+            write_snapshot(self.snapshot_file)
+        except OSError as e:
+            logger.warning(f"Could not write metrics snapshot: {e}")
+
+    def stop(self):
+        """Stop serving and write a final snapshot."""
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        if self.snapshot_file:
+            self._write_snapshot()
+
+
+def start_exporter(
+    port: Optional[int] = None, snapshot_file: Optional[str] = None, interval: Optional[float] = None
+) -> Optional[Exporter]:
+    """Start exporting if a port or a snapshot file is given (defaults: config.METRICS_PORT/METRICS_SNAPSHOT_FILE).
+
+    Returns:
+        The running exporter, or None when metrics are not exported.
+    """
+    port = config.METRICS_PORT if port is None else port
+    snapshot_file = snapshot_file or config.METRICS_SNAPSHOT_FILE
+    if port is None and not snapshot_file:
+        return None
+    return Exporter(port, snapshot_file, interval).start()
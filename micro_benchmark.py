@@ -0,0 +1,260 @@
+"""Micro-benchmarks for the text hot paths in utils.
+
+Each function runs on inputs from MICRO_BENCHMARK_SCALES characters (10k to
+10M by default). Time is the fastest of MICRO_BENCHMARK_REPEATS timeit
+repeats, each long enough to be measured reliably; allocations are the peak
+memory traced by tracemalloc during one call, and the number of blocks still
+allocated when it returns. Results are compared with the measurements in
+benchmarks/micro_baselines.json, and the script exits non-zero when a case
+is slower or allocates more than MICRO_BENCHMARK_THRESHOLD times its baseline.
+
+Usage:
+    python micro_benchmark.py                                # run everything and check against the baselines
+    python micro_benchmark.py count_tokens --scales 10000    # some functions, some scales
+    python micro_benchmark.py --update-baselines             # record this machine's measurements as baselines
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+import config
+from utils import (
+    OllamaClient,
+    count_tokens,
+    embed_fact,
+    generate_filler_text,
+    insert_secret_message,
+    load_text_from_file,
+)
+
+logger = logging.getLogger(__name__)
+
+BASELINES_FILE = os.path.join(config.BENCHMARKS_DIR, "micro_baselines.json")
+
+WORDS = ["context", "window", "model", "token", "needle", "haystack", "retrieval", "prompt", "a", "the"]
+FACT = "The secret code is BLUE-ZEBRA-99."
+
+
+def make_text(chars: int, seed: int = config.SEED) -> str:
+    """Deterministic text of exactly chars characters, with words and paragraph breaks like the corpora."""
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < chars:
+        word = rng.choice(WORDS) if rng.random() > 0.02 else "\n\n"
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:chars]
+
+
+def _setup_filler(chars: int, workdir: str) -> Callable[[], Any]:
+    articles = [make_text(5_000, seed=i) for i in range(20)]
+    # Filler words average about 6 characters with their separator
+    word_count = chars // 6
+
+    def run():
+        random.seed(config.SEED)
+        return generate_filler_text(word_count, articles)
+
+    return run
+
+
+def _setup_embed_fact(chars: int, workdir: str) -> Callable[[], Any]:
+    text = make_text(chars)
+    return lambda: embed_fact(text, FACT, "middle")
+
+
+def _setup_insert_secret(chars: int, workdir: str) -> Callable[[], Any]:
+    text = make_text(chars)
+    return lambda: insert_secret_message(text, "middle", FACT)
+
+
+def _setup_count_tokens(chars: int, workdir: str) -> Callable[[], Any]:
+    text = make_text(chars)
+    return lambda: count_tokens(text)
+
+
+def _setup_load_text(chars: int, workdir: str) -> Callable[[], Any]:
+    path = os.path.join(workdir, f"text_{chars}.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(make_text(chars))
+    return lambda: load_text_from_file(path, chars)
+
+
+def _setup_cache_path(chars: int, workdir: str) -> Callable[[], Any]:
+    client = OllamaClient("benchmark-model", host="http://127.0.0.1:11434")
+    payload = client.generate_payload(make_text(chars), temperature=0.1, max_tokens=500)
+    return lambda: client._get_cache_path(payload)
+
+
+# Benchmark name -> setup(chars, workdir) returning the call to measure
+BENCHMARKS: Dict[str, Callable[[int, str], Callable[[], Any]]] = {
+    "generate_filler_text": _setup_filler,
+    "embed_fact": _setup_embed_fact,
+    "insert_secret_message": _setup_insert_secret,
+    "count_tokens": _setup_count_tokens,
+    "load_text_from_file": _setup_load_text,
+    "_get_cache_path": _setup_cache_path,
+}
+
+
+def case_name(name: str, chars: int) -> str:
+    return f"{name}[{chars}]"
+
+
+def measure(call: Callable[[], Any], repeats: Optional[int] = None) -> Dict[str, Any]:
+    """Time one call and trace its allocations.
+
+    Returns:
+        Dictionary with "seconds" per call (fastest repeat), "peak_alloc_mb"
+        (peak traced memory during one call) and "retained_blocks" (memory
+        blocks still allocated after it, the result included).
+    """
+    repeats = repeats or config.MICRO_BENCHMARK_REPEATS
+    timer = timeit.Timer(call)
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat=repeats, number=number)) / number
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        current_before, _ = tracemalloc.get_traced_memory()
+        result = call()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    retained = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    del result
+
+    return {
+        "seconds": seconds,
+        "peak_alloc_mb": (peak - current_before) / (1024 * 1024),
+        "retained_blocks": retained,
+    }
+
+
+def run_benchmarks(
+    names: Optional[List[str]] = None, scales: Optional[List[int]] = None, repeats: Optional[int] = None
+) -> Dict[str, Dict[str, Any]]:
+    """Measure every (function, scale) case.
+
+    Returns:
+        Measurements keyed by case name, e.g. "count_tokens[100000]".
+    """
+    names = names or list(BENCHMARKS)
+    scales = scales or config.MICRO_BENCHMARK_SCALES
+    measurements = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in names:
+            for chars in scales:
+                logger.info(f"Measuring {name} on {chars} chars...")
+                call = BENCHMARKS[name](chars, workdir)
+                measurements[case_name(name, chars)] = {"function": name, "chars": chars, **measure(call, repeats)}
+    return measurements
+
+
+def load_baselines(path: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    path = path or BASELINES_FILE
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        baselines: Dict[str, Dict[str, float]] = json.load(f)
+    return baselines
+
+
+def check_regressions(
+    measurements: Dict[str, Dict[str, Any]], baselines: Dict[str, Dict[str, float]], threshold: Optional[float] = None
+) -> List[str]:
+    """List every case slower or allocating more than threshold times its baseline; cases without one pass."""
+    threshold = threshold or config.MICRO_BENCHMARK_THRESHOLD
+    regressions = []
+    for case, measured in measurements.items():
+        baseline = baselines.get(case)
+        if baseline is None:
+            continue
+        for key, slack in (
+            ("seconds", config.MICRO_BENCHMARK_SLACK_SECONDS),
+            ("peak_alloc_mb", config.MICRO_BENCHMARK_SLACK_MB),
+        ):
+            if key not in baseline:
+                continue
+            # The slack keeps microsecond-scale cases from failing on timer noise
+            if measured[key] > baseline[key] * threshold + slack:
+                regressions.append(
+                    f"{case}: {key} {measured[key]:.6g} is over {threshold:g}x its baseline {baseline[key]:.6g}"
+                )
+    return regressions
+
+
+def update_baselines(
+    measurements: Dict[str, Dict[str, Any]], baselines: Dict[str, Dict[str, float]], path: Optional[str] = None
+) -> Dict[str, Dict[str, float]]:
+    """Record the measured cases as the new baselines; other cases keep theirs."""
+    updated = dict(baselines)
+    for case, measured in measurements.items():
+        updated[case] = {"seconds": measured["seconds"], "peak_alloc_mb": round(measured["peak_alloc_mb"], 3)}
+    path = path or BASELINES_FILE
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(dict(sorted(updated.items())), f, indent=2)
+        f.write("\n")
+    return updated
+
+
+def format_report(measurements: Dict[str, Dict[str, Any]], baselines: Dict[str, Dict[str, float]]) -> str:
+    lines = [f"{'Case':<34} {'Time':>10} {'Baseline':>10} {'Peak alloc':>11} {'Baseline':>10} {'Retained':>9}"]
+    for case, measured in measurements.items():
+        baseline = baselines.get(case, {})
+        time_baseline = f"{baseline['seconds'] * 1000:.3f}ms" if "seconds" in baseline else "-"
+        alloc_baseline = f"{baseline['peak_alloc_mb']:.2f} MB" if "peak_alloc_mb" in baseline else "-"
+        lines.append(
+            f"{case:<34} {measured['seconds'] * 1000:>8.3f}ms {time_baseline:>10} "
+            f"{measured['peak_alloc_mb']:>8.2f} MB {alloc_baseline:>10} {measured['retained_blocks']:>9}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark the text hot paths against stored baselines")
+    parser.add_argument("functions", nargs="*", help=f"Any of {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("--scales", nargs="+", type=int, help="Input sizes in characters")
+    parser.add_argument("--repeats", type=int, help="Timing repeats per case (the fastest counts)")
+    parser.add_argument("--threshold", type=float, help="Allowed slowdown/allocation growth factor")
+    parser.add_argument("--update-baselines", action="store_true", help="Record this run as the baselines")
+    parser.add_argument("--output", help="Also save the measurements to this JSON file")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.functions if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown functions: {', '.join(unknown)}")
+    measurements = run_benchmarks(args.functions, args.scales, args.repeats)
+
+    baselines = load_baselines()
+    if args.update_baselines:
+        baselines = update_baselines(measurements, baselines)
+        logger.info(f"Updated {BASELINES_FILE}")
+    print(format_report(measurements, baselines))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(measurements, f, indent=2)
+
+    regressions = check_regressions(measurements, baselines, args.threshold)
+    for regression in regressions:
+        logger.error(regression)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
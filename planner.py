@@ -0,0 +1,283 @@
+"""Dry-run planner: predicts the cost of a sweep before any request is sent.
+
+Every trial is enumerated and asked for the generate requests it would send
+(ExperimentBase.plan_requests). Request times come from the throughput each
+model achieved in past responses: the response cache and the detailed result
+files carry Ollama's prompt_eval/eval token counts and durations.
+
+Request times are single-stream times. A host serves up to its capacity
+(Ollama's parallel slots) at once, so the wall-clock prediction divides the
+server time by the requests the engine keeps in flight, capped by the
+capacity of the hosts it uses.
+"""
+
+import glob
+import json
+import logging
+import os
+from multiprocessing import cpu_count
+from typing import Any, Dict, List, Optional
+
+import config
+from plugins import PluginRegistry
+from scheduler import estimate_task_seconds
+
+logger = logging.getLogger(__name__)
+
+NS_PER_SECOND = 1e9
+# Throughput pooled over every model, used for models with no history of their own
+ALL_MODELS = "*"
+
+
+def _add_sample(totals: Dict[str, Dict[str, float]], model: Optional[str], stats: Dict[str, Any]):
+    if not model or not stats.get("prompt_eval_duration"):
+        return
+    for key in (model, ALL_MODELS):
+        t = totals.setdefault(key, {"prompt_tokens": 0, "prompt_ns": 0, "eval_tokens": 0, "eval_ns": 0, "load_ns": 0})
+        t["prompt_tokens"] += stats.get("prompt_eval_count", 0)
+        t["prompt_ns"] += stats.get("prompt_eval_duration", 0)
+        t["eval_tokens"] += stats.get("eval_count", 0)
+        t["eval_ns"] += stats.get("eval_duration", 0)
+        t["load_ns"] += stats.get("load_duration", 0)
+        t["responses"] = t.get("responses", 0) + 1
+
+
+def load_throughput(cache_dir: Optional[str] = None, results_dir: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    """Per-model throughput observed in past responses.
+
+    Args:
+        cache_dir: Response cache directory (default: config.CACHE_DIR).
+        results_dir: Directory of result files (default: config.RESULTS_DIR).
+
+    Returns:
+        Model (or ALL_MODELS) -> "prefill_tps", "decode_tps", mean "output_tokens",
+        mean "load_seconds" and the number of "responses" they are based on.
+    """
+    totals: Dict[str, Dict[str, float]] = {}
+
+    for path in glob.glob(os.path.join(cache_dir or config.CACHE_DIR, "*.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if isinstance(data, dict):
+            _add_sample(totals, data.get("model"), data)
+
+    for path in glob.glob(os.path.join(results_dir or config.RESULTS_DIR, "*_results.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        rows = data.get("results") if isinstance(data, dict) else None
+        for row in rows if isinstance(rows, list) else []:
+            if isinstance(row, dict) and isinstance(row.get("ollama_metadata"), dict):
+                _add_sample(totals, row.get("model"), row["ollama_metadata"])
+
+    throughput = {}
+    for model, t in totals.items():
+        if not t["prompt_ns"] or not t["eval_ns"]:
+            continue
+        throughput[model] = {
+            "prefill_tps": t["prompt_tokens"] / (t["prompt_ns"] / NS_PER_SECOND),
+            "decode_tps": t["eval_tokens"] / (t["eval_ns"] / NS_PER_SECOND),
+            "output_tokens": t["eval_tokens"] / t["responses"],
+            "load_seconds": t["load_ns"] / NS_PER_SECOND / t["responses"],
+            "responses": t["responses"],
+        }
+    return throughput
+
+
+def model_rates(throughput: Dict[str, Dict[str, float]], model: str) -> Dict[str, Any]:
+    """Throughput to predict a model with: its own history, else all models' history, else defaults."""
+    if model in throughput:
+        return dict(throughput[model], source="history")
+    if ALL_MODELS in throughput:
+        return dict(throughput[ALL_MODELS], source="history (all models)")
+    return {
+        "prefill_tps": config.SCHEDULER_PREFILL_TOKENS_PER_SECOND,
+        "decode_tps": config.PLAN_DEFAULT_DECODE_TOKENS_PER_SECOND,
+        "output_tokens": config.PLAN_DEFAULT_OUTPUT_TOKENS,
+        "load_seconds": config.PLAN_DEFAULT_LOAD_SECONDS,
+        "source": "defaults",
+    }
+
+
+def request_seconds(request: Dict[str, Any], rates: Dict[str, Any]) -> float:
+    """Predicted server time of one uncached request: prefill plus decode."""
+    output_tokens = min(request["max_tokens"], rates["output_tokens"])
+    return float(request["prompt_tokens"] / rates["prefill_tps"] + output_tokens / rates["decode_tps"])
+
+
+def peak_concurrency(engine: str, models: List[str], trial_peaks: Dict[str, List[int]]) -> int:
+    """Most requests in flight at once under an engine.
+
+    Args:
+        engine: "sequential", "pool", "queue" or "async".
+        models: Models in the sweep.
+        trial_peaks: Model -> the peak concurrency of each of its trials.
+    """
+    if not any(trial_peaks.values()):
+        return 0
+
+    def top(peaks: List[int], slots: int) -> int:
+        return sum(sorted(peaks, reverse=True)[:slots])
+
+    per_model = max(max(peaks, default=0) for peaks in trial_peaks.values())
+    if engine == "pool":
+        return min(cpu_count(), len(models), 4) * per_model
+    if engine == "queue":
+        capacity = sum(host.get("capacity") or config.SCHEDULER_HOST_CONCURRENCY for host in config.OLLAMA_HOSTS)
+        return top([p for peaks in trial_peaks.values() for p in peaks], capacity)
+    if engine == "async":
+        model_peak = max(top(peaks, config.ASYNC_MODEL_CONCURRENCY) for peaks in trial_peaks.values())
+        return min(config.SCHEDULER_MAX_RESIDENT_MODELS, len(models)) * model_peak
+    return per_model
+
+
+def parallel_requests(engine: str, concurrency: int) -> int:
+    """Requests served at once: the engine's peak concurrency, capped by its hosts' capacity.
+
+    Only the queue engine spreads work over every host in OLLAMA_HOSTS; the
+    other engines send everything to the first one.
+    """
+    hosts = config.OLLAMA_HOSTS if engine == "queue" else config.OLLAMA_HOSTS[:1]
+    capacity = sum(host.get("capacity") or config.SCHEDULER_HOST_CONCURRENCY for host in hosts)
+    return max(1, min(concurrency, capacity))
+
+
+def plan_sweep(
+    models: Optional[List[str]] = None,
+    experiments: Optional[List[int]] = None,
+    exp1_mode: str = "quick",
+    exp3_mode: str = "single",
+    exp4_mode: str = "standard",
+    engine: str = "sequential",
+    throughput: Optional[Dict[str, Dict[str, float]]] = None,
+) -> Dict[str, Any]:
+    """Enumerate every trial of a sweep and predict its cost.
+
+    Returns:
+        Dictionary with one row per (model, experiment) under "rows" and the
+        sweep totals: "trials", "requests", "prompt_tokens", "output_tokens",
+        "server_seconds", "wall_seconds", "peak_concurrency",
+        "parallel_requests" (see parallel_requests), "cached" and
+        "checkable" (requests whose cache status is known).
+    """
+    # Imported here: main imports this module for --plan
+    from main import experiment_kwargs
+
+    models = models or config.MODELS
+    all_experiments = PluginRegistry.get_all_experiments()
+    experiments = sorted(e for e in (experiments or all_experiments) if e in all_experiments)
+    throughput = load_throughput() if throughput is None else throughput
+
+    rows = []
+    trial_peaks: Dict[str, List[int]] = {}
+    for model in models:
+        rates = model_rates(throughput, model)
+        trial_peaks[model] = []
+        for exp_id in experiments:
+            row: Dict[str, Any] = {
+                "model": model,
+                "exp_id": exp_id,
+                "trials": 0,
+                "requests": 0,
+                "prompt_tokens": 0,
+                "output_tokens": 0,
+                "cached": 0,
+                "checkable": 0,
+                "server_seconds": 0.0,
+                "predicted": True,
+                "rates": rates["source"],
+            }
+            rows.append(row)
+            try:
+                experiment = all_experiments[exp_id](
+                    model, **experiment_kwargs(exp_id, exp1_mode, exp3_mode, exp4_mode)
+                )
+                trials = experiment.trials()
+                peak = experiment.peak_concurrency()
+                row["trials"] = len(trials)
+                trial_peaks[model].extend([1] * len(trials) if len(trials) > 1 else [peak])
+                for trial in trials:
+                    requests = experiment.plan_requests(trial)
+                    if requests is None:
+                        # Nothing to go on but the configured whole-run duration
+                        row["predicted"] = False
+                        row["server_seconds"] += estimate_task_seconds(exp_id, trial)
+                        continue
+                    for request in requests:
+                        row["requests"] += 1
+                        row["prompt_tokens"] += request["prompt_tokens"]
+                        if request["cached"] is not None:
+                            row["checkable"] += 1
+                        if request["cached"]:
+                            row["cached"] += 1
+                            continue
+                        row["output_tokens"] += int(min(request["max_tokens"], rates["output_tokens"]))
+                        row["server_seconds"] += request_seconds(request, rates)
+            except Exception as e:
+                logger.error(f"Could not plan Exp {exp_id} for {model}: {e}")
+                row["error"] = str(e)
+
+        model_seconds = sum(r["server_seconds"] for r in rows if r["model"] == model)
+        if model_seconds:
+            # Each model is loaded at least once
+            rows[-1]["server_seconds"] += rates["load_seconds"]
+
+    hosts = len(config.OLLAMA_HOSTS) if engine == "queue" else 1
+    server_seconds = sum(r["server_seconds"] for r in rows)
+    concurrency = peak_concurrency(engine, models, trial_peaks)
+    parallel = parallel_requests(engine, concurrency)
+    return {
+        "engine": engine,
+        "hosts": hosts,
+        "parallel_requests": parallel,
+        "rows": rows,
+        "trials": sum(r["trials"] for r in rows),
+        "requests": sum(r["requests"] for r in rows),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in rows),
+        "output_tokens": sum(r["output_tokens"] for r in rows),
+        "cached": sum(r["cached"] for r in rows),
+        "checkable": sum(r["checkable"] for r in rows),
+        "server_seconds": server_seconds,
+        "wall_seconds": server_seconds / parallel,
+        "peak_concurrency": concurrency,
+    }
+
+
+def _duration(seconds: float) -> str:
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}h{rest // 60:02d}m" if hours else f"{rest // 60}m{rest % 60:02d}s"
+
+
+def format_plan(plan: Dict[str, Any]) -> str:
+    """Render a plan as a table followed by the sweep totals."""
+    lines = [
+        f"{'Model':<24} {'Exp':>3} {'Trials':>6} {'Requests':>8} {'Prompt tok':>11} {'Cached':>9} {'Time':>9}  Rates",
+    ]
+    for row in plan["rows"]:
+        cached = f"{row['cached']}/{row['checkable']}" if row["checkable"] else "-"
+        time_text = _duration(row["server_seconds"]) + ("" if row["predicted"] else "*")
+        rates = f"error: {row['error']}" if "error" in row else row["rates"]
+        lines.append(
+            f"{row['model']:<24} {row['exp_id']:>3} {row['trials']:>6} {row['requests']:>8} "
+            f"{row['prompt_tokens']:>11,} {cached:>9} {time_text:>9}  {rates}"
+        )
+
+    coverage = f"{plan['cached'] / plan['checkable']:.0%}" if plan["checkable"] else "n/a"
+    lines += [
+        "",
+        f"Trials: {plan['trials']}, requests: {plan['requests']}, "
+        f"prompt tokens: {plan['prompt_tokens']:,}, output tokens: {plan['output_tokens']:,}",
+        f"Cache hits: {plan['cached']} of {plan['checkable']} checkable requests ({coverage})",
+        f"Peak concurrency ({plan['engine']} engine): {plan['peak_concurrency']} requests",
+        f"Predicted server time: {_duration(plan['server_seconds'])}, "
+        f"wall-clock on {plan['hosts']} host(s) with {plan['parallel_requests']} request(s) in parallel: "
+        f"{_duration(plan['wall_seconds'])}",
+    ]
+    if any(not row["predicted"] for row in plan["rows"]):
+        lines.append("* includes configured whole-run estimates (SCHEDULER_EXPERIMENT_SECONDS)")
+    return "\n".join(lines)
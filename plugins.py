@@ -1,59 +1,140 @@
+"""Experiment registry.
+
+Experiments are listed in experiments.json (ID, name, module and class), so
+discovery reads metadata without importing anything; an experiment's module
+is imported only when its class is first looked up. Running Exp 1 alone thus
+never imports LangChain or Chroma. ``exp*.py`` files missing from the manifest
+are still found the old way, by importing them at discovery.
+"""
+
 import glob
 import importlib
 import inspect
+import json
 import logging
 import os
 import sys
-from typing import Dict, Optional, Type
+from typing import Any, Dict, Iterator, Mapping, Optional, Type
 
 from base import ExperimentBase
 
 logger = logging.getLogger(__name__)
 
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_FILE = os.path.join(PLUGIN_DIR, "experiments.json")
+
+
+def load_manifest(path: Optional[str] = None) -> Dict[int, Dict[str, Any]]:
+    """Read the experiment manifest.
+
+    Returns:
+        Experiment ID -> {"id", "name", "module", "class"}; empty if the file is missing.
+    """
+    path = path or MANIFEST_FILE
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)["experiments"]
+    return {int(entry["id"]): entry for entry in entries}
+
+
+class LazyExperiments(Mapping[int, Type[ExperimentBase]]):
+    """Read-only view of the registry: iterating lists IDs, indexing imports the experiment."""
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(sorted(set(PluginRegistry._manifest) | set(PluginRegistry._experiments)))
+
+    def __len__(self) -> int:
+        return len(set(PluginRegistry._manifest) | set(PluginRegistry._experiments))
+
+    def __getitem__(self, exp_id: int) -> Type[ExperimentBase]:
+        exp_class = PluginRegistry.get_experiment_class(exp_id)
+        if exp_class is None:
+            raise KeyError(exp_id)
+        return exp_class
+
 
 class PluginRegistry:
     _experiments: Dict[int, Type[ExperimentBase]] = {}
+    _manifest: Dict[int, Dict[str, Any]] = {}
     _discovered = False
 
     @classmethod
     def discover_experiments(cls):
-        """Discover and register experiments from local files."""
+        """Register the manifest's experiments, and import any exp*.py file it does not list."""
         if cls._discovered:
             return
 
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        # Look for files matching exp*.py
-        files = glob.glob(os.path.join(current_dir, "exp*.py"))
-
         # Ensure current dir is in path
-        if current_dir not in sys.path:
-            sys.path.insert(0, current_dir)
+        if PLUGIN_DIR not in sys.path:
+            sys.path.insert(0, PLUGIN_DIR)
+
+        try:
+            cls._manifest = load_manifest()
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Failed to read experiment manifest {MANIFEST_FILE}: {e}")
+            cls._manifest = {}
 
-        for file_path in files:
+        listed = {entry["module"] for entry in cls._manifest.values()}
+        for file_path in glob.glob(os.path.join(PLUGIN_DIR, "exp*.py")):
             module_name = os.path.basename(file_path).replace(".py", "")
-            try:
-                module = importlib.import_module(module_name)
-                for name, obj in inspect.getmembers(module):
-                    if inspect.isclass(obj) and issubclass(obj, ExperimentBase) and obj is not ExperimentBase:
-                        if hasattr(obj, "ID") and isinstance(obj.ID, int):
-                            cls._experiments[obj.ID] = obj
-                            logger.info(f"Registered Experiment {obj.ID}: {obj.NAME} ({name})")
-                        else:
-                            logger.warning(f"Skipping {name}: Missing ID or NAME class attributes.")
-
-            except Exception as e:
-                logger.error(f"Failed to load plugin {module_name}: {e}")
+            if module_name not in listed:
+                logger.info(f"{module_name} is not in {os.path.basename(MANIFEST_FILE)}; importing it to discover it")
+                cls._register_module(module_name)
 
         cls._discovered = True
 
+    @classmethod
+    def _register_module(cls, module_name: str):
+        try:
+            module = importlib.import_module(module_name)
+            for name, obj in inspect.getmembers(module):
+                if inspect.isclass(obj) and issubclass(obj, ExperimentBase) and obj is not ExperimentBase:
+                    if hasattr(obj, "ID") and isinstance(obj.ID, int):
+                        cls._experiments[obj.ID] = obj
+                        logger.info(f"Registered Experiment {obj.ID}: {obj.NAME} ({name})")
+                    else:
+                        logger.warning(f"Skipping {name}: Missing ID or NAME class attributes.")
+
+        except Exception as e:
+            logger.error(f"Failed to load plugin {module_name}: {e}")
+
+    @classmethod
+    def _load(cls, exp_id: int) -> Optional[Type[ExperimentBase]]:
+        entry = cls._manifest[exp_id]
+        try:
+            exp_class: Type[ExperimentBase] = getattr(importlib.import_module(entry["module"]), entry["class"])
+        except Exception as e:
+            logger.error(f"Failed to load plugin {entry['module']}: {e}")
+            return None
+        if getattr(exp_class, "ID", None) != exp_id:
+            logger.error(f"{entry['module']}.{entry['class']} has ID {getattr(exp_class, 'ID', None)}, not {exp_id}")
+            return None
+        cls._experiments[exp_id] = exp_class
+        logger.info(f"Registered Experiment {exp_id}: {exp_class.NAME} ({entry['class']})")
+        return exp_class
+
     @classmethod
     def get_experiment_class(cls, exp_id: int) -> Optional[Type[ExperimentBase]]:
         if not cls._discovered:
             cls.discover_experiments()
+        if exp_id not in cls._experiments and exp_id in cls._manifest:
+            return cls._load(exp_id)
         return cls._experiments.get(exp_id)
 
     @classmethod
-    def get_all_experiments(cls) -> Dict[int, Type[ExperimentBase]]:
+    def get_experiment_name(cls, exp_id: int) -> Optional[str]:
+        """Name of an experiment, without importing it."""
+        if not cls._discovered:
+            cls.discover_experiments()
+        if exp_id in cls._manifest:
+            return str(cls._manifest[exp_id]["name"])
+        exp_class = cls._experiments.get(exp_id)
+        return exp_class.NAME if exp_class is not None else None
+
+    @classmethod
+    def get_all_experiments(cls) -> Mapping[int, Type[ExperimentBase]]:
+        """Every experiment by ID; a class's module is imported when it is first looked up."""
         if not cls._discovered:
             cls.discover_experiments()
-        return cls._experiments
+        return LazyExperiments()
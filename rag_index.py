@@ -0,0 +1,302 @@
+"""Manifest-tracked, incremental builds of the shared RAG index.
+
+The manifest stored next to the vector store records the splitter parameters,
+the embedding model and a content hash per source document. Comparing it with
+the current corpus tells us exactly which chunks have to be embedded and which
+ones have to be deleted, so a corpus update never needs a full re-embed and a
+stale index is never used without notice.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional
+
+import config
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent builders are not serialized
+    fcntl = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+# 2: chunks are embedded in batches through /api/embed, which returns normalized vectors
+# 3: documents are keyed by content instead of their position in the directory listing
+# 4: documents are keyed by file name, so an edit keeps the IDs of the chunks it did not touch
+MANIFEST_VERSION = 4
+MANIFEST_FILENAME = "index_manifest.json"
+LOCK_FILENAME = ".build.lock"
+SPLITTER_NAME = "RecursiveCharacterTextSplitter"
+
+
+def content_hash(text: str) -> str:
+    """Return the SHA-256 hex digest of a text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def build_lock(persist_directory: str) -> Iterator[None]:
+    """Hold an exclusive inter-process lock on an index directory.
+
+    Only one process at a time may plan and apply an update, so workers that
+    start on a cold index wait for the first builder instead of racing it.
+    """
+    os.makedirs(persist_directory, exist_ok=True)
+    with open(os.path.join(persist_directory, LOCK_FILENAME), "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class RagIndex:
+    """Keeps a persisted vector store in sync with a document corpus."""
+
+    def __init__(
+        self,
+        persist_directory: str = config.EXP3_INDEX_DIR,
+        embedding_model: str = config.EXP3_EMBEDDING_MODEL,
+        chunk_size: int = config.EXP3_CHUNK_SIZE,
+        chunk_overlap: int = config.EXP3_CHUNK_OVERLAP,
+    ):
+        self.persist_directory = persist_directory
+        self.embedding_model = embedding_model
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.manifest_path = os.path.join(persist_directory, MANIFEST_FILENAME)
+
+    def params(self) -> Dict[str, Any]:
+        """Parameters that invalidate every stored chunk when they change."""
+        return {
+            "embedding_model": self.embedding_model,
+            "splitter": SPLITTER_NAME,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+        }
+
+    def split(self, source: str, text: str) -> List["Document"]:
+        """Split one document into chunks with stable, content-derived IDs."""
+        # Imported here: LangChain is only needed when the index is (re)built, not to search it
+        from langchain_core.documents import Document
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+        splitter = RecursiveCharacterTextSplitter(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+        chunks = []
+        seen: Dict[str, int] = {}
+        for chunk_text in splitter.split_text(text):
+            chunk_id = f"{source}:{content_hash(chunk_text)[:16]}"
+            # Identical chunks inside one document still need distinct IDs
+            seen[chunk_id] = seen.get(chunk_id, 0) + 1
+            if seen[chunk_id] > 1:
+                chunk_id = f"{chunk_id}-{seen[chunk_id]}"
+            chunks.append(Document(page_content=chunk_text, metadata={"source": source}, id=chunk_id))
+        return chunks
+
+    def load_manifest(self) -> Optional[Dict[str, Any]]:
+        """Read the manifest, or None if it is missing or unreadable."""
+        if not os.path.exists(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest: Dict[str, Any] = json.load(f)
+            return manifest
+        except Exception as e:
+            logger.warning(f"Failed to read index manifest {self.manifest_path}: {e}")
+            return None
+
+    def save_manifest(self, manifest: Dict[str, Any]):
+        """Write the manifest atomically so a crash never leaves a half-written file."""
+        os.makedirs(self.persist_directory, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def plan(self, documents: Dict[str, str], rebuild: bool = False) -> Dict[str, Any]:
+        """Diff the corpus against the manifest.
+
+        Args:
+            documents: Mapping of source ID to document text.
+            rebuild: Re-embed everything even if the manifest matches.
+
+        Returns:
+            Dictionary with the reason for a full rebuild (None when an
+            incremental update is enough), the chunks to add, the chunk IDs to
+            delete and the manifest describing the index after the update.
+        """
+        manifest = self.load_manifest()
+        rebuild_reason = None
+        if rebuild:
+            rebuild_reason = "forced"
+        elif manifest is None:
+            rebuild_reason = "no manifest"
+        elif manifest.get("version") != MANIFEST_VERSION:
+            rebuild_reason = f"manifest version {manifest.get('version')} != {MANIFEST_VERSION}"
+        elif manifest.get("params") != self.params():
+            rebuild_reason = f"index parameters changed: {manifest.get('params')} -> {self.params()}"
+
+        old_docs: Dict[str, Dict[str, Any]] = {} if rebuild_reason or manifest is None else manifest["documents"]
+        new_docs: Dict[str, Dict[str, Any]] = {}
+        to_add: List["Document"] = []
+        to_delete: List[str] = []
+        changed_sources = []
+
+        for source, text in documents.items():
+            doc_hash = content_hash(text)
+            old = old_docs.get(source)
+            if old is not None and old["hash"] == doc_hash:
+                new_docs[source] = old
+                continue
+
+            chunks = self.split(source, text)
+            new_ids = [c.id for c in chunks]
+            old_ids = set(old["chunk_ids"]) if old is not None else set()
+            # Chunks whose text survived the edit keep their embedding
+            to_add.extend(c for c in chunks if c.id not in old_ids)
+            to_delete.extend(old_ids - set(new_ids))
+            new_docs[source] = {"hash": doc_hash, "chunk_ids": new_ids}
+            changed_sources.append(source)
+
+        removed_sources = [s for s in old_docs if s not in documents]
+        for source in removed_sources:
+            to_delete.extend(old_docs[source]["chunk_ids"])
+
+        return {
+            "rebuild_reason": rebuild_reason,
+            "changed_sources": changed_sources,
+            "removed_sources": removed_sources,
+            "add": to_add,
+            "delete": sorted(to_delete),
+            "manifest": {"version": MANIFEST_VERSION, "params": self.params(), "documents": new_docs},
+        }
+
+    @staticmethod
+    def is_up_to_date(plan: Dict[str, Any]) -> bool:
+        """Whether applying the plan would leave the index unchanged."""
+        return plan["rebuild_reason"] is None and not plan["add"] and not plan["delete"]
+
+    def apply(self, vectorstore: Any, plan: Dict[str, Any]) -> Dict[str, int]:
+        """Apply a plan to a LangChain vector store and record the new manifest.
+
+        Args:
+            vectorstore: Store supporting reset_collection, delete and add_documents.
+            plan: Result of plan().
+
+        Returns:
+            Counts of added, deleted and total chunks.
+        """
+        if plan["rebuild_reason"] is not None:
+            logger.info(f"Rebuilding RAG index from scratch ({plan['rebuild_reason']})")
+            vectorstore.reset_collection()
+        elif plan["delete"]:
+            vectorstore.delete(ids=plan["delete"])
+
+        if plan["add"]:
+            vectorstore.add_documents(plan["add"], ids=[d.id for d in plan["add"]])
+
+        self.save_manifest(plan["manifest"])
+        total = sum(len(d["chunk_ids"]) for d in plan["manifest"]["documents"].values())
+        stats = {"added": len(plan["add"]), "deleted": len(plan["delete"]), "total": total}
+        logger.info(
+            f"RAG index updated: +{stats['added']} / -{stats['deleted']} chunks "
+            f"({len(plan['changed_sources'])} changed, {len(plan['removed_sources'])} removed documents), "
+            f"{stats['total']} chunks total"
+        )
+        return stats
+
+    def sync(
+        self, vectorstore: Any, documents: Dict[str, str], rebuild: bool = False, read_only: bool = False
+    ) -> Dict[str, int]:
+        """Bring a store up to date with the corpus, refusing stale use when auto-update is off.
+
+        Updates are planned and applied under build_lock(), so concurrent
+        callers build the index once and the others reuse it. Stores that
+        read their data only when opened (those with a reload() method) are
+        reloaded first, since another builder may have written the index
+        while this caller waited for the lock.
+
+        Args:
+            vectorstore: Store supporting reset_collection, delete and add_documents.
+            documents: Mapping of source ID to document text.
+            rebuild: Re-embed everything even if the manifest matches.
+            read_only: Only verify that the index matches the corpus; never write to it.
+
+        Returns:
+            Counts of added, deleted and total chunks.
+
+        Raises:
+            RuntimeError: If the index is stale and either read_only is set or
+                config.EXP3_INDEX_AUTO_UPDATE is disabled.
+        """
+        if read_only:
+            self._reload(vectorstore)
+            plan = self.plan(documents)
+            if not self.is_up_to_date(plan):
+                raise RuntimeError(
+                    f"RAG index at {self.persist_directory} is stale but was opened read-only "
+                    f"(rebuild: {plan['rebuild_reason']}, {len(plan['add'])} chunks to add, "
+                    f"{len(plan['delete'])} to delete). Build it before starting workers."
+                )
+            return self._reuse(plan)
+
+        with build_lock(self.persist_directory):
+            self._reload(vectorstore)
+            plan = self.plan(documents, rebuild=rebuild)
+            if self.is_up_to_date(plan):
+                return self._reuse(plan)
+
+            if not config.EXP3_INDEX_AUTO_UPDATE and not rebuild:
+                raise RuntimeError(
+                    f"RAG index at {self.persist_directory} is stale "
+                    f"(rebuild: {plan['rebuild_reason']}, {len(plan['add'])} chunks to add, "
+                    f"{len(plan['delete'])} to delete). Run `python rag_index.py` to update it."
+                )
+
+            return self.apply(vectorstore, plan)
+
+    @staticmethod
+    def _reload(vectorstore: Any):
+        # Chroma reads from disk on every query; the in-memory stores only on open
+        if hasattr(vectorstore, "reload"):
+            vectorstore.reload()
+
+    def _reuse(self, plan: Dict[str, Any]) -> Dict[str, int]:
+        logger.info(f"Reusing up-to-date RAG index from {self.persist_directory}")
+        total = sum(len(d["chunk_ids"]) for d in plan["manifest"]["documents"].values())
+        return {"added": 0, "deleted": 0, "total": total}
+
+
+if __name__ == "__main__":
+    from retrievers import create_retriever
+    from utils import load_hebrew_documents
+
+    parser = argparse.ArgumentParser(description="Check or update the shared RAG index")
+    parser.add_argument("--backend", default=config.EXP3_RETRIEVER, help="Retriever backend whose index to update")
+    parser.add_argument("--check", action="store_true", help="Only report whether the index is stale")
+    parser.add_argument("--rebuild", action="store_true", help="Force a full re-embed of the corpus")
+    args = parser.parse_args()
+
+    retriever = create_retriever(args.backend)
+    corpus = load_hebrew_documents()
+
+    if args.check:
+        update_plan = retriever.rag_index.plan(corpus)
+        if RagIndex.is_up_to_date(update_plan):
+            print("RAG index is up to date.")
+        else:
+            print(
+                f"RAG index is stale: rebuild={update_plan['rebuild_reason']}, "
+                f"add={len(update_plan['add'])}, delete={len(update_plan['delete'])}"
+            )
+    else:
+        print(retriever.build(corpus, rebuild=args.rebuild))
@@ -0,0 +1,387 @@
+"""Columnar store of benchmark results, one flat row per trial.
+
+Results are partitioned like a Hive table,
+``{directory}/run=<run_id>/model=<model>/experiment=<experiment>/part-*.parquet``,
+so a reader only opens the partitions it asks for and, with Parquet, only the
+columns it asks for. Every dict in an experiment's results that records one
+model request becomes a "trial" row with the common fields as columns
+(accuracy, latency, token counts, server throughput) and the full record as
+JSON. The rest of the result (summaries, settings, nesting) is kept
+as one "skeleton" row, so the familiar JSON shapes can be rebuilt exactly as
+views: model_results() gives ``{model}_results.json`` and detailed_results()
+gives ``{mode}_results.json``.
+
+Parts are written with pyarrow when it is installed; without it they are
+JSON Lines files with the same columns, and partition pruning still applies.
+"""
+
+import importlib.util
+import json
+import logging
+import os
+import time
+import uuid
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from urllib.parse import quote, unquote
+
+import config
+from utils import server_metrics
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PARTITION_KEYS = ["run", "model", "experiment"]
+
+# Detailed Exp 1 results are stored per model as experiment "exp1_needle_<mode>"
+DETAILED_PREFIX = "exp1_needle_"
+
+# Column name -> Arrow type alias
+COLUMNS: Dict[str, str] = {
+    "run_id": "string",
+    "model": "string",
+    "experiment": "string",
+    "kind": "string",
+    "path": "string",
+    "key": "string",
+    "mode": "string",
+    "position": "string",
+    "target_length": "double",
+    "doc_count": "double",
+    "accuracy": "double",
+    "latency": "double",
+    "prompt_tokens": "double",
+    "output_tokens": "double",
+    "prefill_tokens_per_second": "double",
+    "decode_tokens_per_second": "double",
+    "load_seconds": "double",
+    "prefill_seconds": "double",
+    "decode_seconds": "double",
+    "server_seconds": "double",
+    "client_seconds": "double",
+    "client_overhead_seconds": "double",
+    "record": "string",
+}
+
+SERVER_METRIC_COLUMNS = [
+    "output_tokens",
+    "prefill_tokens_per_second",
+    "decode_tokens_per_second",
+    "load_seconds",
+    "prefill_seconds",
+    "decode_seconds",
+    "server_seconds",
+    "client_seconds",
+    "client_overhead_seconds",
+]
+
+# Result fields holding a trial's outcome and duration, in order of preference
+OUTCOME_KEYS = ["accuracy", "found_secret", "correct"]
+LATENCY_KEYS = ["latency", "query_time_seconds", "wall_time"]
+
+
+def detailed_experiment(mode: str) -> str:
+    return f"{DETAILED_PREFIX}{mode}"
+
+
+def parquet_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def is_trial(node: Any) -> bool:
+    """A trial is a result dict recording one model request: its response or raw server statistics.
+
+    Summaries that average server_metrics over many requests (Exp 3 arms and
+    sweep configurations) have neither, and Exp 4 strategy results sum a
+    chain of requests (counted in "calls"), so none of them is a trial.
+    """
+    return isinstance(node, dict) and ("response" in node or "ollama_metadata" in node) and "calls" not in node
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)):
+        return float(value)
+    return None
+
+
+def _first(record: Dict[str, Any], keys: List[str]) -> Optional[float]:
+    return next((_number(record[k]) for k in keys if _number(record.get(k)) is not None), None)
+
+
+def trial_row(record: Dict[str, Any], path: List[Any], mode: Optional[str]) -> Dict[str, Any]:
+    """Flatten one trial into the store's columns (partition columns excluded)."""
+    stats = record.get("server_metrics")
+    if not isinstance(stats, dict):
+        stats = {}
+        if isinstance(record.get("ollama_metadata"), dict):
+            # Detailed results written before server_metrics existed
+            stats = server_metrics(record["ollama_metadata"], record.get("query_time_seconds") or 0.0)
+    row = {
+        "kind": "trial",
+        "path": json.dumps(path),
+        "key": path[-1] if path and isinstance(path[-1], str) else None,
+        "mode": record.get("mode") if isinstance(record.get("mode"), str) else mode,
+        "position": record.get("message_position"),
+        "target_length": _number(record.get("target_prompt_length")),
+        "doc_count": _first(record, ["doc_count", "num_documents"]),
+        "accuracy": _first(record, OUTCOME_KEYS),
+        "latency": _first(record, LATENCY_KEYS),
+    }
+    prompt_tokens = _first(stats, ["prompt_tokens"])
+    row["prompt_tokens"] = (
+        prompt_tokens if prompt_tokens is not None else _first(record, ["prompt_tokens", "token_count"])
+    )
+    row.update({column: _number(stats.get(column)) for column in SERVER_METRIC_COLUMNS})
+    row["record"] = json.dumps(record, ensure_ascii=False)
+    return row
+
+
+def flatten(result: Any) -> List[Dict[str, Any]]:
+    """Split an experiment's result into a skeleton row and one row per trial.
+
+    Trials are cut out of the result and replaced by None in the skeleton;
+    each trial row records where it belongs as a JSON list of keys and indices.
+    """
+    rows: List[Dict[str, Any]] = []
+
+    def strip(node: Any, path: List[Any], mode: Optional[str]) -> Any:
+        if is_trial(node):
+            rows.append(trial_row(node, path, mode))
+            return None
+        if isinstance(node, dict):
+            mode = node["mode"] if isinstance(node.get("mode"), str) else mode
+            return {str(k): strip(v, path + [str(k)], mode) for k, v in node.items()}
+        if isinstance(node, list):
+            return [strip(v, path + [i], mode) for i, v in enumerate(node)]
+        return node
+
+    skeleton = strip(result, [], None)
+    empty = {column: None for column in COLUMNS}
+    skeleton_row = dict(empty, kind="skeleton", path="[]", record=json.dumps(skeleton, ensure_ascii=False))
+    return [skeleton_row] + [dict(empty, **row) for row in rows]
+
+
+def assemble(rows: List[Dict[str, Any]]) -> Any:
+    """Rebuild a result from its skeleton and trial rows (the inverse of flatten)."""
+    result = next(json.loads(r["record"]) for r in rows if r["kind"] == "skeleton")
+    for row in rows:
+        if row["kind"] != "trial":
+            continue
+        path = json.loads(row["path"])
+        record = json.loads(row["record"])
+        if not path:
+            result = record
+            continue
+        node = result
+        for key in path[:-1]:
+            node = node[key]
+        node[path[-1]] = record
+    return result
+
+
+class ResultsStore:
+    """Partitioned results under ``{directory}/run=.../model=.../experiment=...``.
+
+    Writing a partition again (e.g. when a run is resumed) replaces its
+    earlier parts, so every trial is stored once per run.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or config.RESULTS_STORE_DIR
+
+    def write(self, run_id: str, model: str, experiment: str, result: Any) -> str:
+        """Store one experiment's result for a model as a new part of its partition.
+
+        Returns:
+            Path of the part file written.
+        """
+        rows = flatten(result)
+        for row in rows:
+            row.update(run_id=run_id, model=model, experiment=experiment)
+
+        partition = os.path.join(
+            self.directory,
+            *(f"{key}={quote(value, safe='')}" for key, value in zip(PARTITION_KEYS, [run_id, model, experiment])),
+        )
+        os.makedirs(partition, exist_ok=True)
+        earlier = self._parts(partition)
+        extension = ".parquet" if parquet_available() else ".jsonl"
+        path = os.path.join(partition, f"part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}{extension}")
+        tmp_path = f"{path}.tmp"
+        if extension == ".parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            schema = pa.schema([(name, pa.type_for_alias(alias)) for name, alias in COLUMNS.items()])
+            pq.write_table(pa.Table.from_pylist(rows, schema=schema), tmp_path)
+        else:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+        for old in earlier:
+            os.remove(old)
+
+        logger.info(f"[{model}] Stored {len(rows) - 1} trials of {experiment} in {path}")
+        return path
+
+    def partitions(
+        self, run_id: Optional[str] = None, model: Optional[str] = None, experiment: Optional[str] = None
+    ) -> List[Dict[str, str]]:
+        """List the partitions matching the given values (None matches any), pruning by directory name."""
+        wanted = [run_id, model, experiment]
+        found: List[Dict[str, str]] = [{"path": self.directory}]
+        for key, value in zip(PARTITION_KEYS, wanted):
+            matches = []
+            for partition in found:
+                if not os.path.isdir(partition["path"]):
+                    continue
+                for name in sorted(os.listdir(partition["path"])):
+                    prefix = f"{key}="
+                    if not name.startswith(prefix):
+                        continue
+                    decoded = unquote(name[len(prefix) :])
+                    if value is None or decoded == value:
+                        matches.append({**partition, "path": os.path.join(partition["path"], name), key: decoded})
+            found = matches
+        return found
+
+    @staticmethod
+    def _parts(partition: str) -> List[str]:
+        names = [n for n in os.listdir(partition) if n.startswith("part-") and n.endswith((".parquet", ".jsonl"))]
+        return [os.path.join(partition, n) for n in sorted(names)]
+
+    def part_files(
+        self, run_id: Optional[str] = None, model: Optional[str] = None, experiment: Optional[str] = None
+    ) -> List[str]:
+        return [part for p in self.partitions(run_id, model, experiment) for part in self._parts(p["path"])]
+
+    @staticmethod
+    def _read_rows(path: str, columns: List[str]) -> List[Dict[str, Any]]:
+        if path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+
+            rows: List[Dict[str, Any]] = pq.read_table(path, columns=columns).to_pylist()
+            return rows
+        with open(path, "r", encoding="utf-8") as f:
+            return [{c: row.get(c) for c in columns} for row in map(json.loads, f)]
+
+    def read(
+        self,
+        columns: Optional[List[str]] = None,
+        run_id: Optional[str] = None,
+        model: Optional[str] = None,
+        experiment: Optional[str] = None,
+        kind: Optional[str] = "trial",
+        latest: bool = False,
+    ) -> "pd.DataFrame":
+        """Read some columns of the matching partitions into a DataFrame.
+
+        Args:
+            columns: Columns to load (default: all of COLUMNS).
+            run_id: Only this run (default: every run).
+            model: Only this model (default: every model).
+            experiment: Only this experiment key, e.g. "exp2_size" (default: every experiment).
+            kind: "trial" or "skeleton" rows, or None for both.
+            latest: Only the newest write of each model's experiments, i.e. the trials the views show.
+
+        Raises:
+            ValueError: For a column the store does not have.
+        """
+        import pandas as pd
+
+        columns = list(columns or COLUMNS)
+        unknown = [c for c in columns if c not in COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown result columns: {unknown}")
+        load = columns if kind is None or "kind" in columns else columns + ["kind"]
+
+        parts = self.part_files(run_id, model, experiment)
+        if latest:
+            newest: Dict[str, str] = {}
+            for part in parts:
+                # .../model=<model>/experiment=<experiment>/part-<time>-...: keyed without the run
+                key = os.path.join(*part.split(os.sep)[-3:-1])
+                if key not in newest or os.path.basename(part) > os.path.basename(newest[key]):
+                    newest[key] = part
+            parts = sorted(newest.values())
+
+        frames = []
+        for path in parts:
+            if path.endswith(".parquet"):
+                import pyarrow.parquet as pq
+
+                frames.append(pq.read_table(path, columns=load).to_pandas())
+            else:
+                frame = pd.DataFrame(self._read_rows(path, load), columns=load)
+                for column in load:
+                    if COLUMNS[column] == "double":
+                        frame[column] = frame[column].astype("float64")
+                frames.append(frame)
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        df = pd.concat(frames, ignore_index=True)
+        if kind is not None:
+            df = df[df["kind"] == kind]
+        return df[columns].reset_index(drop=True)
+
+    def view(self, model: str, experiment: str, run_id: Optional[str] = None) -> Any:
+        """Rebuild one experiment's result as it was written (the newest write without run_id)."""
+        parts = self.part_files(run_id, model, experiment)
+        if not parts:
+            return None
+        # Part names start with their write time
+        latest = max(parts, key=os.path.basename)
+        return assemble(self._read_rows(latest, ["kind", "path", "record"]))
+
+    def models(self, run_id: Optional[str] = None) -> List[str]:
+        return sorted({p["model"] for p in self.partitions(run_id)})
+
+    def model_results(self, model: str, run_id: Optional[str] = None) -> Dict[str, Any]:
+        """The ``{model}_results.json`` view: every standard experiment of the model."""
+        experiments = sorted(
+            {p["experiment"] for p in self.partitions(run_id, model) if not p["experiment"].startswith(DETAILED_PREFIX)}
+        )
+        results: Dict[str, Any] = {"model": model}
+        for experiment in experiments:
+            results[experiment] = self.view(model, experiment, run_id)
+        return results
+
+    def detailed_modes(self) -> List[str]:
+        return sorted(
+            {
+                p["experiment"][len(DETAILED_PREFIX) :]
+                for p in self.partitions()
+                if p["experiment"].startswith(DETAILED_PREFIX)
+            }
+        )
+
+    def detailed_results(self, mode: str, run_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """The ``{mode}_results.json`` view: detailed Exp 1 trials of every model.
+
+        Each model contributes its newest partition, so models benchmarked in
+        separate runs all appear. With run_id, only that run is read.
+        """
+        experiment = detailed_experiment(mode)
+        # Newest part of each model, across runs
+        newest: Dict[str, str] = {}
+        for partition in self.partitions(run_id, experiment=experiment):
+            parts = self._parts(partition["path"])
+            if not parts:
+                continue
+            part = max(parts, key=os.path.basename)
+            model = partition["model"]
+            if model not in newest or os.path.basename(part) > os.path.basename(newest[model]):
+                newest[model] = part
+        if not newest:
+            return None
+
+        # Models in the order they were written
+        parts = sorted(newest.values(), key=os.path.basename)
+        views = [assemble(self._read_rows(part, ["kind", "path", "record"])) for part in parts]
+        results = [row for v in views for row in v["results"]]
+        metadata = dict(views[0]["experiment_metadata"])
+        metadata["models"] = list(dict.fromkeys(m for v in views for m in v["experiment_metadata"]["models"]))
+        metadata["total_experiments"] = len(results)
+        return {"experiment_metadata": metadata, "results": results}
@@ -0,0 +1,433 @@
+"""Retrieval backends for the RAG experiment.
+
+Every backend is kept in sync with the corpus through a RagIndex manifest and
+answers batches of queries in two stages, encode_queries() and search(), so
+callers can time query embedding and vector search separately.
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Type
+
+import numpy as np
+
+import config
+from bm25 import TOKENIZER_VERSION, BM25Index, tokenize
+from rag_index import RagIndex, build_lock, content_hash
+from utils import OllamaClient
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaBatchEmbeddings:
+    """LangChain-compatible embeddings that send whole batches to Ollama.
+
+    Uses the same "passage: "/"query: " prefixes as LangChain's
+    OllamaEmbeddings but one /api/embed request per batch instead of one
+    HTTP round trip per text. The model stays loaded across the batches of
+    one call (EXP3_EMBEDDING_KEEP_ALIVE) and the last batch unloads it.
+    """
+
+    DOCUMENT_PREFIX = "passage: "
+    QUERY_PREFIX = "query: "
+
+    def __init__(self, model: str = config.EXP3_EMBEDDING_MODEL, batch_size: int = 256):
+        self.model = model
+        self.batch_size = batch_size
+        self.client = OllamaClient(model)
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        vectors: List[List[float]] = []
+        for i in range(0, len(texts), self.batch_size):
+            batch = texts[i : i + self.batch_size]
+            last = i + self.batch_size >= len(texts)
+            keep_alive = 0 if last else config.EXP3_EMBEDDING_KEEP_ALIVE
+            embedded = self.client.embed_batch(batch, model=self.model, keep_alive=keep_alive)
+            if len(embedded) != len(batch):
+                raise RuntimeError(f"Embedding request returned {len(embedded)} vectors for {len(batch)} texts")
+            vectors.extend(embedded)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed([f"{self.DOCUMENT_PREFIX}{t}" for t in texts])
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self._embed([f"{self.QUERY_PREFIX}{t}" for t in texts])
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+
+def default_embeddings() -> OllamaBatchEmbeddings:
+    """Embedding function used for both chunks and queries."""
+    return OllamaBatchEmbeddings(model=config.EXP3_EMBEDDING_MODEL)
+
+
+class CachedEmbeddings:
+    """Document embeddings cached on disk by content hash.
+
+    Index variants that share chunk texts (e.g. different overlaps, or the
+    same paragraph split at different sizes) only pay for each distinct text
+    once. Queries are passed through uncached. Vectors live in one .npz file
+    per embedding model plus shards: each warm() appends a shard holding only
+    its new vectors, and shards are merged into the main file once they hold
+    as many vectors as it does, so writing n vectors costs O(n) overall.
+    Access is guarded by a lock so index variants can be built from several
+    threads. Merges hold an inter-process lock and fold in every file on
+    disk, so processes sharing the cache keep each other's vectors.
+    """
+
+    def __init__(self, embeddings: Any, cache_dir: Optional[str] = None):
+        cache_dir = cache_dir or config.EXP3_EMBEDDING_CACHE_DIR
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", config.EXP3_EMBEDDING_MODEL)
+        safe_model_name = self.model.replace(":", "_").replace("/", "_")
+        self.cache_path = os.path.join(cache_dir, f"{safe_model_name}.npz")
+        self.vectors: Dict[str, np.ndarray] = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._shard_prefix = os.path.join(cache_dir, f"{safe_model_name}.shard-")
+        # Vectors in the shards this instance has loaded or written, and in cache_path
+        self._shard_size = 0
+        self._base_size = self._load(self.cache_path) if os.path.exists(self.cache_path) else 0
+        for path in sorted(glob.glob(f"{self._shard_prefix}*.npz")):
+            self._shard_size += self._load(path)
+
+    def _load(self, path: str) -> int:
+        """Add the vectors of one cache file; returns how many it held."""
+        try:
+            with np.load(path) as data:
+                keys = data["keys"].tolist()
+                self.vectors.update(zip(keys, data["vectors"]))
+            return len(keys)
+        except (OSError, ValueError, KeyError) as e:
+            # Another process may have merged the shard away since it was listed
+            logger.warning(f"Skipping embedding cache file {path}: {e}")
+            return 0
+
+    @staticmethod
+    def _write(path: str, keys: List[str], vectors: List[np.ndarray]):
+        # Written through a file object: np.savez would add ".npz" to the temporary name
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, keys=np.array(keys), vectors=np.stack(vectors))
+        os.replace(tmp_path, path)
+
+    def _save(self, new_keys: List[str]):
+        """Persist newly embedded vectors as a shard, or merge everything into cache_path."""
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        self._shard_size += len(new_keys)
+        if self._shard_size < self._base_size:
+            shard = f"{self._shard_prefix}{time.time_ns()}-{os.getpid()}.npz"
+            self._write(shard, new_keys, [self.vectors[key] for key in new_keys])
+            return
+
+        with build_lock(os.path.dirname(self.cache_path)):
+            # Other processes may have merged or added shards since this instance loaded the cache
+            if os.path.exists(self.cache_path):
+                self._load(self.cache_path)
+            shards = sorted(glob.glob(f"{self._shard_prefix}*.npz"))
+            for shard in shards:
+                self._load(shard)
+            keys = list(self.vectors)
+            self._write(self.cache_path, keys, [self.vectors[key] for key in keys])
+            # Only the shards read above are covered by the merged file
+            for shard in shards:
+                try:
+                    os.remove(shard)
+                except FileNotFoundError:
+                    pass
+        self._shard_size = 0
+        self._base_size = len(keys)
+
+    def warm(self, texts: List[str]) -> int:
+        """Embed every text that is not cached yet in one batch; returns how many were embedded."""
+        with self._lock:
+            missing = list(dict.fromkeys(t for t in texts if content_hash(t) not in self.vectors))
+            if missing:
+                vectors = self.embeddings.embed_documents(missing)
+                new_keys = [content_hash(text) for text in missing]
+                for key, vector in zip(new_keys, vectors):
+                    self.vectors[key] = np.asarray(vector, dtype=np.float32)
+                self._save(new_keys)
+            self.misses += len(missing)
+            return len(missing)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        embedded = self.warm(texts)
+        with self._lock:
+            self.hits += len(texts) - embedded
+            return [self.vectors[content_hash(t)].tolist() for t in texts]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        if hasattr(self.embeddings, "embed_queries"):
+            vectors: List[List[float]] = self.embeddings.embed_queries(texts)
+            return vectors
+        return [self.embeddings.embed_query(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+
+class RetrieverBackend(ABC):
+    """Abstract base class for RAG retrievers.
+
+    A hit is a dictionary with the chunk "id", "text", "source" document and a
+    "score" where higher means more relevant.
+    """
+
+    NAME: str
+
+    def __init__(
+        self,
+        persist_directory: str,
+        embeddings: Optional[Any] = None,
+        chunk_size: Optional[int] = None,
+        chunk_overlap: Optional[int] = None,
+    ):
+        self.persist_directory: str = persist_directory
+        self.embeddings: Any = embeddings
+        self.rag_index: RagIndex = RagIndex(
+            persist_directory,
+            embedding_model=getattr(embeddings, "model", config.EXP3_EMBEDDING_MODEL),
+            chunk_size=config.EXP3_CHUNK_SIZE if chunk_size is None else chunk_size,
+            chunk_overlap=config.EXP3_CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap,
+        )
+        # Vector store managed by RagIndex (reset_collection/delete/add_documents)
+        self.store: Any = None
+
+    def build(self, documents: Dict[str, str], rebuild: bool = False) -> Dict[str, int]:
+        """Build the index, or bring a persisted one up to date, for the documents."""
+        return self.rag_index.sync(self.store, documents, rebuild=rebuild)
+
+    def open_read_only(self, documents: Dict[str, str]) -> Dict[str, int]:
+        """Use an index built by another process; raises RuntimeError instead of writing if it is stale."""
+        return self.rag_index.sync(self.store, documents, read_only=True)
+
+    @abstractmethod
+    def encode_queries(self, queries: List[str]) -> Any:
+        """Turn query strings into the representation search() expects."""
+        pass
+
+    @abstractmethod
+    def search(self, encoded_queries: Any, k: int) -> List[List[Dict[str, Any]]]:
+        """Return the top-k hits for every encoded query."""
+        pass
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed a batch of queries, in one request when the embeddings support it."""
+        if hasattr(self.embeddings, "embed_queries"):
+            vectors: List[List[float]] = self.embeddings.embed_queries(queries)
+            return vectors
+        return [self.embeddings.embed_query(q) for q in queries]
+
+    def retrieve(self, queries: List[str], k: int) -> List[List[Dict[str, Any]]]:
+        """Encode and search a batch of queries."""
+        return self.search(self.encode_queries(queries), k)
+
+
+class ChromaRetriever(RetrieverBackend):
+    """Retriever backed by the shared persistent Chroma store."""
+
+    NAME = "chroma"
+
+    def __init__(self, persist_directory: Optional[str] = None, embeddings: Optional[Any] = None, **index_params):
+        # Imported here: Chroma pulls in chromadb, which the numpy and BM25 backends never need
+        from langchain_chroma import Chroma
+
+        super().__init__(persist_directory or config.EXP3_INDEX_DIR, embeddings or default_embeddings(), **index_params)
+        self.store = Chroma(persist_directory=self.persist_directory, embedding_function=self.embeddings)
+
+    def encode_queries(self, queries: List[str]) -> List[List[float]]:
+        return self.embed_queries(queries)
+
+    def search(self, encoded_queries: List[List[float]], k: int) -> List[List[Dict[str, Any]]]:
+        results = []
+        for vector in encoded_queries:
+            docs_and_distances = self.store.similarity_search_by_vector_with_relevance_scores(vector, k=k)
+            results.append(
+                [
+                    {
+                        "id": doc.id,
+                        "text": doc.page_content,
+                        "source": doc.metadata.get("source"),
+                        "score": -distance,
+                    }
+                    for doc, distance in docs_and_distances
+                ]
+            )
+        return results
+
+
+class NumpyVectorIndex:
+    """Exact cosine-similarity index over a contiguous float32 matrix.
+
+    Rows are L2-normalized on insert so search is a single matrix product.
+    The matrix lives in embeddings.npy and is memory-mapped on load; chunk IDs,
+    texts and sources live in chunks.json. Every mutation is written through to
+    disk, which is cheap because the index only changes on corpus updates.
+    The reset_collection/delete/add_documents methods mirror the LangChain
+    vector store API so RagIndex can manage it like Chroma.
+    """
+
+    MATRIX_FILENAME = "embeddings.npy"
+    CHUNKS_FILENAME = "chunks.json"
+
+    def __init__(self, directory: str, embeddings: Any, mmap: bool = True):
+        self.directory = directory
+        self.embeddings = embeddings
+        self.mmap = mmap
+        self.matrix_path = os.path.join(directory, self.MATRIX_FILENAME)
+        self.chunks_path = os.path.join(directory, self.CHUNKS_FILENAME)
+        self.reload()
+
+    def reload(self):
+        """Read the index from disk, e.g. after another builder wrote it."""
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.sources: List[str] = []
+
+        if os.path.exists(self.matrix_path) and os.path.exists(self.chunks_path):
+            self.matrix = np.load(self.matrix_path, mmap_mode="r" if self.mmap else None)
+            with open(self.chunks_path, "r", encoding="utf-8") as f:
+                chunks = json.load(f)
+            self.ids, self.texts, self.sources = chunks["ids"], chunks["texts"], chunks["sources"]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def normalize(vectors: Any) -> np.ndarray:
+        """Convert to a C-contiguous float32 matrix with unit-length rows."""
+        matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        result: np.ndarray = matrix / norms
+        return result
+
+    def _save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        # np.save appends .npy to names without it, so keep the suffix on the temp file
+        tmp_matrix = self.matrix_path.replace(".npy", ".tmp.npy")
+        np.save(tmp_matrix, np.ascontiguousarray(self.matrix, dtype=np.float32))
+        tmp_chunks = f"{self.chunks_path}.tmp"
+        with open(tmp_chunks, "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "texts": self.texts, "sources": self.sources}, f, ensure_ascii=False)
+        os.replace(tmp_matrix, self.matrix_path)
+        os.replace(tmp_chunks, self.chunks_path)
+
+    def reset_collection(self):
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.ids, self.texts, self.sources = [], [], []
+        self._save()
+
+    def delete(self, ids: List[str]):
+        drop = set(ids)
+        keep = [i for i, chunk_id in enumerate(self.ids) if chunk_id not in drop]
+        self.matrix = np.ascontiguousarray(self.matrix[keep]) if len(self.matrix) else self.matrix
+        self.ids = [self.ids[i] for i in keep]
+        self.texts = [self.texts[i] for i in keep]
+        self.sources = [self.sources[i] for i in keep]
+        self._save()
+
+    def add_documents(self, documents: List[Any], ids: List[str]):
+        texts = [d.page_content for d in documents]
+        vectors = self.normalize(self.embeddings.embed_documents(texts))
+        self.matrix = vectors if len(self.matrix) == 0 else np.concatenate([self.matrix, vectors])
+        self.ids.extend(ids)
+        self.texts.extend(texts)
+        self.sources.extend(d.metadata.get("source") for d in documents)
+        self._save()
+
+    def search(self, query_vectors: Any, k: int) -> List[List[Dict[str, Any]]]:
+        """Top-k rows by cosine similarity for a batch of query vectors in one matrix product."""
+        if len(self) == 0:
+            return [[] for _ in range(len(query_vectors))]
+
+        queries = self.normalize(query_vectors)
+        scores = queries @ self.matrix.T
+        k = min(k, scores.shape[1])
+        # argpartition finds the top-k in linear time; only those k get sorted
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+
+        return [
+            [
+                {
+                    "id": self.ids[j],
+                    "text": self.texts[j],
+                    "source": self.sources[j],
+                    "score": float(scores[row, j]),
+                }
+                for j in top[row]
+            ]
+            for row in range(len(top))
+        ]
+
+
+class NumpyRetriever(RetrieverBackend):
+    """In-process exact vector search, avoiding the LangChain/Chroma/SQLite stack at query time."""
+
+    NAME = "numpy"
+
+    def __init__(self, persist_directory: Optional[str] = None, embeddings: Optional[Any] = None, **index_params):
+        super().__init__(
+            persist_directory or config.EXP3_NUMPY_INDEX_DIR, embeddings or default_embeddings(), **index_params
+        )
+        self.store = NumpyVectorIndex(self.persist_directory, self.embeddings)
+
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        return NumpyVectorIndex.normalize(self.embed_queries(queries))
+
+    def search(self, encoded_queries: np.ndarray, k: int) -> List[List[Dict[str, Any]]]:
+        results: List[List[Dict[str, Any]]] = self.store.search(encoded_queries, k)
+        return results
+
+
+class BM25Retriever(RetrieverBackend):
+    """Lexical BM25 retrieval; needs no embedding model or model server."""
+
+    NAME = "bm25"
+
+    def __init__(self, persist_directory: Optional[str] = None, embeddings: Optional[Any] = None, **index_params):
+        super().__init__(persist_directory or config.EXP3_BM25_INDEX_DIR, None, **index_params)
+        # The tokenizer plays the embedding model's role in the manifest: changing it rebuilds the index
+        self.rag_index.embedding_model = f"bm25-tokenizer-v{TOKENIZER_VERSION}"
+        self.store = BM25Index(self.persist_directory, k1=config.EXP3_BM25_K1, b=config.EXP3_BM25_B)
+
+    def encode_queries(self, queries: List[str]) -> List[List[str]]:
+        return [tokenize(q) for q in queries]
+
+    def search(self, encoded_queries: List[List[str]], k: int) -> List[List[Dict[str, Any]]]:
+        results: List[List[Dict[str, Any]]] = self.store.search(encoded_queries, k)
+        return results
+
+
+RETRIEVER_BACKENDS: Dict[str, Type[RetrieverBackend]] = {
+    ChromaRetriever.NAME: ChromaRetriever,
+    NumpyRetriever.NAME: NumpyRetriever,
+    BM25Retriever.NAME: BM25Retriever,
+}
+
+
+def create_retriever(name: Optional[str] = None, **kwargs) -> RetrieverBackend:
+    """Instantiate a retriever backend by name (default: config.EXP3_RETRIEVER).
+
+    Raises:
+        ValueError: If no backend is registered under the name.
+    """
+    name = name or config.EXP3_RETRIEVER
+    if name not in RETRIEVER_BACKENDS:
+        raise ValueError(f"Unknown retriever backend: {name}. Must be one of {list(RETRIEVER_BACKENDS)}")
+    return RETRIEVER_BACKENDS[name](**kwargs)
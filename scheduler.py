@@ -0,0 +1,286 @@
+"""Global work queue for benchmark tasks.
+
+Every (model, experiment, trial) becomes one task in a single queue, and a
+pool of worker threads sized to the servers' parallel slots pulls from it.
+Each host in the pool (config.OLLAMA_HOSTS) has its own capacity, the models
+it holds and its own resident models. The policy keeps every host's slots
+busy while loading as few models as possible:
+
+- A host with free slots takes the longest queued task of a model already
+  resident on it, so short tasks fill the gaps at the end of that model's
+  work. Less loaded hosts pick first.
+- A host loads a new model only when fewer than ``max_resident_models``
+  models have work in flight on it. Models no other host is working through
+  go first, then the one with the most estimated work left.
+- A host that drops connections during a task is taken out of rotation for
+  SCHEDULER_HOST_RETRY_SECONDS and the task goes back in the queue for
+  another host, up to SCHEDULER_MAX_ATTEMPTS attempts. Only the task whose
+  own requests failed is retried; other tasks in flight on the host keep
+  their results.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import config
+import metrics
+from utils import OllamaClient, host_context, keep_alive_context
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_task_seconds(exp_id: int, trial: Dict[str, Any]) -> float:
+    """Estimate how long a trial keeps a server slot busy.
+
+    Trials that declare "estimated_tokens" are costed at the prefill rate;
+    whole-experiment trials fall back to a per-experiment estimate.
+    """
+    tokens = trial.get("estimated_tokens")
+    if tokens is not None:
+        return float(config.SCHEDULER_TASK_OVERHEAD_SECONDS + tokens / config.SCHEDULER_PREFILL_TOKENS_PER_SECOND)
+    return float(config.SCHEDULER_EXPERIMENT_SECONDS.get(exp_id, config.SCHEDULER_DEFAULT_TASK_SECONDS))
+
+
+def make_task(model: str, exp_id: int, trial_index: int, trial: Dict[str, Any]) -> Dict[str, Any]:
+    """Build a queue entry for one trial of one experiment on one model."""
+    return {
+        "id": f"{model}/exp{exp_id}/{trial_index}",
+        "model": model,
+        "exp_id": exp_id,
+        "trial_index": trial_index,
+        "trial": trial,
+        "estimated_seconds": estimate_task_seconds(exp_id, trial),
+        "attempts": 0,
+    }
+
+
+class Scheduler:
+    """Runs a queue of tasks across a pool of hosts, aware of model residency.
+
+    A model counts as resident on a host from its first started task there
+    until it is evicted to make room for another, so a model whose work is
+    draining is never displaced by a second load. Tasks run with their host
+    as the current host (utils.host_context), so clients created without an
+    explicit host follow the dispatcher. Their generate requests carry
+    SCHEDULER_KEEP_ALIVE, so a resident model stays loaded on the server
+    between tasks instead of being unloaded as soon as it is idle; an
+    evicted model is unloaded right away, so a host never holds more than
+    max_resident_models models the scheduler put there.
+    """
+
+    def __init__(
+        self,
+        tasks: List[Dict[str, Any]],
+        run_task: Callable[[Dict[str, Any]], Any],
+        concurrency: Optional[int] = None,
+        max_resident_models: Optional[int] = None,
+        hosts: Optional[List[Dict[str, Any]]] = None,
+        on_result: Optional[Callable[[Dict[str, Any], Any], None]] = None,
+    ):
+        """Create a scheduler.
+
+        Args:
+            tasks: Tasks from make_task.
+            run_task: Runs one task and returns its result.
+            on_result: Called with a task and its result once the result is accepted, i.e. not
+                produced against a host that dropped the task's connections (e.g. to journal it).
+            concurrency: Slots of a single default host; ignored when hosts are given.
+            max_resident_models: Models with work in flight per host.
+            hosts: Host pool entries with "url", "capacity" and "models" (default: config.OLLAMA_HOSTS,
+                or config.OLLAMA_HOST alone when concurrency is given).
+        """
+        pool: List[Dict[str, Any]]
+        if hosts is not None:
+            pool = hosts
+        elif concurrency:
+            pool = [{"url": config.OLLAMA_HOST, "capacity": concurrency, "models": None}]
+        else:
+            pool = config.OLLAMA_HOSTS
+        self.hosts: List[Dict[str, Any]] = [
+            {
+                "url": host["url"],
+                "capacity": host.get("capacity") or config.SCHEDULER_HOST_CONCURRENCY,
+                "models": set(host["models"]) if host.get("models") else None,
+                # model -> tasks in flight
+                "running": {},
+                # Least recently started first
+                "resident": [],
+                "down_until": 0.0,
+            }
+            for host in pool
+        ]
+        self.pending = list(tasks)
+        self.run_task = run_task
+        self.on_result = on_result
+        self.concurrency = sum(host["capacity"] for host in self.hosts)
+        self.max_resident_models = max_resident_models or config.SCHEDULER_MAX_RESIDENT_MODELS
+        self.model_loads = 0
+        # (host url, model) pairs evicted from a resident set and not unloaded yet
+        self._evicted: List[Tuple[str, str]] = []
+        self._condition = threading.Condition()
+
+    def in_flight(self) -> int:
+        return sum(sum(host["running"].values()) for host in self.hosts)
+
+    @staticmethod
+    def serves(host: Dict[str, Any], model: str) -> bool:
+        return host["models"] is None or model in host["models"]
+
+    def next_task(self) -> Optional[Dict[str, Any]]:
+        """Take the next task to start, with its "host" set, or None if nothing should start yet."""
+        now = time.time()
+        available = [
+            host
+            for host in self.hosts
+            if host["down_until"] <= now and sum(host["running"].values()) < host["capacity"]
+        ]
+        available.sort(key=lambda host: sum(host["running"].values()) / host["capacity"])
+
+        for host in available:
+            task = self._next_task_for(host)
+            if task is not None:
+                self.pending.remove(task)
+                metrics.QUEUE_DEPTH.dec()
+                task["host"] = host["url"]
+                task["attempts"] += 1
+                self._start(host, task["model"])
+                return task
+        return None
+
+    def _next_task_for(self, host: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        eligible = [task for task in self.pending if self.serves(host, task["model"])]
+        if not eligible:
+            return None
+
+        candidates = [task for task in eligible if task["model"] in host["resident"]]
+        if not candidates:
+            active = [model for model, count in host["running"].items() if count]
+            if len(active) >= self.max_resident_models:
+                # Wait for a resident model to drain rather than thrash the host with a load
+                return None
+            remaining: Dict[str, float] = {}
+            for task in eligible:
+                remaining[task["model"]] = remaining.get(task["model"], 0.0) + task["estimated_seconds"]
+            elsewhere = {model for other in self.hosts if other is not host for model in other["resident"]}
+            model = max(remaining, key=lambda m: (m not in elsewhere, remaining[m]))
+            candidates = [task for task in eligible if task["model"] == model]
+
+        return max(candidates, key=lambda t: t["estimated_seconds"])
+
+    def _start(self, host: Dict[str, Any], model: str):
+        host["running"][model] = host["running"].get(model, 0) + 1
+        if model in host["resident"]:
+            host["resident"].remove(model)
+        else:
+            self.model_loads += 1
+            logger.info(f"Scheduling model {model} on {host['url']} ({len(self.pending)} tasks queued)")
+        host["resident"].append(model)
+
+        idle = [m for m in host["resident"] if not host["running"].get(m)]
+        while len(host["resident"]) > self.max_resident_models and idle:
+            evicted = idle.pop(0)
+            host["resident"].remove(evicted)
+            self._evicted.append((host["url"], evicted))
+
+    def _unload(self, url: str, model: str):
+        """Unload an evicted model, which SCHEDULER_KEEP_ALIVE would otherwise keep on the server."""
+        with self._condition:
+            if model in self._host(url)["resident"]:
+                # Scheduled on the host again since it was evicted
+                return
+        if OllamaClient(model, host=url).unload():
+            logger.info(f"Unloaded evicted model {model} from {url}")
+
+    def _host(self, url: str) -> Dict[str, Any]:
+        return next(host for host in self.hosts if host["url"] == url)
+
+    def _fail_unservable(self, completed: List[Dict[str, Any]]):
+        for task in list(self.pending):
+            if not any(self.serves(host, task["model"]) for host in self.hosts):
+                self.pending.remove(task)
+                task["error"] = f"No host serves model {task['model']}"
+                logger.error(f"Task {task['id']} failed: {task['error']}")
+                completed.append(task)
+
+    def _execute(self, task: Dict[str, Any], completed: List[Dict[str, Any]]):
+        url = task["host"]
+        start_time = time.time()
+        result, error = None, None
+        with host_context(url) as failures, keep_alive_context(config.SCHEDULER_KEEP_ALIVE):
+            try:
+                result = self.run_task(task)
+            except Exception as e:
+                error = str(e)
+                metrics.ERRORS.inc(model=task["model"], error=type(e).__name__)
+        wall_time = time.time() - start_time
+        host_failed = failures.count > 0
+
+        if not host_failed and error is None and self.on_result is not None:
+            try:
+                self.on_result(task, result)
+            except Exception as e:
+                logger.error(f"Task {task['id']}: failed to record result: {e}")
+
+        with self._condition:
+            host = self._host(url)
+            host["running"][task["model"]] -= 1
+            if host_failed:
+                # Whatever the task returned was produced against a dead host
+                host["down_until"] = time.time() + config.SCHEDULER_HOST_RETRY_SECONDS
+                host["resident"] = [m for m in host["resident"] if host["running"].get(m)]
+                if task["attempts"] < config.SCHEDULER_MAX_ATTEMPTS:
+                    logger.warning(f"Host {url} dropped connections; requeueing task {task['id']}")
+                    self.pending.append(task)
+                    metrics.QUEUE_DEPTH.inc()
+                    metrics.RETRIES.inc(host=url)
+                    self._condition.notify()
+                    return
+                error = f"Host {url} unreachable after {task['attempts']} attempts"
+
+            task["wall_time"] = wall_time
+            if error is None:
+                task["result"] = result
+            else:
+                logger.error(f"Task {task['id']} failed: {error}")
+                task["error"] = error
+            completed.append(task)
+            self._condition.notify()
+
+    def _wait_timeout(self) -> Optional[float]:
+        """Seconds until a down host returns, if no running task can wake the loop first."""
+        if self.in_flight():
+            return None
+        down = [host["down_until"] for host in self.hosts if host["down_until"] > time.time()]
+        return max(0.0, min(down) - time.time()) if down else None
+
+    def run(self) -> List[Dict[str, Any]]:
+        """Run every task.
+
+        Returns:
+            The tasks in completion order, each with its "host", "wall_time"
+            and either its "result" or an "error".
+        """
+        completed: List[Dict[str, Any]] = []
+        total = len(self.pending)
+        start_time = time.time()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            with self._condition:
+                self._fail_unservable(completed)
+                metrics.QUEUE_DEPTH.inc(len(self.pending))
+                while self.pending or self.in_flight():
+                    task = self.next_task()
+                    if task is None:
+                        self._condition.wait(self._wait_timeout())
+                        continue
+                    executor.submit(self._execute, task, completed)
+                    # Unloads are HTTP requests, so they run outside the lock held here
+                    while self._evicted:
+                        executor.submit(self._unload, *self._evicted.pop(0))
+
+        duration = time.time() - start_time
+        logger.info(f"Scheduler ran {total} tasks in {duration:.2f}s with {self.model_loads} model loads")
+        return completed
@@ -0,0 +1,204 @@
+"""Cold-start benchmark for every entry point.
+
+Each entry point is imported in a fresh interpreter started with
+``-X importtime``; the child reports its import wall time and peak RSS, and
+the import-time profile attributes the cost to top-level packages. Results
+are compared with the budgets tracked in benchmarks/startup_baselines.json,
+and the script exits non-zero when an entry point goes over budget.
+
+Usage:
+    python startup_benchmark.py                      # measure and check against the budgets
+    python startup_benchmark.py main exp1_needle     # only some entry points
+    python startup_benchmark.py --update-baselines   # rewrite the budgets from this machine
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+BASELINES_FILE = os.path.join(config.BENCHMARKS_DIR, "startup_baselines.json")
+
+# Entry point -> module it imports
+ENTRY_POINTS = {
+    "config": "config",
+    "main": "main",
+    "analyze_results": "analyze_results",
+    "exp1_needle": "exp1_needle",
+    "exp2_size": "exp2_size",
+    "exp3_rag": "exp3_rag",
+    "exp4_strategies": "exp4_strategies",
+    "dashboard": "dashboard",
+}
+
+# Runs in the child: imports one module, then reports its cost as JSON on the last stdout line
+CHILD_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+__import__(sys.argv[1])
+seconds = time.perf_counter() - start
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"seconds": seconds, "peak_rss_mb": peak_kb / 1024, "modules": len(sys.modules)}))
+"""
+
+
+def parse_importtime(stderr: str, top: int = 5) -> List[Dict[str, Any]]:
+    """Attribute the self time in an ``-X importtime`` profile to top-level packages.
+
+    Returns:
+        The ``top`` most expensive packages, each with "package" and "seconds".
+    """
+    packages: Dict[str, float] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, _, name = line[len("import time:") :].split("|")
+            package = name.strip().split(".")[0]
+            packages[package] = packages.get(package, 0.0) + int(self_us) / 1e6
+        except ValueError:
+            continue
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [{"package": package, "seconds": seconds} for package, seconds in ranked]
+
+
+def measure(module: str, repeats: Optional[int] = None) -> Dict[str, Any]:
+    """Import a module cold, several times, in fresh interpreters.
+
+    Returns:
+        Dictionary with the fastest "seconds", the largest "peak_rss_mb", the
+        number of "modules" loaded and the "heaviest" packages, or an "error"
+        if the module cannot be imported (e.g. a missing optional dependency).
+    """
+    repeats = repeats or config.STARTUP_BENCHMARK_REPEATS
+    runs = []
+    heaviest: List[Dict[str, Any]] = []
+    for _ in range(repeats):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", CHILD_SCRIPT, module],
+            cwd=config.BASE_DIR,
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}"
+            return {"module": module, "error": error}
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        heaviest = parse_importtime(proc.stderr)
+
+    return {
+        "module": module,
+        "seconds": min(run["seconds"] for run in runs),
+        "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+        "modules": runs[-1]["modules"],
+        "heaviest": heaviest,
+    }
+
+
+def load_baselines(path: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    path = path or BASELINES_FILE
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        baselines: Dict[str, Dict[str, float]] = json.load(f)
+    return baselines
+
+
+def check_budgets(measurements: Dict[str, Dict[str, Any]], baselines: Dict[str, Dict[str, float]]) -> List[str]:
+    """List every measurement over its budget; entry points without a budget or a measurement are not checked."""
+    regressions = []
+    for name, measured in measurements.items():
+        budget = baselines.get(name)
+        if budget is None or "error" in measured:
+            continue
+        for key, unit in (("seconds", "s"), ("peak_rss_mb", " MB")):
+            if key in budget and measured[key] > budget[key]:
+                regressions.append(f"{name}: {key} {measured[key]:.2f}{unit} over budget {budget[key]:.2f}{unit}")
+    return regressions
+
+
+def update_baselines(
+    measurements: Dict[str, Dict[str, Any]], baselines: Dict[str, Dict[str, float]], path: Optional[str] = None
+) -> Dict[str, Dict[str, float]]:
+    """Set the budgets of the measured entry points to their measurements plus headroom."""
+    updated = dict(baselines)
+    for name, measured in measurements.items():
+        if "error" in measured:
+            continue
+        updated[name] = {
+            # The slack keeps near-instant imports from failing on scheduler noise
+            "seconds": round(
+                measured["seconds"] * config.STARTUP_BUDGET_HEADROOM + config.STARTUP_BUDGET_SLACK_SECONDS, 2
+            ),
+            "peak_rss_mb": round(measured["peak_rss_mb"] * config.STARTUP_BUDGET_HEADROOM, 1),
+        }
+    path = path or BASELINES_FILE
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(dict(sorted(updated.items())), f, indent=2)
+        f.write("\n")
+    return updated
+
+
+def format_report(measurements: Dict[str, Dict[str, Any]], baselines: Dict[str, Dict[str, float]]) -> str:
+    lines = [
+        f"{'Entry point':<18} {'Import':>8} {'Budget':>8} {'Peak RSS':>10} {'Budget':>10} {'Modules':>8}  Heaviest"
+    ]
+    for name, measured in measurements.items():
+        if "error" in measured:
+            lines.append(f"{name:<18} {'skipped':>8}  {measured['error']}")
+            continue
+        budget = baselines.get(name, {})
+        seconds_budget = f"{budget['seconds']:.2f}s" if "seconds" in budget else "-"
+        rss_budget = f"{budget['peak_rss_mb']:.0f} MB" if "peak_rss_mb" in budget else "-"
+        heaviest = ", ".join(f"{h['package']} {h['seconds']:.2f}s" for h in measured["heaviest"][:3])
+        lines.append(
+            f"{name:<18} {measured['seconds']:>7.2f}s {seconds_budget:>8} {measured['peak_rss_mb']:>7.0f} MB "
+            f"{rss_budget:>10} {measured['modules']:>8}  {heaviest}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start time and peak RSS of each entry point")
+    parser.add_argument("entry_points", nargs="*", help=f"Any of {', '.join(ENTRY_POINTS)} (default: all)")
+    parser.add_argument("--repeats", type=int, help="Cold imports per entry point (the fastest counts)")
+    parser.add_argument("--update-baselines", action="store_true", help="Rewrite the budgets from this run")
+    parser.add_argument("--output", help="Also save the measurements to this JSON file")
+    args = parser.parse_args()
+
+    names = args.entry_points or list(ENTRY_POINTS)
+    unknown = [name for name in names if name not in ENTRY_POINTS]
+    if unknown:
+        parser.error(f"unknown entry points: {', '.join(unknown)}")
+    measurements = {}
+    for name in names:
+        logger.info(f"Measuring {name}...")
+        measurements[name] = measure(ENTRY_POINTS[name], args.repeats)
+
+    baselines = load_baselines()
+    if args.update_baselines:
+        baselines = update_baselines(measurements, baselines)
+        logger.info(f"Updated {BASELINES_FILE}")
+    print(format_report(measurements, baselines))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(measurements, f, indent=2)
+
+    regressions = check_budgets(measurements, baselines)
+    for regression in regressions:
+        logger.error(regression)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+import pytest
+
+import config
+
+
+@pytest.fixture(autouse=True)
+def journal_dir(tmp_path, monkeypatch):
+    """Keep run journals written by tests out of the real results directory."""
+    monkeypatch.setattr(config, "JOURNAL_DIR", str(tmp_path / "runs"))
+    return tmp_path / "runs"
+
+
+@pytest.fixture(autouse=True)
+def results_store_dir(tmp_path, monkeypatch):
+    """Keep results stored by tests out of the real results directory."""
+    monkeypatch.setattr(config, "RESULTS_STORE_DIR", str(tmp_path / "store"))
+    return tmp_path / "store"
@@ -0,0 +1,47 @@
+import re
+
+import pytest
+
+from action_history import HELD, OBJECTS, ROOMS, generate_history
+
+
+def replay(actions, initial):
+    """Independently apply the actions to find where each object ends up."""
+    locations = dict(initial)
+    for action in actions:
+        if match := re.fullmatch(r"I pick up the (\w+)\.", action):
+            locations[match.group(1)] = HELD
+        elif match := re.fullmatch(r"I put the (\w+) on the (\w+)\.", action):
+            assert locations[match.group(1)] == HELD
+            locations[match.group(1)] = match.group(2)
+    return locations
+
+
+class TestGenerateHistory:
+
+    def test_exact_length_and_deterministic(self):
+        history = generate_history(500, seed=7)
+
+        assert len(history["actions"]) == 500
+        assert history == generate_history(500, seed=7)
+        assert history["actions"] != generate_history(500, seed=8)["actions"]
+
+    def test_ground_truth_matches_actions(self):
+        history = generate_history(2000, seed=3)
+        target = history["question"].removeprefix("Where is the ").removesuffix("?")
+
+        # Every object that was put down ends where its last put says
+        final = replay(history["actions"], {obj: "unknown" for obj in OBJECTS})
+        moved = {obj: place for obj, place in final.items() if place != "unknown"}
+        assert all(history["final_state"][obj] == place for obj, place in moved.items())
+        assert history["expected_answer"] == final[target]
+        assert history["expected_answer"] in [p for places in ROOMS.values() for p in places]
+
+    def test_objects_move_many_times(self):
+        actions = generate_history(5000)["actions"]
+        puts = [a for a in actions if a.startswith("I put")]
+        assert all(sum(f"the {obj} " in a for a in puts) > 20 for obj in OBJECTS)
+
+    def test_too_short(self):
+        with pytest.raises(ValueError):
+            generate_history(1)
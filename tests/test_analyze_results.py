@@ -12,7 +12,14 @@ STANDARD_RESULT = {
         {"token_count": 100, "accuracy": 1.0, "latency": 0.1},
         {"token_count": 1000, "accuracy": 0.8, "latency": 1.0},
     ],
-    "exp3_rag": {"rag": {"accuracy": 0.9, "latency": 0.2}, "full_context": {"accuracy": 1.0, "latency": 2.0}},
+    "exp3_rag": {
+        "rag": {
+            "accuracy": 0.9,
+            "latency": 0.2,
+            "timings": {"embed_query": 0.01, "search": 0.001, "prefill": 0.05, "decode": 0.1, "other": 0.039},
+        },
+        "full_context": {"accuracy": 1.0, "latency": 2.0, "timings": {"prefill": 1.5, "decode": 0.4, "other": 0.1}},
+    },
     "exp4_strategies": {"write": {"correct": True}},
 }
 
@@ -83,6 +90,67 @@ class TestAnalyzeResults:
         assert mock_barplot.call_count == 2
         mock_savefig.assert_called()
 
+    @patch("matplotlib.pyplot.savefig")
+    def test_plot_exp3_rag_stages(self, mock_savefig):
+        results = [{"type": "standard", "data": STANDARD_RESULT}]
+        analyze_results.plot_exp3_rag_stages(results)
+        mock_savefig.assert_called_with(os.path.join(config.PLOTS_DIR, "exp3_rag_stages.png"), dpi=300)
+
+    @patch("matplotlib.pyplot.savefig")
+    def test_plot_exp3_rag_stages_skips_legacy_results(self, mock_savefig):
+        legacy = dict(STANDARD_RESULT, exp3_rag={"rag": {"accuracy": 1.0, "latency": 0.2}})
+        analyze_results.plot_exp3_rag_stages([{"type": "standard", "data": legacy}])
+        mock_savefig.assert_not_called()
+
+    @patch("matplotlib.pyplot.savefig")
+    def test_plot_exp3_scaling(self, mock_savefig):
+        points = [
+            {
+                "num_documents": n,
+                "full_context": {"latency": full_latency, "accuracy": 1.0},
+                "rag": {"latency": 1.0, "accuracy": 1.0},
+            }
+            for n, full_latency in [(20, 0.5), (200, 2.0)]
+        ]
+        scaling = dict(STANDARD_RESULT, exp3_rag={"mode": "scaling", "points": points, "crossover": {"latency": 200}})
+
+        analyze_results.plot_exp3_scaling([{"type": "standard", "data": STANDARD_RESULT}])
+        mock_savefig.assert_not_called()
+
+        analyze_results.plot_exp3_scaling([{"type": "standard", "data": scaling}])
+        mock_savefig.assert_called_with(os.path.join(config.PLOTS_DIR, "exp3_scaling_crossover.png"), dpi=300)
+
+    @patch("matplotlib.pyplot.savefig")
+    def test_plot_throughput_vs_context(self, mock_savefig):
+        metrics = {"prompt_tokens": 1000, "prefill_tokens_per_second": 500.0, "decode_tokens_per_second": 20.0}
+        standard = dict(
+            STANDARD_RESULT,
+            exp2_size=[dict(point, response="ID", server_metrics=metrics) for point in STANDARD_RESULT["exp2_size"]],
+            # Averages and chain sums over requests are not requests themselves
+            exp3_rag={"rag": {"accuracy": 1.0, "server_metrics": metrics}},
+            exp4_strategies={"write": {"response": "Table", "calls": 11, "server_metrics": metrics}},
+        )
+        legacy_row = {
+            "model": "other:7b",
+            "query_time_seconds": 2.0,
+            "ollama_metadata": {"prompt_eval_count": 3000, "prompt_eval_duration": 1_000_000_000},
+        }
+        results = [
+            {"type": "standard", "data": standard},
+            {"type": "detailed_needle", "metadata": {}, "results": [legacy_row]},
+        ]
+
+        df = analyze_results.collect_server_metrics(results)
+        assert sorted(df["experiment"]) == ["exp1_needle (detailed)", "exp2_size", "exp2_size"]
+        assert df[df["model"] == "other:7b"]["prefill_tokens_per_second"].iloc[0] == 3000
+
+        analyze_results.plot_throughput_vs_context(results)
+        saved = [call.args[0] for call in mock_savefig.call_args_list]
+        assert saved == [
+            os.path.join(config.PLOTS_DIR, "throughput_test-model.png"),
+            os.path.join(config.PLOTS_DIR, "throughput_other_7b.png"),
+        ]
+
     @patch("matplotlib.pyplot.savefig")
     def test_plot_radar_summary(self, mock_savefig):
         results = [{"type": "standard", "data": STANDARD_RESULT}]
@@ -105,14 +173,31 @@ class TestAnalyzeResults:
     @patch("analyze_results.plot_exp1_needle")
     @patch("analyze_results.plot_exp2_size")
     @patch("analyze_results.plot_exp3_rag")
+    @patch("analyze_results.plot_exp3_rag_stages")
+    @patch("analyze_results.plot_exp3_scaling")
+    @patch("analyze_results.plot_throughput_vs_context")
     @patch("analyze_results.plot_radar_summary")
     @patch("analyze_results.plot_detailed_needle_experiments")
-    def test_main(self, mock_detailed, mock_radar, mock_rag, mock_size, mock_needle, mock_load):
+    def test_main(
+        self,
+        mock_detailed,
+        mock_radar,
+        mock_throughput,
+        mock_scaling,
+        mock_stages,
+        mock_rag,
+        mock_size,
+        mock_needle,
+        mock_load,
+    ):
         mock_load.return_value = ["some data"]
         analyze_results.main()
 
         mock_needle.assert_called()
         mock_size.assert_called()
         mock_rag.assert_called()
+        mock_stages.assert_called()
+        mock_scaling.assert_called()
+        mock_throughput.assert_called()
         mock_radar.assert_called()
         mock_detailed.assert_called()
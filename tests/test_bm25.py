@@ -0,0 +1,49 @@
+from langchain_core.documents import Document
+
+from bm25 import BM25Index, strip_niqqud, strip_prefixes, tokenize
+
+
+class TestTokenize:
+
+    def test_strips_niqqud(self):
+        assert strip_niqqud("שָׁלוֹם") == "שלום"
+
+    def test_prefix_letters_add_stem(self):
+        assert tokenize("ובבית") == ["ובבית", "בית"]
+        # Stripping never leaves fewer than three letters
+        assert strip_prefixes("מלך") == "מלך"
+        assert strip_prefixes("ולמה") == "למה"
+
+    def test_acronyms_and_latin(self):
+        assert tokenize('צה"ל Hello') == ["צהל", "hello"]
+
+
+def make_docs(texts):
+    return [Document(page_content=text, metadata={"source": f"doc_{i}"}) for i, text in enumerate(texts)]
+
+
+class TestBM25Index:
+
+    def test_ranks_rare_terms_higher(self, tmp_path):
+        index = BM25Index(str(tmp_path))
+        index.add_documents(make_docs(["apple banana", "apple cherry", "apple grape"]), ids=["a", "b", "c"])
+
+        hits = index.search([tokenize("apple cherry")], k=2)[0]
+
+        assert [h["id"] for h in hits][0] == "b"
+        assert hits[0]["score"] > hits[1]["score"]
+
+    def test_delete_and_persist(self, tmp_path):
+        index = BM25Index(str(tmp_path))
+        index.add_documents(make_docs(["apple banana", "cherry"]), ids=["a", "b"])
+        index.delete(["a"])
+
+        reloaded = BM25Index(str(tmp_path))
+        assert len(reloaded) == 1
+        assert "apple" not in reloaded.postings
+        apple_hits, cherry_hits = reloaded.search([["apple"], ["cherry"]], k=3)
+        assert apple_hits == []
+        assert [(h["id"], h["source"]) for h in cherry_hits] == [("b", "doc_1")]
+
+    def test_empty_index(self, tmp_path):
+        assert BM25Index(str(tmp_path)).search([["apple"]], k=3) == [[]]
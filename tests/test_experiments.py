@@ -1,13 +1,26 @@
 import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
+from langchain_core.documents import Document
 
 import config
+from action_history import OBJECTS, ROOMS
 from exp1_needle import NeedleExperiment
 from exp2_size import ContextSizeExperiment
-from exp3_rag import RagExperiment
-from exp4_strategies import StrategiesExperiment
+from exp3_rag import (
+    TIMING_STAGES,
+    RagExperiment,
+    build_query_set,
+    build_scaling_corpus,
+    find_crossover,
+    full_context_window,
+    load_query_set,
+    prepare_shared_indexes,
+)
+from exp4_strategies import STRATEGIES, StrategiesExperiment
 
 
 class TestNeedleExperiment:
@@ -74,6 +87,76 @@ class TestNeedleExperiment:
         finally:
             config.EXP1_DETAILED_PROMPT_LENGTHS = original_lengths
 
+    @patch("exp1_needle.OllamaClient")
+    @patch("exp1_needle.load_text_from_file")
+    def test_detailed_trials(self, mock_load_text, MockOllamaClient):
+        MockOllamaClient.return_value.generate_with_stats_async = AsyncMock(return_value={"response": "VRAMIEL"})
+        mock_load_text.side_effect = lambda path, length: "" if length == 5000 else "Some long text content..."
+
+        exp = NeedleExperiment("test-model", mode="info_retrieval")
+        trials = exp.trials()
+
+        exp_cfg = config.NEEDLE_EXPERIMENTS["info_retrieval"]
+        assert len(trials) == len(exp_cfg["prompt_lengths"]) * len(exp_cfg["positions"])
+        assert trials[0]["estimated_tokens"] == trials[0]["prompt_length"] // 4
+
+        # A trial whose text cannot be loaded is dropped when merging
+        results = exp.merge_trials([exp.run_trial(trial) for trial in trials[:5]])
+        assert [r["target_prompt_length"] for r in results] == [10000]
+        assert results[0]["message_position"] == trials[4]["position"]
+
+    def test_plan_requests_checks_response_cache(self, tmp_path):
+        source_file = tmp_path / "haystack.txt"
+        source_file.write_text("filler " * 1000, encoding="utf-8")
+        trial = {"prompt_length": 500, "position": "middle"}
+
+        with patch("config.CACHE_DIR", str(tmp_path)):
+            exp = NeedleExperiment("test-model", mode="info_retrieval")
+            exp.exp_config = dict(exp.exp_config, source_file=str(source_file))
+
+            [request] = exp.plan_requests(trial)
+            assert request["cached"] is False
+            assert request["max_tokens"] == 500
+
+            # The planned payload is the one the trial sends: once its response is cached, the trial needs no server
+            prompt_payloads = []
+            original = exp.client.generate_payload
+
+            def record(*args, **kwargs):
+                payload = original(*args, **kwargs)
+                prompt_payloads.append(payload)
+                return payload
+
+            with patch.object(exp.client, "generate_payload", side_effect=record):
+                exp.plan_requests(trial)
+            exp.client._save_to_cache(exp.client._get_cache_path(prompt_payloads[0]), {"response": "VRAMIEL"})
+
+            assert exp.plan_requests(trial)[0]["cached"] is True
+            with patch("aiohttp.ClientSession") as mock_session:
+                result = exp.run_trial(trial)
+            mock_session.assert_not_called()
+            assert result["found_secret"] is True
+
+        assert NeedleExperiment("test-model").plan_requests({})[0]["cached"] is None
+
+    @patch("exp1_needle.OllamaClient")
+    def test_detailed_trial_async_uses_cpu_executor(self, MockOllamaClient, tmp_path):
+        MockOllamaClient.return_value.generate_with_stats_async = AsyncMock(return_value={"response": "VRAMIEL"})
+        source_file = tmp_path / "haystack.txt"
+        source_file.write_text("filler " * 1000, encoding="utf-8")
+
+        exp = NeedleExperiment("test-model", mode="info_retrieval")
+        exp.exp_config = dict(exp.exp_config, source_file=str(source_file))
+        trial = {"prompt_length": 500, "position": "middle"}
+
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as cpu_executor:
+            exp.cpu_executor = cpu_executor
+            result = asyncio.run(exp.run_trial_async(trial))
+
+        assert result["prompt_length_chars"] > 500
+        prompt = MockOllamaClient.return_value.generate_with_stats_async.call_args.kwargs["prompt"]
+        assert exp.exp_config["secret_message"] in prompt
+
 
 class TestContextSizeExperiment:
 
@@ -82,7 +165,15 @@ class TestContextSizeExperiment:
     def test_run(self, mock_load, MockClient):
         mock_load.return_value = ["doc1", "doc2", "doc3", "doc4"]
         mock_client = MockClient.return_value
-        mock_client.generate.return_value = "ID-1234"  # Simulate correct answer
+        mock_client.generate_with_stats.return_value = {
+            "response": "ID-1234",
+            "prompt_eval_count": 400,
+            "eval_count": 10,
+            "load_duration": 500_000_000,
+            "prompt_eval_duration": 200_000_000,
+            "eval_duration": 500_000_000,
+            "total_duration": 1_200_000_000,
+        }
 
         # Override config doc counts to be small for test
         original_counts = config.EXP2_DOC_COUNTS
@@ -94,6 +185,13 @@ class TestContextSizeExperiment:
 
             assert len(results) == 1
             assert results[0]["doc_count"] == 2
+            metrics = results[0]["server_metrics"]
+            assert metrics["prefill_tokens_per_second"] == pytest.approx(2000)
+            assert metrics["decode_tokens_per_second"] == pytest.approx(20)
+            assert metrics["load_seconds"] == pytest.approx(0.5)
+            assert metrics["server_seconds"] == pytest.approx(1.2)
+            # The mocked request returns instantly, as a cached response would
+            assert metrics["client_overhead_seconds"] is None
         finally:
             config.EXP2_DOC_COUNTS = original_counts
 
@@ -101,40 +199,606 @@ class TestContextSizeExperiment:
 class TestRagExperiment:
 
     @patch("exp3_rag.OllamaClient")
-    @patch("exp3_rag.load_hebrew_articles")
-    @patch("exp3_rag.Chroma")
-    @patch("exp3_rag.OllamaEmbeddings")
+    @patch("exp3_rag.load_hebrew_documents")
+    @patch("langchain_chroma.Chroma")
+    @patch("retrievers.OllamaBatchEmbeddings")
     @patch("os.path.exists")
-    def test_run(self, mock_exists, MockEmbeddings, MockChroma, mock_load, MockClient):
+    def test_run(self, mock_exists, MockEmbeddings, MockChroma, mock_load, MockClient, tmp_path):
         mock_exists.return_value = False  # Force new DB creation
-        mock_load.return_value = ["hebrew doc 1", "hebrew doc 2"]
+        mock_load.return_value = {"a.txt": "hebrew doc 1", "b.txt": "hebrew doc 2"}
         mock_client = MockClient.return_value
-        mock_client.generate.return_value = "Yes"
+        mock_client.generate_with_stats.return_value = {
+            "response": "Yes",
+            "prompt_eval_count": 120,
+            "prompt_eval_duration": 2_000_000,
+            "eval_duration": 3_000_000,
+        }
 
-        mock_retriever = MagicMock()
-        mock_retriever.invoke.return_value = [MagicMock(page_content="doc snippet")]
-        MockChroma.from_documents.return_value.as_retriever.return_value = mock_retriever
+        MockEmbeddings.return_value.model = "test-embed"
+        MockEmbeddings.return_value.embed_queries.return_value = [[0.1, 0.2]]
+        mock_store = MockChroma.return_value
+        mock_store.similarity_search_by_vector_with_relevance_scores.return_value = [
+            (Document(page_content="doc snippet", metadata={"source": "a.txt"}), 0.1)
+        ]
 
         exp = RagExperiment("test-model")
+        exp.persist_directory = str(tmp_path)
         results = exp.run()
 
         assert "full_context" in results
         assert "rag" in results
         assert results["rag"]["accuracy"] == 1.0
+        mock_store.add_documents.assert_called_once()
+
+        rag_timings = results["rag"]["timings"]
+        assert list(rag_timings) == TIMING_STAGES
+        assert rag_timings["prefill"] == pytest.approx(0.002)
+        assert rag_timings["decode"] == pytest.approx(0.003)
+        assert results["full_context"]["timings"]["embed_query"] == 0.0
+        assert results["full_context"]["timings"]["search"] == 0.0
+
+    @patch("exp3_rag.OllamaClient")
+    @patch("exp3_rag.load_hebrew_documents")
+    @patch("exp3_rag.create_retriever")
+    def test_run_uses_configured_backend(self, mock_create, mock_load, MockClient):
+        mock_load.return_value = {"a.txt": "hebrew doc 1"}
+        MockClient.return_value.generate_with_stats.return_value = {"response": "כן"}
+        mock_create.return_value.search.return_value = [[{"text": "doc snippet"}]]
+
+        original = config.EXP3_RETRIEVER
+        config.EXP3_RETRIEVER = "numpy"
+        try:
+            results = RagExperiment("test-model").run()
+        finally:
+            config.EXP3_RETRIEVER = original
+
+        assert mock_create.call_args[0][0] == "numpy"
+        assert results["rag"]["accuracy"] == 1.0
+        mock_create.return_value.build.assert_called_once()
+
+    @patch("exp3_rag.OllamaClient")
+    @patch("exp3_rag.load_hebrew_documents")
+    @patch("exp3_rag.create_retriever")
+    def test_read_only_index_is_not_built(self, mock_create, mock_load, MockClient):
+        mock_load.return_value = {"a.txt": "hebrew doc 1"}
+        MockClient.return_value.generate_with_stats.return_value = {"response": "כן"}
+        retriever = mock_create.return_value
+        retriever.search.return_value = [[{"text": "doc snippet"}]]
+
+        RagExperiment("test-model", read_only_index=True).run()
+
+        retriever.open_read_only.assert_called_once_with({"a.txt": "hebrew doc 1"})
+        retriever.build.assert_not_called()
+
+    @patch("exp3_rag.load_hebrew_documents")
+    @patch("exp3_rag.create_retriever")
+    def test_prepare_shared_indexes(self, mock_create, mock_load):
+        mock_load.return_value = {"a.txt": "hebrew doc 1"}
+        mock_create.return_value.build.return_value = {"added": 1, "deleted": 0, "total": 1}
+
+        with patch.multiple(config, EXP3_RETRIEVER="numpy", EXP3_BASELINE_RETRIEVERS=["bm25"]):
+            assert set(prepare_shared_indexes("query_set")) == {"numpy", "bm25"}
+            assert set(prepare_shared_indexes("single")) == {"numpy"}
+            assert prepare_shared_indexes("sweep") == {}
+
+    def test_invalid_mode(self):
+        with pytest.raises(ValueError):
+            RagExperiment("test-model", mode="invalid_mode")
+
+    @patch("exp3_rag.OllamaClient")
+    @patch("exp3_rag.load_hebrew_documents")
+    @patch("exp3_rag.create_retriever")
+    def test_query_set_batches_retrieval(self, mock_create, mock_load, MockClient):
+        doc_0, doc_1 = "a.txt", "b.txt"
+        mock_load.return_value = {
+            doc_0: "First sentence of document zero here. Another long sentence in document zero.",
+            doc_1: "Only sentence of document one is right here.",
+        }
+        mock_client = MockClient.return_value
+        mock_client.generate_with_stats_async = AsyncMock(return_value={"response": "כן", "prompt_eval_count": 10})
+
+        retriever = mock_create.return_value
+        retriever.NAME = "chroma"
+        # Query 0 retrieves its own document, query 1 does not
+        retriever.search.return_value = [
+            [{"text": "chunk", "source": doc_0}],
+            [{"text": "chunk", "source": doc_0}],
+        ]
+        # The BM25 baseline (same mock) finds both documents
+        retriever.retrieve.return_value = [[{"source": doc_0}], [{"source": doc_1}]]
+
+        original_size = config.EXP3_QUERY_SET_SIZE
+        config.EXP3_QUERY_SET_SIZE = 2
+        try:
+            results = RagExperiment("test-model", mode="query_set").run()
+        finally:
+            config.EXP3_QUERY_SET_SIZE = original_size
+
+        retriever.encode_queries.assert_called_once()
+        assert len(retriever.encode_queries.call_args[0][0]) == 2
+        retriever.search.assert_called_once()
+        assert mock_client.generate_with_stats_async.await_count == 4
+
+        assert results["num_queries"] == 2
+        assert results["retrieval"]["recall_at_k"] == 0.5
+        assert results["rag"]["recall_at_k"] == 0.5
+        assert results["rag"]["accuracy"] == 1.0
+        assert set(results["rag"]["timings"]) == set(TIMING_STAGES)
+
+        mock_create.assert_called_with("bm25")
+        assert results["retrievers"]["chroma"]["recall_at_k"] == 0.5
+        assert results["retrievers"]["bm25"]["recall_at_k"] == 1.0
+        assert set(results["retrievers"]["bm25"]) == {"index_build_seconds", "query_latency", "recall_at_k"}
+
+    @patch("exp3_rag.OllamaClient")
+    @patch("exp3_rag.load_hebrew_documents")
+    @patch("exp3_rag.create_retriever")
+    def test_query_set_counts_failed_requests_as_errors(self, mock_create, mock_load, MockClient):
+        mock_load.return_value = {"a.txt": "Only sentence of document zero is right here."}
+
+        async def generate(prompt, **kwargs):
+            # Every full-context request times out
+            return {} if "Only sentence" in prompt.split("Question")[0] else {"response": "כן"}
+
+        MockClient.return_value.generate_with_stats_async = generate
+        retriever = mock_create.return_value
+        retriever.NAME = "chroma"
+        retriever.search.return_value = [[{"text": "chunk", "source": "a.txt"}]] * 2
+
+        with patch.multiple(config, EXP3_QUERY_SET_SIZE=2, EXP3_BASELINE_RETRIEVERS=[]):
+            results = RagExperiment("test-model", mode="query_set").run()
+
+        assert results["full_context"] == {"errors": 2}
+        assert results["rag"]["accuracy"] == 1.0
+        assert results["rag"]["errors"] == 0
+        assert all("error" in row["full_context"] for row in results["queries"])
+
+    @patch("exp3_rag.OllamaClient")
+    @patch("exp3_rag.load_hebrew_documents")
+    @patch("exp3_rag.create_retriever")
+    def test_empty_query_set_is_rejected(self, mock_create, mock_load, MockClient):
+        mock_load.return_value = {"a.txt": "hebrew doc 1"}
+
+        with patch.object(config, "EXP3_QUERY_SET_SIZE", 0), pytest.raises(ValueError, match="Query set is empty"):
+            RagExperiment("test-model", mode="query_set").run()
+
+    @patch("exp3_rag.OllamaClient")
+    @patch("exp3_rag.load_hebrew_documents")
+    @patch("exp3_rag.default_embeddings")
+    def test_sweep_reuses_embeddings(self, mock_default_embeddings, mock_load, MockClient, tmp_path):
+        embedded_texts = []
+        embeddings = MagicMock(model="test-embed")
+        embeddings.embed_documents.side_effect = lambda texts: embedded_texts.extend(texts) or [
+            [float(len(t)), 1.0] for t in texts
+        ]
+        embeddings.embed_queries.side_effect = lambda texts: [[1.0, 1.0] for _ in texts]
+        mock_default_embeddings.return_value = embeddings
+        mock_load.return_value = {
+            "a.txt": "First sentence of document zero here. Another long sentence in document zero.",
+            "b.txt": "Only sentence of document one is right here.",
+        }
+        MockClient.return_value.generate_with_stats_async = AsyncMock(
+            return_value={"response": "כן", "prompt_eval_count": 10}
+        )
+
+        overrides = {
+            "EXP3_SWEEP_CHUNK_SIZES": [40, 80],
+            "EXP3_SWEEP_CHUNK_OVERLAPS": [0, 10],
+            "EXP3_SWEEP_K": [1, 2],
+            "EXP3_SWEEP_INDEX_DIR": str(tmp_path / "indexes"),
+            "EXP3_EMBEDDING_CACHE_DIR": str(tmp_path / "embeddings"),
+            "EXP3_QUERY_SET_SIZE": 2,
+        }
+        with patch.multiple(config, **overrides):
+            results = RagExperiment("test-model", mode="sweep").run()
+
+        assert len(results["configurations"]) == 8
+        assert {(c["chunk_size"], c["chunk_overlap"], c["k"]) for c in results["configurations"]} == {
+            (size, overlap, k) for size in [40, 80] for overlap in [0, 10] for k in [1, 2]
+        }
+        # Shared chunk texts across variants were embedded exactly once
+        assert len(embedded_texts) == len(set(embedded_texts))
+        assert results["embedding"]["chunks_embedded"] == len(embedded_texts)
+        assert results["best"]["accuracy"] == 1.0
+        assert all(c["errors"] == 0 for c in results["configurations"])
+
+    @patch("exp3_rag.OllamaClient")
+    @patch("exp3_rag.load_english_articles")
+    @patch("exp3_rag.load_hebrew_documents")
+    def test_scaling_finds_crossover(self, mock_hebrew, mock_english, MockClient, tmp_path):
+        mock_hebrew.return_value = {"a.txt": "Hebrew article one. It has two sentences."}
+        mock_english.return_value = ["English article. Also with two sentences."]
+
+        async def generate(prompt, **kwargs):
+            # Full context grows with the corpus; answer with the code found in the prompt
+            code = prompt.split("is ", 1)[1].split(".")[0] if "archive code of record" in prompt else ""
+            return {"response": code, "prompt_eval_duration": len(prompt) * 1_000_000}
+
+        MockClient.return_value.generate_with_stats_async = generate
+
+        overrides = {
+            "EXP3_SCALING_DOC_COUNTS": [5, 2],
+            "EXP3_SCALING_QUERIES": 2,
+            "EXP3_SCALING_RETRIEVER": "bm25",
+            "EXP3_SCALING_INDEX_DIR": str(tmp_path),
+            "EXP3_SCALING_CONTEXT_TOKENS": 100_000,
+            "EXP3_RAG_K": 1,
+        }
+        with patch.multiple(config, **overrides):
+            results = RagExperiment("test-model", mode="scaling").run()
+
+        assert [p["num_documents"] for p in results["points"]] == [2, 5]
+        assert results["points"][1]["num_chunks"] >= 5
+        assert results["points"][1]["retrieval"]["recall_at_k"] == 1.0
+        assert results["points"][1]["full_context"]["documents_in_context"] == 5
+        assert set(results["points"][0]["rag"]["timings"]) == set(TIMING_STAGES)
+        assert set(results["crossover"]) == {"latency", "accuracy"}
+
+    @patch("exp3_rag.OllamaClient")
+    @patch("exp3_rag.load_english_articles")
+    @patch("exp3_rag.load_hebrew_documents")
+    def test_scaling_counts_timeouts_as_errors(self, mock_hebrew, mock_english, MockClient, tmp_path):
+        mock_hebrew.return_value = {"a.txt": "Hebrew article one. It has two sentences."}
+        mock_english.return_value = ["English article. Also with two sentences."]
+        requests = []
+
+        async def generate(prompt, **kwargs):
+            requests.append(kwargs)
+            # The full-context arm times out (the client returns {}); RAG answers wrongly
+            return {} if "record 0 is" in prompt and "record 1 is" in prompt else {"response": "no idea"}
+
+        MockClient.return_value.generate_with_stats_async = generate
+
+        overrides = {
+            "EXP3_SCALING_DOC_COUNTS": [2],
+            "EXP3_SCALING_QUERIES": 2,
+            "EXP3_SCALING_RETRIEVER": "bm25",
+            "EXP3_SCALING_INDEX_DIR": str(tmp_path),
+            "EXP3_RAG_K": 1,
+        }
+        with patch.multiple(config, **overrides):
+            results = RagExperiment("test-model", mode="scaling").run()
+
+        point = results["points"][0]
+        assert point["full_context"]["errors"] == 2
+        assert "accuracy" not in point["full_context"]
+        assert point["rag"] == {**point["rag"], "errors": 0, "accuracy": 0.0}
+        assert results["crossover"] == {"latency": None, "accuracy": None}
+        # One context window per corpus size; timeouts grow with the prompt
+        assert {r["num_ctx"] for r in requests} == {4096}
+        assert all(r["timeout"] > config.EXP3_SCALING_TIMEOUT_SECONDS for r in requests)
+
+    @patch("exp3_rag.load_english_articles", return_value=["word " * 1000])
+    @patch("exp3_rag.load_hebrew_documents", return_value={"a.txt": "word " * 3000})
+    def test_plan_covers_sweep_and_scaling(self, mock_hebrew, mock_english):
+        overrides = {
+            "EXP3_QUERY_SET_SIZE": 2,
+            "EXP3_SWEEP_CHUNK_SIZES": [100, 400],
+            "EXP3_SWEEP_CHUNK_OVERLAPS": [0, 200],
+            "EXP3_SWEEP_K": [1, 3],
+            "EXP3_SCALING_DOC_COUNTS": [2, 100],
+            "EXP3_SCALING_QUERIES": 3,
+            "EXP3_SCALING_CONTEXT_TOKENS": 10_000,
+        }
+        with patch.multiple(config, **overrides):
+            sweep = RagExperiment("test-model", mode="sweep").plan_requests({})
+            scaling = RagExperiment("test-model", mode="scaling").plan_requests({})
+
+        # Three (chunk size, overlap) variants x two k x two queries, one RAG request each
+        assert len(sweep) == 12
+        assert sorted({r["prompt_tokens"] for r in sweep}) == [25, 75, 100, 300]
+        # Two queries at 2 documents and three at 100, each with a full-context and a RAG request
+        assert len(scaling) == 10
+        assert [r["prompt_tokens"] for r in scaling[::2]] == [5200, 5200, 10_000, 10_000, 10_000]
+
+
+class TestScalingCorpus:
+
+    def test_corpus_is_nested_and_has_unique_facts(self):
+        base = ["First article. Second sentence.", "Other article. More text here."]
+        small, small_codes = build_scaling_corpus(base, 3)
+        large, large_codes = build_scaling_corpus(base, 6)
+
+        assert all(large[source] == text for source, text in small.items())
+        assert small_codes == {s: large_codes[s] for s in small_codes}
+        assert all(f"record {i} is {large_codes[f'doc_{i}']}" in large[f"doc_{i}"] for i in range(6))
+        # Past the base corpus, documents are reordered variants of the base articles
+        assert large["doc_2"] != large["doc_0"]
+
+    def test_full_context_window_keeps_target(self):
+        documents = {f"doc_{i}": "word " * 100 for i in range(10)}
+        documents["doc_9"] = "target " * 100
+
+        context, included = full_context_window(documents, "doc_9", max_tokens=400)
+
+        assert included == 3
+        assert "target" in context
+
+    def test_find_crossover(self):
+        points = [
+            {
+                "num_documents": n,
+                "full_context": {"latency": f, "accuracy": fa},
+                "rag": {"latency": 1.0, "accuracy": 1.0},
+            }
+            for n, f, fa in [(10, 0.5, 1.0), (100, 2.0, 1.0), (1000, 8.0, 0.5)]
+        ]
+        assert find_crossover(points) == {"latency": 100, "accuracy": 1000}
+        assert find_crossover(points[:1]) == {"latency": None, "accuracy": None}
+
+
+class TestQuerySet:
+
+    def test_build_query_set_covers_corpus(self):
+        documents = {
+            "a.txt": "Sentence number one is long enough. Short. Sentence number two is long enough.",
+            "b.txt": "x" * 150,
+        }
+        pairs = build_query_set(documents, 4, seed=1)
+
+        assert [p["source"] for p in pairs] == ["a.txt", "b.txt", "a.txt", "b.txt"]
+        assert "x" * 100 in pairs[1]["query"]
+        assert pairs == build_query_set(documents, 4, seed=1)
+
+    def test_load_query_set_validates_entries(self, tmp_path):
+        path = tmp_path / "queries.json"
+        path.write_text('[{"query": "q"}]', encoding="utf-8")
+        with pytest.raises(ValueError):
+            load_query_set(str(path))
+
+
+class ObjectEmbeddings:
+    """Deterministic embeddings: one dimension per object name, plus a constant one."""
+
+    def __init__(self):
+        self.model = "test-embed"
+        self.document_calls = 0
+
+    def _vector(self, text):
+        return [float(obj in text) for obj in OBJECTS] + [0.1]
+
+    def embed_documents(self, texts):
+        self.document_calls += 1
+        return [self._vector(t) for t in texts]
+
+    def embed_queries(self, texts):
+        return [self._vector(t) for t in texts]
 
 
 class TestStrategiesExperiment:
 
+    @patch("exp4_strategies.default_embeddings", ObjectEmbeddings)
     @patch("exp4_strategies.OllamaClient")
-    def test_run(self, MockClient):
+    def test_run(self, MockClient, tmp_path):
         mock_client = MockClient.return_value
-        mock_client.generate.return_value = "Table"  # Correct answer
+        mock_client.generate_with_stats_async = AsyncMock(
+            return_value={
+                "response": "Table",  # Correct answer
+                "prompt_eval_count": 50,
+                "eval_count": 5,
+                "total_duration": 1_000_000_000,
+            }
+        )
 
         exp = StrategiesExperiment("test-model")
-        results = exp.run()
+        with patch.object(config, "EXP4_EMBEDDING_CACHE_DIR", str(tmp_path)):
+            results = exp.run()
 
         assert "baseline" in results
         assert "select" in results
         assert "compress" in results
         assert "write" in results
         assert results["baseline"]["correct"] is True
+
+        # Map-reduce compression is only part of compress_benchmark
+        assert {name: r["calls"] for name, r in results.items()} == {
+            "baseline": 1,
+            "select": 1,
+            "compress": 5,
+            "write": 11,
+        }
+        assert results["write"]["prompt_tokens"] == 550
+        assert results["write"]["eval_tokens"] == 55
+        assert results["write"]["server_seconds"] == pytest.approx(11.0)
+        assert results["write"]["server_metrics"]["prompt_tokens"] == 550
+        assert results["write"]["server_metrics"]["server_seconds"] == pytest.approx(11.0)
+        assert "server_stats" not in results["write"]
+        assert results["write"]["wall_time"] >= 0
+        assert results["select"]["embedding_calls"] == 2
+        assert "error" not in results["select"]
+
+    @pytest.mark.parametrize("mode", ["standard", "compress_benchmark", "history_sweep"])
+    @patch("exp4_strategies.default_embeddings", ObjectEmbeddings)
+    def test_plan_matches_requests_sent(self, mode, tmp_path):
+        overrides = {
+            "CACHE_DIR": str(tmp_path),
+            "EXP4_EMBEDDING_CACHE_DIR": str(tmp_path / "embeddings"),
+            "EXP4_COMPRESS_HISTORY_REPEATS": [1, 3],
+            "EXP4_HISTORY_LENGTHS": [40],
+        }
+        with patch.multiple(config, **overrides):
+            plan = StrategiesExperiment("test-model", mode=mode).plan_requests({})
+            with patch("exp4_strategies.OllamaClient") as MockClient:
+                MockClient.return_value.generate_with_stats_async = AsyncMock(return_value={"response": "Table"})
+                StrategiesExperiment("test-model", mode=mode).run()
+
+        assert len(plan) == MockClient.return_value.generate_with_stats_async.await_count
+        # Nothing is cached yet, and the first request of each chain is known exactly
+        assert {r["cached"] for r in plan} == {False, None}
+        assert all(r["prompt_tokens"] > 0 for r in plan)
+
+    @patch("exp4_strategies.default_embeddings", ObjectEmbeddings)
+    @patch("exp4_strategies.OllamaClient")
+    def test_strategies_run_concurrently(self, MockClient, tmp_path):
+        in_flight = 0
+        max_in_flight = 0
+
+        async def generate(prompt, **kwargs):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return {"response": "Table"}
+
+        MockClient.return_value.generate_with_stats_async = generate
+
+        with patch.multiple(config, EXP4_MAX_CONCURRENCY=3, EXP4_EMBEDDING_CACHE_DIR=str(tmp_path)):
+            StrategiesExperiment("test-model").run()
+
+        # Chains overlap, up to the concurrency limit
+        assert max_in_flight == 3
+
+    def test_invalid_mode(self):
+        with pytest.raises(ValueError):
+            StrategiesExperiment("test-model", mode="invalid_mode")
+
+    @patch("exp4_strategies.OllamaClient")
+    def test_mapreduce_keeps_history_order(self, MockClient):
+        prompts = []
+
+        async def generate(prompt, **kwargs):
+            prompts.append(prompt)
+            if prompt.startswith("Actions:"):
+                return {"response": prompt.split("\n")[1]}
+            if prompt.startswith("Summaries"):
+                parts = [line for line in prompt.split("\n") if line.startswith("I ")]
+                return {"response": " | ".join(parts)}
+            return {"response": "Table"}
+
+        MockClient.return_value.generate_with_stats_async = generate
+
+        exp = StrategiesExperiment("test-model")
+        with patch.object(config, "EXP4_COMPRESS_CHUNK_SIZE", 2):
+            result = asyncio.run(exp._run_strategies(["compress_mapreduce"], exp._task([f"I a{i}" for i in range(8)])))
+
+        # 4 map calls, 2 + 1 merges and the final answer
+        assert result["compress_mapreduce"]["calls"] == 8
+        assert "I a0 | I a2 | I a4 | I a6" in prompts[-1]
+
+    @patch("exp4_strategies.OllamaClient")
+    def test_compress_benchmark(self, MockClient):
+        MockClient.return_value.generate_with_stats_async = AsyncMock(return_value={"response": "Table"})
+
+        with patch.object(config, "EXP4_COMPRESS_HISTORY_REPEATS", [1, 2]):
+            results = StrategiesExperiment("test-model", mode="compress_benchmark").run()
+
+        assert [p["history_length"] for p in results["points"]] == [10, 20]
+        # The sequential fold makes one call per chunk; map-reduce adds the merges
+        assert results["points"][1]["compress"]["calls"] == 8
+        assert results["points"][1]["compress_mapreduce"]["calls"] == 7 + 6 + 1
+        assert all(p["compress_mapreduce"]["correct"] for p in results["points"])
+
+    @patch("exp4_strategies.default_embeddings", ObjectEmbeddings)
+    @patch("exp4_strategies.OllamaClient")
+    def test_history_sweep(self, MockClient, tmp_path):
+        every_place = " ".join(place for places in ROOMS.values() for place in places)
+
+        async def generate(prompt, **kwargs):
+            # Only the full history is slow, and only the full history gets a wrong answer
+            if prompt.startswith("History:"):
+                await asyncio.sleep(0.05)
+                return {"response": "Nowhere"}
+            return {"response": every_place}
+
+        MockClient.return_value.generate_with_stats_async = generate
+
+        with patch.multiple(config, EXP4_HISTORY_LENGTHS=[20, 10], EXP4_EMBEDDING_CACHE_DIR=str(tmp_path)):
+            results = StrategiesExperiment("test-model", mode="history_sweep").run()
+
+        assert [p["history_length"] for p in results["points"]] == [10, 20]
+        assert results["points"][1]["write"]["calls"] == 21
+        assert results["points"][0]["question"].startswith("Where is the")
+        assert set(results["break_even"]) == set(STRATEGIES) - {"baseline"}
+        assert results["break_even"]["select"] == {"latency": 10, "accuracy": 10}
+
+    @patch("exp4_strategies.default_embeddings", ObjectEmbeddings)
+    @patch("exp4_strategies.OllamaClient")
+    def test_history_sweep_sizes_requests_and_skips_failures(self, MockClient, tmp_path):
+        every_place = " ".join(place for places in ROOMS.values() for place in places)
+        options = []
+
+        async def generate(prompt, **kwargs):
+            options.append((prompt, kwargs))
+            # The long baseline times out; every answer that comes back is right
+            if prompt.startswith("History:") and prompt.count("\n") > 50:
+                return {}
+            return {"response": every_place}
+
+        MockClient.return_value.generate_with_stats_async = generate
+
+        with patch.multiple(config, EXP4_HISTORY_LENGTHS=[10, 1000], EXP4_EMBEDDING_CACHE_DIR=str(tmp_path)):
+            results = StrategiesExperiment("test-model", mode="history_sweep").run()
+
+        short, long = results["points"]
+        assert "error" not in short["baseline"]
+        assert long["baseline"]["error"] == "generate request failed or timed out"
+        assert long["baseline"]["correct"] is False
+        assert long["select"]["correct"] is True
+        # A failed baseline is not a wrong answer a strategy can beat
+        assert all(b["accuracy"] is None for b in results["break_even"].values())
+
+        # Every request fits its point's baseline prompt, and longer prompts get longer timeouts
+        baseline_prompts = [(p, kw) for p, kw in options if p.startswith("History:")]
+        assert [kw["num_ctx"] for _, kw in baseline_prompts] == [4096, 16384]
+        assert {kw["num_ctx"] for _, kw in options} == {4096, 16384}
+        assert baseline_prompts[1][1]["timeout"] > baseline_prompts[0][1]["timeout"] > 30
+
+    @patch("exp4_strategies.default_embeddings", ObjectEmbeddings)
+    @patch("exp4_strategies.OllamaClient")
+    def test_select_actions_by_similarity(self, MockClient, tmp_path):
+        actions = [
+            "I pick up the Key.",
+            "I put the Key on the Desk.",
+            "I move to the Garden.",
+            "I pick up the Key.",
+            "I put the Key on the Bench.",
+            "I pick up the Book.",
+        ]
+        exp = StrategiesExperiment("test-model")
+        usage = {"embedding_calls": 0}
+
+        with patch.multiple(config, EXP4_EMBEDDING_CACHE_DIR=str(tmp_path), EXP4_SELECT_K=3, EXP4_SELECT_RECENT=1):
+            selected = exp.select_actions(actions, "Where is the Key?", usage)
+            # Among equally similar lines the most recent win; the last line is always kept; order is preserved
+            assert selected == [actions[1], actions[3], actions[4], actions[5]]
+            assert usage["embedding_calls"] == 2
+
+            exp.select_actions(actions, "Where is the Book?", usage)
+            # History lines are cached, so only the question is embedded
+            assert usage["embedding_calls"] == 3
+            assert exp._action_embeddings.embeddings.document_calls == 1
+
+    @patch("exp4_strategies.default_embeddings", ObjectEmbeddings)
+    @patch("exp4_strategies.OllamaClient")
+    def test_standard_select_drops_lines(self, MockClient, tmp_path):
+        prompts = []
+
+        async def generate(prompt, **kwargs):
+            prompts.append(prompt)
+            return {"response": "Table"}
+
+        MockClient.return_value.generate_with_stats_async = generate
+
+        exp = StrategiesExperiment("test-model")
+        with patch.object(config, "EXP4_EMBEDDING_CACHE_DIR", str(tmp_path)):
+            results = exp.run()
+
+        (select_prompt,) = [p for p in prompts if p.startswith("Relevant History:")]
+        selected = [a for a in exp.actions if a in select_prompt]
+        assert len(selected) == config.EXP4_SELECT_K < len(exp.actions)
+        assert {"I pick up the Apple.", "I put the Apple on the Table."} <= set(selected)
+        assert results["select"]["correct"] is True
+
+    @patch("exp4_strategies.default_embeddings")
+    @patch("exp4_strategies.OllamaClient")
+    def test_failing_strategy_keeps_others(self, MockClient, mock_default_embeddings, tmp_path):
+        MockClient.return_value.generate_with_stats_async = AsyncMock(return_value={"response": "Table"})
+        mock_default_embeddings.return_value.embed_documents.side_effect = RuntimeError("embedding server down")
+
+        with patch.object(config, "EXP4_EMBEDDING_CACHE_DIR", str(tmp_path)):
+            results = StrategiesExperiment("test-model").run()
+
+        assert results["select"]["error"] == "embedding server down"
+        assert results["select"]["correct"] is False
+        assert results["baseline"]["correct"] is True
@@ -27,10 +27,10 @@ class TestIntegration(unittest.TestCase):
     @patch("exp4_strategies.OllamaClient")
     @patch("exp1_needle.load_english_articles")
     @patch("exp2_size.load_english_articles")
-    @patch("exp3_rag.load_hebrew_articles")
+    @patch("exp3_rag.load_hebrew_documents")
     def test_run_single_model_end_to_end(
         self,
-        mock_load_hebrew_articles,
+        mock_load_hebrew_documents,
         mock_load_articles_exp2,
         mock_load_articles_exp1,
         mock_client_exp4,
@@ -42,7 +42,7 @@ class TestIntegration(unittest.TestCase):
         mock_articles = ["Article 1 content.", "Article 2 content.", "Article 3 content."]
         mock_load_articles_exp1.return_value = mock_articles
         mock_load_articles_exp2.return_value = mock_articles
-        mock_load_hebrew_articles.return_value = mock_articles
+        mock_load_hebrew_documents.return_value = {f"article{i}.txt": a for i, a in enumerate(mock_articles)}
 
         # Mock generate responses
         mock_client_instance = MagicMock()
@@ -0,0 +1,80 @@
+import json
+import os
+import pickle
+
+import pytest
+
+from journal import RunJournal, latest_run_id, new_run_id, trial_key
+
+SETTINGS = {"exp1_mode": "info_retrieval", "exp3_mode": "single", "exp4_mode": "standard"}
+
+
+class TestRunJournal:
+
+    def test_new_journal_writes_header(self, journal_dir):
+        journal = RunJournal("run-1", SETTINGS)
+
+        entries = journal.entries()
+        assert entries[0]["type"] == "run"
+        assert entries[0]["exp1_mode"] == "info_retrieval"
+        assert journal.path == os.path.join(str(journal_dir), "run-1.jsonl")
+
+    def test_resume_skips_recorded_trials(self):
+        journal = RunJournal("run-1", SETTINGS)
+        journal.record("m", 1, 0, {"position": "start"}, {"found_secret": True})
+        journal.record("m", 1, 1, {"position": "end"}, None)
+
+        resumed = RunJournal("run-1", SETTINGS, resume=True)
+
+        assert resumed.completed("m", 1, {"position": "start"})["result"] == {"found_secret": True}
+        # Trials without a result are not recorded, so they rerun
+        assert resumed.completed("m", 1, {"position": "end"}) is None
+        assert resumed.completed("other", 1, {"position": "start"}) is None
+
+    def test_existing_run_requires_resume(self):
+        RunJournal("run-1", SETTINGS)
+        with pytest.raises(ValueError, match="already exists"):
+            RunJournal("run-1", SETTINGS)
+
+    def test_resume_rejects_different_settings(self):
+        RunJournal("run-1", SETTINGS)
+        with pytest.raises(ValueError, match="recorded with"):
+            RunJournal("run-1", dict(SETTINGS, exp1_mode="anomaly_detection"), resume=True)
+
+    def test_torn_last_line_is_skipped(self):
+        journal = RunJournal("run-1", SETTINGS)
+        journal.record("m", 2, 0, {}, [1])
+        with open(journal.path, "a", encoding="utf-8") as f:
+            f.write('{"type": "trial", "model": "m", "exp_id": 3')
+
+        resumed = RunJournal("run-1", SETTINGS, resume=True)
+        assert resumed.completed("m", 2, {}) is not None
+        assert resumed.completed("m", 3, {}) is None
+
+    def test_trial_results_span_models_in_trial_order(self):
+        journal = RunJournal("run-1", SETTINGS)
+        journal.record("b", 1, 1, {"n": 1}, "b1")
+        journal.record("a", 1, 0, {"n": 0}, "a0")
+        journal.record("b", 1, 0, {"n": 0}, "b0")
+        journal.record("b", 1, 0, {"n": 0}, "b0-again")
+        journal.record("a", 2, 0, {}, "other experiment")
+
+        assert journal.trial_results(1) == ["a0", "b0-again", "b1"]
+        assert journal.trial_results(1, model="a") == ["a0"]
+
+    def test_journal_is_picklable(self):
+        journal = RunJournal("run-1", SETTINGS)
+        copy = pickle.loads(pickle.dumps(journal))
+        copy.record("m", 2, 0, {}, [1])
+        assert json.loads(open(journal.path).readlines()[-1])["result"] == [1]
+
+    def test_latest_run_id(self, journal_dir):
+        assert latest_run_id() is None
+        RunJournal("old", SETTINGS)
+        os.utime(os.path.join(str(journal_dir), "old.jsonl"), (0, 0))
+        RunJournal("new", SETTINGS)
+        assert latest_run_id() == "new"
+
+    def test_ids_and_keys(self):
+        assert new_run_id() != new_run_id()
+        assert trial_key("m", 1, {"a": 1, "b": 2}) == trial_key("m", 1, {"b": 2, "a": 1})
@@ -0,0 +1,56 @@
+from load_test import MODES, compare, run_load_test, scenarios
+
+
+class TestLoadTest:
+
+    def test_scenarios_run_sequential_once_per_prompt_size(self):
+        grid = scenarios(["sequential", "asyncio"], [4, 16], [100, 1000])
+
+        assert grid == [
+            ("sequential", 1, 100),
+            ("asyncio", 4, 100),
+            ("asyncio", 16, 100),
+            ("sequential", 1, 1000),
+            ("asyncio", 4, 1000),
+            ("asyncio", 16, 1000),
+        ]
+
+    def test_every_mode_drives_the_client_against_the_stand_in(self):
+        run = run_load_test(
+            concurrency_levels=[2],
+            prompt_sizes=[400],
+            requests=4,
+            server={"prefill_tokens_per_second": 1e6, "decode_tokens_per_second": 1e5},
+        )
+
+        assert [s["mode"] for s in run["scenarios"]] == MODES
+        for scenario in run["scenarios"]:
+            assert scenario["errors"] == 0
+            assert 0 < scenario["latency_p50"] <= scenario["latency_p95"] <= scenario["latency_p99"]
+            assert scenario["requests_per_second"] > 0
+            assert scenario["client_cpu_seconds"] > 0
+            assert scenario["lifetime_peak_rss_mb"] > 0
+            assert scenario["rss_mb"] > 0
+            assert scenario["rss_change_mb"] is not None
+        assert "worker_lifetime_peak_rss_mb" in run["scenarios"][-1]
+        assert run["metadata"]["server"]["parallel"] > 0
+
+    def test_compare_matches_scenarios(self):
+        previous = {
+            "scenarios": [
+                {"mode": "threaded", "concurrency": 4, "prompt_chars": 100, "requests_per_second": 10.0},
+                {"mode": "asyncio", "concurrency": 4, "prompt_chars": 100, "requests_per_second": 10.0},
+            ]
+        }
+        current = {
+            "scenarios": [
+                {"mode": "threaded", "concurrency": 4, "prompt_chars": 100, "requests_per_second": 15.0},
+                {"mode": "process", "concurrency": 4, "prompt_chars": 100, "requests_per_second": 5.0},
+            ]
+        }
+
+        [change] = compare(current, previous)
+
+        assert change["mode"] == "threaded"
+        assert change["requests_per_second_change"] == 0.5
+        assert "latency_p95_change" not in change
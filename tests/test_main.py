@@ -1,14 +1,21 @@
-from unittest.mock import MagicMock, patch
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
 
 import main
+from exp1_needle import NeedleExperiment
+from journal import RunJournal
 
 
 class TestMain:
 
     @patch("main.PluginRegistry")
+    @patch("main.ResultsStore")
     @patch("builtins.open", new_callable=MagicMock)
     @patch("json.dump")
-    def test_run_single_model(self, mock_json_dump, mock_open, MockRegistry):
+    def test_run_single_model(self, mock_json_dump, mock_open, MockStore, MockRegistry):
         # Setup mocks
         MockNeedle = MagicMock()
         MockNeedle.NAME = "Needle"
@@ -39,6 +46,12 @@ class TestMain:
         assert results["exp4_strategies"] == {"strat": "results"}
 
         # Check if saved
+        assert [c.args[2] for c in MockStore.return_value.write.call_args_list] == [
+            "exp1_needle",
+            "exp2_size",
+            "exp3_rag",
+            "exp4_strategies",
+        ]
         mock_json_dump.assert_called()
 
     @patch("main.PluginRegistry")
@@ -57,6 +70,30 @@ class TestMain:
         # Verify
         mock_exp1_instance.save_detailed_results.assert_called()
 
+    @patch("main.PluginRegistry")
+    def test_run_single_model_passes_exp3_mode(self, MockRegistry):
+        MockRag = MagicMock()
+        MockRag.NAME = "Rag"
+        MockRag.return_value.run.return_value = {"rag": "results"}
+        MockRegistry.get_all_experiments.return_value = {3: MockRag}
+
+        with patch("builtins.open", new_callable=MagicMock), patch("json.dump"):
+            main.run_single_model("test-model", experiments=[3], exp3_mode="query_set")
+
+        MockRag.assert_called_once_with("test-model", mode="query_set")
+
+    @patch("main.PluginRegistry")
+    def test_run_single_model_passes_exp4_mode(self, MockRegistry):
+        MockStrategies = MagicMock()
+        MockStrategies.NAME = "Strat"
+        MockStrategies.return_value.run.return_value = {"strat": "results"}
+        MockRegistry.get_all_experiments.return_value = {4: MockStrategies}
+
+        with patch("builtins.open", new_callable=MagicMock), patch("json.dump"):
+            main.run_single_model("test-model", experiments=[4], exp4_mode="compress_benchmark")
+
+        MockStrategies.assert_called_once_with("test-model", mode="compress_benchmark")
+
     @patch("main.run_single_model")
     def test_run_benchmark_sequential(self, mock_run_single):
         models = ["model1", "model2"]
@@ -78,3 +115,193 @@ class TestMain:
         main.run_benchmark(models=models, experiments=[1], parallel=True)
 
         pool_instance.map.assert_called()
+
+    @patch("main.prepare_rag_indexes")
+    @patch("main.Pool")
+    @patch("main.cpu_count")
+    def test_run_benchmark_parallel_prepares_rag_index(self, mock_cpu, mock_pool, mock_prepare):
+        mock_cpu.return_value = 4
+        mock_prepare.return_value = True
+        pool_instance = mock_pool.return_value
+        pool_instance.__enter__.return_value = pool_instance
+
+        main.run_benchmark(models=["model1", "model2"], experiments=[3], parallel=True, exp3_mode="query_set")
+
+        mock_prepare.assert_called_once_with("query_set")
+        func = pool_instance.map.call_args[0][0]
+        assert func.keywords["exp3_read_only_index"] is True
+
+    @patch("main.PluginRegistry")
+    def test_run_single_model_read_only_index(self, MockRegistry):
+        MockRag = MagicMock()
+        MockRag.NAME = "Rag"
+        MockRag.return_value.run.return_value = {"rag": "results"}
+        MockRegistry.get_all_experiments.return_value = {3: MockRag}
+
+        with patch("builtins.open", new_callable=MagicMock), patch("json.dump"):
+            main.run_single_model("test-model", experiments=[3], exp3_read_only_index=True)
+
+        MockRag.assert_called_once_with("test-model", mode="single", read_only_index=True)
+
+    @patch("main.run_scheduled")
+    @patch("main.run_single_model")
+    def test_run_benchmark_queue_engine(self, mock_run_single, mock_run_scheduled):
+        main.run_benchmark(models=["model1", "model2"], experiments=[1, 2], engine="queue")
+
+        mock_run_single.assert_not_called()
+        mock_run_scheduled.assert_called_once()
+        assert mock_run_scheduled.call_args[0] == (["model1", "model2"], [1, 2])
+
+    @patch("main.save_model_results")
+    @patch("main.PluginRegistry")
+    def test_run_scheduled_merges_trials_per_model(self, MockRegistry, mock_save):
+        MockNeedle = MagicMock()
+        MockNeedle.side_effect = lambda model, **kwargs: MagicMock(
+            trials=MagicMock(return_value=[{"n": 0}, {"n": 1}]),
+            run_trial=lambda trial, model=model: f"{model}-{trial['n']}",
+            merge_trials=lambda results: results,
+        )
+        MockSize = MagicMock()
+        MockSize.return_value.trials.return_value = [{}]
+        MockSize.return_value.run_trial.side_effect = RuntimeError("server down")
+        MockRegistry.get_all_experiments.return_value = {1: MockNeedle, 2: MockSize}
+
+        results = main.run_scheduled(["model1", "model2"], [2, 1, 9])
+
+        assert [r["model"] for r in results] == ["model1", "model2"]
+        assert results[0]["exp1_needle"] == ["model1-0", "model1-1"]
+        assert results[1]["exp1_needle"] == ["model2-0", "model2-1"]
+        # A failed trial drops its experiment, as in run_single_model
+        assert "exp2_size" not in results[0]
+        assert mock_save.call_count == 2
+
+    @patch("main.run_all_async", new_callable=AsyncMock)
+    @patch("main.run_single_model")
+    def test_run_benchmark_async_engine(self, mock_run_single, mock_run_all):
+        main.run_benchmark(models=["model1", "model2"], experiments=[1, 2], engine="async")
+
+        mock_run_single.assert_not_called()
+        mock_run_all.assert_awaited_once()
+        assert mock_run_all.call_args[0] == (["model1", "model2"], [1, 2])
+
+    @patch("config.ASYNC_MODEL_CONCURRENCY", 2)
+    @patch("main.save_model_results")
+    @patch("main.PluginRegistry")
+    def test_run_model_async_limits_concurrency(self, MockRegistry, mock_save):
+        in_flight = {"now": 0, "peak": 0}
+
+        async def run_trial_async(trial):
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            in_flight["now"] -= 1
+            if trial.get("fail"):
+                raise RuntimeError("server down")
+            return trial["n"]
+
+        def make_experiment(trials):
+            ExpClass = MagicMock()
+            ExpClass.return_value.trials.return_value = trials
+            ExpClass.return_value.run_trial_async = run_trial_async
+            ExpClass.return_value.merge_trials = lambda results: results
+            return ExpClass
+
+        MockRegistry.get_all_experiments.return_value = {
+            2: make_experiment([{"n": i} for i in range(4)]),
+            3: make_experiment([{"n": 0}, {"n": 1, "fail": True}]),
+        }
+
+        results = asyncio.run(main.run_model_async("test-model", [3, 2]))
+
+        assert results["exp2_size"] == [0, 1, 2, 3]
+        assert "exp3_rag" not in results
+        assert in_flight["peak"] == 2
+        mock_save.assert_called_once()
+
+    @patch("config.SCHEDULER_MAX_RESIDENT_MODELS", 1)
+    @patch("main.run_model_async", new_callable=AsyncMock)
+    def test_run_all_async_runs_models_in_one_loop(self, mock_run_model):
+        mock_run_model.side_effect = lambda model, *args: {"model": model}
+
+        results = asyncio.run(main.run_all_async(["model1", "model2"], [2]))
+
+        assert [r["model"] for r in results] == ["model1", "model2"]
+        cpu_executor = mock_run_model.call_args[0][-1]
+        assert cpu_executor is mock_run_model.call_args_list[0][0][-1]
+
+    @patch("main.PluginRegistry")
+    def test_run_single_model_resumes_from_journal(self, MockRegistry):
+        MockSize = MagicMock()
+        MockSize.NAME = "Size"
+        experiment = MockSize.return_value
+        experiment.model = "test-model"
+        experiment.trials.return_value = [{"n": 0}, {"n": 1}]
+        experiment.run_trial.side_effect = lambda trial: f"ran-{trial['n']}"
+        experiment.merge_trials.side_effect = lambda results: results
+        MockRegistry.get_all_experiments.return_value = {2: MockSize}
+
+        journal = RunJournal("run-1", {"exp1_mode": "quick"})
+        journal.record("test-model", 2, 0, {"n": 0}, "from-journal")
+        journal = RunJournal("run-1", {"exp1_mode": "quick"}, resume=True)
+
+        with patch("main.save_model_results"):
+            results = main.run_single_model("test-model", experiments=[2], journal=journal)
+
+        assert results["exp2_size"] == ["from-journal", "ran-1"]
+        experiment.run_trial.assert_called_once_with({"n": 1})
+        assert RunJournal("run-1", {"exp1_mode": "quick"}, resume=True).completed("test-model", 2, {"n": 1})
+
+    def test_journaled_detailed_trials_run_concurrently(self):
+        trials = [{"prompt_length": 5000, "position": p, "estimated_tokens": 1250} for p in ("start", "end", "middle")]
+        in_flight = []
+        peak = []
+
+        async def run_trial_async(self, trial):
+            in_flight.append(trial)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(trial)
+            return {"model": self.model, "message_position": trial["position"]}
+
+        journal = RunJournal("run-1", {"exp1_mode": "info_retrieval"})
+        journal.record("m", 1, 0, trials[0], {"model": "m", "message_position": "from-journal"})
+        journal = RunJournal("run-1", {"exp1_mode": "info_retrieval"}, resume=True)
+        with (
+            patch.object(NeedleExperiment, "trials", return_value=trials),
+            patch.object(NeedleExperiment, "run_trial_async", run_trial_async),
+        ):
+            results = main.run_journaled_trials(NeedleExperiment("m", mode="info_retrieval"), 1, journal)
+
+        assert [r["message_position"] for r in results] == ["from-journal", "end", "middle"]
+        assert max(peak) == 2
+        assert len(journal.trial_results(1)) == 3
+
+    @patch("main.run_single_model")
+    def test_run_benchmark_resume_uses_latest_run(self, mock_run_single):
+        main.run_benchmark(models=["model1"], experiments=[2], run_id="run-1")
+        main.run_benchmark(models=["model1"], experiments=[2], resume=True)
+
+        assert mock_run_single.call_args_list[0].kwargs["journal"].run_id == "run-1"
+        assert mock_run_single.call_args_list[1].kwargs["journal"].run_id == "run-1"
+        with pytest.raises(ValueError):
+            main.run_benchmark(models=["model1"], experiments=[2], run_id="run-1")
+
+    @patch("main.PluginRegistry")
+    def test_detailed_results_cover_every_model(self, MockRegistry, tmp_path):
+        MockRegistry.get_all_experiments.return_value = {1: NeedleExperiment}
+        trial = {"prompt_length": 5000, "position": "start", "estimated_tokens": 1250}
+
+        def run_trial(self, trial):
+            return {"model": self.model, "message_position": trial["position"]}
+
+        with (
+            patch.object(NeedleExperiment, "trials", return_value=[trial]),
+            patch.object(NeedleExperiment, "run_trial", run_trial),
+            patch("config.RESULTS_DIR", str(tmp_path)),
+        ):
+            main.run_benchmark(models=["model1", "model2"], experiments=[1], exp1_mode="info_retrieval")
+
+        with open(tmp_path / "info_retrieval_results.json") as f:
+            saved = json.load(f)
+        assert saved["experiment_metadata"]["models"] == ["model1", "model2"]
+        assert [r["model"] for r in saved["results"]] == ["model1", "model2"]
@@ -0,0 +1,102 @@
+import os
+import urllib.request
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+import metrics
+from utils import OllamaClient
+
+RESPONSE = {
+    "response": "hi",
+    "prompt_eval_count": 100,
+    "eval_count": 20,
+    "prompt_eval_duration": 500_000_000,
+    "eval_duration": 2_000_000_000,
+}
+
+
+@pytest.fixture(autouse=True)
+def registry():
+    metrics.REGISTRY.reset()
+    yield metrics.REGISTRY
+    metrics.REGISTRY.reset()
+
+
+class TestMetrics:
+
+    def test_render_prometheus_text(self):
+        counter = metrics.Counter("things_total", "Things", ["kind"])
+        counter.inc(kind="a")
+        counter.inc(2, kind="a")
+        histogram = metrics.Histogram("latency_seconds", "Latency", ["model"], buckets=[1, 5])
+        for seconds in (0.5, 2, 2, 10):
+            histogram.observe(seconds, model="m")
+
+        assert counter.render() == [
+            "# HELP things_total Things",
+            "# TYPE things_total counter",
+            'things_total{kind="a"} 3',
+        ]
+        assert histogram.render()[2:] == [
+            'latency_seconds_bucket{model="m",le="1"} 1',
+            'latency_seconds_bucket{model="m",le="5"} 3',
+            'latency_seconds_bucket{model="m",le="+Inf"} 4',
+            'latency_seconds_sum{model="m"} 14.5',
+            'latency_seconds_count{model="m"} 4',
+        ]
+
+    def test_client_requests_tokens_and_cache(self, tmp_path):
+        response = MagicMock()
+        response.json.return_value = RESPONSE
+        with patch("config.CACHE_DIR", str(tmp_path)), patch("utils.requests.post", return_value=response):
+            client = OllamaClient("m")
+            client.generate_with_stats("prompt")
+            client.generate_with_stats("prompt")
+            client.generate("other")
+
+        assert metrics.REQUESTS.value(model="m", endpoint="generate") == 2
+        assert metrics.LATENCY.value(model="m", endpoint="generate") == 2
+        assert metrics.IN_FLIGHT.value(model="m") == 0
+        text = metrics.REGISTRY.render()
+        assert "benchmark_cache_hit_ratio 0.3333333333333333" in text
+        assert 'benchmark_tokens_per_second{model="m",phase="prefill"} 200' in text
+        assert 'benchmark_tokens_per_second{model="m",phase="decode"} 10' in text
+
+    def test_failed_requests_count_as_errors(self, tmp_path):
+        with (
+            patch("config.CACHE_DIR", str(tmp_path)),
+            patch("utils.requests.post", side_effect=requests.exceptions.Timeout("slow")),
+        ):
+            assert OllamaClient("m").generate("prompt") == ""
+
+        assert metrics.ERRORS.value(model="m", error="Timeout") == 1
+        assert metrics.IN_FLIGHT.value(model="m") == 0
+
+    @patch("config.METRICS_RATE_WINDOW_SECONDS", 10)
+    def test_requests_per_second_over_the_window(self, registry):
+        registry.reset()
+        start = registry._request_history[0][0]
+        metrics.REQUESTS.inc(20, model="m", endpoint="generate")
+        assert registry.requests_per_second(start + 10) == 2.0
+
+        metrics.REQUESTS.inc(5, model="m", endpoint="generate")
+        assert registry.requests_per_second(start + 25) == pytest.approx(5 / 15)
+
+    def test_exporter_serves_and_snapshots(self, tmp_path):
+        snapshot = str(tmp_path / "metrics.prom")
+        metrics.QUEUE_DEPTH.inc(3)
+        assert metrics.start_exporter() is None
+
+        exporter = metrics.start_exporter(port=0, snapshot_file=snapshot, interval=60)
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{exporter.port}/metrics") as response:
+                body = response.read().decode("utf-8")
+            assert "benchmark_queue_depth 3" in body
+            assert not os.path.exists(snapshot)
+        finally:
+            exporter.stop()
+
+        with open(snapshot, "r", encoding="utf-8") as f:
+            assert "benchmark_queue_depth 3" in f.read()
@@ -0,0 +1,44 @@
+import json
+
+from micro_benchmark import BENCHMARKS, check_regressions, make_text, measure, run_benchmarks, update_baselines
+
+
+class TestMicroBenchmark:
+
+    def test_make_text_is_deterministic_and_sized(self):
+        assert len(make_text(10_000)) == 10_000
+        assert make_text(1_000) == make_text(1_000)
+        assert "\n\n" in make_text(10_000)
+
+    def test_measure_records_time_and_allocations(self):
+        measured = measure(lambda: "x" * 1_000_000, repeats=1)
+
+        assert 0 < measured["seconds"] < 1
+        assert 0.9 < measured["peak_alloc_mb"] < 1.5
+
+    def test_every_function_runs_at_a_small_scale(self):
+        measurements = run_benchmarks(scales=[2_000], repeats=1)
+
+        assert set(measurements) == {f"{name}[2000]" for name in BENCHMARKS}
+        assert all(m["seconds"] > 0 for m in measurements.values())
+
+    def test_regressions_and_baselines(self, tmp_path):
+        measurements = {
+            "count_tokens[10000]": {"seconds": 0.02, "peak_alloc_mb": 1.0},
+            "embed_fact[10000]": {"seconds": 0.001, "peak_alloc_mb": 5.0},
+            "new_case[10]": {"seconds": 1.0, "peak_alloc_mb": 1.0},
+        }
+        baselines = {
+            "count_tokens[10000]": {"seconds": 0.01, "peak_alloc_mb": 1.0},
+            "embed_fact[10000]": {"seconds": 0.001, "peak_alloc_mb": 2.0},
+        }
+
+        regressions = check_regressions(measurements, baselines, threshold=1.5)
+        assert len(regressions) == 2
+        assert regressions[0].startswith("count_tokens[10000]: seconds")
+        assert regressions[1].startswith("embed_fact[10000]: peak_alloc_mb")
+
+        path = tmp_path / "baselines.json"
+        updated = update_baselines(measurements, {"old[1]": {"seconds": 1.0}}, path=str(path))
+        assert set(json.loads(path.read_text())) == {"old[1]", *measurements}
+        assert check_regressions(measurements, updated) == []
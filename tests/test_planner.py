@@ -0,0 +1,186 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+from base import ExperimentBase
+from planner import ALL_MODELS, format_plan, load_throughput, model_rates, peak_concurrency, plan_sweep
+
+
+def write_json(path, data):
+    path.write_text(json.dumps(data), encoding="utf-8")
+
+
+class StubExperiment(ExperimentBase):
+    def run(self):
+        raise AssertionError("planning must not run experiments")
+
+
+class PlannedExperiment(StubExperiment):
+    """Two trials of two requests each; the first request of trial 0 is cached."""
+
+    ID = 1
+    NAME = "Planned"
+
+    def trials(self):
+        return [{"n": 0}, {"n": 1}]
+
+    def plan_requests(self, trial):
+        return [
+            {"prompt_tokens": 1000, "max_tokens": 50, "cached": trial["n"] == 0},
+            {"prompt_tokens": 2000, "max_tokens": 500, "cached": None},
+        ]
+
+
+class UnplannedExperiment(StubExperiment):
+    ID = 2
+    NAME = "Unplanned"
+
+    def peak_concurrency(self):
+        return 3
+
+
+class TestThroughput:
+
+    def test_load_throughput_from_cache_and_results(self, tmp_path):
+        cache_dir = tmp_path / "cache"
+        cache_dir.mkdir()
+        write_json(
+            cache_dir / "a.json",
+            {
+                "model": "m1",
+                "prompt_eval_count": 1000,
+                "prompt_eval_duration": 2_000_000_000,
+                "eval_count": 100,
+                "eval_duration": 4_000_000_000,
+                "load_duration": 1_000_000_000,
+            },
+        )
+        # Embedding responses and unreadable files carry no timings
+        write_json(cache_dir / "b.json", [0.1, 0.2])
+        (cache_dir / "c.json").write_text("{", encoding="utf-8")
+        write_json(
+            tmp_path / "info_retrieval_results.json",
+            {
+                "results": [
+                    {
+                        "model": "m1",
+                        "ollama_metadata": {
+                            "prompt_eval_count": 3000,
+                            "prompt_eval_duration": 2_000_000_000,
+                            "eval_count": 300,
+                            "eval_duration": 6_000_000_000,
+                            "load_duration": 3_000_000_000,
+                        },
+                    },
+                    {"model": "m2", "ollama_metadata": {}},
+                ]
+            },
+        )
+
+        throughput = load_throughput(cache_dir=str(cache_dir), results_dir=str(tmp_path))
+
+        assert set(throughput) == {"m1", ALL_MODELS}
+        assert throughput["m1"]["prefill_tps"] == pytest.approx(1000.0)
+        assert throughput["m1"]["decode_tps"] == pytest.approx(40.0)
+        assert throughput["m1"]["output_tokens"] == pytest.approx(200.0)
+        assert throughput["m1"]["load_seconds"] == pytest.approx(2.0)
+        assert throughput["m1"]["responses"] == 2
+
+    @patch("config.PLAN_DEFAULT_DECODE_TOKENS_PER_SECOND", 10)
+    def test_model_rates_fall_back(self):
+        history = {"prefill_tps": 1.0, "decode_tps": 1.0, "output_tokens": 1.0, "load_seconds": 1.0}
+
+        assert model_rates({"m1": history}, "m1")["source"] == "history"
+        assert model_rates({ALL_MODELS: history}, "m2")["source"] == "history (all models)"
+        defaults = model_rates({}, "m2")
+        assert defaults["source"] == "defaults"
+        assert defaults["decode_tps"] == 10
+
+
+class TestPlanSweep:
+
+    THROUGHPUT = {"m1": {"prefill_tps": 1000.0, "decode_tps": 10.0, "output_tokens": 100.0, "load_seconds": 5.0}}
+
+    @patch("config.SCHEDULER_EXPERIMENT_SECONDS", {2: 60.0})
+    @patch("config.OLLAMA_HOSTS", [{"url": "http://h", "capacity": 2, "models": None}])
+    @patch("planner.PluginRegistry.get_all_experiments")
+    def test_predicts_time_tokens_and_cache_coverage(self, mock_experiments):
+        mock_experiments.return_value = {1: PlannedExperiment, 2: UnplannedExperiment}
+
+        with patch("requests.post") as mock_post:
+            plan = plan_sweep(models=["m1"], throughput=self.THROUGHPUT)
+        mock_post.assert_not_called()
+
+        planned, unplanned = plan["rows"]
+        assert planned["trials"] == 2 and planned["requests"] == 4
+        assert planned["prompt_tokens"] == 6000
+        # One cached request costs nothing; output is capped by max_tokens
+        assert planned["output_tokens"] == 50 + 100 + 100
+        assert planned["server_seconds"] == pytest.approx((1 + 5) + (2 + 10) * 2)
+        assert planned["cached"] == 1 and planned["checkable"] == 2
+        assert not unplanned["predicted"]
+        # The configured whole-run estimate plus one model load
+        assert unplanned["server_seconds"] == pytest.approx(60.0 + 5.0)
+        # Peak concurrency 3 is capped by the host's 2 parallel slots
+        assert plan["parallel_requests"] == 2
+        assert plan["wall_seconds"] == pytest.approx(plan["server_seconds"] / 2)
+
+        report = format_plan(plan)
+        assert "Cache hits: 1 of 2 checkable requests (50%)" in report
+        assert "Peak concurrency (sequential engine): 3 requests" in report
+
+    @patch("planner.PluginRegistry.get_all_experiments")
+    def test_queue_engine_spreads_time_over_hosts(self, mock_experiments):
+        mock_experiments.return_value = {1: PlannedExperiment}
+        hosts = [{"url": f"http://h{i}", "capacity": 2, "models": None} for i in range(2)]
+
+        with patch("config.OLLAMA_HOSTS", hosts):
+            plan = plan_sweep(models=["m1"], engine="queue", throughput=self.THROUGHPUT)
+
+        assert plan["hosts"] == 2
+        assert plan["wall_seconds"] == pytest.approx(plan["server_seconds"] / 2)
+
+    @patch("config.OLLAMA_HOSTS", [{"url": "http://h", "capacity": 8, "models": None}])
+    @patch("planner.PluginRegistry.get_all_experiments")
+    def test_pool_engine_overlaps_models(self, mock_experiments):
+        mock_experiments.return_value = {2: UnplannedExperiment}
+        throughput = {"*": self.THROUGHPUT["m1"]}
+
+        with patch("planner.cpu_count", return_value=8):
+            sequential = plan_sweep(models=["m1", "m2"], throughput=throughput)
+            pool = plan_sweep(models=["m1", "m2"], engine="pool", throughput=throughput)
+
+        assert pool["server_seconds"] == pytest.approx(sequential["server_seconds"])
+        assert (sequential["parallel_requests"], pool["parallel_requests"]) == (3, 6)
+        assert pool["wall_seconds"] == pytest.approx(sequential["wall_seconds"] / 2)
+
+    @patch("planner.PluginRegistry.get_all_experiments")
+    def test_failing_experiment_is_reported(self, mock_experiments):
+        class Broken(StubExperiment):
+            def __init__(self, model, **kwargs):
+                raise ValueError("no corpus")
+
+        mock_experiments.return_value = {3: Broken}
+
+        plan = plan_sweep(models=["m1"], throughput=self.THROUGHPUT)
+
+        assert plan["rows"][0]["error"] == "no corpus"
+        assert "error: no corpus" in format_plan(plan)
+
+
+class TestPeakConcurrency:
+
+    @patch("config.ASYNC_MODEL_CONCURRENCY", 2)
+    @patch("config.SCHEDULER_MAX_RESIDENT_MODELS", 1)
+    def test_engines(self):
+        peaks = {"m1": [5, 1, 1, 1], "m2": [1, 1]}
+        hosts = [{"url": "http://h", "capacity": 3, "models": None}]
+
+        assert peak_concurrency("sequential", ["m1", "m2"], peaks) == 5
+        with patch("planner.cpu_count", return_value=8):
+            assert peak_concurrency("pool", ["m1", "m2"], peaks) == 10
+        with patch("config.OLLAMA_HOSTS", hosts):
+            assert peak_concurrency("queue", ["m1", "m2"], peaks) == 7
+        assert peak_concurrency("async", ["m1", "m2"], peaks) == 6
+        assert peak_concurrency("sequential", ["m1"], {"m1": []}) == 0
@@ -1,7 +1,13 @@
 import os
+import subprocess
+import sys
+from unittest.mock import patch
 
 from base import ExperimentBase
-from plugins import PluginRegistry
+from plugins import PluginRegistry, load_manifest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_BUDGET_SECONDS = 1.0
 
 
 class TestPlugins:
@@ -29,3 +35,69 @@ class TestPlugins:
         cls = PluginRegistry.get_experiment_class(1)
         assert cls is not None
         assert cls.ID == 1
+
+    def test_manifest_matches_experiment_classes(self):
+        PluginRegistry._discovered = False
+        PluginRegistry._experiments = {}
+
+        for exp_id, entry in load_manifest().items():
+            cls = PluginRegistry.get_experiment_class(exp_id)
+            assert cls is not None
+            assert (cls.ID, cls.NAME, cls.__module__, cls.__name__) == (
+                exp_id,
+                entry["name"],
+                entry["module"],
+                entry["class"],
+            )
+
+    def test_listing_does_not_import_experiments(self):
+        # A fresh interpreter, so modules imported by other tests do not count
+        script = (
+            "import sys, time\n"
+            "start = time.perf_counter()\n"
+            "import main\n"
+            "from plugins import PluginRegistry\n"
+            "ids = list(PluginRegistry.get_all_experiments())\n"
+            "name = PluginRegistry.get_experiment_name(3)\n"
+            "PluginRegistry.get_experiment_class(1)\n"
+            "elapsed = time.perf_counter() - start\n"
+            "heavy = [m for m in ('exp2_size', 'exp3_rag', 'exp4_strategies', 'langchain_chroma', 'chromadb')"
+            " if m in sys.modules]\n"
+            "print(ids, name, heavy, elapsed)\n"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.split("\n")[-2]
+
+        assert output.startswith("[1, 2, 3, 4] RAG vs Full [] ")
+        # Single-experiment runs start in well under a second
+        assert float(output.split()[-1]) < STARTUP_BUDGET_SECONDS
+
+    def test_unlisted_module_is_imported_at_discovery(self, tmp_path):
+        (tmp_path / "experiments.json").write_text('{"experiments": []}', encoding="utf-8")
+        (tmp_path / "exp9_extra.py").write_text(
+            "from base import ExperimentBase\n\n\n"
+            "class ExtraExperiment(ExperimentBase):\n"
+            "    ID = 9\n"
+            "    NAME = 'Extra'\n\n"
+            "    def run(self):\n"
+            "        return {}\n",
+            encoding="utf-8",
+        )
+        PluginRegistry._discovered = False
+        PluginRegistry._experiments = {}
+
+        try:
+            with (
+                patch("plugins.PLUGIN_DIR", str(tmp_path)),
+                patch("plugins.MANIFEST_FILE", str(tmp_path / "experiments.json")),
+            ):
+                experiments = PluginRegistry.get_all_experiments()
+                assert list(experiments) == [9]
+                assert experiments[9].NAME == "Extra"
+                assert 1 not in experiments
+        finally:
+            sys.path.remove(str(tmp_path))
+            sys.modules.pop("exp9_extra", None)
+            PluginRegistry._discovered = False
+            PluginRegistry._experiments = {}
@@ -0,0 +1,155 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+import config
+from rag_index import RagIndex
+from utils import load_hebrew_documents
+
+
+def make_index(tmp_path, **kwargs):
+    return RagIndex(str(tmp_path), embedding_model="test-embed", chunk_size=40, chunk_overlap=0, **kwargs)
+
+
+DOCS = {
+    "doc_0": "First paragraph of the first document.\n\nSecond paragraph of the first document.",
+    "doc_1": "Only paragraph of the second document.",
+}
+
+
+class TestRagIndex:
+
+    def test_first_build_is_full_rebuild(self, tmp_path):
+        index = make_index(tmp_path)
+        plan = index.plan(DOCS)
+
+        assert plan["rebuild_reason"] == "no manifest"
+        assert len(plan["add"]) == 3
+        assert not RagIndex.is_up_to_date(plan)
+
+        store = MagicMock()
+        stats = index.apply(store, plan)
+
+        store.reset_collection.assert_called_once()
+        store.add_documents.assert_called_once()
+        assert stats["total"] == 3
+
+    def test_unchanged_corpus_is_up_to_date(self, tmp_path):
+        index = make_index(tmp_path)
+        index.apply(MagicMock(), index.plan(DOCS))
+
+        assert RagIndex.is_up_to_date(index.plan(DOCS))
+
+    def test_changed_document_only_embeds_new_chunks(self, tmp_path):
+        index = make_index(tmp_path)
+        index.apply(MagicMock(), index.plan(DOCS))
+
+        edited = dict(DOCS)
+        edited["doc_0"] = "First paragraph of the first document.\n\nAn edited second paragraph here."
+        plan = index.plan(edited)
+
+        assert plan["rebuild_reason"] is None
+        assert plan["changed_sources"] == ["doc_0"]
+        assert [c.page_content for c in plan["add"]] == ["An edited second paragraph here."]
+        assert len(plan["delete"]) == 1
+
+        store = MagicMock()
+        index.apply(store, plan)
+        store.reset_collection.assert_not_called()
+        store.delete.assert_called_once_with(ids=plan["delete"])
+
+    def test_removed_document_deletes_its_chunks(self, tmp_path):
+        index = make_index(tmp_path)
+        index.apply(MagicMock(), index.plan(DOCS))
+
+        plan = index.plan({"doc_0": DOCS["doc_0"]})
+
+        assert plan["removed_sources"] == ["doc_1"]
+        assert plan["add"] == []
+        assert len(plan["delete"]) == 1
+
+    def test_inserted_file_only_embeds_itself(self, tmp_path, monkeypatch):
+        articles_dir = tmp_path / "articles"
+        articles_dir.mkdir()
+        monkeypatch.setattr(config, "HEBREW_ARTICLES_DIR", str(articles_dir))
+        for name, text in [("a.txt", DOCS["doc_0"]), ("c.txt", DOCS["doc_1"])]:
+            (articles_dir / name).write_text(text, encoding="utf-8")
+        index = make_index(tmp_path / "index")
+        index.apply(MagicMock(), index.plan(load_hebrew_documents()))
+
+        # Sorts between the existing files, which shifted every later positional ID
+        inserted = "A document added between the others."
+        (articles_dir / "b.txt").write_text(inserted, encoding="utf-8")
+        plan = index.plan(load_hebrew_documents())
+
+        assert plan["rebuild_reason"] is None
+        assert plan["changed_sources"] == ["b.txt"]
+        assert [c.page_content for c in plan["add"]] == [inserted]
+        assert plan["delete"] == []
+
+    def test_edited_file_only_embeds_its_changed_chunks(self, tmp_path, monkeypatch):
+        articles_dir = tmp_path / "articles"
+        articles_dir.mkdir()
+        monkeypatch.setattr(config, "HEBREW_ARTICLES_DIR", str(articles_dir))
+        (articles_dir / "a.txt").write_text(DOCS["doc_0"], encoding="utf-8")
+        index = make_index(tmp_path / "index")
+        index.apply(MagicMock(), index.plan(load_hebrew_documents()))
+
+        # Editing one paragraph keeps the file name, so the untouched paragraph keeps its chunk ID
+        (articles_dir / "a.txt").write_text(
+            "First paragraph of the first document.\n\nAn edited second paragraph here.", encoding="utf-8"
+        )
+        plan = index.plan(load_hebrew_documents())
+
+        assert plan["changed_sources"] == ["a.txt"]
+        assert plan["removed_sources"] == []
+        assert [c.page_content for c in plan["add"]] == ["An edited second paragraph here."]
+        assert len(plan["delete"]) == 1
+
+    def test_parameter_change_forces_rebuild(self, tmp_path):
+        make_index(tmp_path).apply(MagicMock(), make_index(tmp_path).plan(DOCS))
+
+        other = RagIndex(str(tmp_path), embedding_model="other-embed", chunk_size=40, chunk_overlap=0)
+        plan = other.plan(DOCS)
+
+        assert "parameters changed" in plan["rebuild_reason"]
+        assert len(plan["add"]) == 3
+
+    def test_sync_refuses_stale_index_without_auto_update(self, tmp_path):
+        store = MagicMock()
+        original = config.EXP3_INDEX_AUTO_UPDATE
+        config.EXP3_INDEX_AUTO_UPDATE = False
+        try:
+            with pytest.raises(RuntimeError, match="stale"):
+                make_index(tmp_path).sync(store, DOCS)
+        finally:
+            config.EXP3_INDEX_AUTO_UPDATE = original
+
+        store.add_documents.assert_not_called()
+
+    def test_read_only_sync_never_writes(self, tmp_path):
+        index = make_index(tmp_path)
+        store = MagicMock()
+
+        with pytest.raises(RuntimeError, match="read-only"):
+            index.sync(store, DOCS, read_only=True)
+        store.reset_collection.assert_not_called()
+        store.add_documents.assert_not_called()
+
+        index.sync(store, DOCS)
+        assert make_index(tmp_path).sync(MagicMock(), DOCS, read_only=True) == {"added": 0, "deleted": 0, "total": 3}
+
+    def test_concurrent_builders_embed_once(self, tmp_path):
+        store = MagicMock()
+        # Hold the lock long enough for the other thread to queue behind it
+        store.add_documents.side_effect = lambda *args, **kwargs: time.sleep(0.2)
+
+        threads = [threading.Thread(target=make_index(tmp_path).sync, args=(store, DOCS)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        store.add_documents.assert_called_once()
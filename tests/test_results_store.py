@@ -0,0 +1,136 @@
+import json
+import os
+
+import pytest
+
+import analyze_results
+from results_store import ResultsStore, detailed_experiment, flatten
+
+METRICS = {"prompt_tokens": 1200, "output_tokens": 30, "prefill_tokens_per_second": 600.0, "client_seconds": 2.5}
+
+SIZE = [
+    {"doc_count": 1, "accuracy": 1.0, "latency": 1.5, "response": "BLUE", "server_metrics": METRICS},
+    {"doc_count": 5, "accuracy": 0.0, "latency": 0.5, "response": "no"},
+]
+
+STRATEGIES = {
+    "write": {"correct": True, "response": "BLUE", "calls": 11, "wall_time": 1.5, "server_metrics": METRICS},
+    "select": {"correct": False, "response": "no", "calls": 1, "wall_time": 0.5},
+}
+
+RAG = {
+    "mode": "query_set",
+    "k": 3,
+    "rag": {"accuracy": 0.5, "latency": 1.0, "server_metrics": METRICS},
+    "queries": [{"query": "q", "rag": {"accuracy": 1.0, "latency": 1.0, "response": "a"}}],
+}
+
+
+def detailed(model, positions):
+    rows = [
+        {
+            "model": model,
+            "mode": "info_retrieval",
+            "message_position": position,
+            "target_prompt_length": 5000,
+            "found_secret": position == "start",
+            "query_time_seconds": 2.0,
+            "ollama_metadata": {"prompt_eval_count": 3000, "prompt_eval_duration": 1_000_000_000},
+        }
+        for position in positions
+    ]
+    return {"experiment_metadata": {"experiment_name": "needle", "models": [model]}, "results": rows}
+
+
+class TestResultsStore:
+
+    def test_trial_rows(self):
+        skeleton, first, second = flatten(SIZE)
+        assert json.loads(skeleton["record"]) == [None, None]
+        assert first["path"] == "[0]"
+        assert first["doc_count"] == 1
+        assert first["accuracy"] == 1.0
+        assert first["latency"] == 1.5
+        assert first["prompt_tokens"] == 1200
+        assert first["prefill_tokens_per_second"] == 600.0
+        assert second["accuracy"] == 0.0
+        assert second["prompt_tokens"] is None
+
+        legacy = flatten(detailed("m", ["start"]))[1]
+        assert legacy["position"] == "start"
+        assert legacy["mode"] == "info_retrieval"
+        assert legacy["prefill_tokens_per_second"] == 3000
+
+    def test_summaries_are_not_trials(self):
+        # Arm averages and strategy chains aggregate many requests; only the per-query answer is one
+        assert len(flatten(STRATEGIES)) == 1
+        _, query = flatten(RAG)
+        assert json.loads(query["path"]) == ["queries", 0, "rag"]
+
+    def test_views_rebuild_results(self):
+        store = ResultsStore()
+        store.write("run-1", "m:7b", "exp3_rag", RAG)
+        store.write("run-1", "m:7b", "exp4_strategies", STRATEGIES)
+
+        assert store.model_results("m:7b") == {"model": "m:7b", "exp3_rag": RAG, "exp4_strategies": STRATEGIES}
+        assert os.path.isdir(os.path.join(store.directory, "run=run-1", "model=m%3A7b", "experiment=exp3_rag"))
+
+    def test_read_prunes_partitions_and_columns(self):
+        store = ResultsStore()
+        store.write("run-1", "a", "exp2_size", SIZE)
+        store.write("run-1", "b", "exp2_size", SIZE)
+        store.write("run-1", "a", "exp3_rag", RAG)
+
+        df = store.read(columns=["model", "doc_count", "accuracy"], model="a", experiment="exp2_size")
+        assert list(df.columns) == ["model", "doc_count", "accuracy"]
+        assert df.to_dict("records") == [
+            {"model": "a", "doc_count": 1.0, "accuracy": 1.0},
+            {"model": "a", "doc_count": 5.0, "accuracy": 0.0},
+        ]
+        assert len(store.read(columns=["model"])) == 5
+        with pytest.raises(ValueError):
+            store.read(columns=["nope"])
+
+    def test_rewrites_replace_and_latest_reads_newest_run(self):
+        store = ResultsStore()
+        store.write("run-1", "a", "exp2_size", SIZE)
+        store.write("run-1", "a", "exp2_size", SIZE[:1])
+        assert len(store.read(columns=["accuracy"])) == 1
+
+        store.write("run-2", "a", "exp2_size", SIZE)
+        assert len(store.read(columns=["accuracy"])) == 3
+        assert len(store.read(columns=["accuracy"], latest=True)) == 2
+        assert store.model_results("a")["exp2_size"] == SIZE
+        assert store.model_results("a", "run-1")["exp2_size"] == SIZE[:1]
+
+    def test_detailed_results_merge_newest_partition_per_model(self):
+        store = ResultsStore()
+        experiment = detailed_experiment("info_retrieval")
+        store.write("run-1", "b", experiment, detailed("b", ["start"]))
+        store.write("run-2", "b", experiment, detailed("b", ["start", "end"]))
+        store.write("run-2", "a", experiment, detailed("a", ["middle"]))
+        # A later run of another model adds to the view instead of replacing it
+        store.write("run-3", "c", experiment, detailed("c", ["end"]))
+
+        view = store.detailed_results("info_retrieval")
+        assert view["experiment_metadata"]["models"] == ["b", "a", "c"]
+        assert view["experiment_metadata"]["total_experiments"] == 4
+        assert [r["model"] for r in view["results"]] == ["b", "b", "a", "c"]
+        assert store.detailed_results("info_retrieval", "run-1")["experiment_metadata"]["total_experiments"] == 1
+        assert store.detailed_modes() == ["info_retrieval"]
+
+    def test_analysis_reads_store_before_files(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("config.RESULTS_DIR", str(tmp_path))
+        ResultsStore().write("run-1", "m:7b", "exp2_size", SIZE)
+        ResultsStore().write("run-1", "m:7b", detailed_experiment("info_retrieval"), detailed("m:7b", ["start"]))
+        for name, data in [("m_7b_results.json", {"model": "m:7b"}), ("old_results.json", {"model": "old"})]:
+            with open(tmp_path / name, "w") as f:
+                json.dump(data, f)
+
+        results = analyze_results.load_results()
+        assert [r.get("source") for r in results] == ["store", "store", None]
+        assert results[0]["data"]["exp2_size"] == SIZE
+        assert results[2]["data"] == {"model": "old"}
+
+        df = analyze_results.stored_server_metrics()
+        assert sorted(df["experiment"]) == ["exp1_needle (info_retrieval)", "exp2_size", "exp2_size"]
@@ -0,0 +1,199 @@
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+import config
+from retrievers import (
+    BM25Retriever,
+    CachedEmbeddings,
+    NumpyRetriever,
+    NumpyVectorIndex,
+    OllamaBatchEmbeddings,
+    create_retriever,
+)
+
+VOCAB = ["apple", "banana", "cherry", "grape"]
+
+
+class KeywordEmbeddings:
+    """Deterministic embeddings: one dimension per vocabulary word."""
+
+    def __init__(self):
+        self.document_calls = 0
+        self.embedded_texts = []
+
+    def _vector(self, text):
+        return [float(text.lower().count(word)) for word in VOCAB]
+
+    def embed_documents(self, texts):
+        self.document_calls += 1
+        self.embedded_texts.extend(texts)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+DOCS = {
+    "doc_0": "apple apple",
+    "doc_1": "banana",
+    "doc_2": "cherry and a little apple",
+}
+
+
+class TestNumpyVectorIndex:
+
+    def test_normalize_rows(self):
+        matrix = NumpyVectorIndex.normalize([[3.0, 4.0], [0.0, 0.0]])
+        assert matrix.dtype == np.float32
+        assert matrix.flags["C_CONTIGUOUS"]
+        np.testing.assert_allclose(matrix[0], [0.6, 0.8], rtol=1e-6)
+        np.testing.assert_allclose(matrix[1], [0.0, 0.0])
+
+    def test_batched_top_k_is_sorted(self, tmp_path):
+        retriever = NumpyRetriever(str(tmp_path), embeddings=KeywordEmbeddings())
+        retriever.build(DOCS)
+
+        results = retriever.retrieve(["apple", "banana"], k=2)
+
+        assert [hit["source"] for hit in results[0]] == ["doc_0", "doc_2"]
+        assert results[0][0]["score"] >= results[0][1]["score"]
+        assert results[1][0]["source"] == "doc_1"
+
+    def test_k_larger_than_index(self, tmp_path):
+        retriever = NumpyRetriever(str(tmp_path), embeddings=KeywordEmbeddings())
+        retriever.build(DOCS)
+
+        assert len(retriever.retrieve(["grape"], k=10)[0]) == 3
+
+    def test_reload_from_disk_and_incremental_update(self, tmp_path):
+        embeddings = KeywordEmbeddings()
+        NumpyRetriever(str(tmp_path), embeddings=embeddings).build(DOCS)
+
+        reopened = NumpyRetriever(str(tmp_path), embeddings=embeddings)
+        assert isinstance(reopened.store.matrix, np.memmap)
+        assert len(reopened.store) == 3
+
+        calls_before = embeddings.document_calls
+        stats = reopened.build({"doc_0": DOCS["doc_0"], "doc_1": "grape"})
+
+        assert stats == {"added": 1, "deleted": 2, "total": 2}
+        assert embeddings.document_calls == calls_before + 1
+        assert reopened.retrieve(["grape"], k=1)[0][0]["source"] == "doc_1"
+
+    @pytest.mark.parametrize("backend", ["numpy", "bm25"])
+    def test_retrievers_opened_on_a_cold_index_see_each_others_build(self, backend, tmp_path):
+        embeddings = KeywordEmbeddings()
+        # Both open the empty directory; the second builds only after the first has finished
+        first = create_retriever(backend, persist_directory=str(tmp_path), embeddings=embeddings)
+        second = create_retriever(backend, persist_directory=str(tmp_path), embeddings=embeddings)
+        first.build(DOCS)
+
+        assert second.build(DOCS) == {"added": 0, "deleted": 0, "total": 3}
+        assert second.retrieve(["banana"], k=1)[0][0]["source"] == "doc_1"
+        if backend == "numpy":
+            assert embeddings.document_calls == 1
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            create_retriever("does-not-exist")
+
+
+class TestOllamaBatchEmbeddings:
+
+    def test_batches_with_prefixes(self):
+        embeddings = OllamaBatchEmbeddings(batch_size=2)
+        embeddings.client = MagicMock()
+        embeddings.client.embed_batch.side_effect = lambda texts, model, keep_alive: [[float(len(t))] for t in texts]
+
+        vectors = embeddings.embed_documents(["a", "b", "c"])
+
+        assert vectors == [[10.0], [10.0], [10.0]]
+        assert embeddings.client.embed_batch.call_count == 2
+        assert embeddings.client.embed_batch.call_args_list[0][0][0] == ["passage: a", "passage: b"]
+        # The model stays loaded between batches and is unloaded once, after the last
+        keep_alive = [call.kwargs["keep_alive"] for call in embeddings.client.embed_batch.call_args_list]
+        assert keep_alive == [config.EXP3_EMBEDDING_KEEP_ALIVE, 0]
+        assert embeddings.embed_query("q") == [8.0]
+
+    def test_short_response_raises(self):
+        embeddings = OllamaBatchEmbeddings()
+        embeddings.client = MagicMock()
+        embeddings.client.embed_batch.return_value = []
+
+        with pytest.raises(RuntimeError):
+            embeddings.embed_queries(["q"])
+
+
+class TestCachedEmbeddings:
+
+    def test_each_text_embedded_once_and_persisted(self, tmp_path):
+        inner = KeywordEmbeddings()
+        cached = CachedEmbeddings(inner, cache_dir=str(tmp_path))
+
+        assert cached.warm(["apple", "banana", "apple"]) == 2
+        assert cached.embed_documents(["banana", "cherry"]) == [[0.0, 1.0, 0.0, 0.0], [0.0, 0.0, 1.0, 0.0]]
+        assert inner.embedded_texts == ["apple", "banana", "cherry"]
+
+        reloaded = CachedEmbeddings(KeywordEmbeddings(), cache_dir=str(tmp_path))
+        assert reloaded.warm(["apple", "banana", "cherry"]) == 0
+
+    def test_warms_append_shards_until_they_outgrow_the_main_file(self, tmp_path):
+        cached = CachedEmbeddings(KeywordEmbeddings(), cache_dir=str(tmp_path))
+        main_file = tmp_path / "nomic-embed-text.npz"
+        cached.warm(["apple", "banana", "cherry"])
+        merged_at = main_file.stat().st_mtime_ns
+
+        # Small warms only write their own vectors; the main file is untouched
+        cached.warm(["grape"])
+        cached.warm(["apple grape"])
+        assert len(list(tmp_path.glob("*.shard-*.npz"))) == 2
+        assert main_file.stat().st_mtime_ns == merged_at
+        assert CachedEmbeddings(KeywordEmbeddings(), cache_dir=str(tmp_path)).warm(["grape", "apple grape"]) == 0
+
+        # Once the shards hold as many vectors as the main file, they are merged into it
+        cached.warm(["banana grape"])
+        assert list(tmp_path.glob("*.npz")) == [main_file]
+        assert len(CachedEmbeddings(KeywordEmbeddings(), cache_dir=str(tmp_path)).vectors) == 6
+
+    def test_instances_sharing_a_path_keep_each_others_vectors(self, tmp_path):
+        # Both open the empty cache, as two processes would, then merge their own vectors
+        first = CachedEmbeddings(KeywordEmbeddings(), cache_dir=str(tmp_path))
+        second = CachedEmbeddings(KeywordEmbeddings(), cache_dir=str(tmp_path))
+        assert first.warm(["apple"]) == 1
+        assert second.warm(["banana"]) == 1
+
+        reloaded = CachedEmbeddings(KeywordEmbeddings(), cache_dir=str(tmp_path))
+        assert reloaded.warm(["apple", "banana"]) == 0
+
+    def test_variants_share_cache(self, tmp_path):
+        inner = KeywordEmbeddings()
+        cached = CachedEmbeddings(inner, cache_dir=str(tmp_path / "cache"))
+        docs = {"doc_0": "apple apple.\n\nbanana banana."}
+
+        NumpyRetriever(str(tmp_path / "a"), embeddings=cached, chunk_size=20, chunk_overlap=0).build(docs)
+        NumpyRetriever(str(tmp_path / "b"), embeddings=cached, chunk_size=20, chunk_overlap=5).build(docs)
+
+        assert len(inner.embedded_texts) == len(set(inner.embedded_texts))
+
+
+class TestBM25Retriever:
+
+    def test_build_and_search_without_embeddings(self, tmp_path):
+        retriever = create_retriever("bm25", persist_directory=str(tmp_path))
+        assert isinstance(retriever, BM25Retriever)
+        retriever.build({"doc_0": "הַבַּיִת הַגָּדוֹל בָּעִיר", "doc_1": "הכלב רץ בפארק"})
+
+        hits = retriever.retrieve(["איפה הבית?", "ובפארק"], k=1)
+
+        assert hits[0][0]["source"] == "doc_0"
+        assert hits[1][0]["source"] == "doc_1"
+
+    def test_index_is_reused_from_disk(self, tmp_path):
+        docs = {"doc_0": "apple banana", "doc_1": "cherry grape"}
+        create_retriever("bm25", persist_directory=str(tmp_path)).build(docs)
+
+        reloaded = create_retriever("bm25", persist_directory=str(tmp_path))
+        assert reloaded.build(docs) == {"added": 0, "deleted": 0, "total": 2}
+        assert reloaded.retrieve(["grape"], k=1)[0][0]["source"] == "doc_1"
@@ -0,0 +1,241 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+
+import metrics
+from scheduler import Scheduler, estimate_task_seconds, make_task
+from utils import OllamaClient, record_connection_failure
+
+
+def tasks_for(model, durations, exp_id=1):
+    return [make_task(model, exp_id, i, {"estimated_tokens": d}) for i, d in enumerate(durations)]
+
+
+class TestEstimates:
+
+    @patch("config.SCHEDULER_TASK_OVERHEAD_SECONDS", 1.0)
+    @patch("config.SCHEDULER_PREFILL_TOKENS_PER_SECOND", 100)
+    @patch("config.SCHEDULER_EXPERIMENT_SECONDS", {2: 50.0})
+    @patch("config.SCHEDULER_DEFAULT_TASK_SECONDS", 10.0)
+    def test_estimate_task_seconds(self):
+        assert estimate_task_seconds(1, {"estimated_tokens": 500}) == pytest.approx(6.0)
+        assert estimate_task_seconds(2, {}) == 50.0
+        assert estimate_task_seconds(7, {}) == 10.0
+
+    def test_make_task(self):
+        task = make_task("m:1b", 3, 2, {})
+        assert task["id"] == "m:1b/exp3/2"
+        assert task["model"] == "m:1b"
+        assert task["estimated_seconds"] > 0
+
+
+class TestScheduler:
+
+    def test_resident_model_runs_longest_first(self):
+        tasks = tasks_for("a", [100, 300, 200]) + tasks_for("b", [5000])
+        scheduler = Scheduler(tasks, run_task=lambda t: None, concurrency=2, max_resident_models=1)
+
+        # "b" has the most work left, so it is loaded first
+        first = scheduler.next_task()
+        assert first["model"] == "b"
+        # Its queue is empty and it is still running, so "a" must wait instead of being loaded beside it
+        assert scheduler.next_task() is None
+
+        scheduler.hosts[0]["running"]["b"] -= 1
+        order = [scheduler.next_task()["trial"]["estimated_tokens"] for _ in range(2)]
+        assert order == [300, 200]
+        # Both slots are busy
+        assert scheduler.next_task() is None
+        assert scheduler.model_loads == 2
+
+    def test_run_collects_results_and_errors(self):
+        def run_task(task):
+            if task["trial_index"] == 1:
+                raise RuntimeError("boom")
+            return task["id"]
+
+        scheduler = Scheduler(tasks_for("a", [1, 2, 3]), run_task=run_task, concurrency=2)
+        completed = scheduler.run()
+
+        by_index = {t["trial_index"]: t for t in completed}
+        assert by_index[0]["result"] == "a/exp1/0"
+        assert by_index[1]["error"] == "boom"
+        assert all("wall_time" in t for t in completed)
+
+    def test_run_respects_concurrency_and_residency(self):
+        lock = threading.Lock()
+        in_flight = {"a": 0, "b": 0}
+        peaks = {"tasks": 0, "models": 0}
+
+        def run_task(task):
+            with lock:
+                in_flight[task["model"]] += 1
+                peaks["tasks"] = max(peaks["tasks"], sum(in_flight.values()))
+                peaks["models"] = max(peaks["models"], sum(1 for n in in_flight.values() if n))
+            time.sleep(0.01)
+            with lock:
+                in_flight[task["model"]] -= 1
+
+        tasks = tasks_for("a", [1] * 6) + tasks_for("b", [1] * 6)
+        scheduler = Scheduler(tasks, run_task=run_task, concurrency=3, max_resident_models=1)
+        completed = scheduler.run()
+
+        assert len(completed) == 12
+        assert peaks["tasks"] == 3
+        assert peaks["models"] == 1
+        # Each model is loaded once instead of alternating
+        assert scheduler.model_loads == 2
+
+
+class FakeOllama:
+    """Local stand-in for one Ollama server: /api/generate answers with the server's own URL."""
+
+    def __init__(self):
+        self.models = []
+        self.payloads = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                fake.models.append(payload["model"])
+                fake.payloads.append(payload)
+                body = json.dumps({"response": fake.url, "prompt_eval_count": 1}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_hosts(tmp_path):
+    hosts = [FakeOllama(), FakeOllama()]
+    with patch("config.CACHE_DIR", str(tmp_path)):
+        yield hosts
+    for host in hosts:
+        if host.server.socket.fileno() != -1:
+            host.stop()
+
+
+def generate(task):
+    # Host-less client: the request goes to whichever host the scheduler assigned
+    return OllamaClient(task["model"]).generate_with_stats(prompt=task["id"]).get("response")
+
+
+class TestHostPool:
+
+    def test_routes_models_to_hosts_that_hold_them(self, fake_hosts):
+        a, b = fake_hosts
+        hosts = [{"url": a.url, "capacity": 2, "models": ["m1"]}, {"url": b.url, "capacity": 2, "models": ["m2"]}]
+        tasks = tasks_for("m1", [1, 1, 1]) + tasks_for("m2", [1, 1]) + tasks_for("m3", [1])
+
+        completed = Scheduler(tasks, run_task=generate, hosts=hosts).run()
+
+        results = {t["id"]: t.get("result") for t in completed}
+        assert [results[f"m1/exp1/{i}"] for i in range(3)] == [a.url] * 3
+        assert [results[f"m2/exp1/{i}"] for i in range(2)] == [b.url] * 2
+        assert set(a.models) == {"m1"} and set(b.models) == {"m2"}
+        assert next(t for t in completed if t["model"] == "m3")["error"] == "No host serves model m3"
+
+    def test_spreads_load_across_hosts(self, fake_hosts):
+        a, b = fake_hosts
+        hosts = [{"url": a.url, "capacity": 1, "models": None}, {"url": b.url, "capacity": 1, "models": None}]
+
+        completed = Scheduler(tasks_for("m1", [1] * 2), run_task=generate, hosts=hosts).run()
+
+        assert sorted(t["host"] for t in completed) == sorted([a.url, b.url])
+
+    @patch("config.SCHEDULER_MAX_ATTEMPTS", 3)
+    def test_fails_over_when_a_host_goes_down(self, fake_hosts):
+        a, b = fake_hosts
+        b.stop()
+        hosts = [{"url": a.url, "capacity": 2, "models": None}, {"url": b.url, "capacity": 2, "models": None}]
+        scheduler = Scheduler(tasks_for("m1", [1] * 6), run_task=generate, hosts=hosts)
+        metrics.REGISTRY.reset()
+
+        completed = scheduler.run()
+
+        assert len(completed) == 6
+        assert all(t["result"] == a.url and t["host"] == a.url for t in completed)
+        assert any(t["attempts"] > 1 for t in completed)
+        assert scheduler.hosts[1]["down_until"] > time.time()
+        assert metrics.RETRIES.value(host=b.url) >= 1
+        assert metrics.ERRORS.value(model="m1", error="ConnectionError") >= 1
+        assert metrics.QUEUE_DEPTH.value() == 0
+
+    def test_evicted_models_are_unloaded(self, fake_hosts):
+        a, _ = fake_hosts
+        hosts = [{"url": a.url, "capacity": 1, "models": None}]
+        tasks = tasks_for("m1", [2, 2]) + tasks_for("m2", [1])
+
+        completed = Scheduler(tasks, run_task=generate, hosts=hosts, max_resident_models=1).run()
+
+        assert all(t["result"] == a.url for t in completed)
+        # m1 goes first and is unloaded when m2 takes its place; m2 stays resident
+        assert [p for p in a.payloads if "prompt" not in p] == [{"model": "m1", "keep_alive": 0}]
+
+    @patch("config.SCHEDULER_KEEP_ALIVE", "10m")
+    def test_tasks_keep_their_model_loaded(self):
+        client = OllamaClient("m1")
+        completed = Scheduler(
+            tasks_for("m1", [1]), run_task=lambda t: client.generate_payload("p")["keep_alive"], concurrency=1
+        ).run()
+
+        assert completed[0]["result"] == "10m"
+        assert client.generate_payload("p")["keep_alive"] == 0
+
+    @patch("config.SCHEDULER_HOST_RETRY_SECONDS", 0.01)
+    def test_connection_failures_count_per_task(self):
+        url = "http://gpu1:11434"
+        started = threading.Barrier(2)
+
+        def run_task(task):
+            if task["attempts"] == 1:
+                # Both tasks are in flight on the host together
+                started.wait(timeout=5)
+            if task["trial_index"] == 0 and task["attempts"] == 1:
+                # The client swallows the error and returns an empty answer
+                record_connection_failure(url)
+                return ""
+            time.sleep(0.05)
+            return task["id"]
+
+        accepted = []
+        hosts = [{"url": url, "capacity": 2, "models": None}]
+        scheduler = Scheduler(
+            tasks_for("m1", [2, 1]), run_task, hosts=hosts, on_result=lambda task, result: accepted.append(result)
+        )
+        completed = {t["id"]: t for t in scheduler.run()}
+
+        # Only the task that saw the failure is retried, and its empty answer is never reported
+        assert completed["m1/exp1/0"]["attempts"] == 2
+        assert completed["m1/exp1/1"]["attempts"] == 1
+        assert sorted(accepted) == ["m1/exp1/0", "m1/exp1/1"]
+
+    @patch("config.SCHEDULER_MAX_ATTEMPTS", 2)
+    @patch("config.SCHEDULER_HOST_RETRY_SECONDS", 0.01)
+    def test_gives_up_when_every_host_is_down(self, fake_hosts):
+        a, _ = fake_hosts
+        a.stop()
+        hosts = [{"url": a.url, "capacity": 1, "models": None}]
+
+        completed = Scheduler(tasks_for("m1", [1]), run_task=generate, hosts=hosts).run()
+
+        assert completed[0]["attempts"] == 2
+        assert "unreachable" in completed[0]["error"]
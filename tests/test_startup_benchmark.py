@@ -0,0 +1,61 @@
+import json
+import subprocess
+import sys
+
+from startup_benchmark import check_budgets, measure, parse_importtime, update_baselines
+
+PROFILE = """import time: self [us] | cumulative | imported package
+import time:       100 |        100 |     numpy.core
+import time:       400 |        500 |   numpy
+import time:      2000 |       2000 |   langchain_core.documents
+import time:        50 |       2550 | exp3_rag
+"""
+
+
+class TestStartupBenchmark:
+
+    def test_parse_importtime_groups_by_package(self):
+        heaviest = parse_importtime(PROFILE, top=2)
+
+        assert [h["package"] for h in heaviest] == ["langchain_core", "numpy"]
+        assert heaviest[1]["seconds"] == 0.0005
+
+    def test_measure_imports_in_a_fresh_interpreter(self):
+        measured = measure("action_history", repeats=1)
+
+        assert measured["seconds"] > 0
+        assert measured["peak_rss_mb"] > 0
+        assert measured["heaviest"]
+
+        assert "No module named" in measure("no_such_module", repeats=1)["error"]
+
+    def test_budgets_and_baselines(self, tmp_path):
+        measurements = {
+            "main": {"seconds": 0.5, "peak_rss_mb": 40.0},
+            "exp1_needle": {"seconds": 0.1, "peak_rss_mb": 90.0},
+            "dashboard": {"error": "No module named 'streamlit'"},
+        }
+        baselines = {
+            "main": {"seconds": 0.3, "peak_rss_mb": 50.0},
+            "exp1_needle": {"seconds": 0.2, "peak_rss_mb": 60.0},
+        }
+
+        regressions = check_budgets(measurements, baselines)
+        assert len(regressions) == 2
+        assert regressions[0].startswith("main: seconds 0.50s over budget 0.30s")
+        assert regressions[1].startswith("exp1_needle: peak_rss_mb")
+
+        path = tmp_path / "baselines.json"
+        updated = update_baselines(measurements, {"old": {"seconds": 1.0}}, path=str(path))
+        assert set(json.loads(path.read_text())) == {"old", "main", "exp1_needle"}
+        assert check_budgets(measurements, updated) == []
+
+    def test_entry_points_skip_unused_heavy_dependencies(self):
+        script = (
+            "import sys\n"
+            "import main, exp3_rag, exp4_strategies\n"
+            "print([m for m in ('aiohttp', 'chromadb', 'langchain_core', 'langchain_chroma') if m in sys.modules])\n"
+        )
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+
+        assert output.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,111 @@
+import asyncio
+import os
+import subprocess
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import tracing
+from utils import OllamaClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    path = str(tmp_path / "trace.json")
+    tracing.enable(path)
+    yield path
+    tracing.disable()
+
+
+def spans(path):
+    return [e for e in tracing.load_trace(path) if e["ph"] == "X"]
+
+
+class TestTracing:
+
+    def test_disabled_by_default_and_free(self, tmp_path):
+        assert not tracing.enabled()
+        # Every disabled span is the same no-op object
+        assert tracing.span("a") is tracing.span("b", x=1)
+        with tracing.span("a"):
+            tracing.set_attributes(x=1)
+            tracing.add_span("server.decode", 0.0, 1.0)
+        assert os.listdir(str(tmp_path)) == []
+
+    def test_nested_spans_are_written_when_the_outermost_closes(self, trace_file):
+        with tracing.span("trial", model="m"):
+            with tracing.span("prompt.build"):
+                pass
+            with pytest.raises(ValueError):
+                with tracing.span("score"):
+                    raise ValueError("bad answer")
+            assert not os.path.exists(trace_file)
+            tracing.set_attributes(found=True)
+
+        events = {e["name"]: e for e in spans(trace_file)}
+        trial, build = events["trial"], events["prompt.build"]
+        assert trial["args"] == {"model": "m", "found": True}
+        assert trial["ts"] <= build["ts"] and build["ts"] + build["dur"] <= trial["ts"] + trial["dur"]
+        assert build["tid"] == trial["tid"]
+        assert "bad answer" in events["score"]["args"]["error"]
+
+    def test_async_tasks_get_their_own_tracks(self, trace_file):
+        async def request(i):
+            with tracing.span("http.generate", i=i):
+                await asyncio.sleep(0.01)
+
+        async def trial():
+            with tracing.span("trial"):
+                await asyncio.gather(request(0), request(1))
+
+        asyncio.run(trial())
+
+        events = spans(trace_file)
+        tracks = {e["tid"] for e in events if e["name"] == "http.generate"}
+        assert len(tracks) == 2
+        names = [e for e in tracing.load_trace(trace_file) if e["ph"] == "M"]
+        assert {e["tid"] for e in names} >= tracks
+
+    def test_client_spans_cache_http_and_server_phases(self, trace_file, tmp_path):
+        response = MagicMock()
+        response.json.return_value = {
+            "response": "hi",
+            "prompt_eval_count": 10,
+            "eval_count": 2,
+            "load_duration": 1_000_000,
+            "prompt_eval_duration": 2_000_000,
+            "eval_duration": 3_000_000,
+            "total_duration": 7_000_000,
+        }
+        with patch("config.CACHE_DIR", str(tmp_path / "cache")), patch("utils.requests.post", return_value=response):
+            os.makedirs(str(tmp_path / "cache"))
+            client = OllamaClient("m")
+            with tracing.span("trial"):
+                client.generate_with_stats("prompt")
+                client.generate_with_stats("prompt")
+
+        events = spans(trace_file)
+        lookups = [e["args"]["hit"] for e in events if e["name"] == "cache.lookup"]
+        assert lookups == [False, True]
+        assert [e["name"] for e in events].count("cache.write") == 1
+        [http] = [e for e in events if e["name"] == "http.generate"]
+        assert http["args"]["model"] == "m"
+        assert http["args"]["prompt_tokens"] == 10
+        assert http["args"]["server_prefill_seconds"] == pytest.approx(0.002)
+        phases = {e["name"]: e for e in events if e["cat"] == "server"}
+        assert list(phases) == ["server.load", "server.prefill", "server.decode"]
+        assert phases["server.decode"]["dur"] == 3000
+        assert phases["server.load"]["ts"] + 1000 == phases["server.prefill"]["ts"]
+
+    def test_processes_append_to_one_file(self, trace_file):
+        with tracing.span("parent"):
+            pass
+        script = "import tracing\nwith tracing.span('child'):\n    pass\n"
+        subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True, env=dict(os.environ))
+
+        events = spans(trace_file)
+        assert [e["name"] for e in events] == ["parent", "child"]
+        assert events[0]["pid"] != events[1]["pid"]
@@ -3,15 +3,22 @@ from unittest.mock import MagicMock, mock_open, patch
 import pytest
 import requests
 
+import config
 from utils import (
     OllamaClient,
+    add_server_stats,
+    average_server_metrics,
+    connection_failures,
     count_tokens,
     embed_fact,
     generate_filler_text,
+    host_context,
     insert_secret_message,
+    keep_alive_context,
     load_english_articles,
     load_hebrew_articles,
     load_text_from_file,
+    server_metrics,
 )
 
 
@@ -145,9 +152,71 @@ class TestUtils:
         content = load_text_from_file("file.txt", 100)
         assert content == ""
 
+    def test_server_metrics_over_summed_responses(self):
+        totals = {}
+        for _ in range(2):
+            add_server_stats(
+                totals,
+                {
+                    "prompt_eval_count": 300,
+                    "eval_count": 20,
+                    "load_duration": 1_000_000_000,
+                    "prompt_eval_duration": 500_000_000,
+                    "eval_duration": 1_000_000_000,
+                    "total_duration": 2_500_000_000,
+                },
+            )
+
+        metrics = server_metrics(totals, client_seconds=5.5)
+
+        assert metrics["prompt_tokens"] == 600
+        assert metrics["prefill_tokens_per_second"] == pytest.approx(600)
+        assert metrics["decode_tokens_per_second"] == pytest.approx(20)
+        assert metrics["load_seconds"] == pytest.approx(2.0)
+        assert metrics["server_seconds"] == pytest.approx(5.0)
+        assert metrics["client_overhead_seconds"] == pytest.approx(0.5)
+
+        empty = server_metrics({}, client_seconds=0.1)
+        assert empty["prefill_tokens_per_second"] is None
+        assert average_server_metrics([metrics, empty])["prefill_tokens_per_second"] == pytest.approx(600)
+        assert average_server_metrics([metrics, empty])["client_seconds"] == pytest.approx(2.8)
+
 
 class TestOllamaClient:
 
+    def test_host_follows_context(self):
+        client = OllamaClient("test-model")
+        pinned = OllamaClient("test-model", host="http://pinned:11434")
+
+        assert client.host == config.OLLAMA_HOST
+        with host_context("http://gpu2:11434"):
+            assert client.api_generate == "http://gpu2:11434/api/generate"
+            assert pinned.host == "http://pinned:11434"
+        assert client.host == config.OLLAMA_HOST
+
+    def test_keep_alive_is_not_part_of_the_cache_key(self):
+        client = OllamaClient("test-model")
+        payload = client.generate_payload("prompt")
+        with keep_alive_context("5m"):
+            kept = client.generate_payload("prompt")
+
+        assert (payload["keep_alive"], kept["keep_alive"]) == (0, "5m")
+        assert client._get_cache_path(kept) == client._get_cache_path(payload)
+
+    @patch("requests.post")
+    @patch("utils.OllamaClient._get_from_cache", return_value=None)
+    def test_connection_errors_are_counted_per_host(self, mock_get_cache, mock_post):
+        client = OllamaClient("test-model", host="http://down:11434")
+        before = connection_failures("http://down:11434")
+
+        mock_post.side_effect = requests.exceptions.ReadTimeout("slow")
+        assert client.generate("prompt") == ""
+        assert connection_failures("http://down:11434") == before
+
+        mock_post.side_effect = requests.exceptions.ConnectionError("refused")
+        assert client.generate("prompt") == ""
+        assert connection_failures("http://down:11434") == before + 1
+
     @patch("requests.post")
     @patch("utils.OllamaClient._get_from_cache")
     def test_generate_cache_hit(self, mock_get_cache, mock_post):
@@ -235,3 +304,20 @@ class TestOllamaClient:
         client = OllamaClient("test-model")
         emb = client.embed("text")
         assert emb == []
+
+    @patch("requests.post")
+    def test_embed_batch_success(self, mock_post):
+        mock_resp = MagicMock()
+        mock_resp.json.return_value = {"embeddings": [[0.1, 0.2], [0.3, 0.4]]}
+        mock_post.return_value = mock_resp
+
+        client = OllamaClient("test-model")
+        embs = client.embed_batch(["a", "b"])
+
+        assert embs == [[0.1, 0.2], [0.3, 0.4]]
+        assert mock_post.call_args.kwargs["json"]["input"] == ["a", "b"]
+
+    @patch("requests.post", side_effect=requests.exceptions.RequestException)
+    def test_embed_batch_failure(self, mock_post):
+        client = OllamaClient("test-model")
+        assert client.embed_batch(["a"]) == []
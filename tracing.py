@@ -0,0 +1,204 @@
+"""Opt-in tracing of benchmark work as nested spans.
+
+Spans are written in the Chrome trace event format (a JSON array of complete
+"X" events), which chrome://tracing, Perfetto (ui.perfetto.dev) and
+speedscope open directly. Tracing is off unless config.TRACE_FILE is set (the
+BENCHMARK_TRACE_FILE environment variable or main.py --trace); while it is
+off, span() hands back one shared no-op context manager, so instrumented code
+pays a function call and a flag check.
+
+Each process buffers its events and appends them to the trace file under an
+exclusive lock whenever its outermost span closes, so pool and spawned
+workers share one file and a crash loses at most the span in progress. Spans
+opened in different asyncio tasks go on different tracks, so concurrent
+requests do not look nested in each other.
+"""
+
+import asyncio
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+import config
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent appends are not serialized
+    fcntl = None  # type: ignore[assignment]
+
+_enabled = False
+_path: Optional[str] = None
+_buffer: List[Dict[str, Any]] = []
+_named_tracks: set = set()
+_lock = threading.Lock()
+_exit_hook_registered = False
+_NOOP = nullcontext()
+
+
+class Span:
+    """One timed operation; use through span()."""
+
+    __slots__ = ("name", "cat", "args", "track", "parent", "_start_ns", "_start_us", "_token")
+
+    def __init__(self, name: str, cat: str, args: Dict[str, Any]):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self) -> "Span":
+        self.parent = _current_span.get()
+        self.track = _track()
+        self._token = _current_span.set(self)
+        self._start_us = time.time_ns() // 1000
+        self._start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_us = (time.perf_counter_ns() - self._start_ns) // 1000
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.args["error"] = repr(exc)
+        _record(self.name, self.cat, self._start_us, duration_us, self.track, self.args)
+        if self.parent is None:
+            flush()
+        return False
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+def _track() -> int:
+    """Track (trace "tid") of the caller: its asyncio task if it runs in one, else its thread."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is None:
+        track, name = threading.get_ident(), threading.current_thread().name
+    else:
+        track, name = id(task), task.get_name()
+    # Keyed by process too: a forked worker inherits the set but writes under its own pid
+    if (os.getpid(), track) not in _named_tracks:
+        _named_tracks.add((os.getpid(), track))
+        with _lock:
+            _buffer.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": track, "args": {"name": name}})
+    return track
+
+
+def _record(name: str, cat: str, start_us: int, duration_us: int, track: int, args: Dict[str, Any]):
+    event = {
+        "name": name,
+        "cat": cat,
+        "ph": "X",
+        "ts": start_us,
+        "dur": duration_us,
+        "pid": os.getpid(),
+        "tid": track,
+        "args": args,
+    }
+    with _lock:
+        _buffer.append(event)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def span(name: str, cat: str = "benchmark", **attributes: Any) -> Any:
+    """Context manager timing a block as a span, nested under the span open around it.
+
+    Args:
+        name: Span name, e.g. "http.generate".
+        cat: Category, used by viewers to filter and color spans.
+        attributes: Recorded as the span's args.
+    """
+    if not _enabled:
+        return _NOOP
+    return Span(name, cat, attributes)
+
+
+def set_attributes(**attributes: Any):
+    """Add attributes to the innermost open span."""
+    if not _enabled:
+        return
+    current = _current_span.get()
+    if current is not None:
+        current.args.update(attributes)
+
+
+def add_span(name: str, start: float, seconds: float, cat: str = "benchmark", **attributes: Any):
+    """Record a span that was timed elsewhere (e.g. by the server), on the caller's track.
+
+    Args:
+        start: Start time as a Unix timestamp in seconds.
+        seconds: Duration in seconds.
+    """
+    if not _enabled:
+        return
+    current = _current_span.get()
+    track = current.track if current is not None else _track()
+    _record(name, cat, int(start * 1e6), int(seconds * 1e6), track, attributes)
+
+
+def flush():
+    """Append buffered events to the trace file."""
+    with _lock:
+        if not _buffer or _path is None:
+            return
+        events = list(_buffer)
+        _buffer.clear()
+        lines = "".join(json.dumps(event, ensure_ascii=False, default=str) + ",\n" for event in events)
+        with open(_path, "a", encoding="utf-8") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                # The array is left open: trace viewers accept a missing "]", and other processes keep appending
+                if f.tell() == 0:
+                    f.write("[\n")
+                f.write(lines)
+                f.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def enable(path: str):
+    """Start tracing to a file; processes spawned afterwards trace to it too."""
+    global _enabled, _path, _exit_hook_registered
+    _path = os.path.abspath(path)
+    os.makedirs(os.path.dirname(_path), exist_ok=True)
+    os.environ["BENCHMARK_TRACE_FILE"] = _path
+    _enabled = True
+    if not _exit_hook_registered:
+        atexit.register(flush)
+        _exit_hook_registered = True
+
+
+def disable():
+    """Flush and stop tracing."""
+    global _enabled, _path
+    flush()
+    _enabled = False
+    _path = None
+    os.environ.pop("BENCHMARK_TRACE_FILE", None)
+
+
+def load_trace(path: str) -> List[Dict[str, Any]]:
+    """Read the events of a trace file written by this module."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    if not text:
+        return []
+    if not text.endswith("]"):
+        text = text.rstrip(",") + "]"
+    events: List[Dict[str, Any]] = json.loads(text)
+    return events
+
+
+if config.TRACE_FILE:
+    enable(config.TRACE_FILE)
@@ -4,33 +4,124 @@ import json
 import logging
 import os
 import random
+import sys
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Protocol
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Protocol, Union
 
-import aiohttp
 import requests
 
 import config
+import metrics
+import tracing
 
 logger = logging.getLogger(__name__)
 
+# Server that clients created without an explicit host talk to; set per task by the dispatcher
+_current_host: ContextVar[Optional[str]] = ContextVar("ollama_host", default=None)
+
+# Connection failures seen per host, so a dispatcher can tell a dead host from a bad answer
+_connection_failures: Dict[str, int] = {}
+_connection_failures_lock = threading.Lock()
+
+
+class FailureCounter:
+    """Connection failures of the requests made in one host_context, including tasks started from it."""
+
+    def __init__(self):
+        self.count = 0
+
+
+_context_failures: ContextVar[Optional[FailureCounter]] = ContextVar("connection_failures", default=None)
+
+# keep_alive sent with generate requests; set per task by the dispatcher
+_keep_alive: ContextVar[Union[int, str]] = ContextVar("ollama_keep_alive", default=0)
+
+
+def current_host() -> str:
+    return _current_host.get() or config.OLLAMA_HOST
+
+
+@contextmanager
+def host_context(host: str) -> Iterator[FailureCounter]:
+    """Route requests of host-less clients in this context (and tasks started from it) to a host.
+
+    Yields:
+        Counter of the connection failures seen in this context only, so one
+        task's dropped connection does not count against others on the host.
+    """
+    failures = FailureCounter()
+    token = _current_host.set(host)
+    failures_token = _context_failures.set(failures)
+    try:
+        yield failures
+    finally:
+        _context_failures.reset(failures_token)
+        _current_host.reset(token)
+
+
+@contextmanager
+def keep_alive_context(keep_alive: Union[int, str]) -> Iterator[None]:
+    """Ask the server to keep models loaded this long after each generate request made in this context."""
+    token = _keep_alive.set(keep_alive)
+    try:
+        yield
+    finally:
+        _keep_alive.reset(token)
+
+
+def record_connection_failure(host: str):
+    with _connection_failures_lock:
+        _connection_failures[host] = _connection_failures.get(host, 0) + 1
+        failures = _context_failures.get()
+        if failures is not None:
+            failures.count += 1
+
+
+def connection_failures(host: str) -> int:
+    with _connection_failures_lock:
+        return _connection_failures.get(host, 0)
+
 
 class LLMClient(ABC):
     """Abstract base class for LLM clients."""
 
     @abstractmethod
-    def generate(self, prompt: str, system: str = "", temperature: float = 0.7, max_tokens: int = 2048) -> str:
+    def generate(
+        self,
+        prompt: str,
+        system: str = "",
+        temperature: float = 0.7,
+        max_tokens: int = 2048,
+        num_ctx: Optional[int] = None,
+        timeout: float = 30,
+    ) -> str:
         pass
 
     @abstractmethod
     def generate_with_stats(
-        self, prompt: str, system: str = "", temperature: float = 0.7, max_tokens: int = 2048
+        self,
+        prompt: str,
+        system: str = "",
+        temperature: float = 0.7,
+        max_tokens: int = 2048,
+        num_ctx: Optional[int] = None,
+        timeout: float = 30,
     ) -> Dict[str, Any]:
         pass
 
     @abstractmethod
     async def generate_with_stats_async(
-        self, prompt: str, system: str = "", temperature: float = 0.7, max_tokens: int = 2048
+        self,
+        prompt: str,
+        system: str = "",
+        temperature: float = 0.7,
+        max_tokens: int = 2048,
+        num_ctx: Optional[int] = None,
+        timeout: float = 30,
     ) -> Dict[str, Any]:
         pass
 
@@ -42,36 +133,108 @@ class LLMClient(ABC):
 class OllamaClient(LLMClient):
     """Client for interacting with Ollama API."""
 
-    def __init__(self, model: str, host: str = config.OLLAMA_HOST):
+    def __init__(self, model: str, host: Optional[str] = None):
+        """Create a client.
+
+        Args:
+            model: Model identifier.
+            host: Server URL. None follows the host of the current context
+                (see host_context), falling back to config.OLLAMA_HOST.
+        """
         self.model = model
-        self.host = host
-        self.api_generate = f"{host}/api/generate"
-        self.api_embeddings = f"{host}/api/embeddings"
+        self._host = host
         self.cache_dir = config.CACHE_DIR
 
+    @property
+    def host(self) -> str:
+        return self._host or current_host()
+
+    @property
+    def api_generate(self) -> str:
+        return f"{self.host}/api/generate"
+
+    @property
+    def api_embeddings(self) -> str:
+        return f"{self.host}/api/embeddings"
+
+    @property
+    def api_embed(self) -> str:
+        return f"{self.host}/api/embed"
+
+    def _check_connection_error(self, error: Exception):
+        # aiohttp is imported by the async path only; if it was never imported, the error is not its own
+        aiohttp = sys.modules.get("aiohttp")
+        connection_errors: tuple = (requests.exceptions.ConnectionError,)
+        if aiohttp is not None:
+            connection_errors += (aiohttp.ClientConnectionError,)
+        if isinstance(error, connection_errors):
+            record_connection_failure(self.host)
+
     def _get_cache_path(self, payload: Dict[str, Any]) -> str:
-        """Generate cache file path based on payload hash."""
+        """Generate cache file path based on payload hash.
+
+        keep_alive does not change the response, so every value hashes like 0
+        (the value cached responses were first stored with).
+        """
+        if payload.get("keep_alive", 0) != 0:
+            payload = dict(payload, keep_alive=0)
         payload_str = json.dumps(payload, sort_keys=True)
         payload_hash = hashlib.md5(payload_str.encode("utf-8")).hexdigest()
         return os.path.join(self.cache_dir, f"{payload_hash}.json")
 
+    def generate_payload(
+        self,
+        prompt: str,
+        system: str = "",
+        temperature: float = 0.7,
+        max_tokens: int = 2048,
+        num_ctx: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Build the /api/generate payload; its hash is the response cache key.
+
+        num_ctx is only sent when given, so requests on the server's default
+        context window keep their existing cache keys.
+        """
+        options: Dict[str, Any] = {"temperature": temperature, "num_predict": max_tokens}
+        if num_ctx is not None:
+            options["num_ctx"] = num_ctx
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "system": system,
+            "stream": False,
+            "keep_alive": _keep_alive.get(),
+            "options": options,
+        }
+
+    def is_cached(self, payload: Dict[str, Any]) -> bool:
+        """Whether a response for this payload is already in the cache."""
+        return os.path.exists(self._get_cache_path(payload))
+
     def _get_from_cache(self, cache_path: str) -> Any:
         """Retrieve data from cache if it exists."""
-        if os.path.exists(cache_path):
-            try:
-                with open(cache_path, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except Exception as e:
-                logger.warning(f"Failed to read cache {cache_path}: {e}")
-        return None
+        with tracing.span("cache.lookup", "cache"):
+            if os.path.exists(cache_path):
+                try:
+                    with open(cache_path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                    tracing.set_attributes(hit=bool(data))
+                    metrics.record_cache_lookup(bool(data))
+                    return data
+                except Exception as e:
+                    logger.warning(f"Failed to read cache {cache_path}: {e}")
+            tracing.set_attributes(hit=False)
+            metrics.record_cache_lookup(False)
+            return None
 
     def _save_to_cache(self, cache_path: str, data: Any):
         """Save data to cache."""
-        try:
-            with open(cache_path, "w", encoding="utf-8") as f:
-                json.dump(data, f)
-        except Exception as e:
-            logger.warning(f"Failed to write cache {cache_path}: {e}")
+        with tracing.span("cache.write", "cache"):
+            try:
+                with open(cache_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+            except Exception as e:
+                logger.warning(f"Failed to write cache {cache_path}: {e}")
 
     def generate(
         self,
@@ -79,16 +242,11 @@ class OllamaClient(LLMClient):
         system: str = "",
         temperature: float = 0.7,
         max_tokens: int = 2048,
+        num_ctx: Optional[int] = None,
+        timeout: float = 30,
     ) -> str:
         """Generate text response from model."""
-        payload = {
-            "model": self.model,
-            "prompt": prompt,
-            "system": system,
-            "stream": False,
-            "keep_alive": 0,
-            "options": {"temperature": temperature, "num_predict": max_tokens},
-        }
+        payload = self.generate_payload(prompt, system, temperature, max_tokens, num_ctx)
 
         # Check cache
         cache_path = self._get_cache_path(payload)
@@ -99,15 +257,22 @@ class OllamaClient(LLMClient):
             return response_str
 
         try:
-            response = requests.post(self.api_generate, json=payload, timeout=30)
-            response.raise_for_status()
-            result = response.json()
+            with (
+                tracing.span("http.generate", "http", host=self.host, model=self.model),
+                metrics.track_request(self.model, "generate"),
+            ):
+                response = requests.post(self.api_generate, json=payload, timeout=timeout)
+                response.raise_for_status()
+                result = response.json()
+                trace_server_timings(result)
+                metrics.record_response(self.model, result)
 
             # Save to cache
             self._save_to_cache(cache_path, result)
             response_text: str = result.get("response", "")
             return response_text
         except requests.exceptions.RequestException as e:
+            self._check_connection_error(e)
             logger.error(f"Ollama generation failed: {e}")
             return ""
 
@@ -117,16 +282,16 @@ class OllamaClient(LLMClient):
         system: str = "",
         temperature: float = 0.7,
         max_tokens: int = 2048,
+        num_ctx: Optional[int] = None,
+        timeout: float = 30,
     ) -> Dict[str, Any]:
-        """Generate text response with full statistics."""
-        payload = {
-            "model": self.model,
-            "prompt": prompt,
-            "system": system,
-            "stream": False,
-            "keep_alive": 0,
-            "options": {"temperature": temperature, "num_predict": max_tokens},
-        }
+        """Generate text response with full statistics.
+
+        Args:
+            num_ctx: Context window to load the model with; None keeps the server default.
+            timeout: Request timeout in seconds. A timed-out request returns {}.
+        """
+        payload = self.generate_payload(prompt, system, temperature, max_tokens, num_ctx)
 
         # Check cache
         cache_path = self._get_cache_path(payload)
@@ -137,15 +302,22 @@ class OllamaClient(LLMClient):
             return cached_dict
 
         try:
-            response = requests.post(self.api_generate, json=payload, timeout=30)
-            response.raise_for_status()
-            result = response.json()
+            with (
+                tracing.span("http.generate", "http", host=self.host, model=self.model),
+                metrics.track_request(self.model, "generate"),
+            ):
+                response = requests.post(self.api_generate, json=payload, timeout=timeout)
+                response.raise_for_status()
+                result = response.json()
+                trace_server_timings(result)
+                metrics.record_response(self.model, result)
 
             # Save to cache
             self._save_to_cache(cache_path, result)
             result_dict: Dict[str, Any] = result if isinstance(result, dict) else {}
             return result_dict
         except requests.exceptions.RequestException as e:
+            self._check_connection_error(e)
             logger.error(f"Ollama generation failed: {e}")
             return {}
 
@@ -155,16 +327,11 @@ class OllamaClient(LLMClient):
         system: str = "",
         temperature: float = 0.7,
         max_tokens: int = 2048,
+        num_ctx: Optional[int] = None,
+        timeout: float = 30,
     ) -> Dict[str, Any]:
-        """Generate text response with full statistics asynchronously."""
-        payload = {
-            "model": self.model,
-            "prompt": prompt,
-            "system": system,
-            "stream": False,
-            "keep_alive": 0,
-            "options": {"temperature": temperature, "num_predict": max_tokens},
-        }
+        """Generate text response with full statistics asynchronously (see generate_with_stats)."""
+        payload = self.generate_payload(prompt, system, temperature, max_tokens, num_ctx)
 
         # Check cache (synchronous check is fine for local FS usually, or could make async)
         cache_path = self._get_cache_path(payload)
@@ -174,21 +341,48 @@ class OllamaClient(LLMClient):
             cached_dict: Dict[str, Any] = cached_response if isinstance(cached_response, dict) else {}
             return cached_dict
 
+        # Imported here: aiohttp takes longer to import than the rest of the client, and sync runs never use it
+        import aiohttp
+
         try:
-            async with aiohttp.ClientSession() as session:
-                timeout = aiohttp.ClientTimeout(total=30)
-                async with session.post(self.api_generate, json=payload, timeout=timeout) as response:
-                    response.raise_for_status()
-                    result = await response.json()
-
-                    # Save to cache
-                    self._save_to_cache(cache_path, result)
-                    result_dict: Dict[str, Any] = result if isinstance(result, dict) else {}
-                    return result_dict
+            with (
+                tracing.span("http.generate", "http", host=self.host, model=self.model),
+                metrics.track_request(self.model, "generate"),
+            ):
+                async with aiohttp.ClientSession() as session:
+                    client_timeout = aiohttp.ClientTimeout(total=timeout)
+                    async with session.post(self.api_generate, json=payload, timeout=client_timeout) as response:
+                        response.raise_for_status()
+                        result = await response.json()
+                trace_server_timings(result)
+                metrics.record_response(self.model, result)
+
+            # Save to cache
+            self._save_to_cache(cache_path, result)
+            result_dict: Dict[str, Any] = result if isinstance(result, dict) else {}
+            return result_dict
         except Exception as e:
+            self._check_connection_error(e)
             logger.error(f"Ollama async generation failed: {e}")
             return {}
 
+    def unload(self) -> bool:
+        """Ask the server to unload the model now (a generate request without a prompt and keep_alive 0).
+
+        Returns:
+            Whether the server accepted the request.
+        """
+        payload: Dict[str, Any] = {"model": self.model, "keep_alive": 0}
+        try:
+            with tracing.span("http.unload", "http", host=self.host):
+                response = requests.post(self.api_generate, json=payload, timeout=30)
+                response.raise_for_status()
+            return True
+        except requests.exceptions.RequestException as e:
+            self._check_connection_error(e)
+            logger.error(f"Ollama unload of {self.model} failed: {e}")
+            return False
+
     def embed(self, text: str) -> List[float]:
         """Generate embeddings for text."""
         payload = {
@@ -197,15 +391,149 @@ class OllamaClient(LLMClient):
             "keep_alive": 0,
         }
         try:
-            response = requests.post(self.api_embeddings, json=payload, timeout=30)
-            response.raise_for_status()
-            result = response.json()
+            with (
+                tracing.span("http.embed", "http", host=self.host),
+                metrics.track_request(str(payload["model"]), "embed"),
+            ):
+                response = requests.post(self.api_embeddings, json=payload, timeout=30)
+                response.raise_for_status()
+                result = response.json()
             embedding: List[float] = result.get("embedding", [])
             return embedding if isinstance(embedding, list) else []
         except requests.exceptions.RequestException as e:
+            self._check_connection_error(e)
             logger.error(f"Ollama embedding failed: {e}")
             return []
 
+    def embed_batch(
+        self, texts: List[str], model: str = "nomic-embed-text", keep_alive: Union[int, str] = 0
+    ) -> List[List[float]]:
+        """Generate embeddings for many texts in a single request.
+
+        Uses Ollama's /api/embed endpoint, which accepts a list of inputs and
+        returns L2-normalized vectors in the same order.
+
+        Args:
+            texts: Texts to embed.
+            model: Embedding model name.
+            keep_alive: How long the server keeps the model loaded afterwards
+                (0 unloads it right away).
+
+        Returns:
+            One embedding per input text, or an empty list on failure.
+        """
+        if not texts:
+            return []
+        payload: Dict[str, Any] = {"model": model, "input": texts, "keep_alive": keep_alive}
+        try:
+            with (
+                tracing.span("http.embed_batch", "http", host=self.host, inputs=len(texts)),
+                metrics.track_request(model, "embed_batch"),
+            ):
+                response = requests.post(self.api_embed, json=payload, timeout=120)
+                response.raise_for_status()
+                embeddings: List[List[float]] = response.json().get("embeddings", [])
+            return embeddings if isinstance(embeddings, list) else []
+        except requests.exceptions.RequestException as e:
+            self._check_connection_error(e)
+            logger.error(f"Ollama batch embedding failed: {e}")
+            return []
+
+
+def server_durations(response_data: Dict[str, Any]) -> Dict[str, float]:
+    """Convert the durations Ollama reports (nanoseconds) to seconds.
+
+    Args:
+        response_data: Response dictionary from generate_with_stats.
+
+    Returns:
+        Model load, prefill (prompt eval), decode (eval) and total server time.
+    """
+    return {
+        "load": response_data.get("load_duration", 0) / 1e9,
+        "prefill": response_data.get("prompt_eval_duration", 0) / 1e9,
+        "decode": response_data.get("eval_duration", 0) / 1e9,
+        "server_total": response_data.get("total_duration", 0) / 1e9,
+    }
+
+
+SERVER_STAT_KEYS = [
+    "prompt_eval_count",
+    "eval_count",
+    "load_duration",
+    "prompt_eval_duration",
+    "eval_duration",
+    "total_duration",
+]
+
+
+def add_server_stats(totals: Dict[str, Any], response_data: Dict[str, Any]):
+    """Add the token counts and durations of one response to totals, for requests summarized together."""
+    for key in SERVER_STAT_KEYS:
+        totals[key] = totals.get(key, 0) + (response_data.get(key) or 0)
+
+
+def server_metrics(response_data: Dict[str, Any], client_seconds: float) -> Dict[str, Any]:
+    """Server-side throughput of a response, in the schema every experiment records.
+
+    Args:
+        response_data: Response dictionary from generate_with_stats, or
+            totals from add_server_stats over several requests.
+        client_seconds: Wall-clock time the client spent on the request(s).
+
+    Returns:
+        Prompt/output tokens, prefill and decode tokens per second (None
+        without a duration), load/prefill/decode/server seconds, client
+        seconds, and client overhead (client minus server time; None when the
+        server time exceeds it, i.e. the response came from the cache).
+    """
+    durations = server_durations(response_data)
+    prompt_tokens = response_data.get("prompt_eval_count") or 0
+    output_tokens = response_data.get("eval_count") or 0
+    overhead = client_seconds - durations["server_total"]
+    return {
+        "prompt_tokens": prompt_tokens,
+        "output_tokens": output_tokens,
+        "prefill_tokens_per_second": prompt_tokens / durations["prefill"] if durations["prefill"] else None,
+        "decode_tokens_per_second": output_tokens / durations["decode"] if durations["decode"] else None,
+        "load_seconds": durations["load"],
+        "prefill_seconds": durations["prefill"],
+        "decode_seconds": durations["decode"],
+        "server_seconds": durations["server_total"],
+        "client_seconds": client_seconds,
+        "client_overhead_seconds": overhead if overhead >= 0 else None,
+    }
+
+
+def average_server_metrics(metrics_list: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Average each server_metrics field over many requests, skipping missing (None) values."""
+    averaged: Dict[str, Any] = {}
+    for key in metrics_list[0] if metrics_list else []:
+        values = [m[key] for m in metrics_list if m.get(key) is not None]
+        averaged[key] = sum(values) / len(values) if values else None
+    return averaged
+
+
+def trace_server_timings(response_data: Any):
+    """Record the server-reported durations of a response on the current span.
+
+    The load, prefill and decode phases are also added as child spans, laid
+    out back to back so the server's work ends when the response arrived.
+    """
+    if not tracing.enabled() or not isinstance(response_data, dict):
+        return
+    durations = server_durations(response_data)
+    tracing.set_attributes(
+        prompt_tokens=response_data.get("prompt_eval_count", 0),
+        output_tokens=response_data.get("eval_count", 0),
+        **{f"server_{phase}_seconds": seconds for phase, seconds in durations.items()},
+    )
+    start = time.time() - (durations["server_total"] or durations["load"] + durations["prefill"] + durations["decode"])
+    for phase in ("load", "prefill", "decode"):
+        if durations[phase]:
+            tracing.add_span(f"server.{phase}", start, durations[phase], "server")
+            start += durations[phase]
+
 
 def load_english_articles(limit: int = 150) -> List[str]:
     """Load English articles from the configured directory.
@@ -232,29 +560,44 @@ def load_english_articles(limit: int = 150) -> List[str]:
     return articles
 
 
-def load_hebrew_articles(limit: int = 20) -> List[str]:
-    """Load Hebrew articles from the configured directory.
+def load_hebrew_documents(limit: int = 20) -> Dict[str, str]:
+    """Load Hebrew articles from the configured directory, keyed by file name.
+
+    The file name is the document's identity in the RAG indexes: it survives
+    edits to the text and files being added or removed around it.
 
     Args:
         limit: Maximum number of articles to load.
 
     Returns:
-        List of article contents.
+        Mapping of file name to article content, in file name order.
     """
-    articles = []
+    documents: Dict[str, str] = {}
     if not os.path.exists(config.HEBREW_ARTICLES_DIR):
         logger.warning(f"Hebrew articles dir not found: {config.HEBREW_ARTICLES_DIR}")
-        return []
+        return {}
 
     files = sorted(os.listdir(config.HEBREW_ARTICLES_DIR))[:limit]
     for f in files:
         if f.endswith(".txt"):
             try:
                 with open(os.path.join(config.HEBREW_ARTICLES_DIR, f), "r", encoding="utf-8") as file:
-                    articles.append(file.read())
+                    documents[f] = file.read()
             except Exception as e:
                 logger.warning(f"Failed to read {f}: {e}")
-    return articles
+    return documents
+
+
+def load_hebrew_articles(limit: int = 20) -> List[str]:
+    """Load Hebrew articles from the configured directory.
+
+    Args:
+        limit: Maximum number of articles to load.
+
+    Returns:
+        List of article contents.
+    """
+    return list(load_hebrew_documents(limit).values())
 
 
 def generate_filler_text(word_count: int, source_texts: List[str]) -> str:
@@ -344,6 +687,23 @@ def count_tokens(text: str) -> int:
     return int(len(text.split()) * 1.3)
 
 
+def fit_num_ctx(prompt_tokens: int, max_tokens: int = 2048) -> int:
+    """Context window for a prompt plus its answer budget, rounded up to a power of two.
+
+    Ollama reloads a model whenever num_ctx changes, so rounding keeps the
+    number of distinct windows (and reloads) small.
+    """
+    num_ctx = 2048
+    while num_ctx < prompt_tokens + max_tokens:
+        num_ctx *= 2
+    return num_ctx
+
+
+def prefill_timeout(prompt_tokens: int, base_seconds: float, min_prefill_tokens_per_second: float) -> float:
+    """Request timeout that grows with the prefill a prompt of this size needs at the slowest accepted rate."""
+    return base_seconds + prompt_tokens / min_prefill_tokens_per_second
+
+
 def load_text_from_file(filepath: str, max_chars: int) -> str:
     """Load text from file up to max_chars characters.
 